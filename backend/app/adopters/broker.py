@@ -0,0 +1,377 @@
+import asyncio
+import itertools
+import logging
+import math
+import threading
+
+from ib_insync import (
+    IB,
+    AccountValue,
+    LimitOrder,
+    MarketOrder,
+    Stock,
+    StopOrder,
+    Ticker,
+)
+from ib_insync import Order as IBOrder
+from sqlalchemy import Engine
+from sqlmodel import Session, col, select
+
+from app.core.account_sync import AccountSync
+from app.core.broker_adopters import Broker, BrokerError
+from app.core.config import settings
+from app.core.event_bus import publish_price
+from app.core.fills import BrokerFill, FillHandler
+from app.core.ledger import Ledger
+from app.core.oms import working_rows
+from app.models import (
+    Instrument,
+    Order,
+    OrderGroupType,
+    OrderLeg,
+    OrderSide,
+    OrderType,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _action(side: OrderSide) -> str:
+    return "BUY" if side == OrderSide.BUY else "SELL"
+
+
+def _reverse(side: OrderSide) -> OrderSide:
+    return OrderSide.SELL if side == OrderSide.BUY else OrderSide.BUY
+
+
+def _leg_side(order: Order) -> OrderSide:
+    """
+    Bracket legs close the entry so they trade against it, OCO legs share the
+    side of their header.
+    """
+    if order.group_type == OrderGroupType.BRACKET:
+        return _reverse(order.side)
+    return order.side
+
+
+#########################################################
+# Interactive Brokers
+#########################################################
+
+
+class IBBroker(Broker):
+    def __init__(self, host: str, port: int, client_id: int):
+        self.__host = host
+        self.__port = port
+        self.__client_id = client_id
+        self.__ib = IB()
+        # ib_insync is not thread safe, requests come from the API thread pool
+        self.__lock = threading.Lock()
+
+    def __connected(self) -> IB:
+        if not self.__ib.isConnected():
+            self.__ib.connect(self.__host, self.__port, clientId=self.__client_id)
+        return self.__ib
+
+    @staticmethod
+    def __build(
+        side: OrderSide, order_type: OrderType, qty: float, price: float
+    ) -> IBOrder:
+        if order_type == OrderType.LIMIT:
+            return LimitOrder(_action(side), qty, price)
+        if order_type == OrderType.STOP:
+            return StopOrder(_action(side), qty, price)
+        return MarketOrder(_action(side), qty)
+
+    def place_group(self, order: Order, legs: list[OrderLeg]) -> None:
+        with self.__lock:
+            try:
+                ib = self.__connected()
+                contract = Stock(order.symbol, "SMART", order.currency)
+                tif = order.time_in_force.value.upper()
+                placed: list[tuple[OrderLeg | Order, IBOrder]] = []
+
+                if order.group_type == OrderGroupType.BRACKET:
+                    parent = self.__build(
+                        order.side, order.order_type, order.qty, order.price
+                    )
+                    parent.orderId = ib.client.getReqId()
+                    parent.transmit = False
+                    placed.append((order, parent))
+
+                for leg in legs:
+                    child = self.__build(
+                        _leg_side(order), leg.order_type, leg.qty, leg.price
+                    )
+                    child.orderId = ib.client.getReqId()
+                    if order.group_type == OrderGroupType.BRACKET:
+                        child.parentId = placed[0][1].orderId
+                        child.transmit = False
+                    else:
+                        child.ocaGroup = f"oco-{order.id}"
+                        child.ocaType = 1
+                    placed.append((leg, child))
+
+                # nothing is routed by TWS until the last order of the group is transmitted
+                placed[-1][1].transmit = True
+                for row, ib_order in placed:
+                    ib_order.tif = tif
+                    ib.placeOrder(contract, ib_order)
+                    row.broker_order_id = ib_order.orderId
+            except (ConnectionError, OSError, TimeoutError) as e:
+                raise BrokerError(str(e))
+
+    def cancel_group(self, order: Order, legs: list[OrderLeg]) -> None:
+        with self.__lock:
+            try:
+                ib = self.__connected()
+                for row in working_rows(order, legs):
+                    if row.broker_order_id is not None:
+                        ib.cancelOrder(IBOrder(orderId=row.broker_order_id))
+            except (ConnectionError, OSError, TimeoutError) as e:
+                raise BrokerError(str(e))
+
+
+class IBAccountFeed:
+    """
+    Feeds the account values and summaries of every account managed by the
+    connection into an AccountSync. Connecting subscribes to the account
+    updates once, the summaries are requested right after; from then on IB
+    pushes changes and nothing is polled. Runs its own event loop on a
+    background thread and reconnects after any failure. IB accepts a client
+    id once, so only the elected leader runs it.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        client_id: int,
+        sync: AccountSync,
+        retry_seconds: float = 10.0,
+    ):
+        self.__host = host
+        self.__port = port
+        self.__client_id = client_id
+        self.__sync = sync
+        self.__retry_seconds = retry_seconds
+
+    def __on_value(self, value: AccountValue) -> None:
+        self.__sync.apply(value.account, value.tag, value.value, value.currency)
+
+    def run(self, stop: threading.Event) -> None:
+        """
+        Event loop for a background thread, returns once stop is set.
+        """
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        ib = IB()
+        ib.accountValueEvent += self.__on_value
+        ib.accountSummaryEvent += self.__on_value
+        while not stop.is_set():
+            try:
+                if not ib.isConnected():
+                    ib.connect(
+                        self.__host,
+                        self.__port,
+                        clientId=self.__client_id,
+                        readonly=True,
+                    )
+                    ib.reqAccountSummary()
+                ib.sleep(1.0)
+            except Exception:
+                logger.exception("IB account feed failed, reconnecting")
+                ib.disconnect()
+                stop.wait(self.__retry_seconds)
+        ib.disconnect()
+
+
+class IBExecutionFeed:
+    """
+    Feeds the day's executions into a FillHandler, each once its commission
+    report has come in so its fees are known. Connecting asks for every
+    execution since midnight, the ones made while disconnected included;
+    the ledger skips those it applied before. IB only reports another
+    client's executions to the master API client id set in TWS. Runs its
+    own event loop on a background thread and reconnects after any failure.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        client_id: int,
+        fills: FillHandler,
+        retry_seconds: float = 10.0,
+    ):
+        self.__host = host
+        self.__port = port
+        self.__client_id = client_id
+        self.__fills = fills
+        self.__retry_seconds = retry_seconds
+        # exec ids already handed to the handler on this connection
+        self.__handed: set[str] = set()
+
+    def __hand_over(self, ib: IB) -> None:
+        for fill in ib.fills():
+            execution = fill.execution
+            if execution.execId in self.__handed or not fill.commissionReport.execId:
+                continue
+            self.__fills.apply(
+                BrokerFill(
+                    exec_id=execution.execId,
+                    client_id=execution.clientId,
+                    broker_order_id=execution.orderId,
+                    symbol=fill.contract.symbol,
+                    qty=execution.shares
+                    if execution.side == "BOT"
+                    else -execution.shares,
+                    price=execution.price,
+                    fees=fill.commissionReport.commission,
+                    filled=execution.cumQty,
+                )
+            )
+            self.__handed.add(execution.execId)
+
+    def run(self, stop: threading.Event) -> None:
+        """
+        Event loop for a background thread, returns once stop is set.
+        """
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        ib = IB()
+        while not stop.is_set():
+            try:
+                if not ib.isConnected():
+                    self.__handed.clear()
+                    ib.connect(
+                        self.__host,
+                        self.__port,
+                        clientId=self.__client_id,
+                        readonly=True,
+                    )
+                    ib.reqExecutions()
+                self.__hand_over(ib)
+                ib.sleep(1.0)
+            except Exception:
+                logger.exception("IB execution feed failed, reconnecting")
+                ib.disconnect()
+                stop.wait(self.__retry_seconds)
+        ib.disconnect()
+
+
+class IBMarketDataFeed:
+    """
+    Publishes the market price of every instrument the ledger holds a
+    position in, the ledger marks its positions to them off the event bus.
+    Subscriptions follow the holdings, checked once a second. Runs its own
+    event loop on a background thread and reconnects after any failure.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        client_id: int,
+        engine: Engine,
+        ledger: Ledger,
+        retry_seconds: float = 10.0,
+    ):
+        self.__host = host
+        self.__port = port
+        self.__client_id = client_id
+        self.__engine = engine
+        self.__ledger = ledger
+        self.__retry_seconds = retry_seconds
+        # contracts subscribed on this connection, by instrument id
+        self.__contracts: dict[int, Stock] = {}
+        self.__instruments: dict[str, int] = {}
+
+    def __on_tickers(self, tickers: set[Ticker]) -> None:
+        for ticker in tickers:
+            if ticker.contract is None:
+                continue
+            instrument_id = self.__instruments.get(ticker.contract.symbol)
+            price = ticker.marketPrice()
+            if instrument_id is not None and not math.isnan(price) and price > 0:
+                publish_price(instrument_id, price)
+
+    def __follow_holdings(self, ib: IB) -> None:
+        held = self.__ledger.held_instruments()
+        for instrument_id in self.__contracts.keys() - held:
+            contract = self.__contracts.pop(instrument_id)
+            self.__instruments.pop(contract.symbol, None)
+            ib.cancelMktData(contract)
+        new = held - self.__contracts.keys()
+        if not new:
+            return
+        with Session(self.__engine) as session:
+            rows = session.exec(
+                select(
+                    col(Instrument.id), col(Instrument.symbol), col(Instrument.currency)
+                ).where(col(Instrument.id).in_(new))
+            ).all()
+        for id, symbol, currency in rows:
+            assert id is not None
+            contract = Stock(symbol, "SMART", currency)
+            ib.reqMktData(contract)
+            self.__contracts[id] = contract
+            self.__instruments[symbol] = id
+
+    def run(self, stop: threading.Event) -> None:
+        """
+        Event loop for a background thread, returns once stop is set.
+        """
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        ib = IB()
+        ib.pendingTickersEvent += self.__on_tickers
+        while not stop.is_set():
+            try:
+                if not ib.isConnected():
+                    self.__contracts.clear()
+                    self.__instruments.clear()
+                    ib.connect(
+                        self.__host,
+                        self.__port,
+                        clientId=self.__client_id,
+                        readonly=True,
+                    )
+                self.__follow_holdings(ib)
+                ib.sleep(1.0)
+            except Exception:
+                logger.exception("IB market data feed failed, reconnecting")
+                ib.disconnect()
+                stop.wait(self.__retry_seconds)
+        ib.disconnect()
+
+
+#########################################################
+# Paper
+#########################################################
+
+
+class PaperBroker(Broker):
+    """
+    Accepts every order without routing it, used when IB is disabled.
+    """
+
+    def __init__(self) -> None:
+        self.__ids = itertools.count(1)
+        self.working: set[int] = set()
+
+    def place_group(self, order: Order, legs: list[OrderLeg]) -> None:
+        rows: list[Order | OrderLeg] = list(legs)
+        if order.group_type == OrderGroupType.BRACKET:
+            rows.insert(0, order)
+        for row in rows:
+            row.broker_order_id = next(self.__ids)
+            self.working.add(row.broker_order_id)
+
+    def cancel_group(self, order: Order, legs: list[OrderLeg]) -> None:
+        for row in working_rows(order, legs):
+            if row.broker_order_id is not None:
+                self.working.discard(row.broker_order_id)
+
+
+def create_broker() -> Broker:
+    if settings.IB_ENABLED:
+        return IBBroker(settings.IB_HOST, settings.IB_PORT, settings.IB_CLIENT_ID)
+    return PaperBroker()
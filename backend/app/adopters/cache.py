@@ -0,0 +1,250 @@
+import threading
+import time
+from collections.abc import Callable, Mapping, Sequence
+from typing import Any, Generic
+
+from sqlmodel import SQLModel
+
+from app.core.cache import TieredCache, TTLCache
+from app.core.cache_adopters import CacheBackend
+from app.core.config import settings
+from app.core.db_adopters import (
+    AccountsRepo,
+    BulkRepo,
+    CompaniesRepo,
+    ExchangesRepo,
+    InstrumentsRepo,
+    ModelT,
+)
+from app.core.event_bus import (
+    ACCOUNT,
+    CACHE,
+    BusEvent,
+    OverflowPolicy,
+    Topic,
+    event_bus,
+)
+from app.models import Account, Company, Exchange, Instrument, InstrumentSearchHit
+
+#########################################################
+# Backends
+#########################################################
+
+
+class LocalCacheBackend(CacheBackend):
+    """
+    In-process stand-in for a shared cache server, for development and tests.
+    """
+
+    def __init__(self) -> None:
+        self.__values: dict[str, tuple[float, str]] = {}
+        self.__lock = threading.Lock()
+
+    def get(self, key: str) -> str | None:
+        with self.__lock:
+            entry = self.__values.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.__values[key]
+                return None
+            return entry[1]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self.__lock:
+            self.__values[key] = (time.monotonic() + ttl, value)
+
+    def delete(self, *keys: str) -> None:
+        with self.__lock:
+            for key in keys:
+                self.__values.pop(key, None)
+
+
+def create_cache_backend() -> CacheBackend | None:
+    if settings.REFERENCE_CACHE_BACKEND == "local":
+        return LocalCacheBackend()
+    return None
+
+
+reference_cache = TieredCache(
+    "reference",
+    TTLCache(settings.REFERENCE_CACHE_SIZE, settings.REFERENCE_CACHE_TTL_SECONDS),
+    create_cache_backend(),
+    settings.REFERENCE_CACHE_SHARED_TTL_SECONDS,
+)
+
+# the account sync writes balances past the repos; one eviction per account
+# covers any number of updates waiting
+event_bus.add_consumer(
+    Topic(ACCOUNT),
+    lambda event: reference_cache.invalidate(f"account:{event.topic.key}"),
+    OverflowPolicy.CONFLATE,
+)
+
+
+def evict_written_rows(event: BusEvent) -> None:
+    """
+    Drop the rows a committed transaction wrote. The writing worker also
+    clears them from the shared tier, closing the window in which a read
+    before the commit cached the old row there.
+    """
+    table, ids = event.topic.key, event.payload["ids"]
+    keys = [f"{table}:{id}" for id in ids or ()]
+    if event.origin == event_bus.origin:
+        reference_cache.invalidate(*keys)
+    if ids is None:
+        # the shared tier can't be cleared by prefix, its entries run out
+        reference_cache.evict(prefix=f"{table}:")
+    elif event.origin != event_bus.origin:
+        reference_cache.evict(*keys)
+
+
+# never dropped, a missed eviction serves a stale row until the ttl runs out
+event_bus.add_consumer(Topic(CACHE), evict_written_rows, OverflowPolicy.BLOCK)
+
+trade_aggregate_cache = TieredCache(
+    "trade_aggregates",
+    TTLCache(
+        settings.TRADE_AGGREGATE_CACHE_SIZE, settings.TRADE_AGGREGATE_CACHE_TTL_SECONDS
+    ),
+    create_cache_backend(),
+    settings.TRADE_AGGREGATE_CACHE_TTL_SECONDS,
+)
+
+
+#########################################################
+# Cached repos
+#########################################################
+
+
+class CachedRepo(Generic[ModelT]):
+    """
+    Wraps a repo, plain get_* lookups by id are served from the cache and the
+    repo's own writes invalidate the rows they touch. Cache hits are copies
+    detached from any session, load through the wrapped repo (or pass a
+    profile) when relationships or writes are needed.
+
+    The entries are dropped when the write is issued and again, in every
+    worker, once it commits (see app.core.invalidation), so a read in between
+    can't keep the old row cached.
+    """
+
+    model: type[ModelT]
+
+    def __init__(self, repo: BulkRepo[ModelT], cache: TieredCache = reference_cache):
+        self._repo = repo
+        self._cache = cache
+
+    def __getattr__(self, name: str) -> Any:
+        # list_* and other lookups that aren't cached
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self._repo, name)
+
+    def _key(self, id: int) -> str:
+        return f"{self.model.__tablename__}:{id}"
+
+    def _cached(self, id: int, load: Callable[[], ModelT | None]) -> ModelT | None:
+        key = self._key(id)
+        payload = self._cache.get(key)
+        if payload is not None:
+            return self.model.model_validate(payload)
+        item = load()
+        if item is not None:
+            self._cache.set(key, item.model_dump(mode="json"))
+        return item
+
+    def save(self, c: ModelT) -> ModelT:
+        item = self._repo.save(c)
+        id = getattr(c, "id", None)
+        if id is not None:
+            self._cache.invalidate(self._key(id))
+        return item
+
+    def create(self, c: SQLModel) -> ModelT:
+        return self._repo.create(c)
+
+    def bulk_create(self, items: Sequence[SQLModel]) -> list[ModelT]:
+        return self._repo.bulk_create(items)
+
+    def update(self, id: int, c: SQLModel) -> ModelT:
+        try:
+            return self._repo.update(id, c)
+        finally:
+            self._cache.invalidate(self._key(id))
+
+    def delete(self, id: int) -> None:
+        try:
+            self._repo.delete(id)
+        finally:
+            self._cache.invalidate(self._key(id))
+
+    def bulk_update(self, rows: Sequence[Mapping[str, Any]]) -> int:
+        try:
+            return self._repo.bulk_update(rows)
+        finally:
+            self._cache.invalidate(
+                *(self._key(row["id"]) for row in rows if row.get("id") is not None)
+            )
+
+    def bulk_delete(self, ids: Sequence[int]) -> int:
+        try:
+            return self._repo.bulk_delete(ids)
+        finally:
+            self._cache.invalidate(*(self._key(id) for id in ids))
+
+
+class CachedCompaniesRepo(CachedRepo[Company], CompaniesRepo):
+    model = Company
+
+    def __init__(self, repo: CompaniesRepo, cache: TieredCache = reference_cache):
+        super().__init__(repo, cache)
+        self.__repo = repo
+
+    def get_company(self, id: int, profile: str | None = None) -> Company | None:
+        if profile is not None:
+            return self.__repo.get_company(id, profile)
+        return self._cached(id, lambda: self.__repo.get_company(id))
+
+    def search_company(self, query: str, limit: int = 10) -> list[Company]:
+        return self.__repo.search_company(query, limit)
+
+
+class CachedInstrumentsRepo(CachedRepo[Instrument], InstrumentsRepo):
+    model = Instrument
+
+    def __init__(self, repo: InstrumentsRepo, cache: TieredCache = reference_cache):
+        super().__init__(repo, cache)
+        self.__repo = repo
+
+    def get_instrument(self, id: int, profile: str | None = None) -> Instrument | None:
+        if profile is not None:
+            return self.__repo.get_instrument(id, profile)
+        return self._cached(id, lambda: self.__repo.get_instrument(id))
+
+    def search_instruments(
+        self, query: str, limit: int = 10
+    ) -> list[InstrumentSearchHit]:
+        return self.__repo.search_instruments(query, limit)
+
+
+class CachedExchangesRepo(CachedRepo[Exchange], ExchangesRepo):
+    model = Exchange
+
+    def __init__(self, repo: ExchangesRepo, cache: TieredCache = reference_cache):
+        super().__init__(repo, cache)
+        self.__repo = repo
+
+    def get_exchange(self, id: int) -> Exchange | None:
+        return self._cached(id, lambda: self.__repo.get_exchange(id))
+
+
+class CachedAccountsRepo(CachedRepo[Account], AccountsRepo):
+    model = Account
+
+    def __init__(self, repo: AccountsRepo, cache: TieredCache = reference_cache):
+        super().__init__(repo, cache)
+        self.__repo = repo
+
+    def get_account(self, id: int) -> Account | None:
+        return self._cached(id, lambda: self.__repo.get_account(id))
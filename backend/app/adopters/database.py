@@ -1,315 +1,357 @@
-from typing import Any
+from collections.abc import Callable, Mapping, Sequence
+from functools import partial
+from typing import Any, Generic, TypeVar
 
-from sqlalchemy import func
-from sqlmodel import select
+from sqlalchemy import delete, func, insert, or_, update
+from sqlmodel import SQLModel, select
 
 from app.api.deps import SessionDep
-from app.core.db_adopters import CompaniesRepo, AccountsRepo, InstrumentsRepo, OrdersRepo, PortfoliosRepo, TradesRepo
-from app.models import Company, CompaniesPublic, Account, Instrument, Order, OrdersPublic, Portfolio, PortfoliosPublic, \
-    Trade
-
+from app.core.db_adopters import (
+    AccountsRepo,
+    CompaniesRepo,
+    ExchangesRepo,
+    InstrumentsRepo,
+    ModelT,
+    OrdersRepo,
+    PortfoliosRepo,
+    TradesRepo,
+    UnitOfWork,
+)
+from app.core.loaders import loader_options
+from app.core.pnl_rollups import refresh_daily_pnl, trade_days
+from app.core.queries import orders_by_status, positions_by_portfolio
+from app.core.search import normalize, search_statement
+from app.models import (
+    Account,
+    AccountsPublic,
+    CompaniesPublic,
+    Company,
+    Exchange,
+    Instrument,
+    InstrumentSearchHit,
+    InstrumentsPublic,
+    Order,
+    OrdersPublic,
+    OrderStatus,
+    Portfolio,
+    PortfoliosPublic,
+    Position,
+    Trade,
+    TradesPublic,
+)
+
+T = TypeVar("T")
 
 #########################################################
-# Companies
+# Shared writes
 #########################################################
 
-class DefaultCompaniesRepo(CompaniesRepo):
-
-    def __init__(self, dep: SessionDep):
-        self.__sessions = dep
-
-    def get_company(self, id: int) -> Company:
-        return self.__sessions.get(Company, id)
-
-    def list_companies(self, skip: int = 0, limit: int = 100) -> Any:
-        """
-        List companies.
-        """
-        count_statement = select(func.count()).select_from(Company)
-        count = self.__sessions.exec(count_statement).one()
-        statement = select(Company).offset(skip).limit(limit)
-        items = self.__sessions.exec(statement).all()
-        return CompaniesPublic(data=items, count=count)
-
-    def save(self, c: Company):
-        self.__sessions.save(c)
-
-    def create(self, c: Company):
-        item = Company.model_validate(c)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
+class SessionRepo(Generic[ModelT]):
+    """
+    create/update/delete and the bulk variants for one table model. With
+    autocommit every call commits, a unit of work passes autocommit=False and
+    commits once for all of its repos.
+    """
+    model: type[ModelT]
+
+    def __init__(self, dep: SessionDep, autocommit: bool = True):
+        self._sessions = dep
+        self._autocommit = autocommit
+
+    @property
+    def _name(self) -> str:
+        return self.model.__name__
+
+    def _done(self, *items: SQLModel) -> None:
+        if not self._autocommit:
+            return
+        self._sessions.commit()
+        for item in items:
+            self._sessions.refresh(item)
+
+    def save(self, c: ModelT) -> ModelT:
+        self._sessions.add(c)
+        self._done(c)
+        return c
+
+    def create(self, c: SQLModel) -> ModelT:
+        item = self.model.model_validate(c)
+        self._sessions.add(item)
+        self._done(item)
         return item
 
-    def update(self, c: Company):
-        item = self.__sessions.get(Company, id)
+    def update(self, id: int, c: SQLModel) -> ModelT:
+        item = self._sessions.get(self.model, id)
         if not item:
-            raise ValueError("Company not found")
+            raise ValueError(f"{self._name} not found")
         update_dict = c.model_dump(exclude_unset=True)
-        c.sqlmodel_update(update_dict)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
+        item.sqlmodel_update(update_dict)
+        self._sessions.add(item)
+        self._done(item)
         return item
 
-    def delete(self, id: int):
-        item = self.__sessions.get(Company, id)
+    def delete(self, id: int) -> None:
+        item = self._sessions.get(self.model, id)
         if not item:
-            raise ValueError("Company not found")
-        self.__sessions.delete(item)
-        self.__sessions.commit()
+            raise ValueError(f"{self._name} not found")
+        self._sessions.delete(item)
+        self._done()
+
+    def bulk_create(self, items: Sequence[SQLModel]) -> list[ModelT]:
+        if not items:
+            return []
+        rows = [self.model.model_validate(c).model_dump(exclude={"id"}) for c in items]
+        created = list(
+            self._sessions.scalars(
+                insert(self.model).returning(self.model, sort_by_parameter_order=True), rows
+            ).all()
+        )
+        self._done()
+        return created
+
+    def bulk_update(self, rows: Sequence[Mapping[str, Any]]) -> int:
+        if not rows:
+            return 0
+        if any(row.get("id") is None for row in rows):
+            raise ValueError(f"Every {self._name} row to update needs an id")
+        # ORM bulk UPDATE by primary key, runs as a single executemany
+        self._sessions.execute(update(self.model), [dict(row) for row in rows])
+        self._done()
+        return len(rows)
+
+    def bulk_delete(self, ids: Sequence[int]) -> int:
+        if not ids:
+            return 0
+        statement = delete(self.model).where(self.model.id.in_(ids))  # type: ignore[attr-defined]
+        deleted: int = self._sessions.execute(statement).rowcount  # type: ignore[attr-defined]
+        self._done()
+        return deleted
 
 
 #########################################################
-# Account
+# Companies
 #########################################################
 
-class DefaultAccountsRepo(AccountsRepo):
-
-    def __init__(self, dep: SessionDep):
-        self.__sessions = dep
+class DefaultCompaniesRepo(SessionRepo[Company], CompaniesRepo):
+    model = Company
 
-    def get_account(self, id: int) -> Company:
-        return self.__sessions.get(Account, id)
+    def get_company(self, id: int, profile: str | None = None) -> Company | None:
+        return self._sessions.get(Company, id, options=loader_options(profile))
 
-    def list_accounts(self, skip: int = 0, limit: int = 100) -> Any:
+    def list_companies(self, skip: int = 0, limit: int = 100) -> Any:
         """
         List companies.
         """
         count_statement = select(func.count()).select_from(Company)
-        count = self.__sessions.exec(count_statement).one()
+        count = self._sessions.exec(count_statement).one()
         statement = select(Company).offset(skip).limit(limit)
-        items = self.__sessions.exec(statement).all()
+        items = self._sessions.exec(statement).all()
         return CompaniesPublic(data=items, count=count)
 
-    def save(self, c: Account):
-        self.__sessions.save(c)
+    def search_company(self, query: str, limit: int = 10) -> list[Company]:
+        query = normalize(query)
+        statement = (
+            select(Company)
+            .where(or_(
+                Company.name.istartswith(query, autoescape=True),  # type: ignore[attr-defined]
+                Company.name.icontains(f" {query}", autoescape=True),  # type: ignore[attr-defined]
+            ))
+            .order_by(Company.market_cap.desc(), Company.name)  # type: ignore[attr-defined]
+            .limit(limit)
+        )
+        return list(self._sessions.exec(statement).all())
 
-    def create(self, c: Account):
-        item = Account.model_validate(c)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
-        return item
 
-    def update(self, c: Account):
-        item = self.__sessions.get(Account, id)
-        if not item:
-            raise ValueError("Account not found")
-        update_dict = c.model_dump(exclude_unset=True)
-        c.sqlmodel_update(update_dict)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
-        return item
+#########################################################
+# Account
+#########################################################
 
-    def delete(self, id: int):
-        item = self.__sessions.get(Account, id)
-        if not item:
-            raise ValueError("Account not found")
-        self.__sessions.delete(item)
-        self.__sessions.commit()
+class DefaultAccountsRepo(SessionRepo[Account], AccountsRepo):
+    model = Account
+
+    def get_account(self, id: int) -> Account | None:
+        return self._sessions.get(Account, id)
+
+    def list_accounts(self, skip: int = 0, limit: int = 100) -> Any:
+        """
+        List accounts.
+        """
+        count_statement = select(func.count()).select_from(Account)
+        count = self._sessions.exec(count_statement).one()
+        statement = select(Account).offset(skip).limit(limit)
+        items = self._sessions.exec(statement).all()
+        return AccountsPublic(data=items, count=count)
 
 
 #########################################################
 # Instruments
 #########################################################
 
-class DefaultInstrumentsRepo(InstrumentsRepo):
+class DefaultInstrumentsRepo(SessionRepo[Instrument], InstrumentsRepo):
+    model = Instrument
 
-    def __init__(self, dep: SessionDep):
-        self.__sessions = dep
-
-    def get_instrument(self, id: int) -> Company:
-        return self.__sessions.get(Instrument, id)
+    def get_instrument(self, id: int, profile: str | None = None) -> Instrument | None:
+        return self._sessions.get(Instrument, id, options=loader_options(profile))
 
     def list_instruments(self, skip: int = 0, limit: int = 100) -> Any:
         """
-        List companies.
+        List instruments.
         """
         count_statement = select(func.count()).select_from(Instrument)
-        count = self.__sessions.exec(count_statement).one()
-        statement = select(Company).offset(skip).limit(limit)
-        items = self.__sessions.exec(statement).all()
+        count = self._sessions.exec(count_statement).one()
+        statement = select(Instrument).offset(skip).limit(limit)
+        items = self._sessions.exec(statement).all()
         return InstrumentsPublic(data=items, count=count)
 
-    def save(self, c: Instrument):
-        self.__sessions.save(c)
-
-    def create(self, c: Instrument):
-        item = Account.model_validate(c)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
-        return item
-
-    def update(self, c: Instrument):
-        item = self.__sessions.get(Instrument, id)
-        if not item:
-            raise ValueError("Instrument not found")
-        update_dict = c.model_dump(exclude_unset=True)
-        c.sqlmodel_update(update_dict)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
-        return item
-
-    def delete(self, id: int):
-        item = self.__sessions.get(Instrument, id)
-        if not item:
-            raise ValueError("Instrument not found")
-        self.__sessions.delete(item)
-        self.__sessions.commit()
+    def search_instruments(self, query: str, limit: int = 10) -> list[InstrumentSearchHit]:
+        rows = self._sessions.execute(search_statement(query, limit)).mappings()
+        return [InstrumentSearchHit.model_validate(row) for row in rows]
 
 
 #########################################################
 # Orders
 #########################################################
 
-class DefaultOrdersRepo(OrdersRepo):
+class DefaultOrdersRepo(SessionRepo[Order], OrdersRepo):
+    model = Order
 
-    def __init__(self, dep: SessionDep):
-        self.__sessions = dep
+    def get_order(self, id: int, profile: str | None = None) -> Order | None:
+        return self._sessions.get(Order, id, options=loader_options(profile))
 
-    def get_order(self, id: int) -> Order:
-        return self.__sessions.get(Order, id)
-
-    def list_instruments(self, skip: int = 0, limit: int = 100) -> Any:
+    def list_orders(self, skip: int = 0, limit: int = 100) -> Any:
         """
-        List companies.
+        List orders.
         """
         count_statement = select(func.count()).select_from(Order)
-        count = self.__sessions.exec(count_statement).one()
-        statement = select(Company).offset(skip).limit(limit)
-        items = self.__sessions.exec(statement).all()
+        count = self._sessions.exec(count_statement).one()
+        statement = select(Order).offset(skip).limit(limit)
+        items = self._sessions.exec(statement).all()
         return OrdersPublic(data=items, count=count)
 
-    def save(self, c: Order):
-        self.__sessions.save(c)
-
-    def create(self, c: Order):
-        item = Order.model_validate(c)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
-        return item
-
-    def update(self, c: Order):
-        item = self.__sessions.get(Order, id)
-        if not item:
-            raise ValueError("Order not found")
-        update_dict = c.model_dump(exclude_unset=True)
-        c.sqlmodel_update(update_dict)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
-        return item
-
-    def delete(self, id: int):
-        item = self.__sessions.get(Order, id)
-        if not item:
-            raise ValueError("Order not found")
-        self.__sessions.delete(item)
-        self.__sessions.commit()
+    def list_by_status(self, portfolio_id: int, statuses: Sequence[OrderStatus]) -> Sequence[Order]:
+        return orders_by_status(self._sessions, portfolio_id, statuses)
 
 
 #########################################################
-# Orders
+# Portfolios
 #########################################################
 
-class DefaultProtfoliosRepo(PortfoliosRepo):
+class DefaultPortfoliosRepo(SessionRepo[Portfolio], PortfoliosRepo):
+    model = Portfolio
 
-    def __init__(self, dep: SessionDep):
-        self.__sessions = dep
-
-    def get_protfilio(self, id: int) -> Portfolio:
-        return self.__sessions.get(Portfolio, id)
+    def get_portfolio(self, id: int, profile: str | None = None) -> Portfolio | None:
+        return self._sessions.get(Portfolio, id, options=loader_options(profile))
 
-    def list_portfilios(self, skip: int = 0, limit: int = 100) -> Any:
+    def list_portfolios(self, skip: int = 0, limit: int = 100) -> Any:
         """
-        List companies.
+        List portfolios.
         """
         count_statement = select(func.count()).select_from(Portfolio)
-        count = self.__sessions.exec(count_statement).one()
+        count = self._sessions.exec(count_statement).one()
         statement = select(Portfolio).offset(skip).limit(limit)
-        items = self.__sessions.exec(statement).all()
+        items = self._sessions.exec(statement).all()
         return PortfoliosPublic(data=items, count=count)
 
-    def save(self, c: Portfolio):
-        self.__sessions.save(c)
+    def list_positions(self, portfolio_id: int) -> Sequence[Position]:
+        return positions_by_portfolio(self._sessions, portfolio_id)
 
-    def create(self, c: Portfolio):
-        item = Order.model_validate(c)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
-        return item
 
-    def update(self, c: Portfolio):
-        item = self.__sessions.get(Portfolio, id)
-        if not item:
-            raise ValueError("Portfolio not found")
-        update_dict = c.model_dump(exclude_unset=True)
-        c.sqlmodel_update(update_dict)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
-        return item
+#########################################################
+# Trades
+#########################################################
 
-    def delete(self, id: int):
-        item = self.__sessions.get(Portfolio, id)
-        if not item:
-            raise ValueError("Portfolio not found")
-        self.__sessions.delete(item)
-        self.__sessions.commit()
+class DefaultTradesRepo(SessionRepo[Trade], TradesRepo):
+    """
+    Every write also refreshes the daily P&L rollups of the days the trades
+    exit on, before and after the write, ahead of the commit.
+    """
+    model = Trade
+
+    def _rollup(self, ids: Sequence[int], write: Callable[[], T]) -> T:
+        with self._sessions.no_autoflush:
+            before = trade_days(self._sessions, ids)
+        autocommit, self._autocommit = self._autocommit, False
+        try:
+            result = write()
+        finally:
+            self._autocommit = autocommit
+        self._sessions.flush()
+        written = result if isinstance(result, list) else [result] if isinstance(result, Trade) else []
+        refresh_daily_pnl(self._sessions, before | trade_days(self._sessions, [*ids, *(t.id for t in written)]))
+        if isinstance(result, Trade):
+            self._done(result)
+        else:
+            self._done()
+        return result
+
+    def save(self, c: Trade) -> Trade:
+        return self._rollup([c.id] if c.id is not None else [], partial(super().save, c))
+
+    def create(self, c: SQLModel) -> Trade:
+        return self._rollup([], partial(super().create, c))
+
+    def update(self, id: int, c: SQLModel) -> Trade:
+        return self._rollup([id], partial(super().update, id, c))
+
+    def delete(self, id: int) -> None:
+        self._rollup([id], partial(super().delete, id))
+
+    def bulk_create(self, items: Sequence[SQLModel]) -> list[Trade]:
+        return self._rollup([], partial(super().bulk_create, items))
+
+    def bulk_update(self, rows: Sequence[Mapping[str, Any]]) -> int:
+        ids = [row["id"] for row in rows if row.get("id") is not None]
+        return self._rollup(ids, partial(super().bulk_update, rows))
+
+    def bulk_delete(self, ids: Sequence[int]) -> int:
+        return self._rollup(ids, partial(super().bulk_delete, ids))
+
+    def get_trade(self, id: int) -> Trade | None:
+        return self._sessions.get(Trade, id)
+
+    def list_trades(self, skip: int = 0, limit: int = 100) -> Any:
+        """
+        List trades.
+        """
+        count_statement = select(func.count()).select_from(Trade)
+        count = self._sessions.exec(count_statement).one()
+        statement = select(Trade).offset(skip).limit(limit)
+        items = self._sessions.exec(statement).all()
+        return TradesPublic(data=items, count=count)
 
 
 #########################################################
-# Trades
+# Exchanges
 #########################################################
 
-class DefaultTradesRepo(TradesRepo):
-
-    def __init__(self, dep: SessionDep):
-        self.__sessions = dep
+class DefaultExchangesRepo(SessionRepo[Exchange], ExchangesRepo):
+    model = Exchange
 
-    def get_trade(self, id: int) -> Trade:
-        return self.__sessions.get(Trade, id)
+    def get_exchange(self, id: int) -> Exchange | None:
+        return self._sessions.get(Exchange, id)
 
-    def list_portfilios(self, skip: int = 0, limit: int = 100) -> Any:
-        """
-        List companies.
-        """
-        count_statement = select(func.count()).select_from(Trade)
-        count = self.__sessions.exec(count_statement).one()
-        statement = select(Portfolio).offset(skip).limit(limit)
-        items = self.__sessions.exec(statement).all()
-        return PortfoliosPublic(data=items, count=count)
 
-    def save(self, c: Trade):
-        self.__sessions.save(c)
+#########################################################
+# Unit of work
+#########################################################
 
-    def create(self, c: Trade):
-        item = Order.model_validate(c)
-        self.__sessions.add(item)
-        self.__sessions.commit()
-        self.__sessions.refresh(item)
-        return item
+class DefaultUnitOfWork(UnitOfWork):
 
-    def update(self, c: Trade):
-        item = self.__sessions.get(Trade, id)
-        if not item:
-            raise ValueError("Trade not found")
-        update_dict = c.model_dump(exclude_unset=True)
-        c.sqlmodel_update(update_dict)
-        self.__sessions.add(item)
+    def __init__(self, dep: SessionDep):
+        self.__sessions = dep
+        self.companies = DefaultCompaniesRepo(dep, autocommit=False)
+        self.accounts = DefaultAccountsRepo(dep, autocommit=False)
+        self.exchanges = DefaultExchangesRepo(dep, autocommit=False)
+        self.instruments = DefaultInstrumentsRepo(dep, autocommit=False)
+        self.orders = DefaultOrdersRepo(dep, autocommit=False)
+        self.portfolios = DefaultPortfoliosRepo(dep, autocommit=False)
+        self.trades = DefaultTradesRepo(dep, autocommit=False)
+
+    def flush(self) -> None:
+        self.__sessions.flush()
+
+    def commit(self) -> None:
         self.__sessions.commit()
-        self.__sessions.refresh(item)
-        return item
 
-    def delete(self, id: int):
-        item = self.__sessions.get(Trade, id)
-        if not item:
-            raise ValueError("Trade not found")
-        self.__sessions.delete(item)
-        self.__sessions.commit()
+    def rollback(self) -> None:
+        self.__sessions.rollback()
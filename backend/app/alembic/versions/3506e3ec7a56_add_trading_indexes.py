@@ -0,0 +1,103 @@
+"""Add trading indexes
+
+Revision ID: 3506e3ec7a56
+Revises: e2412789c190
+Create Date: 2026-10-19 09:12:44.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = "3506e3ec7a56"
+down_revision = "e2412789c190"
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns, unique, postgresql_using)
+INDEXES = [
+    ("ix_item_owner_id", "item", ["owner_id"], False, None),
+    (
+        "ix_finstatement_company_id_st_type_year_qtr",
+        "finstatement",
+        ["company_id", "st_type", "year", "qtr"],
+        True,
+        None,
+    ),
+    (
+        "ix_finstatementlineitem_parent_id",
+        "finstatementlineitem",
+        ["parent_id"],
+        False,
+        None,
+    ),
+    ("ix_instrument_symbol", "instrument", ["symbol"], False, None),
+    ("ix_instrument_company_id", "instrument", ["company_id"], False, None),
+    (
+        "ix_chart_instrument_id_interval",
+        "chart",
+        ["instrument_id", "interval"],
+        False,
+        None,
+    ),
+    ("ix_bar_chart_id_timestamp", "bar", ["chart_id", "timestamp"], False, None),
+    ("ix_bar_timestamp", "bar", ["timestamp"], False, "brin"),
+    ("ix_position_portfolio_id", "position", ["portfolio_id"], False, None),
+    ("ix_position_instrument_id", "position", ["instrument_id"], False, None),
+    ("ix_order_portfolio_id_status", "order", ["portfolio_id", "status"], False, None),
+    ("ix_order_status", "order", ["status"], False, None),
+    ("ix_order_account_id", "order", ["account_id"], False, None),
+    ("ix_order_position_id", "order", ["position_id"], False, None),
+    ("ix_orderleg_parent_id", "orderleg", ["parent_id"], False, None),
+    (
+        "ix_trade_portfolio_id_instrument_id",
+        "trade",
+        ["portfolio_id", "instrument_id"],
+        False,
+        None,
+    ),
+    ("ix_trade_instrument_id", "trade", ["instrument_id"], False, None),
+    ("ix_trade_entry_signal_bar_id", "trade", ["entry_signal_bar_id"], False, None),
+    ("ix_trade_entry_action_bar_id", "trade", ["entry_action_bar_id"], False, None),
+    ("ix_trade_exit_action_bar_id", "trade", ["exit_action_bar_id"], False, None),
+    ("ix_trade_exit_order_id", "trade", ["exit_order_id"], False, None),
+    ("ix_trade_position_id", "trade", ["position_id"], False, None),
+]
+
+
+def _existing_tables():
+    return set(sa.inspect(op.get_bind()).get_table_names())
+
+
+def upgrade():
+    # The trading tables have so far been created from the SQLModel metadata
+    # rather than by a migration, skip the ones a database does not have yet.
+    tables = _existing_tables()
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique, using in INDEXES:
+            if table not in tables:
+                continue
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=unique,
+                if_not_exists=True,
+                postgresql_concurrently=True,
+                postgresql_using=using,
+            )
+
+
+def downgrade():
+    tables = _existing_tables()
+    with op.get_context().autocommit_block():
+        for name, table, _, _, _ in reversed(INDEXES):
+            if table not in tables:
+                continue
+            op.drop_index(
+                name, table_name=table, if_exists=True, postgresql_concurrently=True
+            )
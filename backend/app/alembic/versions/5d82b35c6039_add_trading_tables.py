@@ -0,0 +1,417 @@
+"""Add trading tables
+
+Revision ID: 5d82b35c6039
+Revises: 3506e3ec7a56
+Create Date: 2026-10-19 10:02:17.504121
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+from sqlalchemy.dialects import postgresql
+
+from app.core.migrations import (
+    add_column,
+    add_foreign_key_not_valid,
+    validate_constraint,
+)
+
+
+# revision identifiers, used by Alembic.
+revision = "5d82b35c6039"
+down_revision = "3506e3ec7a56"
+branch_labels = None
+depends_on = None
+
+
+TABLES = [
+    "account",
+    "company",
+    "exchange",
+    "portfolio",
+    "finstatement",
+    "instrument",
+    "chart",
+    "finstatementlineitem",
+    "position",
+    "bar",
+    "order",
+    "orderleg",
+    "trade",
+]
+ENUMS = [
+    "fstype",
+    "assettype",
+    "chartinterval",
+    "positiondirection",
+    "ordertype",
+    "qtyunits",
+    "timeinforce",
+    "orderside",
+    "ordergrouptype",
+]
+
+
+def _create_table(name, *elements):
+    # Existing deployments created these tables from the SQLModel metadata,
+    # only create the ones that are missing. Indexes are added concurrently
+    # by the next revision.
+    if sa.inspect(op.get_bind()).has_table(name):
+        return
+    op.create_table(name, *elements)
+
+
+def _add_missing_column(table, column):
+    columns = {c["name"] for c in sa.inspect(op.get_bind()).get_columns(table)}
+    if column.name not in columns:
+        add_column(table, column)
+
+
+def _upgrade_existing_tables():
+    # Columns added to the models after deployments started creating the
+    # tables from the metadata. All are nullable or have a constant default,
+    # so none of them rewrites the table.
+    bind = op.get_bind()
+    sa.Enum("BUY", "SELL", name="orderside").create(bind, checkfirst=True)
+    sa.Enum("BRACKET", "OCO", name="ordergrouptype").create(bind, checkfirst=True)
+    _add_missing_column(
+        "order",
+        sa.Column(
+            "side",
+            postgresql.ENUM("BUY", "SELL", name="orderside", create_type=False),
+            nullable=False,
+            server_default="BUY",
+        ),
+    )
+    _add_missing_column(
+        "order",
+        sa.Column(
+            "group_type",
+            postgresql.ENUM("BRACKET", "OCO", name="ordergrouptype", create_type=False),
+            nullable=True,
+        ),
+    )
+    _add_missing_column(
+        "order", sa.Column("broker_order_id", sa.Integer(), nullable=True)
+    )
+    _add_missing_column(
+        "orderleg", sa.Column("broker_order_id", sa.Integer(), nullable=True)
+    )
+
+    foreign_keys = {fk["name"] for fk in sa.inspect(bind).get_foreign_keys("position")}
+    _add_missing_column(
+        "position", sa.Column("instrument_id", sa.Integer(), nullable=True)
+    )
+    if "position_instrument_id_fkey" not in foreign_keys:
+        add_foreign_key_not_valid(
+            "position_instrument_id_fkey",
+            "position",
+            "instrument",
+            ["instrument_id"],
+            ["id"],
+        )
+        validate_constraint("position", "position_instrument_id_fkey")
+
+
+def upgrade():
+    _create_table(
+        "account",
+        sa.Column("broker", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("buying_power", sa.Float(), nullable=False),
+        sa.Column("cash", sa.Float(), nullable=False),
+        sa.Column("currency", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("daytrade_count", sa.Integer(), nullable=False),
+        sa.Column("equity", sa.Float(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("portfolio_id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "company",
+        sa.Column("name", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("sector", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("subsector", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("market_cap", sa.Float(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "exchange",
+        sa.Column("code", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("name", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("market", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "portfolio",
+        sa.Column("cash", sa.Float(), nullable=False),
+        sa.Column("equity", sa.Float(), nullable=False),
+        sa.Column("profit", sa.Float(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "finstatement",
+        sa.Column(
+            "st_type",
+            sa.Enum("BALANCE_SHEET", "INCOME", "CASHFLOW", name="fstype"),
+            nullable=False,
+        ),
+        sa.Column("qtr", sa.Integer(), nullable=False),
+        sa.Column("year", sa.Integer(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["company_id"],
+            ["company.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "instrument",
+        sa.Column("symbol", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column(
+            "asset_type",
+            sa.Enum(
+                "EQUITY",
+                "OPTION",
+                "COMMODITY",
+                "FOREX",
+                "CFD",
+                "CRYPTO",
+                "CRYPTO_FUTURE",
+                "FUTURE",
+                "FUTURE_OPTION",
+                "INDEX",
+                "INDEX_OPTION",
+                "ETF",
+                name="assettype",
+            ),
+            nullable=False,
+        ),
+        sa.Column("currency", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("exchange", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("root", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("underlying", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("avg_daily_volume", sa.Float(), nullable=True),
+        sa.Column("one_year_return", sa.Float(), nullable=True),
+        sa.Column("one_month_return", sa.Float(), nullable=True),
+        sa.Column("one_week_return", sa.Float(), nullable=True),
+        sa.Column("one_day_return", sa.Float(), nullable=True),
+        sa.Column("metric_52_high", sa.Float(), nullable=True),
+        sa.Column("metric_52_low", sa.Float(), nullable=True),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["company_id"],
+            ["company.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "chart",
+        sa.Column(
+            "interval",
+            sa.Enum(
+                "Min_5",
+                "Min_15",
+                "Min_30",
+                "Hourly",
+                "Daily",
+                "Monthly",
+                name="chartinterval",
+            ),
+            nullable=False,
+        ),
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("instrument_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["instrument_id"],
+            ["instrument.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "finstatementlineitem",
+        sa.Column("name", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("parent_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["parent_id"],
+            ["finstatement.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "position",
+        sa.Column(
+            "long_short",
+            sa.Enum("LONG", "SHORT", name="positiondirection"),
+            nullable=False,
+        ),
+        sa.Column("qty", sa.Float(), nullable=False),
+        sa.Column("cost", sa.Float(), nullable=True),
+        sa.Column("market_value", sa.Float(), nullable=True),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("portfolio_id", sa.Integer(), nullable=True),
+        sa.Column("instrument_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["instrument_id"],
+            ["instrument.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["portfolio_id"],
+            ["portfolio.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "bar",
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("loc", sa.Integer(), nullable=False),
+        sa.Column("high", sa.Float(), nullable=False),
+        sa.Column("low", sa.Float(), nullable=False),
+        sa.Column("open", sa.Float(), nullable=False),
+        sa.Column("close", sa.Float(), nullable=False),
+        sa.Column("volume", sa.Float(), nullable=False),
+        sa.Column("downTicks", sa.Float(), nullable=True),
+        sa.Column("downVolume", sa.Float(), nullable=True),
+        sa.Column("totalTicks", sa.Float(), nullable=True),
+        sa.Column("upTicks", sa.Float(), nullable=True),
+        sa.Column("upVolume", sa.Float(), nullable=True),
+        sa.Column("symbol", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("chart_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["chart_id"],
+            ["chart.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "order",
+        sa.Column("currency", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("symbol", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("open_date_time", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column(
+            "order_type",
+            sa.Enum("LIMIT", "MARKET", "STOP", name="ordertype"),
+            nullable=False,
+        ),
+        sa.Column("qty", sa.Float(), nullable=False),
+        sa.Column("price", sa.Float(), nullable=False),
+        sa.Column("unit", sa.Enum("SHARES", "USD", name="qtyunits"), nullable=False),
+        sa.Column(
+            "time_in_force", sa.Enum("DAY", "GTC", name="timeinforce"), nullable=False
+        ),
+        sa.Column("status", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("side", sa.Enum("BUY", "SELL", name="orderside"), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column(
+            "group_type",
+            sa.Enum("BRACKET", "OCO", name="ordergrouptype"),
+            nullable=True,
+        ),
+        sa.Column("broker_order_id", sa.Integer(), nullable=True),
+        sa.Column("portfolio_id", sa.Integer(), nullable=True),
+        sa.Column("account_id", sa.Integer(), nullable=True),
+        sa.Column("position_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["account.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["portfolio_id"],
+            ["portfolio.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["position_id"],
+            ["position.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "orderleg",
+        sa.Column(
+            "order_type",
+            sa.Enum("LIMIT", "MARKET", "STOP", name="ordertype"),
+            nullable=False,
+        ),
+        sa.Column("qty", sa.Float(), nullable=False),
+        sa.Column("price", sa.Float(), nullable=False),
+        sa.Column("status", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("broker_order_id", sa.Integer(), nullable=True),
+        sa.Column("parent_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["parent_id"],
+            ["order.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _create_table(
+        "trade",
+        sa.Column("qty", sa.Float(), nullable=False),
+        sa.Column("entry_price", sa.Float(), nullable=False),
+        sa.Column("exit_price", sa.Float(), nullable=False),
+        sa.Column(
+            "direction",
+            sa.Enum("LONG", "SHORT", name="positiondirection"),
+            nullable=False,
+        ),
+        sa.Column("profit_loss", sa.Float(), nullable=True),
+        sa.Column("total_fees", sa.Float(), nullable=True),
+        sa.Column("mea", sa.Float(), nullable=True),
+        sa.Column("mfe", sa.Float(), nullable=True),
+        sa.Column("is_win", sa.Boolean(), nullable=True),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("portfolio_id", sa.Integer(), nullable=True),
+        sa.Column("instrument_id", sa.Integer(), nullable=True),
+        sa.Column("entry_signal_bar_id", sa.Integer(), nullable=True),
+        sa.Column("entry_action_bar_id", sa.Integer(), nullable=True),
+        sa.Column("exit_action_bar_id", sa.Integer(), nullable=True),
+        sa.Column("exit_order_id", sa.Integer(), nullable=True),
+        sa.Column("position_id", sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["entry_action_bar_id"],
+            ["bar.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["entry_signal_bar_id"],
+            ["bar.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["exit_action_bar_id"],
+            ["bar.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["exit_order_id"],
+            ["order.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["instrument_id"],
+            ["instrument.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["portfolio_id"],
+            ["portfolio.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["position_id"],
+            ["position.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    _upgrade_existing_tables()
+
+
+def downgrade():
+    for name in reversed(TABLES):
+        if sa.inspect(op.get_bind()).has_table(name):
+            op.drop_table(name)
+    for name in ENUMS:
+        sa.Enum(name=name).drop(op.get_bind(), checkfirst=True)
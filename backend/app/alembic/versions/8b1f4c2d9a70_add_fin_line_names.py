@@ -0,0 +1,68 @@
+"""Add financial statement line name dictionary
+
+Revision ID: 8b1f4c2d9a70
+Revises: f1c9a3e5b702
+Create Date: 2026-10-19 13:41:05.227316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+from app.core.migrations import (
+    add_column,
+    add_foreign_key_not_valid,
+    backfill,
+    create_index_concurrently,
+    drop_index_concurrently,
+    validate_constraint,
+)
+
+
+# revision identifiers, used by Alembic.
+revision = "8b1f4c2d9a70"
+down_revision = "f1c9a3e5b702"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "finlinename",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    add_column(
+        "finstatementlineitem", sa.Column("name_id", sa.Integer(), nullable=True)
+    )
+    add_foreign_key_not_valid(
+        "finstatementlineitem_name_id_fkey",
+        "finstatementlineitem",
+        "finlinename",
+        ["name_id"],
+        ["id"],
+    )
+    op.execute(
+        "INSERT INTO finlinename (name) SELECT DISTINCT name FROM finstatementlineitem ORDER BY name "
+        "ON CONFLICT (name) DO NOTHING"
+    )
+    backfill(
+        "finstatementlineitem",
+        "name_id = (SELECT f.id FROM finlinename f WHERE f.name = finstatementlineitem.name)",
+        "name_id IS NULL",
+    )
+    validate_constraint("finstatementlineitem", "finstatementlineitem_name_id_fkey")
+    create_index_concurrently(
+        "ix_finstatementlineitem_name_id", "finstatementlineitem", ["name_id"]
+    )
+
+
+def downgrade():
+    drop_index_concurrently("ix_finstatementlineitem_name_id", "finstatementlineitem")
+    op.drop_constraint(
+        "finstatementlineitem_name_id_fkey", "finstatementlineitem", type_="foreignkey"
+    )
+    op.drop_column("finstatementlineitem", "name_id")
+    op.drop_table("finlinename")
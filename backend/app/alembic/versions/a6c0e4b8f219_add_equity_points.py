@@ -0,0 +1,43 @@
+"""Add materialized portfolio equity curves
+
+Revision ID: a6c0e4b8f219
+Revises: f3a8d2c61e07
+Create Date: 2026-10-19 19:06:52.381447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "a6c0e4b8f219"
+down_revision = "f3a8d2c61e07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "equitypoint",
+        sa.Column("timestamp", sa.DateTime(), nullable=False),
+        sa.Column("equity", sa.Float(), nullable=False),
+        sa.Column("drawdown", sa.Float(), nullable=False),
+        sa.Column("portfolio_id", sa.Integer(), nullable=False),
+        sa.Column("seq", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["portfolio_id"],
+            ["portfolio.id"],
+        ),
+        sa.PrimaryKeyConstraint("portfolio_id", "seq"),
+    )
+    op.create_index(
+        "ix_equitypoint_portfolio_id_timestamp",
+        "equitypoint",
+        ["portfolio_id", "timestamp"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_equitypoint_portfolio_id_timestamp", table_name="equitypoint")
+    op.drop_table("equitypoint")
@@ -0,0 +1,44 @@
+"""Add the executions applied by the ledger
+
+Revision ID: a9d4e6f1b358
+Revises: e8b4c2f7a913
+Create Date: 2026-10-19 14:12:37.581904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = "a9d4e6f1b358"
+down_revision = "e8b4c2f7a913"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "execution",
+        sa.Column("exec_id", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("portfolio_id", sa.Integer(), nullable=False),
+        sa.Column("instrument_id", sa.Integer(), nullable=False),
+        sa.Column("applied_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["instrument_id"],
+            ["instrument.id"],
+        ),
+        sa.ForeignKeyConstraint(
+            ["portfolio_id"],
+            ["portfolio.id"],
+        ),
+        sa.PrimaryKeyConstraint("exec_id"),
+    )
+    op.create_index(
+        op.f("ix_execution_applied_at"), "execution", ["applied_at"], unique=False
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_execution_applied_at"), table_name="execution")
+    op.drop_table("execution")
@@ -0,0 +1,59 @@
+"""Add daily P&L rollups per portfolio and account
+
+Revision ID: b7d2e9a4c160
+Revises: a6c0e4b8f219
+Create Date: 2026-10-19 21:12:40.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "b7d2e9a4c160"
+down_revision = "a6c0e4b8f219"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "portfoliodailypnl",
+        sa.Column("trades", sa.Integer(), nullable=False),
+        sa.Column("wins", sa.Integer(), nullable=False),
+        sa.Column("profit_loss", sa.Float(), nullable=False),
+        sa.Column("total_fees", sa.Float(), nullable=False),
+        sa.Column("portfolio_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["portfolio_id"],
+            ["portfolio.id"],
+        ),
+        sa.PrimaryKeyConstraint("portfolio_id", "day"),
+    )
+    op.create_table(
+        "accountdailypnl",
+        sa.Column("trades", sa.Integer(), nullable=False),
+        sa.Column("wins", sa.Integer(), nullable=False),
+        sa.Column("profit_loss", sa.Float(), nullable=False),
+        sa.Column("total_fees", sa.Float(), nullable=False),
+        sa.Column("account_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["account.id"],
+        ),
+        sa.PrimaryKeyConstraint("account_id", "day"),
+    )
+    # the range rebuild deletes by day across all portfolios and accounts
+    op.create_index(
+        "ix_portfoliodailypnl_day", "portfoliodailypnl", ["day"], unique=False
+    )
+    op.create_index("ix_accountdailypnl_day", "accountdailypnl", ["day"], unique=False)
+
+
+def downgrade():
+    op.drop_index("ix_accountdailypnl_day", table_name="accountdailypnl")
+    op.drop_index("ix_portfoliodailypnl_day", table_name="portfoliodailypnl")
+    op.drop_table("accountdailypnl")
+    op.drop_table("portfoliodailypnl")
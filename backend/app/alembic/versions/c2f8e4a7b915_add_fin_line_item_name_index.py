@@ -0,0 +1,53 @@
+"""Add unique financial statement line item name index
+
+Revision ID: c2f8e4a7b915
+Revises: a9d4e6f1b358
+Create Date: 2026-10-19 21:12:47.518093
+
+"""
+from alembic import op
+
+from app.core.migrations import (
+    backfill,
+    create_index_concurrently,
+    drop_index_concurrently,
+)
+
+
+# revision identifiers, used by Alembic.
+revision = "c2f8e4a7b915"
+down_revision = "a9d4e6f1b358"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # line items written since the dictionary was added, outside the importer
+    op.execute(
+        "INSERT INTO finlinename (name) SELECT DISTINCT name FROM finstatementlineitem "
+        "WHERE name_id IS NULL ORDER BY name ON CONFLICT (name) DO NOTHING"
+    )
+    backfill(
+        "finstatementlineitem",
+        "name_id = (SELECT f.id FROM finlinename f WHERE f.name = finstatementlineitem.name)",
+        "name_id IS NULL",
+    )
+    # the importer added a second line item next to those without a name_id,
+    # keep the one it wrote last
+    op.execute(
+        "DELETE FROM finstatementlineitem li USING finstatementlineitem newer "
+        "WHERE newer.parent_id = li.parent_id AND newer.name_id = li.name_id "
+        "AND newer.id > li.id"
+    )
+    create_index_concurrently(
+        "ix_finstatementlineitem_parent_id_name_id",
+        "finstatementlineitem",
+        ["parent_id", "name_id"],
+        unique=True,
+    )
+
+
+def downgrade():
+    drop_index_concurrently(
+        "ix_finstatementlineitem_parent_id_name_id", "finstatementlineitem"
+    )
@@ -0,0 +1,54 @@
+"""Add precomputed financial ratios
+
+Revision ID: c4e7a1d93b25
+Revises: 8b1f4c2d9a70
+Create Date: 2026-10-19 15:02:47.618204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "c4e7a1d93b25"
+down_revision = "8b1f4c2d9a70"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "finratio",
+        sa.Column("year", sa.Integer(), nullable=False),
+        sa.Column("qtr", sa.Integer(), nullable=False),
+        sa.Column("revenue_ttm", sa.Float(), nullable=True),
+        sa.Column("gross_profit_ttm", sa.Float(), nullable=True),
+        sa.Column("operating_income_ttm", sa.Float(), nullable=True),
+        sa.Column("net_income_ttm", sa.Float(), nullable=True),
+        sa.Column("total_equity", sa.Float(), nullable=True),
+        sa.Column("total_debt", sa.Float(), nullable=True),
+        sa.Column("gross_margin", sa.Float(), nullable=True),
+        sa.Column("operating_margin", sa.Float(), nullable=True),
+        sa.Column("net_margin", sa.Float(), nullable=True),
+        sa.Column("roe", sa.Float(), nullable=True),
+        sa.Column("debt_to_equity", sa.Float(), nullable=True),
+        sa.Column("pe", sa.Float(), nullable=True),
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("company_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["company_id"],
+            ["company.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(
+        "ix_finratio_company_id_year_qtr",
+        "finratio",
+        ["company_id", "year", "qtr"],
+        unique=True,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_finratio_company_id_year_qtr", table_name="finratio")
+    op.drop_table("finratio")
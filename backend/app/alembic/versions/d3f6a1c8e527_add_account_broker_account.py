@@ -0,0 +1,32 @@
+"""Link accounts to their broker account
+
+Revision ID: d3f6a1c8e527
+Revises: b7d2e9a4c160
+Create Date: 2026-10-19 22:03:17.502914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = "d3f6a1c8e527"
+down_revision = "b7d2e9a4c160"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "account",
+        sa.Column("broker_account", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    )
+    op.create_index(
+        op.f("ix_account_broker_account"), "account", ["broker_account"], unique=True
+    )
+
+
+def downgrade():
+    op.drop_index(op.f("ix_account_broker_account"), table_name="account")
+    op.drop_column("account", "broker_account")
@@ -0,0 +1,49 @@
+"""Add order versions and a journal name to the drained journal events
+
+Revision ID: d8a3f6c1e290
+Revises: c2f8e4a7b915
+Create Date: 2026-10-19 22:04:31.672958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+from app.core.migrations import add_column, lock_timeout
+
+
+# revision identifiers, used by Alembic.
+revision = "d8a3f6c1e290"
+down_revision = "c2f8e4a7b915"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    add_column(
+        "order",
+        sa.Column("version", sa.Integer(), nullable=False, server_default="0"),
+    )
+    # the events drained so far all came from the fill journal
+    add_column(
+        "journalevent",
+        sa.Column(
+            "journal",
+            sqlmodel.sql.sqltypes.AutoString(),
+            nullable=False,
+            server_default="fills",
+        ),
+    )
+    with lock_timeout():
+        op.drop_constraint("journalevent_pkey", "journalevent", type_="primary")
+        op.create_primary_key("journalevent_pkey", "journalevent", ["journal", "seq"])
+        op.alter_column("journalevent", "journal", server_default=None)
+
+
+def downgrade():
+    op.execute("DELETE FROM journalevent WHERE journal <> 'fills'")
+    with lock_timeout():
+        op.drop_constraint("journalevent_pkey", "journalevent", type_="primary")
+        op.create_primary_key("journalevent_pkey", "journalevent", ["seq"])
+    op.drop_column("journalevent", "journal")
+    op.drop_column("order", "version")
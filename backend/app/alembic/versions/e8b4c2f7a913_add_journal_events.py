@@ -0,0 +1,32 @@
+"""Add the drained order and fill journal events
+
+Revision ID: e8b4c2f7a913
+Revises: d3f6a1c8e527
+Create Date: 2026-10-19 23:41:05.263718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = "e8b4c2f7a913"
+down_revision = "d3f6a1c8e527"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "journalevent",
+        sa.Column("seq", sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column("kind", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("data", sa.JSON(), nullable=False),
+        sa.Column("recorded_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("seq"),
+    )
+
+
+def downgrade():
+    op.drop_table("journalevent")
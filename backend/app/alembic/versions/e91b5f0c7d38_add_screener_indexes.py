@@ -0,0 +1,34 @@
+"""Add instrument screener indexes
+
+Revision ID: e91b5f0c7d38
+Revises: c4e7a1d93b25
+Create Date: 2026-10-19 16:25:11.904372
+
+"""
+from app.core.migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision = "e91b5f0c7d38"
+down_revision = "c4e7a1d93b25"
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns)
+INDEXES = [
+    ("ix_instrument_asset_type_exchange", "instrument", ["asset_type", "exchange"]),
+    ("ix_instrument_avg_daily_volume", "instrument", ["avg_daily_volume"]),
+    ("ix_company_sector_subsector", "company", ["sector", "subsector"]),
+    ("ix_company_market_cap", "company", ["market_cap"]),
+]
+
+
+def upgrade():
+    for name, table, columns in INDEXES:
+        create_index_concurrently(name, table, columns)
+
+
+def downgrade():
+    for name, table, _ in reversed(INDEXES):
+        drop_index_concurrently(name, table)
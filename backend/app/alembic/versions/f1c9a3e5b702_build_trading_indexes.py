@@ -0,0 +1,81 @@
+"""Build trading indexes
+
+Revision ID: f1c9a3e5b702
+Revises: 5d82b35c6039
+Create Date: 2026-10-19 10:24:51.907316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+from app.core.migrations import create_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision = "f1c9a3e5b702"
+down_revision = "5d82b35c6039"
+branch_labels = None
+depends_on = None
+
+
+# The indexes of 3506e3ec7a56, which skipped the tables a database did not
+# have yet. Now that the previous revision created them, build the missing ones.
+# (name, table, columns, unique, postgresql_using)
+INDEXES = [
+    (
+        "ix_finstatement_company_id_st_type_year_qtr",
+        "finstatement",
+        ["company_id", "st_type", "year", "qtr"],
+        True,
+        None,
+    ),
+    (
+        "ix_finstatementlineitem_parent_id",
+        "finstatementlineitem",
+        ["parent_id"],
+        False,
+        None,
+    ),
+    ("ix_instrument_symbol", "instrument", ["symbol"], False, None),
+    ("ix_instrument_company_id", "instrument", ["company_id"], False, None),
+    (
+        "ix_chart_instrument_id_interval",
+        "chart",
+        ["instrument_id", "interval"],
+        False,
+        None,
+    ),
+    ("ix_bar_chart_id_timestamp", "bar", ["chart_id", "timestamp"], False, None),
+    ("ix_bar_timestamp", "bar", ["timestamp"], False, "brin"),
+    ("ix_position_portfolio_id", "position", ["portfolio_id"], False, None),
+    ("ix_position_instrument_id", "position", ["instrument_id"], False, None),
+    ("ix_order_portfolio_id_status", "order", ["portfolio_id", "status"], False, None),
+    ("ix_order_status", "order", ["status"], False, None),
+    ("ix_order_account_id", "order", ["account_id"], False, None),
+    ("ix_order_position_id", "order", ["position_id"], False, None),
+    ("ix_orderleg_parent_id", "orderleg", ["parent_id"], False, None),
+    (
+        "ix_trade_portfolio_id_instrument_id",
+        "trade",
+        ["portfolio_id", "instrument_id"],
+        False,
+        None,
+    ),
+    ("ix_trade_instrument_id", "trade", ["instrument_id"], False, None),
+    ("ix_trade_entry_signal_bar_id", "trade", ["entry_signal_bar_id"], False, None),
+    ("ix_trade_entry_action_bar_id", "trade", ["entry_action_bar_id"], False, None),
+    ("ix_trade_exit_action_bar_id", "trade", ["exit_action_bar_id"], False, None),
+    ("ix_trade_exit_order_id", "trade", ["exit_order_id"], False, None),
+    ("ix_trade_position_id", "trade", ["position_id"], False, None),
+]
+
+
+def upgrade():
+    for name, table, columns, unique, using in INDEXES:
+        create_index_concurrently(name, table, columns, unique=unique, using=using)
+
+
+def downgrade():
+    # 3506e3ec7a56 drops them, the ones it built as well as these
+    pass
@@ -0,0 +1,40 @@
+"""Add trigram indexes for symbol and company name search
+
+Revision ID: f3a8d2c61e07
+Revises: e91b5f0c7d38
+Create Date: 2026-10-19 17:48:30.512976
+
+"""
+from alembic import op
+
+from app.core.migrations import create_index_concurrently, drop_index_concurrently
+
+
+# revision identifiers, used by Alembic.
+revision = "f3a8d2c61e07"
+down_revision = "e91b5f0c7d38"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    create_index_concurrently(
+        "ix_instrument_symbol_trgm",
+        "instrument",
+        ["symbol"],
+        using="gin",
+        ops={"symbol": "gin_trgm_ops"},
+    )
+    create_index_concurrently(
+        "ix_company_name_trgm",
+        "company",
+        ["name"],
+        using="gin",
+        ops={"name": "gin_trgm_ops"},
+    )
+
+
+def downgrade():
+    drop_index_concurrently("ix_company_name_trgm", "company")
+    drop_index_concurrently("ix_instrument_symbol_trgm", "instrument")
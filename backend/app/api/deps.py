@@ -1,4 +1,5 @@
 from collections.abc import Generator
+from functools import lru_cache
 from typing import Annotated
 
 from fastapi import Depends, HTTPException, status
@@ -7,9 +8,12 @@ from jose import JWTError, jwt
 from pydantic import ValidationError
 from sqlmodel import Session
 
+from app.adopters.broker import create_broker
 from app.core import security
+from app.core.broker_adopters import Broker
 from app.core.config import settings
-from app.core.db import engine
+from app.core.db import engine, replica_router
+from app.core.risk import RiskEngine, risk_engine
 from app.models import TokenPayload, User
 
 reusable_oauth2 = OAuth2PasswordBearer(
@@ -22,10 +26,33 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+def get_read_db() -> Generator[Session, None, None]:
+    with Session(replica_router.engine()) as session:
+        yield session
+
+
 SessionDep = Annotated[Session, Depends(get_db)]
+# may lag the primary by up to REPLICA_MAX_LAG_SECONDS, never write through it
+ReadSessionDep = Annotated[Session, Depends(get_read_db)]
 TokenDep = Annotated[str, Depends(reusable_oauth2)]
 
 
+@lru_cache
+def get_broker() -> Broker:
+    return create_broker()
+
+
+BrokerDep = Annotated[Broker, Depends(get_broker)]
+
+
+def get_risk_engine() -> RiskEngine | None:
+    return risk_engine if settings.RISK_CHECKS_ENABLED else None
+
+
+# None when the pre-trade risk checks are turned off
+RiskDep = Annotated[RiskEngine | None, Depends(get_risk_engine)]
+
+
 def get_current_user(session: SessionDep, token: TokenDep) -> User:
     try:
         payload = jwt.decode(
@@ -54,3 +81,11 @@ def get_current_active_superuser(current_user: CurrentUser) -> User:
             status_code=403, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+def get_trading_user(current_user: CurrentUser) -> User:
+    """
+    Accounts and portfolios, with their orders, trades and positions, have
+    no owner yet. Until they do, only superusers may see or trade them.
+    """
+    return get_current_active_superuser(current_user)
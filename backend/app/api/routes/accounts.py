@@ -1,47 +1,44 @@
+from datetime import date
 from typing import Any
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import func, select
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Account, AccountCreate, AccountPublic, AccountsPublic, AccountUpdate, Message
+from app.api.deps import ReadSessionDep, SessionDep, get_trading_user
+from app.core.account_sync import account_sync
+from app.core.pnl_rollups import account_pnl
+from app.models import (
+    Account,
+    AccountCreate,
+    AccountPublic,
+    AccountsPublic,
+    AccountUpdate,
+    Message,
+    PnlPeriods,
+    TradeGroup,
+)
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(get_trading_user)])
 
 
 @router.get("/", response_model=AccountsPublic)
 def read_accounts(
-        session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+        session: ReadSessionDep, skip: int = 0, limit: int = 100
 ) -> Any:
     """
     Retrieve accounts.
     """
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Account)
-        count = session.exec(count_statement).one()
-        statement = select(Account).offset(skip).limit(limit)
-        accounts = session.exec(statement).all()
-    else:
-        count_statement = (
-            select(func.count())
-            .select_from(Account)
-            .where(Account.owner_id == current_user.id)
-        )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Account)
-            .where(Account.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
-        )
-        accounts = session.exec(statement).all()
+    count_statement = select(func.count()).select_from(Account)
+    count = session.exec(count_statement).one()
+    statement = select(Account).offset(skip).limit(limit)
+    accounts = session.exec(statement).all()
 
     return AccountsPublic(data=accounts, count=count)
 
 
 @router.get("/{id}", response_model=AccountPublic)
-def read_account(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
+def read_account(session: ReadSessionDep, id: int) -> Any:
     """
     Get account by ID.
     """
@@ -49,28 +46,28 @@ def read_account(session: SessionDep, current_user: CurrentUser, id: int) -> Any
     account = session.get(Account, id)
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
-    if not current_user.is_superuser and (account.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
     return account
 
 
 @router.post("/", response_model=AccountPublic)
 def create_account(
-        *, session: SessionDep, current_user: CurrentUser, account_in: AccountCreate
+        *, session: SessionDep, account_in: AccountCreate
 ) -> Any:
     """
     Create new account.
     """
-    account = Account.model_validate(account_in, update={"owner_id": current_user.id})
+    account = Account.model_validate(account_in)
     session.add(account)
     session.commit()
     session.refresh(account)
+    if account.broker_account is not None:
+        account_sync.track(account)
     return account
 
 
 @router.put("/{id}", response_model=AccountPublic)
 def update_account(
-        *, session: SessionDep, current_user: CurrentUser, id: int, account_in: AccountUpdate
+        *, session: SessionDep, id: int, account_in: AccountUpdate
 ) -> Any:
     """
     Update an account.
@@ -78,26 +75,44 @@ def update_account(
     account = session.get(Account, id)
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
-    if not current_user.is_superuser and (account.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
     update_dict = account_in.model_dump(exclude_unset=True)
     account.sqlmodel_update(update_dict)
     session.add(account)
     session.commit()
     session.refresh(account)
+    if account.broker_account is not None:
+        account_sync.track(account)
     return account
 
 
 @router.delete("/{id}")
-def delete_account(session: SessionDep, current_user: CurrentUser, id: int) -> Message:
+def delete_account(session: SessionDep, id: int) -> Message:
     """
     Delete an account.
     """
     account = session.get(Account, id)
     if not account:
         raise HTTPException(status_code=404, detail="Account not found")
-    if not current_user.is_superuser and (account.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
     session.delete(account)
     session.commit()
     return Message(message="Account deleted successfully")
+
+
+@router.get("/{id}/pnl", response_model=PnlPeriods)
+def read_account_pnl(
+        session: ReadSessionDep,
+        id: int,
+        start: date | None = None,
+        end: date | None = None,
+        period: TradeGroup = TradeGroup.DAY,
+) -> Any:
+    """
+    Get the realized P&L over the portfolios of an account per day, week or
+    month in [start, end).
+    """
+    if not session.get(Account, id):
+        raise HTTPException(status_code=404, detail="Account not found")
+    try:
+        return account_pnl(session, id, start, end, period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,79 @@
+import asyncio
+from collections.abc import AsyncIterator
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlmodel import col, select
+
+from app.api.deps import ReadSessionDep, get_trading_user
+from app.core.config import settings
+from app.core.push import PushSubscription, push_hub
+from app.models import Account, Portfolio
+
+router = APIRouter(dependencies=[Depends(get_trading_user)])
+
+
+def stream_filters(
+    session: ReadSessionDep,
+    portfolio_id: list[int] = Query(default=[]),
+    account_id: list[int] = Query(default=[]),
+) -> tuple[list[int], list[int]]:
+    """
+    The portfolios and accounts a stream asks for, all of them have to exist.
+    """
+    if portfolio_id:
+        found = session.exec(
+            select(Portfolio.id).where(col(Portfolio.id).in_(portfolio_id))
+        ).all()
+        if missing := set(portfolio_id) - set(found):
+            raise HTTPException(
+                status_code=404, detail=f"Portfolios not found: {sorted(missing)}"
+            )
+    if account_id:
+        found = session.exec(
+            select(Account.id).where(col(Account.id).in_(account_id))
+        ).all()
+        if missing := set(account_id) - set(found):
+            raise HTTPException(
+                status_code=404, detail=f"Accounts not found: {sorted(missing)}"
+            )
+    return portfolio_id, account_id
+
+
+async def _stream(subscription: PushSubscription) -> AsyncIterator[str]:
+    try:
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.get(), settings.PUSH_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                # keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                continue
+            yield push_hub.encode(event)
+    finally:
+        push_hub.unsubscribe(subscription)
+
+
+@router.get("/stream")
+async def stream_events(
+    filters: tuple[list[int], list[int]] = Depends(stream_filters),
+    after: str | None = None,
+    last_event_id: str | None = Header(default=None),
+) -> StreamingResponse:
+    """
+    Server-sent events of order status changes, fills and position updates
+    of the given portfolios and accounts, all of them when none is given.
+    A reconnecting client resumes after the event id in Last-Event-ID, or
+    in after, and gets a reset event when it has to refetch instead.
+    """
+    portfolio_ids, account_ids = filters
+    subscription = push_hub.subscribe(
+        portfolio_ids, account_ids, last_event_id or after
+    )
+    return StreamingResponse(
+        _stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,75 +1,91 @@
 from typing import Any
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import func, select
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Instrument, InstrumentCreate, InstrumentPublic, InstrumentsPublic, InstrumentUpdate, Message
+from app.api.deps import (
+    ReadSessionDep,
+    SessionDep,
+    get_current_active_superuser,
+    get_current_user,
+)
+from app.core.config import settings
+from app.core.screener import screen_instruments
+from app.core.search import search_instruments
+from app.models import (
+    Instrument,
+    InstrumentCreate,
+    InstrumentPublic,
+    InstrumentScreen,
+    InstrumentSearchHit,
+    InstrumentsPublic,
+    InstrumentUpdate,
+    Message,
+)
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(get_current_user)])
 
 
 @router.get("/", response_model=InstrumentsPublic)
 def read_instruments(
-        session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+        session: ReadSessionDep, skip: int = 0, limit: int = 100
 ) -> Any:
     """
     Retrieve instruments.
     """
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Instrument)
-        count = session.exec(count_statement).one()
-        statement = select(Instrument).offset(skip).limit(limit)
-        instruments = session.exec(statement).all()
-    else:
-        count_statement = (
-            select(func.count())
-            .select_from(Instrument)
-            .where(Instrument.owner_id == current_user.id)
-        )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Instrument)
-            .where(Instrument.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
-        )
-        instruments = session.exec(statement).all()
+    count_statement = select(func.count()).select_from(Instrument)
+    count = session.exec(count_statement).one()
+    statement = select(Instrument).offset(skip).limit(limit)
+    instruments = session.exec(statement).all()
 
     return InstrumentsPublic(data=instruments, count=count)
 
 
+@router.post("/screen", response_model=InstrumentsPublic)
+def screen(session: ReadSessionDep, screen_in: InstrumentScreen) -> Any:
+    """
+    Screen instruments, count is the number of matches before the limit.
+    """
+    return screen_instruments(session, screen_in)
+
+
+@router.get("/search", response_model=list[InstrumentSearchHit])
+def search(session: ReadSessionDep, q: str = Query(min_length=1), limit: int = Query(10, ge=1, le=settings.SEARCH_INDEX_TOP_K)) -> Any:
+    """
+    Typeahead search on symbols and company names, most traded first.
+    """
+    return search_instruments(session, q, limit)
+
+
 @router.get("/{id}", response_model=InstrumentPublic)
-def read_instrument(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
+def read_instrument(session: ReadSessionDep, id: int) -> Any:
     """
     Get instrument by ID.
     """
     instrument = session.get(Instrument, id)
     if not instrument:
         raise HTTPException(status_code=404, detail="Instrument not found")
-    if not current_user.is_superuser and (instrument.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
     return instrument
 
 
-@router.post("/", response_model=InstrumentPublic)
+@router.post("/", dependencies=[Depends(get_current_active_superuser)], response_model=InstrumentPublic)
 def create_instrument(
-        *, session: SessionDep, current_user: CurrentUser, instrument_in: InstrumentCreate
+        *, session: SessionDep, instrument_in: InstrumentCreate
 ) -> Any:
     """
     Create new instrument.
     """
-    instrument = Instrument.model_validate(instrument_in, update={"owner_id": current_user.id})
+    instrument = Instrument.model_validate(instrument_in)
     session.add(instrument)
     session.commit()
     session.refresh(instrument)
     return instrument
 
 
-@router.put("/{id}", response_model=InstrumentPublic)
+@router.put("/{id}", dependencies=[Depends(get_current_active_superuser)], response_model=InstrumentPublic)
 def update_instrument(
-        *, session: SessionDep, current_user: CurrentUser, id: int, instrument_in: InstrumentUpdate
+        *, session: SessionDep, id: int, instrument_in: InstrumentUpdate
 ) -> Any:
     """
     Update an instrument.
@@ -77,8 +93,6 @@ def update_instrument(
     instrument = session.get(Instrument, id)
     if not instrument:
         raise HTTPException(status_code=404, detail="Instrument not found")
-    if not current_user.is_superuser and (instrument.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
     update_dict = instrument_in.model_dump(exclude_unset=True)
     instrument.sqlmodel_update(update_dict)
     session.add(instrument)
@@ -87,16 +101,14 @@ def update_instrument(
     return instrument
 
 
-@router.delete("/{id}")
-def delete_instrument(session: SessionDep, current_user: CurrentUser, id: int) -> Message:
+@router.delete("/{id}", dependencies=[Depends(get_current_active_superuser)])
+def delete_instrument(session: SessionDep, id: int) -> Message:
     """
     Delete an instrument.
     """
     instrument = session.get(Instrument, id)
     if not instrument:
         raise HTTPException(status_code=404, detail="Instrument not found")
-    if not current_user.is_superuser and (instrument.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
     session.delete(instrument)
     session.commit()
     return Message(message="Instrument deleted successfully")
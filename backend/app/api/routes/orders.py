@@ -1,75 +1,90 @@
 from typing import Any
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import func, select
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Order, OrderCreate, OrderPublic, OrdersPublic, OrderUpdate, Message
+from app.api.deps import (
+    BrokerDep,
+    ReadSessionDep,
+    RiskDep,
+    SessionDep,
+    get_trading_user,
+)
+from app.core.broker_adopters import BrokerError
+from app.core.event_bus import publish_order, publish_order_deleted
+from app.core.journal import commit_order, commit_order_deleted
+from app.core.oms import OrderManager
+from app.core.risk import RiskEngine
+from app.models import (
+    Message,
+    Order,
+    OrderCreate,
+    OrderGroupCreate,
+    OrderGroupPublic,
+    OrderPublic,
+    OrdersPublic,
+    OrderUpdate,
+)
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(get_trading_user)])
+
+
+def _refuse_unchecked(risk: RiskEngine | None) -> None:
+    # a single order carries no account to check against, with the risk
+    # checks on every order has to go through the group routes
+    if risk is not None:
+        raise HTTPException(
+            status_code=400,
+            detail="Risk checks are enabled, submit the order as a group",
+        )
 
 
 @router.get("/", response_model=OrdersPublic)
 def read_orders(
-        session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+        session: ReadSessionDep, skip: int = 0, limit: int = 100
 ) -> Any:
     """
     Retrieve orders.
     """
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Order)
-        count = session.exec(count_statement).one()
-        statement = select(Order).offset(skip).limit(limit)
-        orders = session.exec(statement).all()
-    else:
-        count_statement = (
-            select(func.count())
-            .select_from(Order)
-            .where(Order.owner_id == current_user.id)
-        )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Order)
-            .where(Order.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
-        )
-        orders = session.exec(statement).all()
+    count_statement = select(func.count()).select_from(Order)
+    count = session.exec(count_statement).one()
+    statement = select(Order).offset(skip).limit(limit)
+    orders = session.exec(statement).all()
 
     return OrdersPublic(data=orders, count=count)
 
 
 @router.get("/{id}", response_model=OrderPublic)
-def read_order(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
+def read_order(session: ReadSessionDep, id: int) -> Any:
     """
     Get order by ID.
     """
     order = session.get(Order, id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    if not current_user.is_superuser and (order.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
     return order
 
 
 @router.post("/", response_model=OrderPublic)
 def create_order(
-        *, session: SessionDep, current_user: CurrentUser, order_in: OrderCreate
+        *, session: SessionDep, risk: RiskDep, order_in: OrderCreate
 ) -> Any:
     """
     Create new order.
     """
-    order = Order.model_validate(order_in, update={"owner_id": current_user.id})
+    _refuse_unchecked(risk)
+    order = Order.model_validate(order_in)
     session.add(order)
-    session.commit()
+    commit_order(session, order)
     session.refresh(order)
+    publish_order(order)
     return order
 
 
 @router.put("/{id}", response_model=OrderPublic)
 def update_order(
-        *, session: SessionDep, current_user: CurrentUser, id: int, order_in: OrderUpdate
+        *, session: SessionDep, risk: RiskDep, id: int, order_in: OrderUpdate
 ) -> Any:
     """
     Update an order.
@@ -77,26 +92,74 @@ def update_order(
     order = session.get(Order, id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    if not current_user.is_superuser and (order.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    _refuse_unchecked(risk)
     update_dict = order_in.model_dump(exclude_unset=True)
     order.sqlmodel_update(update_dict)
     session.add(order)
-    session.commit()
+    commit_order(session, order)
     session.refresh(order)
+    publish_order(order)
     return order
 
 
 @router.delete("/{id}")
-def delete_order(session: SessionDep, current_user: CurrentUser, id: int) -> Message:
+def delete_order(session: SessionDep, id: int) -> Message:
     """
     Delete an order.
     """
     order = session.get(Order, id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    if not current_user.is_superuser and (order.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    session.delete(order)
-    session.commit()
+    portfolio_id, account_id = order.portfolio_id, order.account_id
+    commit_order_deleted(session, order)
+    publish_order_deleted(id, portfolio_id, account_id)
     return Message(message="Order deleted successfully")
+
+
+@router.post("/group", response_model=OrderGroupPublic)
+def create_order_group(
+        *, session: SessionDep, broker: BrokerDep, risk: RiskDep, order_in: OrderGroupCreate
+) -> Any:
+    """
+    Create a bracket or OCO order with all of its legs in one request.
+    """
+    try:
+        return OrderManager(session, broker, risk).submit_group(order_in)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BrokerError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+
+@router.put("/{id}/group", response_model=OrderGroupPublic)
+def replace_order_group(
+        *, session: SessionDep, broker: BrokerDep, risk: RiskDep, id: int, order_in: OrderGroupCreate
+) -> Any:
+    """
+    Cancel an order group and replace it with new legs.
+    """
+    order = session.get(Order, id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    try:
+        return OrderManager(session, broker, risk).replace_group(order, order_in)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BrokerError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+
+
+@router.post("/{id}/group/cancel", response_model=OrderGroupPublic)
+def cancel_order_group(session: SessionDep, broker: BrokerDep, risk: RiskDep, id: int) -> Any:
+    """
+    Cancel an order and all of its legs.
+    """
+    order = session.get(Order, id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    try:
+        return OrderManager(session, broker, risk).cancel_group(order)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BrokerError as e:
+        raise HTTPException(status_code=502, detail=str(e))
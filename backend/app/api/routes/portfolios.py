@@ -1,66 +1,80 @@
+from datetime import date, datetime
 from typing import Any
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import func, select
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Portfolio, PortfolioCreate, PortfolioPublic, PortfoliosPublic, PortfolioUpdate, Message
+from app.api.deps import ReadSessionDep, SessionDep, get_trading_user
+from app.core.equity import equity_curve
+from app.core.ledger import ledger
+from app.core.loaders import loader_options
+from app.core.pnl_rollups import portfolio_pnl
+from app.core.trade_analytics import portfolio_trade_stats
+from app.core.valuation import valuation_cache, value_portfolio
+from app.models import (
+    EquityCurve,
+    Message,
+    PnlPeriods,
+    Portfolio,
+    PortfolioCreate,
+    PortfolioDetailPublic,
+    PortfolioPublic,
+    PortfoliosPublic,
+    PortfolioUpdate,
+    PortfolioValuation,
+    TradeGroup,
+    TradeStats,
+)
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(get_trading_user)])
 
 
 @router.get("/", response_model=PortfoliosPublic)
 def read_portfolios(
-        session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+        session: ReadSessionDep, skip: int = 0, limit: int = 100
 ) -> Any:
     """
     Retrieve portfolios.
     """
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Portfolio)
-        count = session.exec(count_statement).one()
-        statement = select(Portfolio).offset(skip).limit(limit)
-        portfolios = session.exec(statement).all()
-    else:
-        count_statement = (
-            select(func.count())
-            .select_from(Portfolio)
-            .where(Portfolio.owner_id == current_user.id)
-        )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Portfolio)
-            .where(Portfolio.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
-        )
-        portfolios = session.exec(statement).all()
+    count_statement = select(func.count()).select_from(Portfolio)
+    count = session.exec(count_statement).one()
+    statement = select(Portfolio).offset(skip).limit(limit)
+    portfolios = session.exec(statement).all()
 
     return PortfoliosPublic(data=portfolios, count=count)
 
 
 @router.get("/{id}", response_model=PortfolioPublic)
-def read_portfolio(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
+def read_portfolio(session: ReadSessionDep, id: int) -> Any:
     """
     Get portfolio by ID.
     """
     portfolio = session.get(Portfolio, id)
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
-    if not current_user.is_superuser and (portfolio.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    return portfolio
+
+
+@router.get("/{id}/detail", response_model=PortfolioDetailPublic)
+def read_portfolio_detail(session: ReadSessionDep, id: int) -> Any:
+    """
+    Get a portfolio with its positions and orders.
+    """
+    portfolio = session.get(Portfolio, id, options=loader_options("portfolio.detail"))
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
     return portfolio
 
 
 @router.post("/", response_model=PortfolioPublic)
 def create_portfolio(
-        *, session: SessionDep, current_user: CurrentUser, portfolio_in: PortfolioCreate
+        *, session: SessionDep, portfolio_in: PortfolioCreate
 ) -> Any:
     """
     Create new portfolio.
     """
-    portfolio = Portfolio.model_validate(portfolio_in, update={"owner_id": current_user.id})
+    portfolio = Portfolio.model_validate(portfolio_in)
     session.add(portfolio)
     session.commit()
     session.refresh(portfolio)
@@ -69,7 +83,7 @@ def create_portfolio(
 
 @router.put("/{id}", response_model=PortfolioPublic)
 def update_portfolio(
-        *, session: SessionDep, current_user: CurrentUser, id: int, portfolio_in: PortfolioUpdate
+        *, session: SessionDep, id: int, portfolio_in: PortfolioUpdate
 ) -> Any:
     """
     Update an portfolio.
@@ -77,8 +91,6 @@ def update_portfolio(
     portfolio = session.get(Portfolio, id)
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
-    if not current_user.is_superuser and (portfolio.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
     update_dict = portfolio_in.model_dump(exclude_unset=True)
     portfolio.sqlmodel_update(update_dict)
     session.add(portfolio)
@@ -88,15 +100,80 @@ def update_portfolio(
 
 
 @router.delete("/{id}")
-def delete_portfolio(session: SessionDep, current_user: CurrentUser, id: int) -> Message:
+def delete_portfolio(session: SessionDep, id: int) -> Message:
     """
     Delete an portfolio.
     """
     portfolio = session.get(Portfolio, id)
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
-    if not current_user.is_superuser and (portfolio.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
     session.delete(portfolio)
     session.commit()
     return Message(message="Portfolio deleted successfully")
+
+
+@router.get("/{id}/valuation", response_model=PortfolioValuation)
+def read_portfolio_valuation(
+        session: ReadSessionDep,
+        id: int,
+        confidence: float = Query(default=0.99, gt=0.5, lt=1),
+        horizon_days: int = Query(default=1, ge=1),
+) -> Any:
+    """
+    Get market value, unrealized P&L, exposures and parametric VaR of a portfolio.
+    """
+    if not session.get(Portfolio, id):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    valuation = valuation_cache.get(id, confidence, horizon_days)
+    if valuation is not None:
+        return valuation
+    valuation = value_portfolio(session, id, confidence, horizon_days, live=ledger)
+    valuation_cache.put(valuation)
+    return valuation
+
+
+@router.get("/{id}/trade-stats", response_model=TradeStats)
+def read_portfolio_trade_stats(session: ReadSessionDep, id: int) -> Any:
+    """
+    Get win rate, profit factor, expectancy, max drawdown and Sharpe of the
+    analyzed trades of a portfolio.
+    """
+    if not session.get(Portfolio, id):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return portfolio_trade_stats(session, [id])[0]
+
+
+@router.get("/{id}/equity", response_model=EquityCurve)
+def read_portfolio_equity(
+        session: ReadSessionDep,
+        id: int,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        points: int = Query(default=500, ge=2, le=5000),
+) -> Any:
+    """
+    Get the realized equity and drawdown curve of a portfolio, downsampled to
+    at most points points.
+    """
+    if not session.get(Portfolio, id):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return equity_curve(session, id, start, end, points)
+
+
+@router.get("/{id}/pnl", response_model=PnlPeriods)
+def read_portfolio_pnl(
+        session: ReadSessionDep,
+        id: int,
+        start: date | None = None,
+        end: date | None = None,
+        period: TradeGroup = TradeGroup.DAY,
+) -> Any:
+    """
+    Get the realized P&L of a portfolio per day, week or month in [start, end).
+    """
+    if not session.get(Portfolio, id):
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    try:
+        return portfolio_pnl(session, id, start, end, period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,75 +1,96 @@
+from datetime import datetime
 from typing import Any
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlmodel import func, select
 
-from app.api.deps import CurrentUser, SessionDep
-from app.models import Trade, TradeCreate, TradePublic, TradesPublic, TradeUpdate, Message
+from app.adopters.cache import trade_aggregate_cache
+from app.api.deps import ReadSessionDep, SessionDep, get_trading_user
+from app.core.pnl_rollups import refresh_daily_pnl, trade_days
+from app.core.trade_aggregates import aggregate_trades, invalidate_trade_aggregates
+from app.models import (
+    Message,
+    Trade,
+    TradeAggregates,
+    TradeCreate,
+    TradeGroup,
+    TradePublic,
+    TradesPublic,
+    TradeUpdate,
+)
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(get_trading_user)])
 
 
 @router.get("/", response_model=TradesPublic)
 def read_trades(
-        session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100
+        session: ReadSessionDep, skip: int = 0, limit: int = 100
 ) -> Any:
     """
     Retrieve trades.
     """
 
-    if current_user.is_superuser:
-        count_statement = select(func.count()).select_from(Trade)
-        count = session.exec(count_statement).one()
-        statement = select(Trade).offset(skip).limit(limit)
-        trades = session.exec(statement).all()
-    else:
-        count_statement = (
-            select(func.count())
-            .select_from(Trade)
-            .where(Trade.owner_id == current_user.id)
-        )
-        count = session.exec(count_statement).one()
-        statement = (
-            select(Trade)
-            .where(Trade.owner_id == current_user.id)
-            .offset(skip)
-            .limit(limit)
-        )
-        trades = session.exec(statement).all()
+    count_statement = select(func.count()).select_from(Trade)
+    count = session.exec(count_statement).one()
+    statement = select(Trade).offset(skip).limit(limit)
+    trades = session.exec(statement).all()
 
     return TradesPublic(data=trades, count=count)
 
 
+@router.get("/aggregates", response_model=TradeAggregates)
+def read_trade_aggregates(
+        session: ReadSessionDep,
+        group_by: list[TradeGroup] = Query(default=[]),
+        portfolio_id: int | None = None,
+        instrument_id: int | None = None,
+        start: datetime | None = None,
+        end: datetime | None = None,
+) -> Any:
+    """
+    Trade count, wins, P&L and fees of the closed trades exiting in [start, end),
+    per day, week or month and / or per instrument, direction and portfolio.
+    """
+    try:
+        return aggregate_trades(
+            session, group_by, portfolio_id=portfolio_id, instrument_id=instrument_id, start=start, end=end,
+            cache=trade_aggregate_cache,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/{id}", response_model=TradePublic)
-def read_trade(session: SessionDep, current_user: CurrentUser, id: int) -> Any:
+def read_trade(session: ReadSessionDep, id: int) -> Any:
     """
     Get trade by ID.
     """
     trade = session.get(Trade, id)
     if not trade:
         raise HTTPException(status_code=404, detail="Trade not found")
-    if not current_user.is_superuser and (trade.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
     return trade
 
 
 @router.post("/", response_model=TradePublic)
 def create_trade(
-        *, session: SessionDep, current_user: CurrentUser, trade_in: TradeCreate
+        *, session: SessionDep, trade_in: TradeCreate
 ) -> Any:
     """
     Create new trade.
     """
-    trade = Trade.model_validate(trade_in, update={"owner_id": current_user.id})
+    trade = Trade.model_validate(trade_in)
     session.add(trade)
+    session.flush()
+    refresh_daily_pnl(session, trade_days(session, [trade.id]))
     session.commit()
+    invalidate_trade_aggregates()
     session.refresh(trade)
     return trade
 
 
 @router.put("/{id}", response_model=TradePublic)
 def update_trade(
-        *, session: SessionDep, current_user: CurrentUser, id: int, trade_in: TradeUpdate
+        *, session: SessionDep, id: int, trade_in: TradeUpdate
 ) -> Any:
     """
     Update an trade.
@@ -77,26 +98,30 @@ def update_trade(
     trade = session.get(Trade, id)
     if not trade:
         raise HTTPException(status_code=404, detail="Trade not found")
-    if not current_user.is_superuser and (trade.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    before = trade_days(session, [id])
     update_dict = trade_in.model_dump(exclude_unset=True)
     trade.sqlmodel_update(update_dict)
     session.add(trade)
+    session.flush()
+    refresh_daily_pnl(session, before | trade_days(session, [id]))
     session.commit()
+    invalidate_trade_aggregates()
     session.refresh(trade)
     return trade
 
 
 @router.delete("/{id}")
-def delete_trade(session: SessionDep, current_user: CurrentUser, id: int) -> Message:
+def delete_trade(session: SessionDep, id: int) -> Message:
     """
     Delete an trade.
     """
     trade = session.get(Trade, id)
     if not trade:
         raise HTTPException(status_code=404, detail="Trade not found")
-    if not current_user.is_superuser and (trade.owner_id != current_user.id):
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    before = trade_days(session, [id])
     session.delete(trade)
+    session.flush()
+    refresh_daily_pnl(session, before)
     session.commit()
+    invalidate_trade_aggregates()
     return Message(message="Trade deleted successfully")
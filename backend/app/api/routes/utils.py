@@ -1,8 +1,13 @@
 from fastapi import APIRouter, Depends
 from pydantic.networks import EmailStr
 
-from app.api.deps import get_current_active_superuser
-from app.models import Message
+from app.adopters.cache import reference_cache, trade_aggregate_cache
+from app.api.deps import SessionDep, get_current_active_superuser
+from app.core.event_bus import event_bus
+from app.core.queries import query_stats
+from app.core.risk import risk_engine
+from app.core.screener import instrument_snapshot
+from app.models import CacheStats, Message, QueryStats, RiskStats, TopicStats
 from app.utils import generate_test_email, send_email
 
 router = APIRouter()
@@ -24,3 +29,67 @@ def test_email(email_to: EmailStr) -> Message:
         html_content=email_data.html_content,
     )
     return Message(message="Test email sent")
+
+
+@router.get(
+    "/cache-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=list[CacheStats],
+)
+def read_cache_stats() -> list[CacheStats]:
+    """
+    Hit, miss and eviction counters of the in-process caches.
+    """
+    return [reference_cache.stats(), trade_aggregate_cache.stats()]
+
+
+@router.get(
+    "/bus-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=list[TopicStats],
+)
+def read_bus_stats() -> list[TopicStats]:
+    """
+    Throughput, overflow and lag of the event bus of this worker, per topic kind.
+    """
+    return event_bus.stats()
+
+
+@router.get(
+    "/query-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=list[QueryStats],
+)
+def read_query_stats() -> list[QueryStats]:
+    """
+    Average compile, execute and load times of the hot repository queries.
+    """
+    return query_stats()
+
+
+@router.get(
+    "/risk-stats/",
+    dependencies=[Depends(get_current_active_superuser)],
+    response_model=RiskStats,
+)
+def read_risk_stats() -> RiskStats:
+    """
+    Pre-trade risk check and rejection counts of this worker, with the check
+    latency histogram.
+    """
+    return risk_engine.stats()
+
+
+@router.post(
+    "/screener-snapshot/",
+    dependencies=[Depends(get_current_active_superuser)],
+)
+def refresh_screener_snapshot(session: SessionDep) -> Message:
+    """
+    Reload this worker's instrument snapshot, for jobs that just updated the
+    instrument metrics.
+    """
+    snapshot = instrument_snapshot.refresh(session)
+    return Message(
+        message=f"Screener snapshot loaded with {len(snapshot.rows)} instruments"
+    )
@@ -1,5 +1,6 @@
 import subprocess
-from typing import Union
+from datetime import datetime
+from typing import TextIO, Union
 
 import click
 from dotenv import load_dotenv
@@ -73,3 +74,215 @@ def tests() -> int:
 def types() -> int:
     click.echo('Running `mypy`...')
     return subprocess.call('mypy')
+
+
+@db.command('check-indexes', help="Report unindexed foreign keys and tables read by sequential scan")
+@click.option('--min-rows', default=10_000, show_default=True,
+              help='Ignore sequential scans on tables smaller than this')
+def check_indexes(min_rows: int) -> int:
+    from sqlmodel import Session
+
+    from app.core.db import engine
+    from app.core.db_health import sequential_scans, unindexed_foreign_keys
+
+    with Session(engine) as session:
+        foreign_keys = unindexed_foreign_keys(session)
+        scans = sequential_scans(session, min_rows)
+
+    for fk in foreign_keys:
+        click.echo(f'unindexed foreign key {fk.table}.{fk.column} ({fk.constraint})')
+    for scan in scans:
+        click.echo(f'sequential scans on {scan.table}: {scan.seq_scan} seq / {scan.idx_scan} idx, '
+                   f'{scan.seq_tup_read} rows read, {scan.live_rows} live rows')
+    if foreign_keys or scans:
+        raise SystemExit(1)
+    click.echo('No index problems found')
+    return 0
+
+
+@cli.group(help='Manage the fundamentals matrices')
+def fundamentals() -> None:
+    pass
+
+
+@fundamentals.command('build', help='Materialize the statement line items into per statement type matrices')
+@click.option('--st-type', 'st_types', multiple=True, type=click.Choice(['balancesheet', 'income', 'cashflow']),
+              help='Statement types to build, all by default')
+@click.option('--line', 'lines', multiple=True, help='Line names to include, all by default')
+def build_fundamentals(st_types: tuple[str, ...], lines: tuple[str, ...]) -> int:
+    import time
+
+    from sqlmodel import Session
+
+    from app.core.db import engine, read_session
+    from app.core.fundamentals import backfill_line_name_ids
+    from app.core.fundamentals import fundamentals as store
+    from app.models import FSType
+
+    with Session(engine) as session:
+        backfilled = backfill_line_name_ids(session)
+        session.commit()
+    if backfilled:
+        click.echo(f'{backfilled} line items without a line name id backfilled')
+    for st_type in [FSType(t) for t in st_types] or list(FSType):
+        started = time.perf_counter()
+        with read_session() as session:
+            matrix = store.refresh(session, st_type, lines or None)
+        line_count, companies, periods = matrix.shape
+        click.echo(f'{st_type.value}: {companies} companies x {periods} periods x {line_count} lines '
+                   f'in {time.perf_counter() - started:.1f}s -> {store.path(st_type)}')
+    return 0
+
+
+@fundamentals.command('import', help='Import statement line items from CSV or JSON Lines, "-" reads stdin')
+@click.argument('source', type=click.File('r'))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'json']),
+              help='Input format, guessed from the file extension by default')
+@click.option('--batch-size', default=50_000, show_default=True, help='Line items per COPY and transaction')
+@click.option('--recompute/--no-recompute', default=True, show_default=True,
+              help='Recompute the ratios of the imported companies')
+def import_fundamentals(source: TextIO, fmt: str | None, batch_size: int, recompute: bool) -> int:
+    from sqlmodel import Session
+
+    from app.core.db import engine
+    from app.core.fundamentals_import import (
+        ImportReport,
+        import_line_items,
+        read_csv,
+        read_json,
+    )
+    from app.core.ratios import recompute_ratios
+
+    if fmt is None:
+        fmt = 'csv' if source.name.endswith('.csv') else 'json'
+    rows = read_csv(source) if fmt == 'csv' else read_json(source)
+
+    def progress(report: ImportReport) -> None:
+        click.echo(f'{report.rows} rows, {report.rows_per_second:,.0f} rows/s', err=True)
+
+    with Session(engine) as session:
+        report = import_line_items(session, rows, batch_size, progress)
+    click.echo(f'{report.rows} rows in {report.seconds:.1f}s ({report.rows_per_second:,.0f} rows/s): '
+               f'{report.statements_created} statements created, {report.inserted} line items inserted, '
+               f'{report.updated} updated, {report.unchanged} unchanged, {report.duplicates} duplicate rows')
+    if recompute and report.companies:
+        with Session(engine) as session:
+            written = recompute_ratios(session, report.companies)
+        click.echo(f'{written} ratio rows recomputed for {len(report.companies)} companies')
+    click.echo("Run 'fundamentals build' to refresh the matrices")
+    return 0
+
+
+@fundamentals.command('ratios', help='Recompute the TTM figures and financial ratios')
+@click.option('--company-id', 'company_ids', multiple=True, type=int,
+              help='Companies to recompute, all by default')
+def compute_ratios(company_ids: tuple[int, ...]) -> int:
+    import time
+
+    from sqlmodel import Session
+
+    from app.core.db import engine
+    from app.core.ratios import recompute_ratios
+
+    started = time.perf_counter()
+    with Session(engine) as session:
+        written = recompute_ratios(session, company_ids or None)
+    click.echo(f'{written} ratio rows in {time.perf_counter() - started:.1f}s')
+    return 0
+
+
+@cli.group(help='Analyze trades')
+def trades() -> None:
+    pass
+
+
+@trades.command('analyze', help='Compute profit, win flag and MFE/MAE of trades not analyzed yet')
+@click.option('--portfolio-id', 'portfolio_ids', multiple=True, type=int,
+              help='Portfolios to analyze, all by default')
+@click.option('--recompute', is_flag=True, help='Also recompute trades analyzed before')
+def analyze_trades(portfolio_ids: tuple[int, ...], recompute: bool) -> int:
+    import time
+
+    from sqlmodel import Session
+
+    from app.core.db import engine
+    from app.core.trade_analytics import analyze_trades as analyze
+
+    started = time.perf_counter()
+    with Session(engine) as session:
+        updated = analyze(session, portfolio_ids or None, recompute)
+    click.echo(f'{updated} trades analyzed in {time.perf_counter() - started:.1f}s')
+    return 0
+
+
+@trades.command('equity', help='Rebuild the equity curves from the analyzed trades')
+@click.option('--portfolio-id', 'portfolio_ids', multiple=True, type=int,
+              help='Portfolios to rebuild, all by default')
+def rebuild_equity(portfolio_ids: tuple[int, ...]) -> int:
+    from sqlmodel import Session, select
+
+    from app.core.db import engine
+    from app.core.equity import rebuild_equity as rebuild
+    from app.models import Portfolio
+
+    with Session(engine) as session:
+        ids = portfolio_ids or [id for id in session.exec(select(Portfolio.id)).all() if id is not None]
+        for portfolio_id in ids:
+            click.echo(f'portfolio {portfolio_id}: {rebuild(session, portfolio_id)} points')
+            session.commit()
+    return 0
+
+
+@trades.command('rollups', help='Rebuild the daily P&L rollups of the days in [start, end) in parallel')
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']), help='First day, the first trade exit by default')
+@click.option('--end', type=click.DateTime(['%Y-%m-%d']),
+              help='Day after the last day, the day after the last trade exit by default')
+@click.option('--workers', default=4, show_default=True, help='Ranges rebuilt at the same time')
+@click.option('--chunk-days', default=31, show_default=True, help='Days per range and transaction')
+def rebuild_rollups(start: datetime | None, end: datetime | None, workers: int, chunk_days: int) -> int:
+    import time
+
+    from sqlmodel import Session
+
+    from app.core.db import engine
+    from app.core.pnl_rollups import rebuild_daily_pnl_parallel, trade_day_range
+
+    first, last = (start.date() if start else None), (end.date() if end else None)
+    if first is None or last is None:
+        with Session(engine) as session:
+            days = trade_day_range(session)
+        if days is None:
+            click.echo('No trades with an exit bar')
+            return 0
+        first, last = first or days[0], last or days[1]
+    started = time.perf_counter()
+    written = rebuild_daily_pnl_parallel(engine, first, last, workers, chunk_days)
+    click.echo(f'{written} portfolio days from {first} to {last} in {time.perf_counter() - started:.1f}s')
+    return 0
+
+
+@cli.group(help='Manage the journals of orders and broker fills')
+def journal() -> None:
+    pass
+
+
+@journal.command('replay', help='Restore the orders the database missed, and the positions and portfolios of the drained fills the ledger never checkpointed')
+@click.option('--after-seq', default=0, show_default=True, help='Replay only the events of each journal after this one')
+def replay_journal(after_seq: int) -> int:
+    from sqlmodel import Session, select
+
+    from app.core.db import engine
+    from app.core.journal import drained_records, replay
+    from app.models import JournalEvent
+
+    with Session(engine) as session:
+        written = 0
+        for name in session.exec(select(JournalEvent.journal).distinct()).all():
+            written += replay(session, drained_records(session, after_seq, name))
+        session.commit()
+    click.echo(f'{written} rows written')
+    return 0
+
+
+if __name__ == '__main__':
+    cli()
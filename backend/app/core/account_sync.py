@@ -0,0 +1,206 @@
+import logging
+import threading
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+from sqlalchemy import Engine, update
+from sqlmodel import Session, select
+
+from app.core.config import settings
+from app.models import Account
+
+logger = logging.getLogger(__name__)
+
+# broker account value tags and the Account field each one sets
+ACCOUNT_TAGS = {
+    "BuyingPower": "buying_power",
+    "TotalCashValue": "cash",
+    "NetLiquidation": "equity",
+    "DayTradesRemaining": "daytrade_count",
+}
+
+# day trades allowed in five business days under the pattern day trader rule
+_PDT_DAY_TRADES = 3
+
+AccountValue = float | int
+
+
+def parse_account_value(name: str, value: str) -> AccountValue | None:
+    """
+    The value of an Account field from a broker account value, None when it
+    isn't a number. IB reports the day trades left rather than the ones made,
+    -1 when the account isn't limited.
+    """
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    if name == "daytrade_count":
+        return max(_PDT_DAY_TRADES - int(number), 0) if number >= 0 else 0
+    return number
+
+
+@dataclass(frozen=True, slots=True)
+class AccountDelta:
+    account_id: int
+    broker_account: str
+    changes: dict[str, AccountValue]
+
+
+AccountListener = Callable[[AccountDelta], None]
+
+
+@dataclass(slots=True)
+class AccountState:
+    account_id: int
+    broker_account: str
+    currency: str
+    # as last written to the database
+    values: dict[str, AccountValue] = field(default_factory=dict)
+    # changed since, only the latest value of each field
+    pending: dict[str, AccountValue] = field(default_factory=dict)
+    # tags reported in the base currency, their per currency values are ignored
+    base_tags: set[str] = field(default_factory=set)
+
+
+class AccountSync:
+    """
+    Keeps the balances of the accounts linked to a broker account in memory,
+    fed by the broker's account update events. Bursts of updates are
+    coalesced per field, a flush writes only the fields that changed since
+    the previous one, all accounts in one transaction, and then publishes
+    the changes to the subscribers.
+    """
+
+    def __init__(self, flush_seconds: float = 2.0):
+        self.flush_seconds = flush_seconds
+        self.__accounts: dict[str, AccountState] = {}
+        self.__listeners: list[AccountListener] = []
+        self.__lock = threading.Lock()
+
+    def subscribe(self, listener: AccountListener) -> None:
+        self.__listeners.append(listener)
+
+    def __publish(self, delta: AccountDelta) -> None:
+        for listener in self.__listeners:
+            try:
+                listener(delta)
+            except Exception:
+                logger.exception("Account listener failed")
+
+    def account(self, broker_account: str) -> AccountState | None:
+        return self.__accounts.get(broker_account)
+
+    def track(self, account: Account) -> None:
+        """
+        Start following an account, its current row is the baseline changes
+        are compared to.
+        """
+        assert account.id is not None and account.broker_account is not None
+        values = {name: getattr(account, name) for name in ACCOUNT_TAGS.values()}
+        with self.__lock:
+            self.__accounts[account.broker_account] = AccountState(
+                account.id, account.broker_account, account.currency, values
+            )
+
+    def load(self, session: Session) -> None:
+        """
+        Replace the followed accounts with every account linked to a broker
+        account.
+        """
+        statement = select(Account).where(Account.broker_account.is_not(None))  # type: ignore[union-attr]
+        accounts = session.exec(statement).all()
+        with self.__lock:
+            self.__accounts.clear()
+        for account in accounts:
+            self.track(account)
+
+    def apply(self, broker_account: str, tag: str, value: str, currency: str) -> bool:
+        """
+        Take an account value update, returns whether it leaves a change to
+        write. Updates of unknown accounts and tags, and values in another
+        currency than the account's or the base currency, are ignored.
+        """
+        name = ACCOUNT_TAGS.get(tag)
+        if name is None:
+            return False
+        parsed = parse_account_value(name, value)
+        if parsed is None:
+            return False
+        with self.__lock:
+            state = self.__accounts.get(broker_account)
+            if state is None:
+                return False
+            if currency == "BASE":
+                state.base_tags.add(tag)
+            elif currency not in ("", state.currency) or tag in state.base_tags:
+                return False
+            if state.values.get(name) == parsed:
+                state.pending.pop(name, None)
+                return False
+            state.pending[name] = parsed
+            return True
+
+    def dirty(self) -> bool:
+        with self.__lock:
+            return any(state.pending for state in self.__accounts.values())
+
+    def flush(self, session: Session) -> int:
+        """
+        Write the pending changes and return the number of accounts updated.
+        Rows with the same changed fields go in one executemany.
+        """
+        with self.__lock:
+            # values are taken as written right away, so updates arriving
+            # during the write are compared to what is being written
+            changed = [
+                (
+                    state,
+                    state.pending,
+                    {name: state.values[name] for name in state.pending},
+                )
+                for state in self.__accounts.values()
+                if state.pending
+            ]
+            for state, pending, _ in changed:
+                state.values.update(pending)
+                state.pending = {}
+        if not changed:
+            return 0
+        try:
+            session.execute(
+                update(Account),
+                [dict(pending, id=state.account_id) for state, pending, _ in changed],
+            )
+            session.commit()
+        except Exception:
+            session.rollback()
+            with self.__lock:
+                for state, pending, previous in changed:
+                    state.values.update(previous)
+                    # newer updates that came in meanwhile win
+                    state.pending = pending | state.pending
+            raise
+        for state, pending, _ in changed:
+            self.__publish(
+                AccountDelta(state.account_id, state.broker_account, pending)
+            )
+        return len(changed)
+
+    def run_flushes(self, engine: Engine, stop: threading.Event) -> None:
+        """
+        Flush loop for a background thread, returns once stop is set.
+        """
+        while not stop.wait(self.flush_seconds):
+            if not self.dirty():
+                continue
+            try:
+                with Session(engine) as session:
+                    self.flush(session)
+            except Exception:
+                logger.exception("Account flush failed")
+        with Session(engine) as session:
+            self.flush(session)
+
+
+account_sync = AccountSync(settings.ACCOUNT_SYNC_FLUSH_SECONDS)
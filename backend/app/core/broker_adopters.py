@@ -0,0 +1,30 @@
+from abc import ABC, abstractmethod
+
+from app.models import Order, OrderLeg
+
+
+class BrokerError(Exception):
+    pass
+
+
+######################################################
+# Broker
+######################################################
+
+
+class Broker(ABC):
+    @abstractmethod
+    def place_group(self, order: Order, legs: list[OrderLeg]) -> None:
+        """
+        Route an order and its legs to the broker as one linked group.
+
+        Broker ids are assigned in place on the order and legs.
+        """
+        pass
+
+    @abstractmethod
+    def cancel_group(self, order: Order, legs: list[OrderLeg]) -> None:
+        """
+        Cancel every working order of a group.
+        """
+        pass
@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+from app.core.cache_adopters import CacheBackend
+from app.models import CacheStats
+
+
+class TTLCache:
+    """
+    Bounded in-process LRU, entries also expire ttl seconds after being set.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.__entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def get(self, key: str) -> Any | None:
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self.__entries[key]
+                self.expirations += 1
+                return None
+            self.__entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any) -> None:
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.ttl, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.maxsize:
+                self.__entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys: str) -> int:
+        with self.__lock:
+            return sum(self.__entries.pop(key, None) is not None for key in keys)
+
+    def delete_prefix(self, prefix: str) -> int:
+        with self.__lock:
+            keys = [key for key in self.__entries if key.startswith(prefix)]
+            for key in keys:
+                del self.__entries[key]
+            return len(keys)
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__entries.clear()
+
+
+class TieredCache:
+    """
+    Read-through cache of JSON compatible values: the in-process LRU first,
+    then the shared backend if there is one. A shared hit is copied into the
+    local tier, so a worker asks the backend at most once per local ttl.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        local: TTLCache,
+        shared: CacheBackend | None = None,
+        shared_ttl: float = 0.0,
+    ):
+        self.name = name
+        self.local = local
+        self.shared = shared
+        self.shared_ttl = shared_ttl or local.ttl
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.__lock = threading.Lock()
+
+    def __count(self, counter: str, n: int = 1) -> None:
+        with self.__lock:
+            setattr(self, counter, getattr(self, counter) + n)
+
+    def get(self, key: str) -> Any | None:
+        value = self.local.get(key)
+        if value is not None:
+            self.__count("hits")
+            return value
+        if self.shared is not None:
+            text = self.shared.get(key)
+            if text is not None:
+                value = json.loads(text)
+                self.local.set(key, value)
+                self.__count("shared_hits")
+                return value
+        self.__count("misses")
+        return None
+
+    def set(self, key: str, value: Any) -> None:
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, json.dumps(value), self.shared_ttl)
+
+    def invalidate(self, *keys: str) -> None:
+        if not keys:
+            return
+        self.__count("invalidations", len(keys))
+        self.local.delete(*keys)
+        if self.shared is not None:
+            self.shared.delete(*keys)
+
+    def evict(self, *keys: str, prefix: str | None = None) -> None:
+        """
+        Drop keys, or every key starting with prefix, from the local tier
+        only, for writes the writing worker invalidated in the shared tier.
+        """
+        n = self.local.delete(*keys)
+        if prefix is not None:
+            n += self.local.delete_prefix(prefix)
+        self.__count("invalidations", n)
+
+    def stats(self) -> CacheStats:
+        lookups = self.hits + self.shared_hits + self.misses
+        return CacheStats(
+            name=self.name,
+            size=len(self.local),
+            hits=self.hits,
+            shared_hits=self.shared_hits,
+            misses=self.misses,
+            hit_ratio=(self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            evictions=self.local.evictions,
+            expirations=self.local.expirations,
+            invalidations=self.invalidations,
+        )
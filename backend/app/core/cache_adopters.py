@@ -0,0 +1,20 @@
+from abc import ABC, abstractmethod
+
+
+class CacheBackend(ABC):
+    """
+    Cache tier shared by every worker, e.g. Redis or memcached. Values are
+    JSON text.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: float) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, *keys: str) -> None:
+        pass
@@ -33,6 +33,9 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
     DOMAIN: str = "localhost"
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
+    # only active in local development, reports repeated lazy loads per request
+    N_PLUS_ONE_DETECTION: Literal["off", "log", "raise"] = "log"
+    N_PLUS_ONE_THRESHOLD: int = 5
 
     @computed_field  # type: ignore[misc]
     @property
@@ -53,6 +56,8 @@ class Settings(BaseSettings):
     POSTGRES_USER: str = "postgres"
     POSTGRES_PASSWORD: str = "changethis"
     POSTGRES_DB: str = ""
+    # None disables server-side prepared statements, e.g. behind pgbouncer in transaction mode
+    POSTGRES_PREPARE_THRESHOLD: int | None = 2
 
     @computed_field  # type: ignore[misc]
     @property
@@ -66,6 +71,121 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # streaming replica for GET endpoints and batch analytics, reads use the
+    # primary when unset or when the replica lags more than REPLICA_MAX_LAG_SECONDS
+    POSTGRES_REPLICA_SERVER: str | None = None
+    POSTGRES_REPLICA_PORT: int | None = None
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_LAG_CHECK_SECONDS: float = 1.0
+    REPLICA_CONNECT_TIMEOUT_SECONDS: int = 2
+
+    @property
+    def SQLALCHEMY_REPLICA_URI(self) -> MultiHostUrl | None:
+        if not self.POSTGRES_REPLICA_SERVER:
+            return None
+        return MultiHostUrl.build(
+            scheme="postgresql+psycopg",
+            username=self.POSTGRES_USER,
+            password=self.POSTGRES_PASSWORD,
+            host=self.POSTGRES_REPLICA_SERVER,
+            port=self.POSTGRES_REPLICA_PORT or self.POSTGRES_PORT,
+            path=self.POSTGRES_DB,
+        )
+
+    # broker feeds, the ledger and the journal run in the one worker holding
+    # this Postgres advisory lock, another takes over once it lets go
+    LEADER_LOCK_KEY: int = 7_146_821
+    LEADER_POLL_SECONDS: float = 5.0
+
+    IB_ENABLED: bool = False
+    IB_HOST: str = "127.0.0.1"
+    IB_PORT: int = 7496
+    IB_CLIENT_ID: int = 1
+
+    # keep the accounts linked to an IB account live from its account updates,
+    # on a connection of its own; changes are written once per flush interval
+    ACCOUNT_SYNC_ENABLED: bool = False
+    ACCOUNT_SYNC_CLIENT_ID: int = 2
+    ACCOUNT_SYNC_FLUSH_SECONDS: float = 2.0
+
+    # apply the executions of the orders placed under IB_CLIENT_ID to the
+    # ledger, on a connection of its own; IB only sends another client's
+    # executions to the master API client id set in TWS
+    IB_FILLS_ENABLED: bool = False
+    IB_FILLS_CLIENT_ID: int = 0
+
+    # mark the ledger's positions to IB market data, on a connection of its
+    # own; only the instruments a portfolio holds are subscribed
+    MARKET_DATA_ENABLED: bool = False
+    MARKET_DATA_CLIENT_ID: int = 3
+
+    LEDGER_ENABLED: bool = False
+    LEDGER_CHECKPOINT_SECONDS: float = 5.0
+    LEDGER_CHECKPOINT_MAX_DIRTY: int = 500
+
+    # pre-trade checks of every order group against in-memory exposures, kept
+    # up to date from the ledger and account sync; the limits apply per account
+    RISK_CHECKS_ENABLED: bool = False
+    RISK_MAX_ORDER_NOTIONAL: float = 1_000_000.0
+    RISK_MAX_POSITION_VALUE: float = 5_000_000.0
+    RISK_MAX_DAYTRADES: int = 3
+    RISK_PDT_MIN_EQUITY: float = 25_000.0
+
+    # append-only journals of order changes, one per worker, and of the
+    # broker fills the ledger applies, run with the ledger in the leader; in
+    # memory-mapped segment files, synced to disk in groups and drained to the
+    # database in batches
+    JOURNAL_ENABLED: bool = False
+    JOURNAL_DIR: str = "data/journal"
+    JOURNAL_SEGMENT_BYTES: int = 64 * 1024 * 1024
+    JOURNAL_COMMIT_MS: float = 2.0
+    JOURNAL_DRAIN_SECONDS: float = 1.0
+    JOURNAL_DRAIN_BATCH: int = 5_000
+
+    # server-sent event stream of order, fill and position updates; the latest
+    # events are kept for clients resuming after a reconnect
+    PUSH_BUFFER_SIZE: int = 10_000
+    PUSH_QUEUE_SIZE: int = 1_000
+    PUSH_KEEPALIVE_SECONDS: float = 15.0
+
+    # in-process event bus; with the bridge the shared topic kinds reach the
+    # other workers over Postgres LISTEN/NOTIFY on EVENT_BUS_CHANNEL, cache
+    # invalidations are sent by the committing transaction itself
+    EVENT_BUS_QUEUE_SIZE: int = 10_000
+    EVENT_BUS_BRIDGE_ENABLED: bool = False
+    EVENT_BUS_CHANNEL: str = "event_bus"
+    EVENT_BUS_SHARED_KINDS: list[str] = ["order", "order_deleted", "fill", "position", "account"]
+
+    # upper bound on how long a valuation is served without a price or fill event
+    VALUATION_CACHE_SECONDS: float = 60.0
+    VALUATION_LOOKBACK_DAYS: int = 250
+
+    # materialized (company, period) matrices of the financial statements
+    FUNDAMENTALS_DIR: str = "data/fundamentals"
+
+    # serve instrument screens from an in-memory columnar copy of the
+    # instruments, reloaded once it is older than the max age
+    SCREENER_SNAPSHOT: bool = False
+    SCREENER_SNAPSHOT_MAX_AGE_SECONDS: float = 3600.0
+
+    # in-memory prefix index for symbol and company name typeahead, built at
+    # startup and rebuilt periodically, otherwise searches run on the trigram
+    # indexes
+    SEARCH_INDEX_ENABLED: bool = False
+    SEARCH_INDEX_REFRESH_SECONDS: float = 900.0
+    SEARCH_INDEX_TOP_K: int = 20
+
+    # read-through cache of reference data (companies, instruments, exchanges,
+    # accounts), "local" adds the in-process stand-in for a shared tier
+    REFERENCE_CACHE_SIZE: int = 10_000
+    REFERENCE_CACHE_TTL_SECONDS: float = 300.0
+    REFERENCE_CACHE_BACKEND: Literal["none", "local"] = "none"
+    REFERENCE_CACHE_SHARED_TTL_SECONDS: float = 3600.0
+
+    # trade aggregates of closed periods, shares the reference cache backend
+    TRADE_AGGREGATE_CACHE_SIZE: int = 1_000
+    TRADE_AGGREGATE_CACHE_TTL_SECONDS: float = 3600.0
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
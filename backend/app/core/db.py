@@ -1,10 +1,121 @@
+import logging
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+from sqlalchemy import Engine, text
+from sqlalchemy.exc import DBAPIError
 from sqlmodel import Session, create_engine, select
 
 from app import crud
+from app.core import invalidation  # noqa: F401  registers the commit hooks
 from app.core.config import settings
 from app.models import User, UserCreate
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+logger = logging.getLogger(__name__)
+
+# psycopg prepares a statement server-side once it has run this many times on a connection
+connect_args = {"prepare_threshold": settings.POSTGRES_PREPARE_THRESHOLD}
+engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), connect_args=connect_args)
+# a replica that doesn't answer must not hold up the lag check for long
+read_engine = (
+    create_engine(
+        str(settings.SQLALCHEMY_REPLICA_URI),
+        connect_args=dict(
+            connect_args, connect_timeout=settings.REPLICA_CONNECT_TIMEOUT_SECONDS
+        ),
+        pool_pre_ping=True,
+    )
+    if settings.SQLALCHEMY_REPLICA_URI
+    else None
+)
+
+
+class ReplicaRouter:
+    """
+    Picks the engine for read-only work: the replica while its replay lag is
+    within max_lag seconds, the primary otherwise or when there is no replica.
+    The lag is measured at most once every check_seconds.
+    """
+
+    def __init__(
+        self,
+        primary: Engine,
+        replica: Engine | None,
+        max_lag: float,
+        check_seconds: float = 1.0,
+    ):
+        self.primary = primary
+        self.replica = replica
+        self.max_lag = max_lag
+        self.check_seconds = check_seconds
+        self.__use_replica = False
+        self.__checked_at = float("-inf")
+        self.__lock = threading.Lock()
+
+    def lag(self) -> float | None:
+        """
+        Seconds the replica is behind the primary, None when it can't be reached
+        or isn't replaying. A replica that has replayed everything it received
+        is not lagging, however old its last replayed transaction is.
+        """
+        assert self.replica is not None
+        try:
+            with self.replica.connect() as connection:
+                lag: float | None = connection.execute(
+                    text(
+                        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp()) END"
+                    )
+                ).scalar_one()
+        except DBAPIError:
+            logger.warning("Replica lag check failed", exc_info=True)
+            return None
+        return lag
+
+    def engine(self) -> Engine:
+        if self.replica is None:
+            return self.primary
+        # one caller measures when the last check is stale, the others go on
+        # with the last decision instead of waiting for the replica to answer
+        with self.__lock:
+            now = time.monotonic()
+            probe = now - self.__checked_at >= self.check_seconds
+            if probe:
+                self.__checked_at = now
+            use_replica = self.__use_replica
+        if not probe:
+            return self.replica if use_replica else self.primary
+        lag = self.lag()
+        use_replica = lag is not None and lag <= self.max_lag
+        with self.__lock:
+            if use_replica != self.__use_replica:
+                logger.warning(
+                    "Routing reads to the %s, replica lag %s",
+                    "replica" if use_replica else "primary",
+                    "unknown" if lag is None else f"{lag:.1f}s",
+                )
+            self.__use_replica = use_replica
+        return self.replica if use_replica else self.primary
+
+
+replica_router = ReplicaRouter(
+    engine,
+    read_engine,
+    settings.REPLICA_MAX_LAG_SECONDS,
+    settings.REPLICA_LAG_CHECK_SECONDS,
+)
+
+
+@contextmanager
+def read_session() -> Iterator[Session]:
+    """
+    Session for reports, exports and other batch analytics, it may see data a
+    few seconds old and must not be used for writes.
+    """
+    with Session(replica_router.engine()) as session:
+        yield session
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
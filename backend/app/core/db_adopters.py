@@ -1,43 +1,108 @@
 from abc import ABC, abstractmethod
-from typing import Optional, List
+from collections.abc import Mapping, Sequence
+from types import TracebackType
+from typing import Any, Generic, List, Optional, TypeVar
+
+from sqlmodel import SQLModel
+
+from app.models import (
+    Account,
+    Company,
+    Exchange,
+    Instrument,
+    InstrumentSearchHit,
+    Order,
+    OrderStatus,
+    Portfolio,
+    Position,
+    Trade,
+)
+
+ModelT = TypeVar("ModelT", bound=SQLModel)
+
+
+class BulkRepo(ABC, Generic[ModelT]):
+    """
+    Writes shared by every repo. Inside a UnitOfWork nothing is committed until
+    the unit of work commits, otherwise every call commits on its own.
+    """
 
-from app.models import Company, Order, Instrument, Portfolio, Account, Trade
+    @abstractmethod
+    def save(self, c: ModelT) -> ModelT:
+        pass
+
+    @abstractmethod
+    def create(self, c: SQLModel) -> ModelT:
+        pass
+
+    @abstractmethod
+    def update(self, id: int, c: SQLModel) -> ModelT:
+        pass
+
+    @abstractmethod
+    def delete(self, id: int) -> None:
+        pass
+
+    @abstractmethod
+    def bulk_create(self, items: Sequence[SQLModel]) -> list[ModelT]:
+        """
+        Insert all items with a single INSERT ... RETURNING.
+        """
+        pass
+
+    @abstractmethod
+    def bulk_update(self, rows: Sequence[Mapping[str, Any]]) -> int:
+        """
+        Update rows by primary key, every row holds "id" and the columns to set.
+        """
+        pass
+
+    @abstractmethod
+    def bulk_delete(self, ids: Sequence[int]) -> int:
+        pass
 
 
 ######################################################
 # Company
 ######################################################
 
-class CompaniesRepo(ABC):
+class CompaniesRepo(BulkRepo[Company]):
     @abstractmethod
-    def get_company(self, id: int) -> Company:
+    def get_company(self, id: int, profile: str | None = None) -> Company | None:
         pass
 
-    # @abstractmethod
-    # def search_company(self, start_after: Optional[int] = None,
-    #                 end_before: Optional[int] = None) -> List[Post]:
-    #    pass
+    @abstractmethod
+    def search_company(self, query: str, limit: int = 10) -> list[Company]:
+        """
+        Companies with a name or a word of it starting with query, largest
+        market cap first.
+        """
+        pass
 
     # @abstractmethod
     # def count_posts(self) -> int:
     #    pass
 
     @abstractmethod
-    def save(self, c: Company):
+    def save(self, c: Company) -> Company:
         pass
 
     @abstractmethod
-    def update(self, c: Company):
+    def update(self, id: int, c: SQLModel) -> Company:
         pass
 
     @abstractmethod
-    def delete(self, id: int):
+    def delete(self, id: int) -> None:
         pass
 
 
-class OrdersRepo(ABC):
+class OrdersRepo(BulkRepo[Order]):
+    @abstractmethod
+    def get_order(self, order_id: int, profile: str | None = None) -> Order | None:
+        pass
+
     @abstractmethod
-    def get_order(self, company_id: int) -> Order:
+    def list_by_status(self, portfolio_id: int, statuses: Sequence[OrderStatus]) -> Sequence[Order]:
         pass
 
     # @abstractmethod
@@ -50,48 +115,51 @@ class OrdersRepo(ABC):
     #    pass
 
     @abstractmethod
-    def save(self, o: Order):
+    def save(self, o: Order) -> Order:
         pass
 
     @abstractmethod
-    def update(self, o: Order):
+    def update(self, id: int, o: SQLModel) -> Order:
         pass
 
     @abstractmethod
-    def delete(self, id: int):
+    def delete(self, id: int) -> None:
         pass
 
 
-class InstrumentsRepo(ABC):
+class InstrumentsRepo(BulkRepo[Instrument]):
     @abstractmethod
-    def get_instrument(self, instrument_id: int) -> Order:
+    def get_instrument(self, instrument_id: int, profile: str | None = None) -> Instrument | None:
         pass
 
-    # @abstractmethod
-    # def search_company(self, start_after: Optional[int] = None,
-    #                 end_before: Optional[int] = None) -> List[Post]:
-    #    pass
+    @abstractmethod
+    def search_instruments(self, query: str, limit: int = 10) -> list[InstrumentSearchHit]:
+        pass
 
     # @abstractmethod
     # def count_posts(self) -> int:
     #    pass
 
     @abstractmethod
-    def save(self, o: Instrument):
+    def save(self, o: Instrument) -> Instrument:
         pass
 
     @abstractmethod
-    def update(self, o: Instrument):
+    def update(self, id: int, o: SQLModel) -> Instrument:
         pass
 
     @abstractmethod
-    def delete(self, id: int):
+    def delete(self, id: int) -> None:
         pass
 
 
-class PortfoliosRepo(ABC):
+class PortfoliosRepo(BulkRepo[Portfolio]):
+    @abstractmethod
+    def get_portfolio(self, portfolio_id: int, profile: str | None = None) -> Portfolio | None:
+        pass
+
     @abstractmethod
-    def get_portfolio(self, portfolio_id: int) -> Portfolio:
+    def list_positions(self, portfolio_id: int) -> Sequence[Position]:
         pass
 
     # @abstractmethod
@@ -104,21 +172,21 @@ class PortfoliosRepo(ABC):
     #    pass
 
     @abstractmethod
-    def save(self, o: Portfolio):
+    def save(self, o: Portfolio) -> Portfolio:
         pass
 
     @abstractmethod
-    def update(self, o: Portfolio):
+    def update(self, id: int, o: SQLModel) -> Portfolio:
         pass
 
     @abstractmethod
-    def delete(self, id: int):
+    def delete(self, id: int) -> None:
         pass
 
 
-class AccountsRepo(ABC):
+class AccountsRepo(BulkRepo[Account]):
     @abstractmethod
-    def get_account(self, instrument_id: int) -> Order:
+    def get_account(self, account_id: int) -> Account | None:
         pass
 
     # @abstractmethod
@@ -131,21 +199,21 @@ class AccountsRepo(ABC):
     #    pass
 
     @abstractmethod
-    def save(self, o: Account):
+    def save(self, o: Account) -> Account:
         pass
 
     @abstractmethod
-    def update(self, o: Account):
+    def update(self, id: int, o: SQLModel) -> Account:
         pass
 
     @abstractmethod
-    def delete(self, id: int):
+    def delete(self, id: int) -> None:
         pass
 
 
-class TradesRepo(ABC):
+class TradesRepo(BulkRepo[Trade]):
     @abstractmethod
-    def get_trade(self, instrument_id: int) -> Trade:
+    def get_trade(self, trade_id: int) -> Trade | None:
         pass
 
     # @abstractmethod
@@ -158,13 +226,76 @@ class TradesRepo(ABC):
         pass
 
     @abstractmethod
-    def save(self, o: Trade):
+    def save(self, o: Trade) -> Trade:
+        pass
+
+    @abstractmethod
+    def update(self, id: int, o: SQLModel) -> Trade:
+        pass
+
+    @abstractmethod
+    def delete(self, id: int) -> None:
+        pass
+
+
+class ExchangesRepo(BulkRepo[Exchange]):
+    @abstractmethod
+    def get_exchange(self, exchange_id: int) -> Exchange | None:
+        pass
+
+    @abstractmethod
+    def save(self, o: Exchange) -> Exchange:
+        pass
+
+    @abstractmethod
+    def update(self, id: int, o: SQLModel) -> Exchange:
+        pass
+
+    @abstractmethod
+    def delete(self, id: int) -> None:
+        pass
+
+
+######################################################
+# Unit of work
+######################################################
+
+class UnitOfWork(ABC):
+    """
+    Collects the changes made through its repos and writes them in one
+    transaction on commit. Whatever isn't committed is rolled back on exit.
+
+        with uow:
+            uow.orders.create(order)
+            uow.trades.bulk_create(trades)
+            uow.commit()
+    """
+    companies: CompaniesRepo
+    accounts: AccountsRepo
+    exchanges: ExchangesRepo
+    instruments: InstrumentsRepo
+    orders: OrdersRepo
+    portfolios: PortfoliosRepo
+    trades: TradesRepo
+
+    def __enter__(self) -> "UnitOfWork":
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, exc: BaseException | None,
+                 tb: TracebackType | None) -> None:
+        self.rollback()
+
+    @abstractmethod
+    def flush(self) -> None:
+        """
+        Send pending changes, e.g. to get generated ids, without committing.
+        """
         pass
 
     @abstractmethod
-    def update(self, o: Trade):
+    def commit(self) -> None:
         pass
 
     @abstractmethod
-    def delete(self, id: int):
+    def rollback(self) -> None:
         pass
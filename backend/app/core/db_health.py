@@ -0,0 +1,63 @@
+from dataclasses import dataclass
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+
+@dataclass
+class UnindexedForeignKey:
+    table: str
+    column: str
+    constraint: str
+
+
+@dataclass
+class SequentialScanStat:
+    table: str
+    seq_scan: int
+    seq_tup_read: int
+    idx_scan: int
+    live_rows: int
+
+
+# single column foreign keys whose column does not lead any index on the table
+UNINDEXED_FOREIGN_KEYS = text(
+    """
+    SELECT t.relname, a.attname, c.conname
+    FROM pg_constraint c
+    JOIN pg_class t ON t.oid = c.conrelid
+    JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = c.conkey[1]
+    WHERE c.contype = 'f'
+      AND array_length(c.conkey, 1) = 1
+      AND NOT EXISTS (
+        SELECT 1 FROM pg_index i
+        WHERE i.indrelid = c.conrelid AND i.indkey[0] = c.conkey[1]
+      )
+    ORDER BY 1, 2
+    """
+)
+
+SEQUENTIAL_SCANS = text(
+    """
+    SELECT relname, seq_scan, seq_tup_read, coalesce(idx_scan, 0), n_live_tup
+    FROM pg_stat_user_tables
+    WHERE n_live_tup >= :min_rows AND seq_scan > coalesce(idx_scan, 0)
+    ORDER BY seq_tup_read DESC
+    """
+)
+
+
+def unindexed_foreign_keys(session: Session) -> list[UnindexedForeignKey]:
+    rows = session.execute(UNINDEXED_FOREIGN_KEYS).all()
+    return [UnindexedForeignKey(*row) for row in rows]
+
+
+def sequential_scans(
+    session: Session, min_rows: int = 10_000
+) -> list[SequentialScanStat]:
+    """
+    Tables large enough to matter that are read by sequential scan more often
+    than through an index.
+    """
+    rows = session.execute(SEQUENTIAL_SCANS, {"min_rows": min_rows}).all()
+    return [SequentialScanStat(*row) for row in rows]
@@ -0,0 +1,186 @@
+"""
+Materialized equity curves. Every closed trade appends a point holding the
+portfolio's cumulative realized P&L and its drawdown from the running peak,
+both starting at 0. Reads pick evenly spaced points by sequence number, so
+their cost follows the number of points returned, not the history length.
+"""
+from collections.abc import Sequence
+from datetime import datetime
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, col, select
+
+from app.models import Bar, EquityCurve, EquityPoint, Trade
+
+
+def running_drawdown(
+    equity: npt.NDArray[np.float64], peak: float = 0.0
+) -> npt.NDArray[np.float64]:
+    """
+    Distance of each value to the highest value so far, peak is the high
+    before the first value.
+    """
+    drawdown: npt.NDArray[np.float64] = (
+        np.maximum.accumulate(np.maximum(equity, peak)) - equity
+    )
+    return drawdown
+
+
+def _last_point(session: Session, portfolio_id: int) -> EquityPoint | None:
+    statement = (
+        select(EquityPoint)
+        .where(EquityPoint.portfolio_id == portfolio_id)
+        .order_by(col(EquityPoint.seq).desc())
+        .limit(1)
+    )
+    return session.exec(statement).first()
+
+
+def _closed_trades(
+    session: Session, portfolio_id: int, trade_ids: Sequence[int] | None = None
+) -> list[tuple[datetime, float]]:
+    exit_ = aliased(Bar)
+    statement = (
+        select(exit_.timestamp, Trade.profit_loss)
+        .join(exit_, col(exit_.id) == Trade.exit_action_bar_id)
+        .where(Trade.portfolio_id == portfolio_id, col(Trade.profit_loss).is_not(None))
+        .order_by(col(exit_.timestamp), col(Trade.id))
+    )
+    if trade_ids is not None:
+        statement = statement.where(col(Trade.id).in_(trade_ids))
+    return list(session.execute(statement).tuples())
+
+
+def _insert(
+    session: Session,
+    portfolio_id: int,
+    first_seq: int,
+    timestamps: Sequence[datetime],
+    equity: npt.NDArray[np.float64],
+    drawdown: npt.NDArray[np.float64],
+) -> None:
+    session.execute(
+        insert(EquityPoint),
+        [
+            {
+                "portfolio_id": portfolio_id,
+                "seq": first_seq + i,
+                "timestamp": t,
+                "equity": float(e),
+                "drawdown": float(d),
+            }
+            for i, (t, e, d) in enumerate(
+                zip(timestamps, equity, drawdown, strict=True)
+            )
+        ],
+    )
+
+
+def rebuild_equity(session: Session, portfolio_id: int) -> int:
+    """
+    Replace the equity curve of a portfolio by one replayed from all of its
+    analyzed trades with an exit bar, returns the number of points.
+    """
+    session.execute(
+        delete(EquityPoint).where(col(EquityPoint.portfolio_id) == portfolio_id)
+    )
+    trades = _closed_trades(session, portfolio_id)
+    if trades:
+        timestamps, pnl = zip(*trades, strict=True)
+        equity = np.cumsum(np.array(pnl, dtype=float))
+        _insert(session, portfolio_id, 1, timestamps, equity, running_drawdown(equity))
+    return len(trades)
+
+
+def append_trades(session: Session, portfolio_id: int, trade_ids: Sequence[int]) -> int:
+    """
+    Append points for newly closed trades of a portfolio. Trades closing
+    before the last stored point can't be appended, the curve is rebuilt
+    instead. Returns the number of points written.
+    """
+    trades = _closed_trades(session, portfolio_id, trade_ids)
+    if not trades:
+        return 0
+    last = _last_point(session, portfolio_id)
+    if last is not None and trades[0][0] < last.timestamp:
+        return rebuild_equity(session, portfolio_id)
+    timestamps, pnl = zip(*trades, strict=True)
+    start, peak, seq = (
+        (0.0, 0.0, 1)
+        if last is None
+        else (last.equity, last.equity + last.drawdown, last.seq + 1)
+    )
+    equity = start + np.cumsum(np.array(pnl, dtype=float))
+    _insert(
+        session, portfolio_id, seq, timestamps, equity, running_drawdown(equity, peak)
+    )
+    return len(trades)
+
+
+def sample_seqs(first: int, last: int, points: int) -> npt.NDArray[np.int64]:
+    """
+    Up to points evenly spaced sequence numbers from first to last, both
+    always included.
+    """
+    if last - first + 1 <= points:
+        return np.arange(first, last + 1)
+    return np.unique(np.linspace(first, last, points).round().astype(np.int64))
+
+
+def _seq_at(
+    session: Session, portfolio_id: int, timestamp: datetime | None, last: bool
+) -> int | None:
+    statement = select(EquityPoint.seq).where(EquityPoint.portfolio_id == portfolio_id)
+    if timestamp is not None:
+        statement = statement.where(
+            EquityPoint.timestamp <= timestamp
+            if last
+            else EquityPoint.timestamp >= timestamp
+        )
+    # seq grows with timestamp, ordering by timestamp keeps to the index
+    if last:
+        statement = statement.order_by(
+            col(EquityPoint.timestamp).desc(), col(EquityPoint.seq).desc()
+        )
+    else:
+        statement = statement.order_by(col(EquityPoint.timestamp), col(EquityPoint.seq))
+    return session.exec(statement.limit(1)).first()
+
+
+def equity_curve(
+    session: Session,
+    portfolio_id: int,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    points: int = 500,
+) -> EquityCurve:
+    """
+    At most points points of the equity curve between start and end, evenly
+    spaced over the stored points in the range.
+    """
+    first = _seq_at(session, portfolio_id, start, last=False)
+    last = _seq_at(session, portfolio_id, end, last=True)
+    if first is None or last is None or last < first:
+        return EquityCurve(
+            portfolio_id=portfolio_id, total=0, timestamps=[], equity=[], drawdown=[]
+        )
+    seqs = sample_seqs(first, last, points)
+    statement = (
+        select(EquityPoint.timestamp, EquityPoint.equity, EquityPoint.drawdown)
+        .where(
+            EquityPoint.portfolio_id == portfolio_id,
+            col(EquityPoint.seq).in_(seqs.tolist()),
+        )
+        .order_by(col(EquityPoint.seq))
+    )
+    rows = session.execute(statement).all()
+    return EquityCurve(
+        portfolio_id=portfolio_id,
+        total=last - first + 1,
+        timestamps=[r[0] for r in rows],
+        equity=[r[1] for r in rows],
+        drawdown=[r[2] for r in rows],
+    )
@@ -0,0 +1,688 @@
+"""
+In-process pub/sub of trading events on the server's event loop. Events are
+published on typed topics, a kind and a key (the instrument of a price, the
+portfolio of a fill), from the loop or from any thread; every consumer gets
+them through a bounded queue of its own with the overflow policy that suits
+it. With the Postgres bridge the shared kinds also reach the bus of every
+other worker.
+"""
+import asyncio
+import concurrent.futures
+import enum
+import inspect
+import json
+import logging
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from collections.abc import Awaitable, Callable, Collection
+from dataclasses import asdict, dataclass
+from typing import Any
+
+import psycopg
+from psycopg import sql
+
+from app.core.account_sync import AccountDelta, account_sync
+from app.core.config import settings
+from app.core.ledger import LedgerDelta, ledger
+from app.models import Order, TopicStats
+
+logger = logging.getLogger(__name__)
+
+# topic kinds and what they are keyed by
+PRICE = "price"  # instrument
+ORDER = "order"  # portfolio
+ORDER_DELETED = "order_deleted"  # portfolio
+FILL = "fill"  # portfolio
+POSITION = "position"  # portfolio
+ACCOUNT = "account"  # account
+CACHE = "cache"  # table
+
+# NOTIFY payloads have to be shorter than 8000 bytes
+_MAX_NOTIFY_BYTES = 7_999
+
+
+@dataclass(frozen=True, slots=True)
+class Topic:
+    kind: str
+    # None as a subscription pattern matches every key of the kind
+    key: str | None = None
+
+    def __str__(self) -> str:
+        return self.kind if self.key is None else f"{self.kind}:{self.key}"
+
+    @classmethod
+    def parse(cls, text: str) -> "Topic":
+        kind, _, key = text.partition(":")
+        return cls(kind, key or None)
+
+    def matches(self, topic: "Topic") -> bool:
+        return self.kind == topic.kind and (self.key is None or self.key == topic.key)
+
+
+def price_topic(instrument_id: int) -> Topic:
+    return Topic(PRICE, str(instrument_id))
+
+
+def portfolio_topic(kind: str, portfolio_id: int | None) -> Topic:
+    return Topic(kind, None if portfolio_id is None else str(portfolio_id))
+
+
+def account_topic(account_id: int) -> Topic:
+    return Topic(ACCOUNT, str(account_id))
+
+
+def cache_topic(table: str) -> Topic:
+    return Topic(CACHE, table)
+
+
+@dataclass(frozen=True, slots=True)
+class BusEvent:
+    topic: Topic
+    payload: dict[str, Any]
+    # wall clock time, so the lag of events from other workers is comparable
+    published_at: float
+    # the bus the event was first published on
+    origin: str
+
+
+class OverflowPolicy(str, enum.Enum):
+    DROP_OLDEST = "drop_oldest"
+    CONFLATE = "conflate"
+    BLOCK = "block"
+
+
+# what became of an event offered to a full queue
+_DROPPED = "dropped"
+_CONFLATED = "conflated"
+
+
+class BusSubscription:
+    """
+    The events of the topics matching any of the patterns, at most queue_size
+    of them waiting. Once the queue is full DROP_OLDEST drops the oldest
+    waiting event; CONFLATE keeps only the latest waiting event of each topic,
+    in the place of the first, and drops the oldest topic when a new one comes
+    in; BLOCK makes publishers off the loop wait for room. Must be used on the
+    bus's event loop.
+    """
+
+    def __init__(
+        self,
+        patterns: Collection[Topic],
+        policy: OverflowPolicy,
+        queue_size: int,
+        on_get: Callable[[BusEvent], None] | None = None,
+    ):
+        self.patterns = tuple(patterns)
+        self.policy = policy
+        self.queue_size = queue_size
+        self.closed = False
+        self.__on_get = on_get
+        self.__events: deque[BusEvent] = deque()
+        # conflated events by topic, dicts keep the topic where it was first put
+        self.__latest: dict[Topic, BusEvent] = {}
+        self.__ready = asyncio.Event()
+        self.__room = asyncio.Event()
+        self.__room.set()
+
+    def __len__(self) -> int:
+        return (
+            len(self.__latest)
+            if self.policy is OverflowPolicy.CONFLATE
+            else len(self.__events)
+        )
+
+    @property
+    def full(self) -> bool:
+        return len(self) >= self.queue_size
+
+    def matches(self, topic: Topic) -> bool:
+        return any(pattern.matches(topic) for pattern in self.patterns)
+
+    def put(self, event: BusEvent) -> str | None:
+        """
+        Queue an event, returns whether it conflated or dropped a waiting one.
+        BLOCK queues past the bound, publishers wait for room beforehand.
+        """
+        outcome = None
+        if self.policy is OverflowPolicy.CONFLATE:
+            if event.topic in self.__latest:
+                self.__latest[event.topic] = event
+                return _CONFLATED
+            if self.full:
+                del self.__latest[next(iter(self.__latest))]
+                outcome = _DROPPED
+            self.__latest[event.topic] = event
+        else:
+            if self.full and self.policy is OverflowPolicy.DROP_OLDEST:
+                self.__events.popleft()
+                outcome = _DROPPED
+            self.__events.append(event)
+        if self.full:
+            self.__room.clear()
+        self.__ready.set()
+        return outcome
+
+    async def wait_for_room(self) -> None:
+        while self.full and not self.closed:
+            self.__room.clear()
+            await self.__room.wait()
+
+    async def get(self) -> BusEvent:
+        while not len(self):
+            self.__ready.clear()
+            await self.__ready.wait()
+        if self.policy is OverflowPolicy.CONFLATE:
+            event = self.__latest.pop(next(iter(self.__latest)))
+        else:
+            event = self.__events.popleft()
+        if not self.full:
+            self.__room.set()
+        if self.__on_get is not None:
+            self.__on_get(event)
+        return event
+
+    def close(self) -> None:
+        # lets waiting publishers through
+        self.closed = True
+        self.__room.set()
+
+    def __aiter__(self) -> "BusSubscription":
+        return self
+
+    async def __anext__(self) -> BusEvent:
+        return await self.get()
+
+
+@dataclass(slots=True)
+class _Counters:
+    published: int = 0
+    received: int = 0
+    delivered: int = 0
+    dropped: int = 0
+    conflated: int = 0
+    blocked: int = 0
+    lag_total_ms: float = 0.0
+    lag_max_ms: float = 0.0
+    # publish counts of the current and the previous second
+    second: int = 0
+    this_second: int = 0
+    last_second: int = 0
+
+    def roll(self, now: float) -> None:
+        second = int(now)
+        if second != self.second:
+            self.last_second = self.this_second if second == self.second + 1 else 0
+            self.second, self.this_second = second, 0
+
+
+EventHandler = Callable[[BusEvent], Awaitable[None] | None]
+
+
+@dataclass(frozen=True, slots=True)
+class _Consumer:
+    patterns: tuple[Topic, ...]
+    handler: EventHandler
+    policy: OverflowPolicy
+    queue_size: int | None
+
+
+class EventBus:
+    """
+    Publishes events from the loop or any thread to the subscriptions on one
+    event loop, started with the server. Publishing before the bus is started
+    only counts the event. Throughput, overflow and lag are counted per topic
+    kind, keys are too many to keep counters of.
+    """
+
+    def __init__(self, queue_size: int = 10_000):
+        self.queue_size = queue_size
+        # tells the events of this process apart from those of other workers
+        self.origin = uuid.uuid4().hex[:12]
+        self.__loop: asyncio.AbstractEventLoop | None = None
+        # replaced rather than changed, publishers off the loop read it
+        self.__subscriptions: tuple[BusSubscription, ...] = ()
+        self.__consumers: list[_Consumer] = []
+        self.__tasks: list[asyncio.Task[None]] = []
+        self.__counters: dict[str, _Counters] = {}
+        self.__forward: Callable[[BusEvent], None] | None = None
+        self.__shared: frozenset[str] = frozenset()
+        # handed to the loop but not yet queued, publishers count them against
+        # the room left
+        self.__in_flight = 0
+        self.__lock = threading.Lock()
+
+    @property
+    def is_started(self) -> bool:
+        return self.__loop is not None
+
+    def start(self) -> None:
+        """
+        Deliver events on the running loop and start the consumers added so far.
+        """
+        self.__loop = asyncio.get_running_loop()
+        for consumer in self.__consumers:
+            self.__start_consumer(consumer)
+
+    async def stop(self) -> None:
+        for subscription in self.__subscriptions:
+            subscription.close()
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        self.__tasks = []
+        self.__subscriptions = ()
+        self.__loop = None
+
+    def bridge(
+        self, forward: Callable[[BusEvent], None], kinds: Collection[str]
+    ) -> None:
+        """
+        Hand the events of the given kinds published here to forward as well.
+        """
+        self.__forward = forward
+        self.__shared = frozenset(kinds)
+
+    def subscribe(
+        self,
+        patterns: Topic | Collection[Topic],
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        queue_size: int | None = None,
+    ) -> BusSubscription:
+        """
+        Subscribe to the topics matching the patterns, on the bus's loop.
+        """
+        if isinstance(patterns, Topic):
+            patterns = (patterns,)
+        subscription = BusSubscription(
+            patterns, policy, queue_size or self.queue_size, self.__record_get
+        )
+        self.__subscriptions = (*self.__subscriptions, subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: BusSubscription) -> None:
+        subscription.close()
+        self.__subscriptions = tuple(
+            s for s in self.__subscriptions if s is not subscription
+        )
+
+    def add_consumer(
+        self,
+        patterns: Topic | Collection[Topic],
+        handler: EventHandler,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+        queue_size: int | None = None,
+    ) -> None:
+        """
+        Call handler, or await it, with every event of the matching topics in
+        a task of its own once the bus is started.
+        """
+        consumer = _Consumer(
+            (patterns,) if isinstance(patterns, Topic) else tuple(patterns),
+            handler,
+            policy,
+            queue_size,
+        )
+        self.__consumers.append(consumer)
+        if self.__loop is not None:
+            self.__loop.call_soon_threadsafe(self.__start_consumer, consumer)
+
+    def __start_consumer(self, consumer: _Consumer) -> None:
+        subscription = self.subscribe(
+            consumer.patterns, consumer.policy, consumer.queue_size
+        )
+        self.__tasks.append(
+            asyncio.create_task(self.__consume(subscription, consumer.handler))
+        )
+
+    async def __consume(
+        self, subscription: BusSubscription, handler: EventHandler
+    ) -> None:
+        async for event in subscription:
+            try:
+                result = handler(event)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception:
+                logger.exception("Event bus consumer failed")
+
+    def publish(self, topic: Topic, payload: dict[str, Any]) -> BusEvent:
+        """
+        Publish from any thread. Off the loop this waits while a BLOCK
+        subscription is full, on the loop BLOCK queues past its bound.
+        """
+        event = BusEvent(topic, payload, time.time(), self.origin)
+        self.__count_published(event)
+        if self.__forward is not None and topic.kind in self.__shared:
+            self.__forward(event)
+        self.__deliver(event)
+        return event
+
+    async def publish_async(self, topic: Topic, payload: dict[str, Any]) -> BusEvent:
+        """
+        Publish on the loop, waiting while a BLOCK subscription is full.
+        """
+        event = BusEvent(topic, payload, time.time(), self.origin)
+        self.__count_published(event)
+        if self.__forward is not None and topic.kind in self.__shared:
+            self.__forward(event)
+        await self.__dispatch_when_room(event)
+        return event
+
+    def receive(self, event: BusEvent) -> None:
+        """
+        Deliver an event published on another bus, without forwarding it.
+        """
+        with self.__lock:
+            self.__counters_of(event.topic.kind).received += 1
+        self.__deliver(event)
+
+    def __deliver(self, event: BusEvent) -> None:
+        loop = self.__loop
+        if loop is None:
+            return
+        try:
+            on_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            on_loop = False
+        if on_loop:
+            self.__dispatch(event)
+        elif any(
+            len(s) + self.__in_flight >= s.queue_size
+            for s in self.__blocking(event.topic)
+        ):
+            future = asyncio.run_coroutine_threadsafe(
+                self.__dispatch_when_room(event), loop
+            )
+            while True:
+                try:
+                    future.result(timeout=1.0)
+                    return
+                except concurrent.futures.TimeoutError:
+                    if self.__loop is not loop:
+                        future.cancel()
+                        return
+        else:
+            with self.__lock:
+                self.__in_flight += 1
+            loop.call_soon_threadsafe(self.__dispatch_in_flight, event)
+
+    def __blocking(self, topic: Topic) -> list[BusSubscription]:
+        return [
+            s
+            for s in self.__subscriptions
+            if s.policy is OverflowPolicy.BLOCK and s.matches(topic)
+        ]
+
+    async def __dispatch_when_room(self, event: BusEvent) -> None:
+        waited = False
+        for subscription in self.__blocking(event.topic):
+            if subscription.full:
+                waited = True
+                await subscription.wait_for_room()
+        if waited:
+            with self.__lock:
+                self.__counters_of(event.topic.kind).blocked += 1
+        self.__dispatch(event)
+
+    def __dispatch_in_flight(self, event: BusEvent) -> None:
+        with self.__lock:
+            self.__in_flight -= 1
+        self.__dispatch(event)
+
+    def __dispatch(self, event: BusEvent) -> None:
+        outcomes = [
+            s.put(event)
+            for s in self.__subscriptions
+            if not s.closed and s.matches(event.topic)
+        ]
+        if _DROPPED in outcomes or _CONFLATED in outcomes:
+            with self.__lock:
+                counters = self.__counters_of(event.topic.kind)
+                counters.dropped += outcomes.count(_DROPPED)
+                counters.conflated += outcomes.count(_CONFLATED)
+
+    def __counters_of(self, kind: str) -> _Counters:
+        counters = self.__counters.get(kind)
+        if counters is None:
+            counters = self.__counters[kind] = _Counters()
+        return counters
+
+    def __count_published(self, event: BusEvent) -> None:
+        with self.__lock:
+            counters = self.__counters_of(event.topic.kind)
+            counters.published += 1
+            counters.roll(event.published_at)
+            counters.this_second += 1
+
+    def __record_get(self, event: BusEvent) -> None:
+        lag_ms = max(time.time() - event.published_at, 0.0) * 1000
+        with self.__lock:
+            counters = self.__counters_of(event.topic.kind)
+            counters.delivered += 1
+            counters.lag_total_ms += lag_ms
+            counters.lag_max_ms = max(counters.lag_max_ms, lag_ms)
+
+    def stats(self) -> list[TopicStats]:
+        now = time.time()
+        subscriptions = self.__subscriptions
+        with self.__lock:
+            result = []
+            for kind, counters in sorted(self.__counters.items()):
+                counters.roll(now)
+                result.append(
+                    TopicStats(
+                        kind=kind,
+                        subscribers=sum(
+                            any(p.kind == kind for p in s.patterns)
+                            for s in subscriptions
+                        ),
+                        published=counters.published,
+                        received=counters.received,
+                        published_per_second=counters.last_second,
+                        delivered=counters.delivered,
+                        dropped=counters.dropped,
+                        conflated=counters.conflated,
+                        blocked=counters.blocked,
+                        lag_avg_ms=counters.lag_total_ms / counters.delivered
+                        if counters.delivered
+                        else None,
+                        lag_max_ms=counters.lag_max_ms if counters.delivered else None,
+                    )
+                )
+            return result
+
+
+def encode_event(event: BusEvent) -> str:
+    return json.dumps(
+        {
+            "origin": event.origin,
+            "topic": str(event.topic),
+            "published_at": event.published_at,
+            "payload": event.payload,
+        },
+        separators=(",", ":"),
+        default=str,
+    )
+
+
+def notify_payload(event: BusEvent) -> str | None:
+    """
+    The event as a NOTIFY payload, None when it is too big for one.
+    """
+    payload = encode_event(event)
+    return payload if len(payload.encode()) <= _MAX_NOTIFY_BYTES else None
+
+
+def decode_event(text: str) -> BusEvent | None:
+    try:
+        data = json.loads(text)
+        return BusEvent(
+            Topic.parse(data["topic"]),
+            data["payload"],
+            data["published_at"],
+            data["origin"],
+        )
+    except (ValueError, KeyError, TypeError):
+        logger.warning("Malformed event bus notification: %.200s", text)
+        return None
+
+
+class PgEventBridge:
+    """
+    Fans the events of the shared kinds out to the bus of every other worker
+    over Postgres LISTEN/NOTIFY on one channel. Events are sent in batches,
+    one transaction each, from a thread of their own, so a slow database holds
+    up neither publishers nor the loop. Events too big for a notification
+    stay in this worker, and those sent while a listener reconnects are lost
+    to it; consumers that can't miss one have to reconcile from the database.
+    """
+
+    def __init__(
+        self,
+        bus: EventBus,
+        conninfo: str,
+        channel: str,
+        kinds: Collection[str],
+        queue_size: int = 10_000,
+        batch: int = 500,
+    ):
+        self.bus = bus
+        self.conninfo = conninfo
+        self.channel = channel
+        self.kinds = frozenset(kinds)
+        self.batch = batch
+        self.__outbox: queue.Queue[str] = queue.Queue(queue_size)
+
+    def attach(self) -> None:
+        self.bus.bridge(self.forward, self.kinds)
+
+    def forward(self, event: BusEvent) -> None:
+        payload = notify_payload(event)
+        if payload is None:
+            logger.warning("Event on %s too big to bridge, kept local", event.topic)
+            return
+        try:
+            self.__outbox.put_nowait(payload)
+        except queue.Full:
+            logger.warning(
+                "Event bus bridge outbox full, event on %s kept local", event.topic
+            )
+
+    def receive(self, payload: str) -> None:
+        event = decode_event(payload)
+        if event is not None and event.origin != self.bus.origin:
+            self.bus.receive(event)
+
+    def run_sender(self, stop: threading.Event) -> None:
+        connection: psycopg.Connection[Any] | None = None
+        while not stop.is_set():
+            try:
+                payloads = [self.__outbox.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+            while len(payloads) < self.batch:
+                try:
+                    payloads.append(self.__outbox.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                if connection is None or connection.closed:
+                    connection = psycopg.connect(self.conninfo, autocommit=True)
+                # notifications of one transaction are delivered in order on commit
+                with connection.transaction(), connection.cursor() as cursor:
+                    cursor.executemany(
+                        "SELECT pg_notify(%s, %s)",
+                        [(self.channel, p) for p in payloads],
+                    )
+            except psycopg.Error:
+                logger.warning(
+                    "Event bus bridge failed to send %d events",
+                    len(payloads),
+                    exc_info=True,
+                )
+                if connection is not None:
+                    connection.close()
+                    connection = None
+                stop.wait(1.0)
+        if connection is not None:
+            connection.close()
+
+    def run_listener(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            try:
+                with psycopg.connect(self.conninfo, autocommit=True) as connection:
+                    connection.execute(
+                        sql.SQL("LISTEN {}").format(sql.Identifier(self.channel))
+                    )
+                    while not stop.is_set():
+                        for notify in connection.notifies(timeout=1.0):
+                            self.receive(notify.payload)
+            except psycopg.Error:
+                logger.warning("Event bus bridge listener disconnected", exc_info=True)
+                stop.wait(1.0)
+
+
+event_bus = EventBus(settings.EVENT_BUS_QUEUE_SIZE)
+
+
+#########################################################
+# Producers
+#########################################################
+
+
+def publish_order(order: Order) -> None:
+    event_bus.publish(
+        portfolio_topic(ORDER, order.portfolio_id),
+        {
+            "id": order.id,
+            "status": order.status,
+            "group_type": order.group_type.value if order.group_type else None,
+            "portfolio_id": order.portfolio_id,
+            "account_id": order.account_id,
+            "legs": [{"id": leg.id, "status": leg.status} for leg in order.legs],
+        },
+    )
+
+
+def publish_order_deleted(
+    order_id: int, portfolio_id: int | None, account_id: int | None
+) -> None:
+    event_bus.publish(
+        portfolio_topic(ORDER_DELETED, portfolio_id),
+        {
+            "id": order_id,
+            "portfolio_id": portfolio_id,
+            "account_id": account_id,
+        },
+    )
+
+
+def publish_price(instrument_id: int, price: float) -> None:
+    event_bus.publish(
+        price_topic(instrument_id), {"instrument_id": instrument_id, "price": price}
+    )
+
+
+def publish_ledger_delta(delta: LedgerDelta) -> None:
+    event_bus.publish(
+        portfolio_topic(FILL if delta.is_fill else POSITION, delta.portfolio_id),
+        asdict(delta),
+    )
+
+
+def publish_account_delta(delta: AccountDelta) -> None:
+    event_bus.publish(account_topic(delta.account_id), asdict(delta))
+
+
+def apply_price(event: BusEvent) -> None:
+    ledger.apply_price(event.payload["instrument_id"], event.payload["price"])
+
+
+ledger.subscribe(publish_ledger_delta)
+account_sync.subscribe(publish_account_delta)
+# only the latest price of an instrument matters to the marks
+event_bus.add_consumer(Topic(PRICE), apply_price, OverflowPolicy.CONFLATE)
@@ -0,0 +1,131 @@
+"""
+Applies the broker's executions to the ledger and to the orders they fill.
+An execution is matched to the order or leg placed under its broker order
+id by our own client id; executions of orders placed elsewhere, e.g. by hand
+in TWS, are left out. Brokers report an execution again after a reconnect,
+the ledger applies each one once.
+"""
+import logging
+from dataclasses import dataclass
+
+from sqlalchemy import Engine
+from sqlmodel import Session, col, select
+
+from app.core.event_bus import publish_order
+from app.core.journal import commit_order
+from app.core.ledger import Ledger, LedgerDelta
+from app.models import Instrument, Order, OrderGroupType, OrderLeg, OrderStatus
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class BrokerFill:
+    exec_id: str
+    # the client and order id the order was placed under
+    client_id: int
+    broker_order_id: int
+    symbol: str
+    # signed, negative for sells
+    qty: float
+    price: float
+    fees: float
+    # of the order so far, unsigned
+    filled: float
+
+
+def _find(
+    session: Session, broker_order_id: int
+) -> tuple[Order, Order | OrderLeg] | None:
+    """
+    The order group of a broker order id and the row placed under it, the
+    parent of a bracket or one of the legs. Broker order ids are reused once
+    the broker resets them, the latest row wins.
+    """
+    order = session.exec(
+        select(Order)
+        .where(Order.broker_order_id == broker_order_id)
+        .order_by(col(Order.id).desc())
+    ).first()
+    if order is not None:
+        return order, order
+    leg = session.exec(
+        select(OrderLeg)
+        .where(OrderLeg.broker_order_id == broker_order_id)
+        .order_by(col(OrderLeg.id).desc())
+    ).first()
+    if leg is not None and leg.parent is not None:
+        return leg.parent, leg
+    return None
+
+
+_WORKING = (OrderStatus.PENDING.value, OrderStatus.SUBMITTED.value)
+
+
+def _mark_filled(order: Order, row: Order | OrderLeg) -> None:
+    row.status = OrderStatus.FILLED.value
+    if order.group_type == OrderGroupType.OCO:
+        order.status = OrderStatus.FILLED.value
+    elif row is order:
+        return
+    # the broker cancels the other legs once one fills, of an OCO group and
+    # the other exit of a bracket
+    for leg in order.legs:
+        if leg is not row and leg.status in _WORKING:
+            leg.status = OrderStatus.CANCELLED.value
+
+
+class FillHandler:
+    def __init__(self, engine: Engine, ledger: Ledger, client_id: int):
+        self.engine = engine
+        self.ledger = ledger
+        self.client_id = client_id
+
+    def apply(self, fill: BrokerFill) -> LedgerDelta | None:
+        """
+        Apply an execution to the ledger and mark the order or leg filled
+        once all of it is; None when the execution isn't ours or was applied
+        before.
+        """
+        if fill.client_id != self.client_id:
+            return None
+        with Session(self.engine) as session:
+            found = _find(session, fill.broker_order_id)
+            if found is None:
+                logger.warning(
+                    "Execution %s of unknown order %d",
+                    fill.exec_id,
+                    fill.broker_order_id,
+                )
+                return None
+            order, row = found
+            instrument_id = session.exec(
+                select(Instrument.id).where(Instrument.symbol == fill.symbol)
+            ).first()
+            if order.portfolio_id is None or instrument_id is None:
+                logger.warning(
+                    "Execution %s of order %s has no portfolio or instrument",
+                    fill.exec_id,
+                    order.id,
+                )
+                return None
+            delta = self.ledger.apply_execution(
+                fill.exec_id,
+                order.portfolio_id,
+                instrument_id,
+                fill.qty,
+                fill.price,
+                fill.fees,
+            )
+            if (
+                delta is None
+                or fill.filled < row.qty
+                or row.status == OrderStatus.FILLED.value
+            ):
+                return delta
+            _mark_filled(order, row)
+            session.add(order)
+            commit_order(session, order)
+            session.refresh(order)
+            publish_order(order)
+            return delta
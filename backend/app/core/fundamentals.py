@@ -0,0 +1,344 @@
+import threading
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import ColumnElement, and_, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col
+
+from app.core.config import settings
+from app.models import FinLineName, FinStatement, FinStatementLineItem, FSType
+
+
+def period_key(year: int, qtr: int) -> int:
+    """
+    Sortable period id, quarterly statements have qtr 1-4, annual ones qtr 0.
+    """
+    return year * 10 + qtr
+
+
+def line_name_ids(session: Session, names: Iterable[str]) -> dict[str, int]:
+    """
+    Dictionary ids of the given line names, names not seen before are added.
+    """
+    wanted = set(names)
+    if not wanted:
+        return {}
+    statement = select(col(FinLineName.name), col(FinLineName.id)).where(
+        col(FinLineName.name).in_(wanted)
+    )
+    ids: dict[str, int] = dict(session.execute(statement).tuples().all())
+    missing = wanted - ids.keys()
+    if missing:
+        session.execute(
+            insert(FinLineName)
+            .values([{"name": name} for name in sorted(missing)])
+            .on_conflict_do_nothing(index_elements=["name"])
+        )
+        statement = select(col(FinLineName.name), col(FinLineName.id)).where(
+            col(FinLineName.name).in_(missing)
+        )
+        ids.update(session.execute(statement).tuples().all())
+    return ids
+
+
+@dataclass
+class FundamentalsMatrix:
+    """
+    The line items of one statement type as a (line, company, period) cube of
+    floats, NaN where a company didn't report a line. companies and periods
+    are sorted, rows and columns are found by binary search.
+    """
+
+    st_type: FSType
+    companies: npt.NDArray[np.int64]
+    periods: npt.NDArray[np.int64]
+    line_ids: npt.NDArray[np.int64]
+    line_names: npt.NDArray[np.str_]
+    values: npt.NDArray[np.float64]
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        lines, companies, periods = self.values.shape
+        return lines, companies, periods
+
+    def line_index(self, line: str | int) -> int | None:
+        if isinstance(line, str):
+            found = np.flatnonzero(self.line_names == line)
+            return int(found[0]) if len(found) else None
+        i = int(np.searchsorted(self.line_ids, line))
+        return i if i < len(self.line_ids) and self.line_ids[i] == line else None
+
+    def line(self, line: str | int) -> npt.NDArray[np.float64]:
+        """
+        (company, period) matrix of one line, all NaN for a line the statement
+        type doesn't have.
+        """
+        i = self.line_index(line)
+        if i is None:
+            return np.full(self.shape[1:], np.nan)
+        return self.values[i]  # type: ignore[no-any-return]
+
+    def company_rows(
+        self, company_ids: Sequence[int] | npt.NDArray[np.int64]
+    ) -> npt.NDArray[np.int64]:
+        """
+        Row of each company, -1 for companies without statements.
+        """
+        ids = np.asarray(company_ids, dtype=np.int64)
+        rows = np.searchsorted(self.companies, ids)
+        found = rows < len(self.companies)
+        found[found] = self.companies[rows[found]] == ids[found]
+        return np.where(found, rows, -1)
+
+    def _select_companies(
+        self,
+        matrix: npt.NDArray[np.float64],
+        company_ids: Sequence[int] | npt.NDArray[np.int64] | None,
+    ) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+        if company_ids is None:
+            return self.companies, matrix
+        rows = self.company_rows(company_ids)
+        selected = np.full((len(rows), matrix.shape[1]), np.nan)
+        selected[rows >= 0] = matrix[rows[rows >= 0]]
+        return np.asarray(company_ids, dtype=np.int64), selected
+
+    def series(
+        self,
+        line: str | int,
+        company_ids: Sequence[int] | npt.NDArray[np.int64] | None = None,
+        start: tuple[int, int] | None = None,
+        end: tuple[int, int] | None = None,
+    ) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+        """
+        (companies, periods, values) of a line between start and end (year, qtr),
+        both inclusive, values has a row per company and a column per period.
+        """
+        low = (
+            0
+            if start is None
+            else int(np.searchsorted(self.periods, period_key(*start)))
+        )
+        high = (
+            len(self.periods)
+            if end is None
+            else int(np.searchsorted(self.periods, period_key(*end), side="right"))
+        )
+        companies, matrix = self._select_companies(
+            self.line(line)[:, low:high], company_ids
+        )
+        return companies, self.periods[low:high], matrix
+
+    def cross_section(
+        self,
+        line: str | int,
+        year: int,
+        qtr: int,
+        company_ids: Sequence[int] | npt.NDArray[np.int64] | None = None,
+    ) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+        """
+        (companies, values) of a line in one period.
+        """
+        column = int(np.searchsorted(self.periods, period_key(year, qtr)))
+        if column == len(self.periods) or self.periods[column] != period_key(year, qtr):
+            values = np.full((len(self.companies), 1), np.nan)
+        else:
+            values = self.line(line)[:, column : column + 1]
+        companies, values = self._select_companies(values, company_ids)
+        return companies, values[:, 0]
+
+    def latest(
+        self,
+        line: str | int,
+        company_ids: Sequence[int] | npt.NDArray[np.int64] | None = None,
+    ) -> tuple[npt.NDArray[np.int64], npt.NDArray[np.float64]]:
+        """
+        (companies, values) of the most recent reported value of a line.
+        """
+        companies, matrix = self._select_companies(self.line(line), company_ids)
+        if not matrix.shape[1]:
+            return companies, np.full(len(companies), np.nan)
+        reported = ~np.isnan(matrix)
+        last = matrix.shape[1] - 1 - np.argmax(reported[:, ::-1], axis=1)
+        values = matrix[np.arange(len(matrix)), last]
+        return companies, np.where(reported.any(axis=1), values, np.nan)
+
+    def save(self, path: Path) -> None:
+        # write next to the target and rename, readers never see a partial file
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_suffix(".partial")
+        with partial.open("wb") as f:
+            np.savez(
+                f,
+                st_type=np.array(self.st_type.value),
+                companies=self.companies,
+                periods=self.periods,
+                line_ids=self.line_ids,
+                line_names=self.line_names,
+                values=self.values,
+            )
+        partial.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "FundamentalsMatrix":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                st_type=FSType(str(data["st_type"])),
+                companies=data["companies"],
+                periods=data["periods"],
+                line_ids=data["line_ids"],
+                line_names=data["line_names"],
+                values=data["values"],
+            )
+
+
+def backfill_line_name_ids(
+    session: Session, company_ids: Sequence[int] | None = None
+) -> int:
+    """
+    Set name_id on the line items written without one, of every company or
+    only the given ones, adding their names to the dictionary. Returns the
+    number of line items updated. Only the importer sets name_id when it
+    writes, line items from anywhere else get it here.
+    """
+    missing: ColumnElement[bool] = col(FinStatementLineItem.name_id).is_(None)
+    if company_ids is not None:
+        statements = select(col(FinStatement.id)).where(
+            col(FinStatement.company_id).in_(company_ids)
+        )
+        missing = and_(missing, col(FinStatementLineItem.parent_id).in_(statements))
+    session.execute(
+        insert(FinLineName)
+        .from_select(
+            ["name"], select(col(FinStatementLineItem.name)).where(missing).distinct()
+        )
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
+    result = session.execute(
+        update(FinStatementLineItem)
+        .where(missing, col(FinLineName.name) == FinStatementLineItem.name)
+        .values(name_id=FinLineName.id)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount  # type: ignore[attr-defined, no-any-return]
+
+
+def materialize(
+    session: Session,
+    st_type: FSType,
+    company_ids: Sequence[int] | None = None,
+    lines: Sequence[str] | None = None,
+    batch_size: int = 100_000,
+) -> FundamentalsMatrix:
+    """
+    Pivot the statement line items of one type, of every company or only the
+    given ones, into a FundamentalsMatrix. The cube is dense, pass the names
+    of the lines needed to keep it to those. Line items without a name_id
+    are matched to the dictionary by name.
+    """
+    name_id = func.coalesce(FinStatementLineItem.name_id, FinLineName.id)
+    statement = (
+        select(
+            col(FinStatement.company_id),
+            col(FinStatement.year),
+            col(FinStatement.qtr),
+            name_id,
+            col(FinStatementLineItem.amount),
+        )
+        .join(
+            FinStatementLineItem, col(FinStatementLineItem.parent_id) == FinStatement.id
+        )
+        .outerjoin(
+            FinLineName,
+            and_(
+                col(FinStatementLineItem.name_id).is_(None),
+                col(FinLineName.name) == FinStatementLineItem.name,
+            ),
+        )
+        .where(col(FinStatement.st_type) == st_type, name_id.is_not(None))
+        .execution_options(yield_per=batch_size)
+    )
+    if company_ids is not None:
+        statement = statement.where(col(FinStatement.company_id).in_(company_ids))
+    if lines is not None:
+        line_ids = select(col(FinLineName.id)).where(col(FinLineName.name).in_(lines))
+        statement = statement.where(
+            or_(
+                col(FinStatementLineItem.name_id).in_(line_ids),
+                and_(
+                    col(FinStatementLineItem.name_id).is_(None),
+                    col(FinStatementLineItem.name).in_(lines),
+                ),
+            )
+        )
+    chunks = [
+        np.array(rows, dtype=np.float64).reshape(-1, 5)
+        for rows in session.execute(statement).tuples().partitions()
+    ]
+    table = np.concatenate(chunks) if chunks else np.empty((0, 5))
+    company = table[:, 0].astype(np.int64)
+    period = table[:, 1].astype(np.int64) * 10 + table[:, 2].astype(np.int64)
+    line = table[:, 3].astype(np.int64)
+
+    companies, company_index = np.unique(company, return_inverse=True)
+    periods, period_index = np.unique(period, return_inverse=True)
+    line_ids, line_index = np.unique(line, return_inverse=True)
+    values = np.full((len(line_ids), len(companies), len(periods)), np.nan)
+    values[line_index, company_index, period_index] = table[:, 4]
+
+    names = dict(
+        session.execute(
+            select(col(FinLineName.id), col(FinLineName.name)).where(
+                col(FinLineName.id).in_(line_ids.tolist())
+            )
+        )
+        .tuples()
+        .all()
+    )
+    return FundamentalsMatrix(
+        st_type=st_type,
+        companies=companies,
+        periods=periods,
+        line_ids=line_ids,
+        line_names=np.array([names.get(int(i), "") for i in line_ids], dtype=str),
+        values=values,
+    )
+
+
+class FundamentalsStore:
+    """
+    One FundamentalsMatrix per statement type, persisted as <st_type>.npz in
+    directory and loaded on first use.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.__matrices: dict[FSType, FundamentalsMatrix] = {}
+        self.__lock = threading.Lock()
+
+    def path(self, st_type: FSType) -> Path:
+        return self.directory / f"{st_type.value}.npz"
+
+    def get(self, st_type: FSType) -> FundamentalsMatrix | None:
+        with self.__lock:
+            matrix = self.__matrices.get(st_type)
+            if matrix is None and self.path(st_type).exists():
+                matrix = self.__matrices[st_type] = FundamentalsMatrix.load(
+                    self.path(st_type)
+                )
+            return matrix
+
+    def refresh(
+        self, session: Session, st_type: FSType, lines: Sequence[str] | None = None
+    ) -> FundamentalsMatrix:
+        matrix = materialize(session, st_type, lines=lines)
+        matrix.save(self.path(st_type))
+        with self.__lock:
+            self.__matrices[st_type] = matrix
+        return matrix
+
+
+fundamentals = FundamentalsStore(Path(settings.FUNDAMENTALS_DIR))
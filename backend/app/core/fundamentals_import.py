@@ -0,0 +1,181 @@
+"""
+Bulk import of financial statement line items. Rows are read as a stream,
+deduplicated per batch, COPY-loaded into a temporary staging table and
+merged into finstatement / finstatementlineitem with set based statements,
+one transaction per batch.
+"""
+import csv
+import json
+import time
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, TextIO
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from app.core.fundamentals import backfill_line_name_ids, line_name_ids
+from app.models import FSType
+
+# company_id, st_type, year, qtr, line name, amount
+LineRow = tuple[int, FSType, int, int, str, float]
+
+_STAGING = "fin_import_staging"
+
+
+@dataclass(slots=True)
+class ImportReport:
+    rows: int = 0
+    duplicates: int = 0
+    statements_created: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    seconds: float = 0.0
+    # companies with statements in the import, whose ratios need recomputing
+    companies: set[int] = field(default_factory=set)
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def add(self, other: "ImportReport") -> None:
+        self.rows += other.rows
+        self.duplicates += other.duplicates
+        self.statements_created += other.statements_created
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.companies |= other.companies
+
+
+def _st_type(value: str) -> FSType:
+    try:
+        return FSType(value.lower())
+    except ValueError:
+        return FSType[value.upper()]
+
+
+def read_csv(f: TextIO) -> Iterator[LineRow]:
+    """
+    CSV with a header of company_id,st_type,year,qtr,name,amount, one line
+    item per row.
+    """
+    for row in csv.DictReader(f):
+        yield (
+            int(row["company_id"]),
+            _st_type(row["st_type"]),
+            int(row["year"]),
+            int(row["qtr"]),
+            row["name"],
+            float(row["amount"]),
+        )
+
+
+def read_json(f: TextIO) -> Iterator[LineRow]:
+    """
+    JSON Lines, either one line item per line with the CSV columns as keys or
+    one statement per line with its line items as {"lines": {name: amount}}.
+    """
+    for text_line in f:
+        if not text_line.strip():
+            continue
+        record: dict[str, Any] = json.loads(text_line)
+        key = (
+            int(record["company_id"]),
+            _st_type(record["st_type"]),
+            int(record["year"]),
+            int(record["qtr"]),
+        )
+        if "lines" in record:
+            for name, amount in record["lines"].items():
+                yield (*key, name, float(amount))
+        else:
+            yield (*key, record["name"], float(record["amount"]))
+
+
+def _import_batch(session: Session, rows: list[LineRow]) -> ImportReport:
+    amounts: dict[tuple[int, FSType, int, int, str], float] = {}
+    for company_id, st_type, year, qtr, name, amount in rows:
+        amounts[(company_id, st_type, year, qtr, name)] = amount
+    companies = {key[0] for key in amounts}
+    names = line_name_ids(session, {key[4] for key in amounts})
+    # line items written elsewhere have no name_id yet, the merge below would
+    # add a second line item next to them
+    backfill_line_name_ids(session, sorted(companies))
+
+    session.execute(
+        text(
+            f"CREATE TEMP TABLE IF NOT EXISTS {_STAGING} ("
+            "company_id integer, st_type fstype, year integer, qtr integer, "
+            "name_id integer, name varchar, amount double precision"
+            ") ON COMMIT DELETE ROWS"
+        )
+    )
+    cursor = session.connection().connection.driver_connection.cursor()  # type: ignore[union-attr]
+    with cursor, cursor.copy(
+        f"COPY {_STAGING} (company_id, st_type, year, qtr, name_id, name, amount) FROM STDIN"
+    ) as copy:
+        for (company_id, st_type, year, qtr, name), amount in amounts.items():
+            copy.write_row(
+                (company_id, st_type.name, year, qtr, names[name], name, amount)
+            )
+
+    matches_statement = "f.company_id = s.company_id AND f.st_type = s.st_type AND f.year = s.year AND f.qtr = s.qtr"
+    created = session.execute(
+        text(
+            "INSERT INTO finstatement (company_id, st_type, year, qtr) "
+            f"SELECT DISTINCT company_id, st_type, year, qtr FROM {_STAGING} "
+            "ON CONFLICT (company_id, st_type, year, qtr) DO NOTHING"
+        )
+    ).rowcount  # type: ignore[attr-defined]
+    updated = session.execute(
+        text(
+            f"UPDATE finstatementlineitem li SET amount = s.amount FROM {_STAGING} s "
+            f"JOIN finstatement f ON {matches_statement} "
+            "WHERE li.parent_id = f.id AND li.name_id = s.name_id AND li.amount IS DISTINCT FROM s.amount"
+        )
+    ).rowcount  # type: ignore[attr-defined]
+    inserted = session.execute(
+        text(
+            "INSERT INTO finstatementlineitem (parent_id, name_id, name, amount) "
+            f"SELECT f.id, s.name_id, s.name, s.amount FROM {_STAGING} s "
+            f"JOIN finstatement f ON {matches_statement} "
+            "WHERE NOT EXISTS (SELECT 1 FROM finstatementlineitem li "
+            "WHERE li.parent_id = f.id AND li.name_id = s.name_id)"
+        )
+    ).rowcount  # type: ignore[attr-defined]
+    session.commit()
+    return ImportReport(
+        rows=len(rows),
+        duplicates=len(rows) - len(amounts),
+        statements_created=created,
+        inserted=inserted,
+        updated=updated,
+        unchanged=len(amounts) - inserted - updated,
+        companies=companies,
+    )
+
+
+def import_line_items(
+    session: Session,
+    rows: Iterable[LineRow],
+    batch_size: int = 50_000,
+    progress: Callable[[ImportReport], None] | None = None,
+) -> ImportReport:
+    """
+    Import line items, statements are created as needed and existing line
+    items only rewritten when their amount changed. Every batch commits on
+    its own, a failed import can be rerun from the start.
+    """
+    report = ImportReport()
+    started = time.perf_counter()
+    iterator = iter(rows)
+    while batch := list(islice(iterator, batch_size)):
+        report.add(_import_batch(session, batch))
+        report.seconds = time.perf_counter() - started
+        if progress is not None:
+            progress(report)
+    report.seconds = time.perf_counter() - started
+    return report
@@ -0,0 +1,142 @@
+"""
+Cache invalidation on commit. Rows of the tracked tables written through a
+session, flushed objects as well as ORM bulk INSERT, UPDATE and DELETE
+statements, are collected per transaction and announced once it commits, as
+cache events on the event bus of this worker. With the event bus bridge the
+same events also go out as a NOTIFY inside the committing transaction, so
+the other workers hear of exactly the writes that committed and nothing
+else, and evict their local copies.
+"""
+import time
+from collections.abc import Iterable
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import ORMExecuteState, Session, SessionTransaction
+from sqlmodel import SQLModel
+
+from app.core.config import settings
+from app.core.event_bus import BusEvent, cache_topic, event_bus, notify_payload
+from app.models import Account, Company, Exchange, Instrument, Trade, User
+
+# writes waiting for the commit in session.info, ids per table; None for a
+# statement that could have touched any row
+_PENDING = "cache_invalidations"
+
+_tracked: set[str] = set()
+
+
+def track(*models: type[SQLModel]) -> None:
+    """
+    Announce the writes to the tables of these models.
+    """
+    _tracked.update(model.__tablename__ for model in models)  # type: ignore[misc]
+
+
+def pending(session: Session) -> dict[str, set[int] | None]:
+    writes: dict[str, set[int] | None] = session.info.setdefault(_PENDING, {})
+    return writes
+
+
+def invalidate_on_commit(
+    session: Session, table: str, ids: Iterable[int] | None
+) -> None:
+    """
+    Announce writes to the rows of a table once the session commits, all of
+    its rows when ids is None.
+    """
+    tables = pending(session)
+    if ids is None:
+        tables[table] = None
+    elif table not in tables or tables[table] is not None:
+        tables.setdefault(table, set()).update(ids)  # type: ignore[union-attr]
+
+
+def _after_flush(session: Session, _context: object) -> None:
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table not in _tracked:
+            continue
+        if obj not in session.new and not session.is_modified(
+            obj, include_collections=False
+        ):
+            continue
+        # new rows have their key only once the flush is finalized, after this hook
+        identity = inspect(obj).mapper.primary_key_from_instance(obj)
+        if None not in identity:
+            invalidate_on_commit(session, table, identity)
+
+
+def _do_orm_execute(state: ORMExecuteState) -> None:
+    if (
+        not (state.is_insert or state.is_update or state.is_delete)
+        or state.bind_mapper is None
+    ):
+        return
+    table = state.bind_mapper.local_table.name  # type: ignore[attr-defined]
+    if table not in _tracked:
+        return
+    # bulk writes by primary key name every row, anything else may touch all of them
+    rows = state.parameters
+    if isinstance(rows, list) and all("id" in row for row in rows):
+        invalidate_on_commit(state.session, table, (row["id"] for row in rows))
+    else:
+        invalidate_on_commit(state.session, table, None)
+
+
+def _events(session: Session) -> list[BusEvent]:
+    now = time.time()
+    return [
+        BusEvent(
+            cache_topic(table),
+            {"ids": None if ids is None else sorted(ids)},
+            now,
+            event_bus.origin,
+        )
+        for table, ids in pending(session).items()
+    ]
+
+
+def _before_commit(session: Session) -> None:
+    # commit flushes after this hook, the last writes have to be collected first
+    session.flush()
+    if not settings.EVENT_BUS_BRIDGE_ENABLED or not session.info.get(_PENDING):
+        return
+    if session.get_bind().dialect.name != "postgresql":
+        return
+    for bus_event in _events(session):
+        payload = notify_payload(bus_event)
+        if payload is None:
+            # too many ids for one notification, evict the whole table instead
+            payload = notify_payload(
+                BusEvent(
+                    bus_event.topic,
+                    {"ids": None},
+                    bus_event.published_at,
+                    bus_event.origin,
+                )
+            )
+        session.execute(select(func.pg_notify(settings.EVENT_BUS_CHANNEL, payload)))
+
+
+def _after_commit(session: Session) -> None:
+    if not session.info.get(_PENDING):
+        return
+    for bus_event in _events(session):
+        event_bus.publish(bus_event.topic, bus_event.payload)
+    del session.info[_PENDING]
+
+
+def _after_rollback(session: Session, transaction: SessionTransaction) -> None:
+    # a savepoint rolling back leaves the writes flushed before it
+    if transaction.parent is None:
+        session.info.pop(_PENDING, None)
+
+
+event.listen(Session, "after_flush", _after_flush)
+event.listen(Session, "do_orm_execute", _do_orm_execute)
+event.listen(Session, "before_commit", _before_commit)
+event.listen(Session, "after_commit", _after_commit)
+event.listen(Session, "after_soft_rollback", _after_rollback)
+
+# tables cached by id, or with aggregates cached, in some worker
+track(Company, Instrument, Exchange, Account, User, Trade)
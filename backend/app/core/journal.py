@@ -0,0 +1,810 @@
+"""
+Append-only journals of order changes and of the broker executions the
+ledger applies. Events are written into a memory-mapped segment file, so
+appending costs a memory copy; a commit thread syncs everything appended
+since its last pass with one msync (group commit), and a drain thread
+copies the synced events into the journalevent table in batches.
+
+Every order change is appended with the order and its legs after it, and
+the database commit waits only for the group commit of the journal, not
+for Postgres to flush its WAL. Each worker appends to an order journal of
+its own; opening one replays what it holds, the newest version of every
+order wins, so an order whose commit was lost in a crash is written again.
+
+Fill events carry the position and portfolio after the fill and are
+appended by the leader to a journal of their own. The ledger writes its
+state only at checkpoints, along with the executions applied since the
+previous one, so after a crash replaying the events of the executions
+missing from the execution table restores the fills it had not
+checkpointed; the last event of each row wins. Fill segments are deleted
+once drained and once the ledger has checkpointed everything in them.
+Price marks aren't journaled, a replayed position is marked at its last
+fill. Opening a journal takes an exclusive lock on its directory, one
+process appends to it at a time.
+
+Segment files are named after their first sequence number and hold records
+of a fixed header (payload length, CRC32, sequence number, unix time)
+followed by the JSON payload. A zero length, a CRC mismatch or a gap in the
+sequence ends a segment, which drops a record torn by a crash.
+"""
+import fcntl
+import itertools
+import json
+import logging
+import mmap
+import struct
+import threading
+import time
+import zlib
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import IO, Any
+
+from sqlalchemy import Engine, delete, insert, text, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlmodel import Session, col, func, select
+
+from app.core.config import settings
+from app.core.ledger import LedgerDelta, ledger
+from app.models import (
+    Execution,
+    JournalEvent,
+    Order,
+    OrderLeg,
+    Portfolio,
+    Position,
+    PositionDirection,
+)
+
+logger = logging.getLogger(__name__)
+
+# event kinds
+ORDER = "order"
+ORDER_DELETED = "order_deleted"
+# an order event whose database commit failed
+ORDER_FAILED = "order_failed"
+FILL = "fill"
+
+# name of the leader's journal of fills, order journals are named by slot
+FILLS = "fills"
+
+_HEADER = struct.Struct("<IIQd")
+_SUFFIX = ".journal"
+_LOCK = "journal.lock"
+
+
+@dataclass(frozen=True, slots=True)
+class JournalRecord:
+    seq: int
+    kind: str
+    data: dict[str, Any]
+    # unix time
+    recorded_at: float
+
+
+@dataclass(slots=True)
+class _Segment:
+    path: Path
+    first_seq: int
+    # first_seq - 1 while empty
+    last_seq: int
+    last_at: float = 0.0
+
+
+def _parse(
+    buf: Any, offset: int, end: int, seq: int
+) -> Iterator[tuple[JournalRecord, int]]:
+    """
+    Records of buf[offset:end] and the offset after each, starting with
+    sequence number seq.
+    """
+    while offset + _HEADER.size <= end:
+        length, crc, record_seq, recorded_at = _HEADER.unpack_from(buf, offset)
+        start = offset + _HEADER.size
+        if not length or start + length > end or record_seq != seq:
+            return
+        payload = bytes(buf[start : start + length])
+        if zlib.crc32(payload) != crc:
+            return
+        event = json.loads(payload)
+        offset = start + length
+        yield (
+            JournalRecord(record_seq, event["kind"], event["data"], recorded_at),
+            offset,
+        )
+        seq += 1
+
+
+class JournalLocked(RuntimeError):
+    pass
+
+
+class EventJournal:
+    def __init__(
+        self,
+        directory: str | Path,
+        segment_bytes: int = 64 * 1024 * 1024,
+        commit_ms: float = 2.0,
+        name: str = FILLS,
+    ):
+        self.directory = Path(directory)
+        # the drained events of each journal are numbered on their own
+        self.name = name
+        self.segment_bytes = segment_bytes
+        self.commit_seconds = commit_ms / 1_000
+        self.__segments: list[_Segment] = []
+        self.__map: mmap.mmap | None = None
+        self.__offset = 0
+        self.__synced_offset = 0
+        self.__seq = 0
+        # maps of rolled over segments, closed by the next commit
+        self.__retired: list[mmap.mmap] = []
+        self.__appended = threading.Event()
+        self.__lock = threading.Lock()
+        self.__synced_seq = 0
+        self.__synced = threading.Condition()
+        # drain position: segment first seq, byte offset, last drained seq
+        self.__cursor = (0, 0, 0)
+        self.__lock_file: IO[bytes] | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.__map is not None
+
+    @property
+    def last_seq(self) -> int:
+        return self.__seq
+
+    @property
+    def synced_seq(self) -> int:
+        return self.__synced_seq
+
+    @property
+    def drained_seq(self) -> int:
+        return self.__cursor[2]
+
+    def __lock_directory(self) -> None:
+        lock_file = (self.directory / _LOCK).open("a+b")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            raise JournalLocked(
+                f"The journal in {self.directory} is open in another process"
+            )
+        self.__lock_file = lock_file
+
+    def open(self, drained_seq: int = 0) -> None:
+        """
+        Open the segments on disk, appends continue after their last intact
+        record or after drained_seq when the segments are gone. Raises
+        JournalLocked while another process has the directory open.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.__lock_directory()
+        segments = []
+        end = 0
+        for path in sorted(self.directory.glob(f"*{_SUFFIX}")):
+            first_seq = int(path.stem)
+            segment = _Segment(path, first_seq, first_seq - 1)
+            with path.open("rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as buf:
+                end = 0
+                for record, offset in _parse(buf, 0, len(buf), first_seq):
+                    segment.last_seq, segment.last_at, end = (
+                        record.seq,
+                        record.recorded_at,
+                        offset,
+                    )
+            segments.append(segment)
+        with self.__lock:
+            self.__segments = segments
+            if segments and segments[-1].last_seq >= drained_seq:
+                last = segments[-1]
+                with last.path.open("r+b") as tail:
+                    self.__map = mmap.mmap(tail.fileno(), 0)
+                self.__offset = self.__synced_offset = end
+                self.__seq = last.last_seq
+                first = next(
+                    s for s in segments if s.last_seq > drained_seq or s is last
+                )
+                self.__cursor = (first.first_seq, 0, drained_seq)
+            else:
+                self.__seq = drained_seq
+                self.__new_segment(drained_seq + 1, self.segment_bytes)
+                self.__cursor = (drained_seq + 1, 0, drained_seq)
+        with self.__synced:
+            self.__synced_seq = self.__seq
+
+    def close(self) -> None:
+        self.commit()
+        with self.__lock:
+            retired, self.__retired = self.__retired, []
+            if self.__map is not None:
+                retired.append(self.__map)
+            self.__map = None
+        for buf in retired:
+            buf.close()
+        if self.__lock_file is not None:
+            # closing the file lets go of the lock
+            self.__lock_file.close()
+            self.__lock_file = None
+
+    def __new_segment(self, first_seq: int, size: int) -> None:
+        path = self.directory / f"{first_seq:020d}{_SUFFIX}"
+        with path.open("w+b") as f:
+            f.truncate(size)
+            self.__map = mmap.mmap(f.fileno(), size)
+        self.__segments.append(_Segment(path, first_seq, first_seq - 1))
+        self.__offset = self.__synced_offset = 0
+
+    def __roll(self, size: int) -> None:
+        assert self.__map is not None
+        # the rest of the full segment is synced before the next one starts
+        self.__map.flush()
+        self.__retired.append(self.__map)
+        with self.__synced:
+            self.__synced_seq = self.__seq
+            self.__synced.notify_all()
+        self.__new_segment(self.__seq + 1, max(self.segment_bytes, size))
+
+    def append(self, kind: str, data: dict[str, Any]) -> int:
+        """
+        Write an event and return its sequence number, it is on disk once
+        synced_seq reaches it.
+        """
+        payload = json.dumps(
+            {"kind": kind, "data": data}, separators=(",", ":")
+        ).encode()
+        size = _HEADER.size + len(payload)
+        with self.__lock:
+            if self.__map is None:
+                raise RuntimeError("The journal is not open")
+            if self.__offset + size > len(self.__map):
+                self.__roll(size)
+                assert self.__map is not None
+            self.__seq += 1
+            now = time.time()
+            start = self.__offset + _HEADER.size
+            self.__map[start : start + len(payload)] = payload
+            _HEADER.pack_into(
+                self.__map,
+                self.__offset,
+                len(payload),
+                zlib.crc32(payload),
+                self.__seq,
+                now,
+            )
+            self.__offset += size
+            segment = self.__segments[-1]
+            segment.last_seq, segment.last_at = self.__seq, now
+            seq = self.__seq
+        self.__appended.set()
+        return seq
+
+    def wait(self, seq: int, timeout: float | None = None) -> bool:
+        """
+        Block until the event seq is synced, False on timeout.
+        """
+        with self.__synced:
+            return self.__synced.wait_for(lambda: self.__synced_seq >= seq, timeout)
+
+    def commit(self) -> int:
+        """
+        Sync everything appended since the last commit and return the last
+        synced sequence number.
+        """
+        with self.__lock:
+            buf, start, end, seq = (
+                self.__map,
+                self.__synced_offset,
+                self.__offset,
+                self.__seq,
+            )
+            retired, self.__retired = self.__retired, []
+            self.__synced_offset = end
+        if buf is not None and end > start:
+            page = start - start % mmap.PAGESIZE
+            buf.flush(page, end - page)
+        for old in retired:
+            old.close()
+        with self.__synced:
+            self.__synced_seq = max(self.__synced_seq, seq)
+            self.__synced.notify_all()
+            return self.__synced_seq
+
+    def run_commits(self, stop: threading.Event) -> None:
+        """
+        Commit loop for a background thread, returns once stop is set.
+        """
+        while not stop.is_set():
+            if not self.__appended.wait(0.5):
+                continue
+            # appends made meanwhile join the same sync
+            stop.wait(self.commit_seconds)
+            self.__appended.clear()
+            try:
+                self.commit()
+            except Exception:
+                logger.exception("Journal commit failed")
+        self.commit()
+
+    def records(self, after_seq: int = 0) -> Iterator[JournalRecord]:
+        """
+        Events after after_seq in every segment still on disk.
+        """
+        with self.__lock:
+            segments = [s for s in self.__segments if s.last_seq > after_seq]
+            last_seq = self.__seq
+        for segment in segments:
+            with segment.path.open("rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as buf:
+                for record, _ in _parse(buf, 0, len(buf), segment.first_seq):
+                    if record.seq > last_seq:
+                        break
+                    if record.seq > after_seq:
+                        yield record
+
+    def __pending(self, limit: int) -> tuple[list[JournalRecord], tuple[int, int, int]]:
+        """
+        Synced events after the drain position, at most limit, and the
+        position after them. Segments are read through maps of their own,
+        the append map may be closed meanwhile.
+        """
+        first_seq, offset, seq = self.__cursor
+        with self.__lock:
+            segments = [s for s in self.__segments if s.first_seq >= first_seq]
+        synced = self.__synced_seq
+        records: list[JournalRecord] = []
+        for segment in segments:
+            if len(records) >= limit or segment.first_seq > synced:
+                break
+            if segment.first_seq != first_seq:
+                first_seq, offset = segment.first_seq, 0
+            with segment.path.open("rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as buf:
+                taken = list(
+                    self.__take(
+                        buf,
+                        offset,
+                        segment.first_seq,
+                        seq,
+                        synced,
+                        limit - len(records),
+                    )
+                )
+            for record, next_offset in taken:
+                records.append(record)
+                seq, offset = record.seq, next_offset
+        return records, (first_seq, offset, seq)
+
+    @staticmethod
+    def __take(
+        buf: Any, offset: int, first_seq: int, after_seq: int, synced: int, limit: int
+    ) -> Iterator[tuple[JournalRecord, int]]:
+        # the offset of a drain position is that of the record after it
+        seq = first_seq if offset == 0 else after_seq + 1
+        for record, next_offset in _parse(buf, offset, len(buf), seq):
+            if record.seq > synced:
+                return
+            if record.seq > after_seq:
+                yield record, next_offset
+                limit -= 1
+                if not limit:
+                    return
+
+    def drain(self, session: Session, limit: int = 5_000) -> int:
+        """
+        Copy the next synced events into the journalevent table and return
+        how many. Events already there are skipped.
+        """
+        records, cursor = self.__pending(limit)
+        if not records:
+            return 0
+        statement = pg_insert(JournalEvent).on_conflict_do_nothing(
+            index_elements=["journal", "seq"]
+        )
+        session.execute(
+            statement,
+            [
+                {
+                    "journal": self.name,
+                    "seq": record.seq,
+                    "kind": record.kind,
+                    "data": record.data,
+                    "recorded_at": datetime.utcfromtimestamp(record.recorded_at),
+                }
+                for record in records
+            ],
+        )
+        session.commit()
+        self.__cursor = cursor
+        return len(records)
+
+    def truncate(self, checkpointed_at: float | None = None) -> int:
+        """
+        Delete the segments whose events are all drained and, when given,
+        recorded before checkpointed_at; returns how many. The segment being
+        appended to is kept.
+        """
+        drained = self.drained_seq
+        with self.__lock:
+            count = 0
+            for segment in self.__segments[:-1]:
+                if segment.last_seq > drained or (
+                    checkpointed_at is not None and segment.last_at >= checkpointed_at
+                ):
+                    break
+                count += 1
+            done, self.__segments = self.__segments[:count], self.__segments[count:]
+        for segment in done:
+            segment.path.unlink(missing_ok=True)
+        return len(done)
+
+    def run_drains(
+        self,
+        engine: Engine,
+        stop: threading.Event,
+        drain_seconds: float = 1.0,
+        batch: int = 5_000,
+        with_ledger: bool = False,
+    ) -> None:
+        """
+        Drain loop for a background thread, returns once stop is set. With
+        the ledger on, segments are kept until it has checkpointed them.
+        """
+        while not stop.wait(drain_seconds):
+            try:
+                with Session(engine) as session:
+                    while self.drain(session, batch) == batch:
+                        pass
+                self.truncate(ledger.checkpointed_at if with_ledger else None)
+            except Exception:
+                logger.exception("Journal drain failed")
+        with Session(engine) as session:
+            while self.drain(session, batch):
+                pass
+
+
+def last_drained_seq(session: Session, journal: str = FILLS) -> int:
+    return session.exec(
+        select(func.coalesce(func.max(JournalEvent.seq), 0)).where(
+            JournalEvent.journal == journal
+        )
+    ).one()
+
+
+def drained_records(
+    session: Session, after_seq: int = 0, journal: str | None = None
+) -> Iterator[JournalRecord]:
+    """
+    Events in the journalevent table after after_seq, of one journal or of
+    every journal, in order.
+    """
+    statement = select(JournalEvent).where(JournalEvent.seq > after_seq)
+    if journal is not None:
+        statement = statement.where(JournalEvent.journal == journal)
+    statement = statement.order_by(
+        col(JournalEvent.journal), col(JournalEvent.seq)
+    ).execution_options(yield_per=5_000)
+    for event in session.exec(statement):
+        recorded_at = event.recorded_at.replace(tzinfo=timezone.utc).timestamp()
+        yield JournalRecord(event.seq, event.kind, event.data, recorded_at)
+
+
+#########################################################
+# Events
+#########################################################
+
+
+def order_event(order: Order) -> dict[str, Any]:
+    return {
+        **order.model_dump(mode="json"),
+        "legs": [leg.model_dump(mode="json") for leg in order.legs],
+    }
+
+
+def _commit_journaled(session: Session, kind: str, event: dict[str, Any]) -> None:
+    seq = order_journal.append(kind, event)
+    order_journal.wait(seq)
+    # the event is on disk, the commit needn't wait for the WAL flush
+    session.execute(text("SET LOCAL synchronous_commit TO OFF"))
+    try:
+        session.commit()
+    except Exception:
+        # replaying the event would write the change after all
+        order_journal.wait(order_journal.append(ORDER_FAILED, {"seq": seq}))
+        raise
+
+
+def commit_order(session: Session, order: Order) -> None:
+    """
+    Commit the changes made to an order and its legs. With the order
+    journal open the change is appended and synced with the next group
+    commit, the database commit then doesn't wait for Postgres to flush.
+    """
+    order.version += 1
+    if not order_journal.is_open:
+        session.commit()
+        return
+    # assigns the ids of new orders and legs
+    session.flush()
+    _commit_journaled(session, ORDER, order_event(order))
+
+
+def commit_order_deleted(session: Session, order: Order) -> None:
+    """
+    Delete an order with its legs and commit, journaled like commit_order.
+    """
+    event = {"id": order.id, "version": order.version + 1}
+    for leg in order.legs:
+        session.delete(leg)
+    session.delete(order)
+    if not order_journal.is_open:
+        session.commit()
+        return
+    _commit_journaled(session, ORDER_DELETED, event)
+
+
+def fill_event(delta: LedgerDelta) -> dict[str, Any]:
+    return {
+        "exec_id": delta.exec_id,
+        "portfolio_id": delta.portfolio_id,
+        "instrument_id": delta.instrument_id,
+        "qty": delta.qty,
+        "market_value": delta.market_value,
+        "cost": delta.cost,
+        "cash": delta.cash,
+        "equity": delta.equity,
+        "profit": delta.profit,
+    }
+
+
+def record_fill(delta: LedgerDelta) -> None:
+    # fills without an execution, applied by hand, are never replayed
+    if delta.exec_id is not None and event_journal.is_open:
+        event_journal.append(FILL, fill_event(delta))
+
+
+#########################################################
+# Replay
+#########################################################
+
+
+def _checkpointed(
+    session: Session, exec_ids: list[str], batch: int = 1_000
+) -> set[str]:
+    """
+    The exec ids the ledger has written with its checkpoints.
+    """
+    found: set[str] = set()
+    for i in range(0, len(exec_ids), batch):
+        statement = select(Execution.exec_id).where(
+            col(Execution.exec_id).in_(exec_ids[i : i + batch])
+        )
+        found.update(session.exec(statement).all())
+    return found
+
+
+def replay(session: Session, records: Iterable[JournalRecord]) -> int:
+    """
+    Write the newest version of every order in the events of one journal,
+    with its legs, and the state the fills the ledger hasn't checkpointed
+    leave the positions and portfolios in, with their executions, ahead of
+    the commit; returns the number of rows written.
+    """
+    records = list(records)
+    failed = {record.data["seq"] for record in records if record.kind == ORDER_FAILED}
+    fills = []
+    orders: dict[int, dict[str, Any]] = {}
+    for record in records:
+        if record.kind == FILL:
+            fills.append(record)
+        elif record.kind in (ORDER, ORDER_DELETED) and record.seq not in failed:
+            data = dict(record.data, deleted=record.kind == ORDER_DELETED)
+            newest = orders.get(data["id"])
+            if newest is None or data["version"] >= newest["version"]:
+                orders[data["id"]] = data
+    written = _replay_orders(session, orders)
+    checkpointed = _checkpointed(session, [record.data["exec_id"] for record in fills])
+    positions: dict[tuple[int, int], dict[str, Any]] = {}
+    portfolios: dict[int, dict[str, Any]] = {}
+    executions = []
+    for record in fills:
+        data = record.data
+        if data["exec_id"] in checkpointed:
+            continue
+        positions[(data["portfolio_id"], data["instrument_id"])] = data
+        portfolios[data["portfolio_id"]] = data
+        executions.append(
+            {
+                "exec_id": data["exec_id"],
+                "portfolio_id": data["portfolio_id"],
+                "instrument_id": data["instrument_id"],
+                "applied_at": datetime.utcfromtimestamp(record.recorded_at),
+            }
+        )
+    written += _replay_positions(session, positions, portfolios)
+    if executions:
+        session.execute(insert(Execution), executions)
+    return written
+
+
+def _replay_orders(session: Session, orders: dict[int, dict[str, Any]]) -> int:
+    if not orders:
+        return 0
+    versions = dict(
+        session.execute(
+            select(col(Order.id), col(Order.version)).where(
+                col(Order.id).in_(list(orders))
+            )
+        )
+        .tuples()
+        .all()
+    )
+    # orders deleted in an event drained before, never to be written again
+    deleted_id = JournalEvent.data["id"].as_integer()
+    deleted = set(
+        session.exec(
+            select(deleted_id).where(
+                JournalEvent.kind == ORDER_DELETED, deleted_id.in_(list(orders))
+            )
+        ).all()
+    )
+    written = 0
+    for order_id, data in orders.items():
+        version = versions.get(order_id)
+        if version is not None and version >= data["version"]:
+            continue
+        if data["deleted"]:
+            if version is not None:
+                session.execute(
+                    delete(OrderLeg).where(col(OrderLeg.parent_id) == order_id)
+                )
+                session.execute(delete(Order).where(col(Order.id) == order_id))
+                written += 1
+            continue
+        if version is None and order_id in deleted:
+            continue
+        legs = [OrderLeg.model_validate(leg) for leg in data["legs"]]
+        session.merge(
+            Order.model_validate(
+                {k: v for k, v in data.items() if k not in ("legs", "deleted")}
+            )
+        )
+        session.execute(
+            delete(OrderLeg).where(
+                col(OrderLeg.parent_id) == order_id,
+                col(OrderLeg.id).not_in([leg.id for leg in legs]),
+            )
+        )
+        for leg in legs:
+            session.merge(leg)
+        written += 1 + len(legs)
+    session.flush()
+    return written
+
+
+def _replay_positions(
+    session: Session,
+    positions: dict[tuple[int, int], dict[str, Any]],
+    portfolios: dict[int, dict[str, Any]],
+) -> int:
+    if not positions:
+        return 0
+    existing = {
+        (portfolio_id, instrument_id): id
+        for id, portfolio_id, instrument_id in session.execute(
+            select(Position.id, Position.portfolio_id, Position.instrument_id).where(
+                tuple_(col(Position.portfolio_id), col(Position.instrument_id)).in_(
+                    list(positions)
+                )
+            )
+        ).tuples()
+    }
+    rows = [
+        {
+            "portfolio_id": portfolio_id,
+            "instrument_id": instrument_id,
+            "long_short": PositionDirection.SHORT
+            if data["qty"] < 0
+            else PositionDirection.LONG,
+            "qty": abs(data["qty"]),
+            "cost": abs(data["cost"]),
+            "market_value": abs(data["market_value"]),
+        }
+        for (portfolio_id, instrument_id), data in positions.items()
+    ]
+    updated = [
+        dict(row, id=existing[(row["portfolio_id"], row["instrument_id"])])
+        for row in rows
+        if (row["portfolio_id"], row["instrument_id"]) in existing
+    ]
+    created = [
+        row
+        for row in rows
+        if (row["portfolio_id"], row["instrument_id"]) not in existing
+    ]
+    if updated:
+        session.execute(update(Position), updated)
+    if created:
+        session.execute(insert(Position), created)
+    session.execute(
+        update(Portfolio),
+        [
+            {
+                "id": portfolio_id,
+                "cash": data["cash"],
+                "equity": data["equity"],
+                "profit": data["profit"],
+            }
+            for portfolio_id, data in portfolios.items()
+        ],
+    )
+    return len(rows) + len(portfolios)
+
+
+def recover(session: Session) -> int:
+    """
+    Open the journal and replay the fills on disk the ledger hasn't
+    checkpointed, returns the number of rows written. Run before the ledger
+    loads its state.
+    """
+    event_journal.open(last_drained_seq(session))
+    written = replay(session, event_journal.records())
+    session.commit()
+    return written
+
+
+def _open_slot(journal: EventJournal, session: Session, slot: int) -> bool:
+    journal.directory = _ORDER_JOURNALS / str(slot)
+    journal.name = f"orders-{slot}"
+    try:
+        journal.open(last_drained_seq(session, journal.name))
+    except JournalLocked:
+        return False
+    return True
+
+
+def open_order_journal(session: Session) -> int:
+    """
+    Open the order journal of the first slot no other worker has open and
+    replay the orders on disk, then those of every other slot left behind
+    by a worker that is gone; returns the number of rows written.
+    """
+    slot = next(s for s in itertools.count() if _open_slot(order_journal, session, s))
+    written = replay(session, order_journal.records())
+    session.commit()
+    for path in _ORDER_JOURNALS.iterdir():
+        if not path.name.isdigit() or int(path.name) == slot:
+            continue
+        orphan = EventJournal(
+            path, settings.JOURNAL_SEGMENT_BYTES, settings.JOURNAL_COMMIT_MS
+        )
+        if not _open_slot(orphan, session, int(path.name)):
+            continue
+        try:
+            written += replay(session, orphan.records())
+            session.commit()
+            while orphan.drain(session):
+                pass
+            orphan.truncate()
+        finally:
+            orphan.close()
+    return written
+
+
+event_journal = EventJournal(
+    settings.JOURNAL_DIR, settings.JOURNAL_SEGMENT_BYTES, settings.JOURNAL_COMMIT_MS
+)
+# the slot directories of the workers' order journals
+_ORDER_JOURNALS = Path(settings.JOURNAL_DIR) / "orders"
+order_journal = EventJournal(
+    _ORDER_JOURNALS, settings.JOURNAL_SEGMENT_BYTES, settings.JOURNAL_COMMIT_MS
+)
+ledger.subscribe(record_fill)
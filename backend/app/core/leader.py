@@ -0,0 +1,104 @@
+"""
+Elects the one worker that runs the jobs which must not run twice: the
+broker feeds, whose client ids IB only accepts once, and the ledger and
+journal, which own their state. The leader holds a session-level Postgres
+advisory lock on a connection of its own; the lock goes away with the
+connection, so a worker that dies or loses the database is replaced by the
+next one to poll.
+"""
+import logging
+import threading
+from collections.abc import Callable
+
+from sqlalchemy import Connection, Engine, text
+
+from app.core.config import settings
+from app.core.db import engine
+
+logger = logging.getLogger(__name__)
+
+# runs while the worker leads, returns once the event it's given is set
+LeaderJobs = Callable[[threading.Event], None]
+
+
+class LeaderElection:
+    def __init__(self, engine: Engine, key: int, poll_seconds: float = 5.0):
+        self.engine = engine
+        self.key = key
+        self.poll_seconds = poll_seconds
+        self.__leading = threading.Event()
+
+    @property
+    def is_leader(self) -> bool:
+        return self.__leading.is_set()
+
+    def try_acquire(self) -> Connection | None:
+        """
+        The connection holding the lock, None when another worker holds it.
+        The connection is detached from the pool, closing it releases the
+        lock.
+        """
+        connection = self.engine.connect()
+        connection.detach()
+        try:
+            acquired = connection.scalar(
+                text("SELECT pg_try_advisory_lock(:key)"), {"key": self.key}
+            )
+            connection.commit()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return None
+        return connection
+
+    @staticmethod
+    def __lead(jobs: LeaderJobs, resign: threading.Event) -> None:
+        try:
+            jobs(resign)
+        except Exception:
+            logger.exception("Leader jobs failed")
+
+    def run(self, stop: threading.Event, jobs: LeaderJobs) -> None:
+        """
+        Election loop for a background thread, returns once stop is set.
+        Once elected the jobs run on a thread of their own until stop is set
+        or the lock's connection fails; jobs that end on their own give up
+        the lock for a poll interval so another worker can take over.
+        """
+        while not stop.is_set():
+            try:
+                connection = self.try_acquire()
+            except Exception:
+                logger.exception("Leader election failed")
+                connection = None
+            if connection is None:
+                stop.wait(self.poll_seconds)
+                continue
+            logger.info("Elected leader")
+            resign = threading.Event()
+            thread = threading.Thread(
+                target=self.__lead, args=(jobs, resign), daemon=True
+            )
+            self.__leading.set()
+            thread.start()
+            try:
+                while not stop.wait(self.poll_seconds) and thread.is_alive():
+                    connection.execute(text("SELECT 1"))
+                    connection.commit()
+            except Exception:
+                logger.exception("Lost the leader lock")
+            finally:
+                resign.set()
+                thread.join()
+                self.__leading.clear()
+                connection.close()
+            logger.info("Resigned as leader")
+            if not stop.is_set():
+                stop.wait(self.poll_seconds)
+
+
+leader_election = LeaderElection(
+    engine, settings.LEADER_LOCK_KEY, settings.LEADER_POLL_SECONDS
+)
@@ -0,0 +1,456 @@
+import logging
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any
+
+from sqlalchemy import Engine, insert, update
+from sqlmodel import Session, col, select
+
+from app.core.config import settings
+from app.models import Execution, Portfolio, Position, PositionDirection
+
+logger = logging.getLogger(__name__)
+
+# brokers report the day's executions again on reconnect, the ids of those
+# applied this long ago are kept to skip them
+_EXECUTIONS_KEPT = timedelta(days=2)
+
+
+@dataclass(slots=True)
+class PositionState:
+    portfolio_id: int
+    instrument_id: int
+    position_id: int | None = None
+    # signed, negative for shorts
+    qty: float = 0.0
+    cost: float = 0.0
+    price: float = 0.0
+
+    @property
+    def market_value(self) -> float:
+        return self.qty * self.price
+
+    @property
+    def unrealized(self) -> float:
+        return self.market_value - self.cost
+
+
+@dataclass(slots=True)
+class PortfolioState:
+    portfolio_id: int
+    cash: float = 0.0
+    realized: float = 0.0
+    market_value: float = 0.0
+    cost: float = 0.0
+    positions: dict[int, PositionState] = field(default_factory=dict)
+
+    @property
+    def equity(self) -> float:
+        return self.cash + self.market_value
+
+    @property
+    def profit(self) -> float:
+        return self.realized + self.market_value - self.cost
+
+
+@dataclass(frozen=True, slots=True)
+class LedgerDelta:
+    portfolio_id: int
+    instrument_id: int
+    qty: float
+    market_value: float
+    cost: float
+    cash: float
+    equity: float
+    profit: float
+    equity_change: float
+    is_fill: bool
+    # of the broker execution the fill applied
+    exec_id: str | None = None
+
+
+LedgerListener = Callable[[LedgerDelta], None]
+
+
+class Ledger:
+    """
+    Keeps positions and portfolio totals in memory and applies fills and price
+    ticks to them incrementally, every update is O(1) per affected position.
+    Changed rows are written back to Position and Portfolio in batches.
+    """
+
+    def __init__(
+        self, checkpoint_seconds: float = 5.0, checkpoint_max_dirty: int = 500
+    ):
+        self.checkpoint_seconds = checkpoint_seconds
+        self.checkpoint_max_dirty = checkpoint_max_dirty
+        self.__portfolios: dict[int, PortfolioState] = {}
+        # instrument id -> positions holding it, so a tick only touches its holders
+        self.__holders: dict[int, list[PositionState]] = {}
+        self.__prices: dict[int, float] = {}
+        self.__listeners: list[LedgerListener] = []
+        self.__dirty_positions: set[tuple[int, int]] = set()
+        self.__dirty_portfolios: set[int] = set()
+        # ids of the executions applied, and the rows of those not checkpointed yet
+        self.__executions: set[str] = set()
+        self.__new_executions: list[dict[str, Any]] = []
+        self.__last_checkpoint = time.monotonic()
+        # wall clock time of the state the last successful checkpoint wrote
+        self.__checkpointed_at = 0.0
+        self.__checkpointing = False
+        self.__lock = threading.RLock()
+
+    def subscribe(self, listener: LedgerListener) -> None:
+        self.__listeners.append(listener)
+
+    def __publish(self, delta: LedgerDelta) -> None:
+        for listener in self.__listeners:
+            try:
+                listener(delta)
+            except Exception:
+                logger.exception("Ledger listener failed")
+
+    def portfolio(self, portfolio_id: int) -> PortfolioState | None:
+        return self.__portfolios.get(portfolio_id)
+
+    def position(self, portfolio_id: int, instrument_id: int) -> PositionState | None:
+        state = self.__portfolios.get(portfolio_id)
+        return state.positions.get(instrument_id) if state else None
+
+    def held_instruments(self) -> set[int]:
+        """
+        Ids of the instruments some portfolio has an open position in.
+        """
+        with self.__lock:
+            return {
+                instrument_id
+                for instrument_id, positions in self.__holders.items()
+                if any(position.qty for position in positions)
+            }
+
+    def __portfolio_state(self, portfolio_id: int) -> PortfolioState:
+        state = self.__portfolios.get(portfolio_id)
+        if state is None:
+            state = self.__portfolios[portfolio_id] = PortfolioState(portfolio_id)
+        return state
+
+    def __position_state(
+        self, portfolio: PortfolioState, instrument_id: int
+    ) -> PositionState:
+        position = portfolio.positions.get(instrument_id)
+        if position is None:
+            position = PositionState(
+                portfolio.portfolio_id,
+                instrument_id,
+                price=self.__prices.get(instrument_id, 0.0),
+            )
+            portfolio.positions[instrument_id] = position
+            self.__holders.setdefault(instrument_id, []).append(position)
+        return position
+
+    def __delta(
+        self,
+        portfolio: PortfolioState,
+        position: PositionState,
+        equity_change: float,
+        is_fill: bool,
+        exec_id: str | None = None,
+    ) -> LedgerDelta:
+        return LedgerDelta(
+            portfolio_id=portfolio.portfolio_id,
+            instrument_id=position.instrument_id,
+            qty=position.qty,
+            market_value=position.market_value,
+            cost=position.cost,
+            cash=portfolio.cash,
+            equity=portfolio.equity,
+            profit=portfolio.profit,
+            equity_change=equity_change,
+            is_fill=is_fill,
+            exec_id=exec_id,
+        )
+
+    def load(self, session: Session) -> None:
+        """
+        Replace the in-memory state with the rows currently in the database.
+        """
+        with self.__lock:
+            self.__portfolios.clear()
+            self.__holders.clear()
+            for portfolio in session.exec(select(Portfolio)).all():
+                assert portfolio.id is not None
+                state = self.__portfolio_state(portfolio.id)
+                state.cash = portfolio.cash
+                state.realized = portfolio.profit
+            statement = select(Position).where(Position.instrument_id.is_not(None))  # type: ignore[union-attr]
+            for row in session.exec(statement).all():
+                if (
+                    row.portfolio_id is None
+                    or row.instrument_id is None
+                    or row.qty == 0
+                ):
+                    continue
+                sign = -1.0 if row.long_short == PositionDirection.SHORT else 1.0
+                state = self.__portfolio_state(row.portfolio_id)
+                position = self.__position_state(state, row.instrument_id)
+                position.position_id = row.id
+                position.qty = sign * row.qty
+                position.cost = sign * (row.cost or 0.0)
+                position.price = self.__prices.get(
+                    row.instrument_id, (row.market_value or 0.0) / row.qty
+                )
+                state.market_value += position.market_value
+                state.cost += position.cost
+                # profit was persisted including the open positions' unrealized P&L
+                state.realized -= position.unrealized
+            since = datetime.utcnow() - _EXECUTIONS_KEPT
+            self.__executions = set(
+                session.exec(
+                    select(Execution.exec_id).where(Execution.applied_at >= since)
+                ).all()
+            )
+            self.__new_executions.clear()
+            self.__dirty_positions.clear()
+            self.__dirty_portfolios.clear()
+            self.__last_checkpoint = time.monotonic()
+
+    def unload(self) -> None:
+        """
+        Drop the in-memory state, for a worker that no longer owns it.
+        """
+        with self.__lock:
+            self.__portfolios.clear()
+            self.__holders.clear()
+            self.__executions.clear()
+            self.__new_executions.clear()
+            self.__dirty_positions.clear()
+            self.__dirty_portfolios.clear()
+
+    def apply_fill(
+        self,
+        portfolio_id: int,
+        instrument_id: int,
+        qty: float,
+        price: float,
+        fees: float = 0.0,
+    ) -> LedgerDelta:
+        """
+        Apply an execution, qty is signed: positive buys, negative sells.
+        """
+        with self.__lock:
+            delta = self.__fill(portfolio_id, instrument_id, qty, price, fees)
+        self.__publish(delta)
+        return delta
+
+    def apply_execution(
+        self,
+        exec_id: str,
+        portfolio_id: int,
+        instrument_id: int,
+        qty: float,
+        price: float,
+        fees: float = 0.0,
+    ) -> LedgerDelta | None:
+        """
+        Apply a broker execution once, None when exec_id was applied before.
+        The execution is written by the checkpoint that writes its fill.
+        """
+        with self.__lock:
+            if exec_id in self.__executions:
+                return None
+            self.__executions.add(exec_id)
+            self.__new_executions.append(
+                {
+                    "exec_id": exec_id,
+                    "portfolio_id": portfolio_id,
+                    "instrument_id": instrument_id,
+                    "applied_at": datetime.utcnow(),
+                }
+            )
+            delta = self.__fill(portfolio_id, instrument_id, qty, price, fees, exec_id)
+        self.__publish(delta)
+        return delta
+
+    def __fill(
+        self,
+        portfolio_id: int,
+        instrument_id: int,
+        qty: float,
+        price: float,
+        fees: float,
+        exec_id: str | None = None,
+    ) -> LedgerDelta:
+        # callers hold the lock
+        portfolio = self.__portfolio_state(portfolio_id)
+        position = self.__position_state(portfolio, instrument_id)
+        equity_before = portfolio.equity
+        portfolio.market_value -= position.market_value
+        portfolio.cost -= position.cost
+
+        portfolio.cash -= qty * price + fees
+        portfolio.realized -= fees
+        remaining = qty
+        if position.qty and (position.qty > 0) != (qty > 0):
+            # reduce (and possibly flip) the open position at its average cost
+            closed = -position.qty if abs(qty) >= abs(position.qty) else qty
+            average = position.cost / position.qty
+            portfolio.realized -= closed * (price - average)
+            position.cost += closed * average
+            position.qty += closed
+            remaining -= closed
+        if remaining:
+            position.qty += remaining
+            position.cost += remaining * price
+        if not position.qty:
+            position.cost = 0.0
+        self.__prices[instrument_id] = price
+        position.price = price
+
+        portfolio.market_value += position.market_value
+        portfolio.cost += position.cost
+        self.__dirty_positions.add((portfolio_id, instrument_id))
+        self.__dirty_portfolios.add(portfolio_id)
+        return self.__delta(
+            portfolio, position, portfolio.equity - equity_before, True, exec_id
+        )
+
+    def apply_price(self, instrument_id: int, price: float) -> list[LedgerDelta]:
+        """
+        Mark every position in the instrument to a new price.
+        """
+        deltas = []
+        with self.__lock:
+            self.__prices[instrument_id] = price
+            for position in self.__holders.get(instrument_id, ()):
+                change = position.qty * (price - position.price)
+                position.price = price
+                if not change:
+                    continue
+                portfolio = self.__portfolios[position.portfolio_id]
+                portfolio.market_value += change
+                self.__dirty_positions.add((position.portfolio_id, instrument_id))
+                self.__dirty_portfolios.add(position.portfolio_id)
+                deltas.append(self.__delta(portfolio, position, change, False))
+        for delta in deltas:
+            self.__publish(delta)
+        return deltas
+
+    @property
+    def checkpointed_at(self) -> float:
+        """
+        Wall clock time every change made before is in the database by.
+        """
+        with self.__lock:
+            if self.__dirty_portfolios or self.__checkpointing:
+                return self.__checkpointed_at
+            return time.time()
+
+    def should_checkpoint(self) -> bool:
+        return bool(self.__dirty_portfolios) and (
+            len(self.__dirty_positions) >= self.checkpoint_max_dirty
+            or time.monotonic() - self.__last_checkpoint >= self.checkpoint_seconds
+        )
+
+    def checkpoint(self, session: Session) -> int:
+        """
+        Write every changed position and portfolio, with the executions
+        applied since the last checkpoint, in one transaction and return the
+        number of position and portfolio rows written.
+        """
+        with self.__lock:
+            keys, self.__dirty_positions = self.__dirty_positions, set()
+            portfolio_ids, self.__dirty_portfolios = self.__dirty_portfolios, set()
+            executions, self.__new_executions = self.__new_executions, []
+            self.__last_checkpoint = time.monotonic()
+            self.__checkpointing = True
+            taken_at = time.time()
+            positions = [self.__portfolios[p].positions[i] for p, i in keys]
+            rows = [
+                {
+                    "portfolio_id": p.portfolio_id,
+                    "instrument_id": p.instrument_id,
+                    "long_short": PositionDirection.SHORT
+                    if p.qty < 0
+                    else PositionDirection.LONG,
+                    "qty": abs(p.qty),
+                    "cost": abs(p.cost),
+                    "market_value": abs(p.market_value),
+                }
+                for p in positions
+            ]
+            portfolios = [
+                {
+                    "id": state.portfolio_id,
+                    "cash": state.cash,
+                    "equity": state.equity,
+                    "profit": state.profit,
+                }
+                for state in (self.__portfolios[i] for i in portfolio_ids)
+            ]
+        existing = [
+            dict(row, id=p.position_id)
+            for p, row in zip(positions, rows, strict=True)
+            if p.position_id
+        ]
+        created = [
+            (p, row)
+            for p, row in zip(positions, rows, strict=True)
+            if not p.position_id
+        ]
+        try:
+            if existing:
+                session.execute(update(Position), existing)
+            if created:
+                ids = session.scalars(
+                    insert(Position).returning(
+                        col(Position.id), sort_by_parameter_order=True
+                    ),
+                    [row for _, row in created],
+                ).all()
+                for (position, _), position_id in zip(created, ids, strict=True):
+                    position.position_id = position_id
+            if portfolios:
+                session.execute(update(Portfolio), portfolios)
+            if executions:
+                session.execute(insert(Execution), executions)
+            session.commit()
+        except Exception:
+            session.rollback()
+            with self.__lock:
+                # ids returned by an insert that rolled back were never persisted
+                for position, _ in created:
+                    position.position_id = None
+                self.__dirty_positions |= keys
+                self.__dirty_portfolios |= portfolio_ids
+                self.__new_executions[:0] = executions
+                self.__checkpointing = False
+            raise
+        with self.__lock:
+            self.__checkpointed_at = taken_at
+            self.__checkpointing = False
+        return len(rows) + len(portfolios)
+
+    def run_checkpoints(
+        self, engine: Engine, stop: threading.Event, poll_seconds: float = 0.5
+    ) -> None:
+        """
+        Checkpoint loop for a background thread, returns once stop is set.
+        """
+        while not stop.wait(poll_seconds):
+            if not self.should_checkpoint():
+                continue
+            try:
+                with Session(engine) as session:
+                    self.checkpoint(session)
+            except Exception:
+                logger.exception("Ledger checkpoint failed")
+        with Session(engine) as session:
+            self.checkpoint(session)
+
+
+ledger = Ledger(
+    settings.LEDGER_CHECKPOINT_SECONDS, settings.LEDGER_CHECKPOINT_MAX_DIRTY
+)
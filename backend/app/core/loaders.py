@@ -0,0 +1,106 @@
+import logging
+from collections import Counter
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Literal
+
+from sqlalchemy import event
+from sqlalchemy.orm import ORMExecuteState, joinedload, selectinload
+from sqlalchemy.orm.interfaces import ORMOption
+from sqlmodel import Session
+
+from app.models import (
+    Chart,
+    Company,
+    FinStatement,
+    Instrument,
+    Order,
+    Portfolio,
+    Position,
+)
+
+logger = logging.getLogger(__name__)
+
+
+##########################################################################
+## Loader profiles
+##########################################################################
+
+# Named eager loading strategies, collections use selectinload (one extra
+# query per relationship), many-to-one uses joinedload (no extra query).
+LOADER_PROFILES: dict[str, Sequence[ORMOption]] = {
+    "company.detail": (
+        selectinload(Company.instruments),  # type: ignore[arg-type]
+        selectinload(Company.statements).selectinload(FinStatement.lines),  # type: ignore[arg-type]
+    ),
+    "instrument.detail": (
+        joinedload(Instrument.company),  # type: ignore[arg-type]
+        selectinload(Instrument.charts),  # type: ignore[arg-type]
+    ),
+    "chart.bars": (
+        selectinload(Chart.bars),  # type: ignore[arg-type]
+    ),
+    "portfolio.detail": (
+        selectinload(Portfolio.positions).joinedload(Position.instrument),  # type: ignore[arg-type]
+        selectinload(Portfolio.orders).selectinload(Order.legs),  # type: ignore[arg-type]
+    ),
+    "order.legs": (
+        selectinload(Order.legs),  # type: ignore[arg-type]
+    ),
+}
+
+
+def loader_options(profile: str | None) -> Sequence[ORMOption]:
+    if profile is None:
+        return ()
+    try:
+        return LOADER_PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown loader profile {profile}")
+
+
+##########################################################################
+## N+1 detection
+##########################################################################
+
+
+class NPlusOneError(Exception):
+    pass
+
+
+_lazy_loads: ContextVar[Counter[str] | None] = ContextVar("lazy_loads", default=None)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _count_lazy_load(orm_execute_state: ORMExecuteState) -> None:
+    counter = _lazy_loads.get()
+    if counter is None or orm_execute_state.lazy_loaded_from is None:
+        return
+    path = orm_execute_state.loader_strategy_path
+    counter[str(path[-1]) if path else str(orm_execute_state.statement)] += 1
+
+
+@contextmanager
+def detect_n_plus_one(
+    threshold: int, mode: Literal["off", "log", "raise"], label: str = ""
+) -> Iterator[None]:
+    """
+    Count the lazy relationship loads issued inside the block and report the
+    relationships that were lazy loaded at least threshold times.
+    """
+    counter: Counter[str] = Counter()
+    token = _lazy_loads.set(counter)
+    try:
+        yield
+    finally:
+        _lazy_loads.reset(token)
+    repeated = {key: count for key, count in counter.items() if count >= threshold}
+    if not repeated or mode == "off":
+        return
+    message = f"N+1 lazy loads in {label or 'block'}: " + ", ".join(
+        f"{key} x{count}" for key, count in sorted(repeated.items())
+    )
+    if mode == "raise":
+        raise NPlusOneError(message)
+    logger.warning(message)
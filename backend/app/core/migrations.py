@@ -0,0 +1,180 @@
+"""
+Helpers for Alembic migrations that must not block writes on large tables
+such as bar and trade. Each helper keeps ACCESS EXCLUSIVE locks short, or
+avoids them, and runs long scans outside the migration transaction.
+
+These need a live connection, they do not support offline (--sql) mode.
+"""
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from alembic import op
+
+
+def _quote(name: str) -> str:
+    return op.get_bind().dialect.identifier_preparer.quote(name)
+
+
+@contextmanager
+def lock_timeout(timeout: str = "5s") -> Iterator[None]:
+    """
+    Give up on a lock instead of queueing for it. A DDL statement waiting
+    behind a long transaction blocks every writer that queues after it.
+    """
+    op.execute(sa.text(f"SET lock_timeout = '{timeout}'"))
+    try:
+        yield
+    finally:
+        op.execute(sa.text("RESET lock_timeout"))
+
+
+def _drop_invalid_index(name: str) -> None:
+    # a failed CREATE INDEX CONCURRENTLY leaves an INVALID index behind
+    invalid = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ),
+            {"name": name},
+        )
+        .first()
+    )
+    if invalid:
+        op.execute(sa.text(f"DROP INDEX CONCURRENTLY IF EXISTS {_quote(name)}"))
+
+
+def create_index_concurrently(
+    name: str,
+    table: str,
+    columns: Sequence[str],
+    *,
+    unique: bool = False,
+    using: str | None = None,
+    where: str | None = None,
+    ops: dict[str, str] | None = None,
+) -> None:
+    with op.get_context().autocommit_block():
+        _drop_invalid_index(name)
+        op.create_index(
+            name,
+            table,
+            list(columns),
+            unique=unique,
+            if_not_exists=True,
+            postgresql_concurrently=True,
+            postgresql_using=using,
+            postgresql_where=sa.text(where) if where else None,
+            postgresql_ops=ops or {},
+        )
+
+
+def drop_index_concurrently(name: str, table: str) -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            name, table_name=table, if_exists=True, postgresql_concurrently=True
+        )
+
+
+def add_column(table: str, column: sa.Column, timeout: str = "5s") -> None:  # type: ignore[type-arg]
+    """
+    Nullable columns and columns with a constant default are added without a
+    table rewrite, only the brief catalog lock is needed.
+    """
+    with lock_timeout(timeout):
+        op.add_column(table, column)
+
+
+def add_foreign_key_not_valid(
+    name: str,
+    source_table: str,
+    referent_table: str,
+    local_columns: Sequence[str],
+    remote_columns: Sequence[str],
+    timeout: str = "5s",
+) -> None:
+    """
+    Enforce the key for new rows only, existing rows are checked later by
+    validate_constraint.
+    """
+    with lock_timeout(timeout):
+        op.create_foreign_key(
+            name,
+            source_table,
+            referent_table,
+            list(local_columns),
+            list(remote_columns),
+            postgresql_not_valid=True,
+        )
+
+
+def add_check_not_valid(
+    name: str, table: str, condition: str, timeout: str = "5s"
+) -> None:
+    with lock_timeout(timeout):
+        op.create_check_constraint(name, table, condition, postgresql_not_valid=True)
+
+
+def validate_constraint(table: str, name: str) -> None:
+    """
+    Check existing rows against a NOT VALID constraint. This scans the table
+    under a SHARE UPDATE EXCLUSIVE lock, which does not block writes, and
+    runs in its own transaction so no earlier lock is held meanwhile.
+    """
+    with op.get_context().autocommit_block():
+        op.execute(
+            sa.text(f"ALTER TABLE {_quote(table)} VALIDATE CONSTRAINT {_quote(name)}")
+        )
+
+
+def set_not_null(table: str, column: str, timeout: str = "5s") -> None:
+    """
+    SET NOT NULL without the full table scan under an exclusive lock, the
+    validated check constraint proves there are no NULLs.
+    """
+    name = f"ck_{table}_{column}_not_null"
+    add_check_not_valid(name, table, f"{_quote(column)} IS NOT NULL", timeout)
+    validate_constraint(table, name)
+    with lock_timeout(timeout):
+        op.alter_column(table, column, nullable=False)
+        op.drop_constraint(name, table, type_="check")
+
+
+def backfill(
+    table: str,
+    assignments: str,
+    where: str | None = None,
+    *,
+    key: str = "id",
+    batch_size: int = 10_000,
+    pause: float = 0.0,
+) -> int:
+    """
+    UPDATE table SET assignments in key ranges of batch_size, each batch
+    commits on its own so row locks are held briefly. Returns rows updated.
+    """
+    bind = op.get_bind()
+    quoted_table, quoted_key = _quote(table), _quote(key)
+    statement = sa.text(
+        f"UPDATE {quoted_table} SET {assignments} "
+        f"WHERE {quoted_key} >= :start AND {quoted_key} < :end"
+        + (f" AND ({where})" if where else "")
+    )
+    updated = 0
+    with op.get_context().autocommit_block():
+        low, high = bind.execute(
+            sa.text(f"SELECT min({quoted_key}), max({quoted_key}) FROM {quoted_table}")
+        ).one()
+        if low is None:
+            return 0
+        for start in range(low, high + 1, batch_size):
+            result = bind.execute(
+                statement, {"start": start, "end": start + batch_size}
+            )
+            updated += result.rowcount
+            if pause:
+                time.sleep(pause)
+    return updated
@@ -0,0 +1,198 @@
+from sqlmodel import Session
+
+from app.core.broker_adopters import Broker
+from app.core.event_bus import publish_order
+from app.core.journal import commit_order
+from app.core.risk import RiskEngine, RiskTicket
+from app.models import (
+    Order,
+    OrderGroupCreate,
+    OrderGroupType,
+    OrderLeg,
+    OrderStatus,
+)
+
+_WORKING = (OrderStatus.PENDING.value, OrderStatus.SUBMITTED.value)
+
+
+def working_rows(order: Order, legs: list[OrderLeg]) -> list[Order | OrderLeg]:
+    """
+    The parent and legs of a group that are still working, neither filled
+    nor cancelled nor rejected.
+    """
+    rows: list[Order | OrderLeg] = [order, *legs]
+    return [row for row in rows if row.status in _WORKING]
+
+
+def _validate_group(order_in: OrderGroupCreate) -> None:
+    if order_in.group_type == OrderGroupType.BRACKET and not order_in.legs:
+        raise ValueError("A bracket order needs at least one exit leg")
+    if order_in.group_type == OrderGroupType.OCO and len(order_in.legs) < 2:
+        raise ValueError("An OCO order needs at least two legs")
+
+
+def _build_legs(order_in: OrderGroupCreate) -> list[OrderLeg]:
+    return [
+        OrderLeg.model_validate(leg_in, update={"status": OrderStatus.PENDING.value})
+        for leg_in in order_in.legs
+    ]
+
+
+def _set_status(order: Order, status: OrderStatus) -> None:
+    order.status = status.value
+    for leg in order.legs:
+        leg.status = status.value
+
+
+class OrderManager:
+    """
+    Submits, cancels and replaces composite orders. Each operation writes the
+    parent and all of its legs in one transaction and makes one broker call
+    for the whole group. With a risk engine every group is checked before
+    anything is written, a rejected group never reaches the database.
+    """
+
+    def __init__(
+        self, session: Session, broker: Broker, risk: RiskEngine | None = None
+    ):
+        self.__session = session
+        self.__broker = broker
+        self.__risk = risk
+
+    def __check(
+        self, order_in: OrderGroupCreate, replaces: int | None = None
+    ) -> RiskTicket | None:
+        if self.__risk is None:
+            return None
+        return self.__risk.check(order_in, replaces=replaces)
+
+    def __release(self, ticket: RiskTicket | None) -> None:
+        if ticket is not None and self.__risk is not None:
+            self.__risk.release(ticket)
+
+    def __attach(self, order: Order, ticket: RiskTicket | None) -> None:
+        if ticket is not None and self.__risk is not None:
+            assert order.id is not None
+            self.__risk.attach(order.id, ticket)
+
+    def __commit_or_cancel(self, order: Order) -> Order:
+        try:
+            commit_order(self.__session, order)
+        except Exception:
+            # the group is live at the broker but we failed to record it
+            self.__session.rollback()
+            self.__broker.cancel_group(order, order.legs)
+            raise
+        self.__session.refresh(order)
+        publish_order(order)
+        return order
+
+    def submit_group(self, order_in: OrderGroupCreate) -> Order:
+        _validate_group(order_in)
+        ticket = self.__check(order_in)
+        try:
+            order = Order.model_validate(
+                order_in.model_dump(exclude={"legs"}),
+                update={"status": OrderStatus.PENDING.value},
+            )
+            order.legs = _build_legs(order_in)
+            self.__session.add(order)
+            # flush assigns ids so the OCO group can be named after the parent
+            self.__session.flush()
+            try:
+                self.__broker.place_group(order, order.legs)
+            except Exception:
+                self.__session.rollback()
+                raise
+            _set_status(order, OrderStatus.SUBMITTED)
+            order = self.__commit_or_cancel(order)
+        except Exception:
+            self.__release(ticket)
+            raise
+        self.__attach(order, ticket)
+        return order
+
+    def cancel_group(self, order: Order) -> Order:
+        """
+        Cancel the parts of the group still working, filled ones are left as
+        they are.
+        """
+        if order.group_type is None:
+            raise ValueError("Order is not part of a group")
+        working = working_rows(order, order.legs)
+        if not working:
+            raise ValueError("Order group is no longer working")
+        self.__broker.cancel_group(order, order.legs)
+        for row in working:
+            row.status = OrderStatus.CANCELLED.value
+        self.__session.add(order)
+        commit_order(self.__session, order)
+        self.__session.refresh(order)
+        publish_order(order)
+        if self.__risk is not None:
+            assert order.id is not None
+            self.__risk.release_order(order.id)
+        return order
+
+    def replace_group(self, order: Order, order_in: OrderGroupCreate) -> Order:
+        """
+        Cancel the working group and route its replacement in one step, the
+        parent row is kept so its id stays stable for clients. The replacement
+        is checked without the buying power the working group holds.
+        """
+        if order.group_type is None:
+            raise ValueError("Order is not part of a group")
+        if order.status not in _WORKING:
+            raise ValueError("Order group is no longer working")
+        _validate_group(order_in)
+        order_id = order.id
+        assert order_id is not None
+        order_in = order_in.model_copy(
+            update={
+                "portfolio_id": order_in.portfolio_id
+                if order_in.portfolio_id is not None
+                else order.portfolio_id,
+                "account_id": order_in.account_id
+                if order_in.account_id is not None
+                else order.account_id,
+            }
+        )
+        ticket = self.__check(order_in, replaces=order_id)
+        try:
+            self.__broker.cancel_group(order, order.legs)
+        except Exception:
+            self.__release(ticket)
+            raise
+        try:
+            order = self.__replace(order, order_in)
+        except Exception:
+            # the working group is gone either way
+            self.__release(ticket)
+            if self.__risk is not None:
+                self.__risk.release_order(order_id)
+            raise
+        # takes over from the ticket of the cancelled group
+        self.__attach(order, ticket)
+        return order
+
+    def __replace(self, order: Order, order_in: OrderGroupCreate) -> Order:
+        for leg in order.legs:
+            self.__session.delete(leg)
+        order.sqlmodel_update(
+            order_in.model_dump(exclude={"legs"}),
+            update={"status": OrderStatus.PENDING.value, "broker_order_id": None},
+        )
+        order.legs = _build_legs(order_in)
+        self.__session.add(order)
+        self.__session.flush()
+        try:
+            self.__broker.place_group(order, order.legs)
+        except Exception:
+            # the old group is already cancelled at the broker, record that
+            self.__session.rollback()
+            _set_status(order, OrderStatus.CANCELLED)
+            commit_order(self.__session, order)
+            publish_order(order)
+            raise
+        _set_status(order, OrderStatus.SUBMITTED)
+        return self.__commit_or_cancel(order)
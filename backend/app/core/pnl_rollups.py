@@ -0,0 +1,303 @@
+"""
+Daily realized P&L per portfolio and per account, materialized from the
+trades with an exit bar so a report over years reads one row per day, or
+per week or month, instead of every trade. Trades are dated by their exit
+bar like the trade aggregates.
+
+Writes to trades refresh the (portfolio, day) rows of the days the trades
+exit on before and after the write, and the account rows of those days, in
+the write's transaction. Moving a portfolio to another account isn't
+tracked, rebuild the affected range afterwards.
+"""
+from collections.abc import Collection, Iterable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Any
+
+from sqlalchemy import DateTime, Engine, case, cast, delete, func, select, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, SQLModel, col
+
+from app.models import (
+    Account,
+    AccountDailyPnl,
+    Bar,
+    PnlPeriod,
+    PnlPeriods,
+    Portfolio,
+    PortfolioDailyPnl,
+    Trade,
+    TradeGroup,
+)
+
+_PERIODS = (TradeGroup.DAY, TradeGroup.WEEK, TradeGroup.MONTH)
+_SUMS = ("trades", "wins", "profit_loss", "total_fees")
+
+# chunk size of the id and key lists sent to the database
+_KEY_BATCH = 5_000
+
+DayKey = tuple[int, date]
+
+
+def _chunks(values: Sequence[Any]) -> Iterable[Sequence[Any]]:
+    for start in range(0, len(values), _KEY_BATCH):
+        yield values[start : start + _KEY_BATCH]
+
+
+def trade_days(session: Session, trade_ids: Collection[int | None]) -> set[DayKey]:
+    """
+    (portfolio_id, day) of the exit bars of the trades, trades without an
+    id, portfolio or exit bar are left out.
+    """
+    exit_ = aliased(Bar)
+    days: set[DayKey] = set()
+    for ids in _chunks(sorted(id for id in trade_ids if id is not None)):
+        statement = (
+            select(col(Trade.portfolio_id), func.date(exit_.timestamp))
+            .join(exit_, col(exit_.id) == Trade.exit_action_bar_id)
+            .where(col(Trade.id).in_(ids), col(Trade.portfolio_id).is_not(None))
+            .distinct()
+        )
+        days.update(session.execute(statement).tuples())
+    return days
+
+
+def _portfolio_sums(exit_: Any, *where: Any) -> Any:
+    day = func.date(exit_.timestamp)
+    return (
+        select(
+            col(Trade.portfolio_id).label("portfolio_id"),
+            day.label("day"),
+            func.count(col(Trade.id)).label("trades"),
+            func.coalesce(
+                func.sum(case((col(Trade.is_win).is_(True), 1), else_=0)), 0
+            ).label("wins"),
+            func.coalesce(func.sum(Trade.profit_loss), 0.0).label("profit_loss"),
+            func.coalesce(func.sum(Trade.total_fees), 0.0).label("total_fees"),
+        )
+        .join(exit_, col(exit_.id) == Trade.exit_action_bar_id)
+        .where(col(Trade.portfolio_id).is_not(None), *where)
+        .group_by(col(Trade.portfolio_id), day)
+    )
+
+
+def _account_sums(*where: Any) -> Any:
+    return (
+        select(
+            col(Portfolio.account_id).label("account_id"),
+            col(PortfolioDailyPnl.day).label("day"),
+            *(func.sum(getattr(PortfolioDailyPnl, name)).label(name) for name in _SUMS),
+        )
+        .join(Portfolio, col(Portfolio.id) == PortfolioDailyPnl.portfolio_id)
+        .join(Account, col(Account.id) == Portfolio.account_id)
+        .where(*where)
+        .group_by(col(Portfolio.account_id), col(PortfolioDailyPnl.day))
+    )
+
+
+def _upsert(session: Session, table: type[SQLModel], key: str, sums: Any) -> int:
+    statement = insert(table).from_select([key, "day", *_SUMS], sums)
+    statement = statement.on_conflict_do_update(
+        index_elements=[key, "day"],
+        set_={name: statement.excluded[name] for name in _SUMS},
+    )
+    written: int = session.execute(statement).rowcount  # type: ignore[attr-defined]
+    return written
+
+
+def refresh_daily_pnl(session: Session, days: Iterable[DayKey]) -> int:
+    """
+    Recompute the portfolio rows of the (portfolio_id, day) pairs and the
+    account rows of those portfolios' accounts on the same days, rows left
+    without trades are deleted. Returns the number of portfolio rows written.
+    """
+    keys = sorted(set(days))
+    if not keys:
+        return 0
+    written = 0
+    exit_ = aliased(Bar)
+    for chunk in _chunks(keys):
+        session.execute(
+            delete(PortfolioDailyPnl).where(
+                tuple_(
+                    col(PortfolioDailyPnl.portfolio_id), col(PortfolioDailyPnl.day)
+                ).in_(chunk)
+            )
+        )
+        written += _upsert(
+            session,
+            PortfolioDailyPnl,
+            "portfolio_id",
+            _portfolio_sums(
+                exit_,
+                tuple_(col(Trade.portfolio_id), func.date(exit_.timestamp)).in_(chunk),
+            ),
+        )
+
+    portfolio_ids = sorted({portfolio_id for portfolio_id, _ in keys})
+    accounts = dict(
+        session.execute(
+            select(col(Portfolio.id), col(Portfolio.account_id)).where(
+                col(Portfolio.id).in_(portfolio_ids),
+                col(Portfolio.account_id).is_not(None),
+            )
+        )
+        .tuples()
+        .all()
+    )
+    account_keys = sorted({(accounts[p], day) for p, day in keys if p in accounts})
+    for chunk in _chunks(account_keys):
+        session.execute(
+            delete(AccountDailyPnl).where(
+                tuple_(col(AccountDailyPnl.account_id), col(AccountDailyPnl.day)).in_(
+                    chunk
+                )
+            )
+        )
+        _upsert(
+            session,
+            AccountDailyPnl,
+            "account_id",
+            _account_sums(
+                tuple_(col(Portfolio.account_id), col(PortfolioDailyPnl.day)).in_(chunk)
+            ),
+        )
+    return written
+
+
+def rebuild_daily_pnl(session: Session, start: date, end: date) -> int:
+    """
+    Replace the portfolio and account rows of the days in [start, end) by
+    ones summed from the trades, returns the number of portfolio rows.
+    """
+    for table in (PortfolioDailyPnl, AccountDailyPnl):
+        session.execute(
+            delete(table).where(col(table.day) >= start, col(table.day) < end)
+        )
+    exit_ = aliased(Bar)
+    written = _upsert(
+        session,
+        PortfolioDailyPnl,
+        "portfolio_id",
+        _portfolio_sums(
+            exit_,
+            exit_.timestamp >= datetime.combine(start, datetime.min.time()),
+            exit_.timestamp < datetime.combine(end, datetime.min.time()),
+        ),
+    )
+    _upsert(
+        session,
+        AccountDailyPnl,
+        "account_id",
+        _account_sums(
+            col(PortfolioDailyPnl.day) >= start,
+            col(PortfolioDailyPnl.day) < end,
+        ),
+    )
+    return written
+
+
+def trade_day_range(session: Session) -> tuple[date, date] | None:
+    """
+    First day with a trade exit and the day after the last one.
+    """
+    exit_ = aliased(Bar)
+    statement = select(func.min(exit_.timestamp), func.max(exit_.timestamp)).join(
+        Trade, col(Trade.exit_action_bar_id) == exit_.id
+    )
+    first, last = session.execute(statement).one()
+    if first is None:
+        return None
+    return first.date(), last.date() + timedelta(days=1)
+
+
+def rebuild_daily_pnl_parallel(
+    engine: Engine, start: date, end: date, workers: int = 4, chunk_days: int = 31
+) -> int:
+    """
+    rebuild_daily_pnl over [start, end) in chunks of chunk_days days, each
+    in its own session and transaction, run by workers threads. Account rows
+    only sum portfolio rows of the same day so chunks are independent.
+    """
+    chunks = []
+    day = start
+    while day < end:
+        chunks.append((day, min(day + timedelta(days=chunk_days), end)))
+        day += timedelta(days=chunk_days)
+
+    def rebuild(chunk: tuple[date, date]) -> int:
+        with Session(engine) as session:
+            written = rebuild_daily_pnl(session, *chunk)
+            session.commit()
+            return written
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(rebuild, chunks))
+
+
+def _periods(
+    session: Session,
+    table: Any,
+    owner: Any,
+    start: date | None,
+    end: date | None,
+    period: TradeGroup,
+) -> PnlPeriods:
+    if period not in _PERIODS:
+        raise ValueError("period has to be one of day, week and month")
+    day = table.day
+    if period != TradeGroup.DAY:
+        day = func.date(func.date_trunc(period.value, cast(table.day, DateTime)))
+    statement = select(
+        day.label("day"),
+        *(func.sum(getattr(table, name)).label(name) for name in _SUMS),
+    ).where(owner)
+    if start is not None:
+        statement = statement.where(table.day >= start)
+    if end is not None:
+        statement = statement.where(table.day < end)
+    rows = session.execute(statement.group_by(day).order_by(day)).mappings()
+    return PnlPeriods(data=[PnlPeriod.model_validate(row) for row in rows])
+
+
+def portfolio_pnl(
+    session: Session,
+    portfolio_id: int,
+    start: date | None = None,
+    end: date | None = None,
+    period: TradeGroup = TradeGroup.DAY,
+) -> PnlPeriods:
+    """
+    Realized P&L of a portfolio per day, week or month in [start, end), read
+    from the daily rollups. Periods without trades are left out.
+    """
+    return _periods(
+        session,
+        PortfolioDailyPnl,
+        PortfolioDailyPnl.portfolio_id == portfolio_id,
+        start,
+        end,
+        period,
+    )
+
+
+def account_pnl(
+    session: Session,
+    account_id: int,
+    start: date | None = None,
+    end: date | None = None,
+    period: TradeGroup = TradeGroup.DAY,
+) -> PnlPeriods:
+    """
+    Realized P&L over the portfolios of an account per day, week or month in
+    [start, end), read from the daily rollups.
+    """
+    return _periods(
+        session,
+        AccountDailyPnl,
+        AccountDailyPnl.account_id == account_id,
+        start,
+        end,
+        period,
+    )
@@ -0,0 +1,187 @@
+"""
+Order, fill and position updates from the event bus for the event stream.
+Every event gets a sequence number and the latest ones are kept, so a
+client reconnecting with the id of the last event it got receives what it
+missed. When that event is gone from the buffer, was sent by another
+process, or a client falls too far behind, it gets a reset event instead
+and refetches the state it shows.
+"""
+import asyncio
+import json
+import threading
+import uuid
+from collections import deque
+from collections.abc import Collection
+from dataclasses import dataclass
+from typing import Any
+
+from app.core.config import settings
+from app.core.event_bus import (
+    FILL,
+    ORDER,
+    ORDER_DELETED,
+    POSITION,
+    BusEvent,
+    OverflowPolicy,
+    Topic,
+    event_bus,
+)
+
+# event types, besides the event bus topic kinds forwarded to the stream
+RESET = "reset"
+
+
+@dataclass(frozen=True, slots=True)
+class PushEvent:
+    seq: int
+    type: str
+    data: dict[str, Any]
+    portfolio_id: int | None = None
+    account_id: int | None = None
+
+
+class PushSubscription:
+    """
+    Events for one stream, filtered by portfolio and account; empty filters
+    let everything through. Events are handed over on the stream's event
+    loop, a full queue is replaced by a reset event.
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        portfolio_ids: Collection[int],
+        account_ids: Collection[int],
+        queue_size: int,
+    ):
+        self.loop = loop
+        self.portfolio_ids = frozenset(portfolio_ids)
+        self.account_ids = frozenset(account_ids)
+        self.queue: asyncio.Queue[PushEvent] = asyncio.Queue(queue_size)
+        self.lagging = False
+
+    def matches(self, event: PushEvent) -> bool:
+        if not self.portfolio_ids and not self.account_ids:
+            return True
+        return (
+            event.portfolio_id in self.portfolio_ids
+            or event.account_id in self.account_ids
+        )
+
+    def offer(self, event: PushEvent) -> None:
+        if self.lagging:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.lagging = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(PushEvent(event.seq, RESET, {}))
+
+    async def get(self) -> PushEvent:
+        event = await self.queue.get()
+        if event.type == RESET:
+            self.lagging = False
+        return event
+
+
+class PushHub:
+    def __init__(self, buffer_size: int = 10_000, queue_size: int = 1_000):
+        self.queue_size = queue_size
+        # tells the events of this process apart from those of a previous
+        # run or another worker
+        self.epoch = uuid.uuid4().hex[:12]
+        self.__buffer: deque[PushEvent] = deque(maxlen=buffer_size)
+        self.__seq = 0
+        self.__subscriptions: set[PushSubscription] = set()
+        self.__lock = threading.Lock()
+
+    def event_id(self, event: PushEvent) -> str:
+        return f"{self.epoch}-{event.seq}"
+
+    def publish(
+        self,
+        type: str,
+        data: dict[str, Any],
+        portfolio_id: int | None = None,
+        account_id: int | None = None,
+    ) -> PushEvent:
+        """
+        Publish an event from any thread.
+        """
+        with self.__lock:
+            self.__seq += 1
+            event = PushEvent(self.__seq, type, data, portfolio_id, account_id)
+            self.__buffer.append(event)
+            subscriptions = [s for s in self.__subscriptions if s.matches(event)]
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(subscription.offer, event)
+        return event
+
+    def subscribe(
+        self,
+        portfolio_ids: Collection[int] = (),
+        account_ids: Collection[int] = (),
+        last_event_id: str | None = None,
+    ) -> PushSubscription:
+        """
+        Subscribe the running event loop. With the id of the last event a
+        client got, the buffered events after it are queued first, or a
+        reset event when they can't be.
+        """
+        subscription = PushSubscription(
+            asyncio.get_running_loop(), portfolio_ids, account_ids, self.queue_size
+        )
+        with self.__lock:
+            if last_event_id is not None:
+                after = self.__resume_after(last_event_id)
+                if after is None:
+                    subscription.offer(PushEvent(self.__seq, RESET, {}))
+                else:
+                    for event in self.__buffer:
+                        if event.seq > after and subscription.matches(event):
+                            subscription.offer(event)
+            self.__subscriptions.add(subscription)
+        return subscription
+
+    def __resume_after(self, last_event_id: str) -> int | None:
+        epoch, _, seq = last_event_id.rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        after = int(seq)
+        oldest = self.__buffer[0].seq if self.__buffer else self.__seq + 1
+        return after if oldest - 1 <= after <= self.__seq else None
+
+    def unsubscribe(self, subscription: PushSubscription) -> None:
+        with self.__lock:
+            self.__subscriptions.discard(subscription)
+
+    def encode(self, event: PushEvent) -> str:
+        """
+        The event as a server-sent event.
+        """
+        data = json.dumps(event.data, separators=(",", ":"))
+        return f"id: {self.event_id(event)}\nevent: {event.type}\ndata: {data}\n\n"
+
+
+push_hub = PushHub(settings.PUSH_BUFFER_SIZE, settings.PUSH_QUEUE_SIZE)
+
+
+def forward_event(event: BusEvent) -> None:
+    payload = event.payload
+    push_hub.publish(
+        event.topic.kind,
+        payload,
+        payload.get("portfolio_id"),
+        payload.get("account_id"),
+    )
+
+
+# one subscription keeps the kinds in the order they were published, blocking
+# rather than dropping since the stream resets lagging clients itself
+event_bus.add_consumer(
+    [Topic(ORDER), Topic(ORDER_DELETED), Topic(FILL), Topic(POSITION)],
+    forward_event,
+    OverflowPolicy.BLOCK,
+)
@@ -0,0 +1,165 @@
+"""
+Hot read paths built as lambda statements: SQLAlchemy caches the statement
+construction and the compiled SQL per call site, and since the SQL text is
+identical on every call psycopg turns it into a server-side prepared
+statement once POSTGRES_PREPARE_THRESHOLD executions have been seen on a
+connection.
+
+Every query here records how long it spent compiling (from the Core execute
+call, the compiled cache lookup or the compile itself, until the cursor is
+called), executing (the cursor call) and loading rows into objects, see
+query_stats(). Pool checkout and the session's autobegin come before the
+compile step and count towards none of them.
+"""
+import threading
+import time
+from collections.abc import Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import Engine, event, lambda_stmt, select
+from sqlalchemy.engine.default import CACHE_HIT, DefaultExecutionContext
+from sqlmodel import Session, col
+
+from app.models import Bar, Order, OrderStatus, Position, QueryStats
+
+
+@dataclass(slots=True)
+class _Timing:
+    started: float | None = None
+    sent: float | None = None
+    executed: float = 0.0
+    cache_hit: bool = False
+
+
+@dataclass(slots=True)
+class _Totals:
+    calls: int = 0
+    cache_hits: int = 0
+    compile_time: float = 0.0
+    execute_time: float = 0.0
+    load_time: float = 0.0
+
+
+class _QueryStats:
+    def __init__(self) -> None:
+        self.__totals: dict[str, _Totals] = {}
+        self.__lock = threading.Lock()
+
+    def record(self, name: str, timing: _Timing, finished: float) -> None:
+        assert timing.started is not None and timing.sent is not None
+        with self.__lock:
+            totals = self.__totals.setdefault(name, _Totals())
+            totals.calls += 1
+            totals.cache_hits += timing.cache_hit
+            totals.compile_time += timing.sent - timing.started
+            totals.execute_time += timing.executed
+            totals.load_time += finished - timing.sent - timing.executed
+
+    def snapshot(self) -> list[QueryStats]:
+        with self.__lock:
+            return [
+                QueryStats(
+                    name=name,
+                    calls=t.calls,
+                    compiled_cache_hits=t.cache_hits,
+                    compile_ms=t.compile_time * 1000 / t.calls,
+                    execute_ms=t.execute_time * 1000 / t.calls,
+                    load_ms=t.load_time * 1000 / t.calls,
+                )
+                for name, t in sorted(self.__totals.items())
+            ]
+
+    def reset(self) -> None:
+        with self.__lock:
+            self.__totals.clear()
+
+
+_stats = _QueryStats()
+_timing: ContextVar[_Timing | None] = ContextVar("query_timing", default=None)
+
+
+@event.listens_for(Engine, "before_execute", named=True)
+def _before_execute(**_kw: Any) -> None:
+    # a connection is checked out and has begun by now, the statement is compiled next
+    timing = _timing.get()
+    if timing is not None and timing.started is None:
+        timing.started = time.perf_counter()
+
+
+@event.listens_for(Engine, "before_cursor_execute", named=True)
+def _before_cursor_execute(context: DefaultExecutionContext, **_kw: Any) -> None:
+    timing = _timing.get()
+    if timing is not None and timing.started is not None and timing.sent is None:
+        timing.sent = time.perf_counter()
+        timing.cache_hit = context.cache_hit is CACHE_HIT
+
+
+@event.listens_for(Engine, "after_cursor_execute", named=True)
+def _after_cursor_execute(**_kw: Any) -> None:
+    timing = _timing.get()
+    if timing is not None and timing.sent is not None and not timing.executed:
+        timing.executed = time.perf_counter() - timing.sent
+
+
+@contextmanager
+def timed(name: str) -> Iterator[None]:
+    timing = _Timing()
+    token = _timing.set(timing)
+    try:
+        yield
+    finally:
+        _timing.reset(token)
+    if timing.sent is not None:
+        _stats.record(name, timing, time.perf_counter())
+
+
+def query_stats() -> list[QueryStats]:
+    return _stats.snapshot()
+
+
+def reset_query_stats() -> None:
+    _stats.reset()
+
+
+def bars_in_range(
+    session: Session, chart_id: int, start: datetime, end: datetime
+) -> Sequence[Bar]:
+    """
+    Bars of a chart with start <= timestamp < end in time order.
+    """
+    with timed("bars_in_range"):
+        statement = lambda_stmt(
+            lambda: select(Bar)
+            .where(
+                col(Bar.chart_id) == chart_id,
+                col(Bar.timestamp) >= start,
+                col(Bar.timestamp) < end,
+            )
+            .order_by(col(Bar.timestamp))
+        )
+        return session.scalars(statement).all()
+
+
+def positions_by_portfolio(session: Session, portfolio_id: int) -> Sequence[Position]:
+    with timed("positions_by_portfolio"):
+        statement = lambda_stmt(
+            lambda: select(Position).where(col(Position.portfolio_id) == portfolio_id)
+        )
+        return session.scalars(statement).all()
+
+
+def orders_by_status(
+    session: Session, portfolio_id: int, statuses: Sequence[OrderStatus]
+) -> Sequence[Order]:
+    values = [status.value for status in statuses]
+    with timed("orders_by_status"):
+        statement = lambda_stmt(
+            lambda: select(Order).where(
+                col(Order.portfolio_id) == portfolio_id, col(Order.status).in_(values)
+            )
+        )
+        return session.scalars(statement).all()
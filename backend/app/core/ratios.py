@@ -0,0 +1,222 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import delete, insert, select
+from sqlmodel import Session, col
+
+from app.core.fundamentals import (
+    FundamentalsMatrix,
+    backfill_line_name_ids,
+    materialize,
+)
+from app.models import Company, FinRatio, FSType
+
+# Line items each figure is read from, the first one a company reports is
+# used. Covers the Reuters COA codes of the IB fundamentals feed and plain
+# names.
+RATIO_LINES: dict[str, tuple[FSType, tuple[str, ...]]] = {
+    "revenue": (FSType.INCOME, ("RTLR", "TotalRevenue", "Revenue", "revenue")),
+    "gross_profit": (FSType.INCOME, ("SGRP", "GrossProfit", "gross_profit")),
+    "operating_income": (
+        FSType.INCOME,
+        ("SOPI", "OperatingIncome", "operating_income"),
+    ),
+    "net_income": (FSType.INCOME, ("NINC", "NetIncome", "net_income")),
+    "total_equity": (FSType.BALANCE_SHEET, ("QTLE", "TotalEquity", "total_equity")),
+    "total_debt": (FSType.BALANCE_SHEET, ("STLD", "TotalDebt", "total_debt")),
+}
+
+# chunk size of the company id lists sent to the database
+_COMPANY_BATCH = 5_000
+
+
+@dataclass
+class RatioSeries:
+    """
+    Every figure as a (company, quarter) matrix, NaN where it can't be derived.
+    """
+
+    companies: npt.NDArray[np.int64]
+    periods: npt.NDArray[np.int64]
+    values: dict[str, npt.NDArray[np.float64]]
+
+
+def _quarter_number(periods: npt.NDArray[np.int64]) -> npt.NDArray[np.int64]:
+    return (periods // 10) * 4 + periods % 10 - 1
+
+
+def trailing_sum(
+    values: npt.NDArray[np.float64], periods: npt.NDArray[np.int64], n: int = 4
+) -> npt.NDArray[np.float64]:
+    """
+    Sum over the last n quarters of each column, NaN unless all n quarters are
+    reported and consecutive. periods are sorted quarterly period keys.
+    """
+    out = np.full(values.shape, np.nan)
+    if values.shape[1] < n:
+        return out
+    filled = np.concatenate(
+        [np.zeros((len(values), 1)), np.cumsum(np.nan_to_num(values), axis=1)], axis=1
+    )
+    missing = np.concatenate(
+        [
+            np.zeros((len(values), 1), dtype=np.int64),
+            np.cumsum(np.isnan(values), axis=1),
+        ],
+        axis=1,
+    )
+    sums = filled[:, n:] - filled[:, :-n]
+    gaps = missing[:, n:] - missing[:, :-n]
+    quarters = _quarter_number(periods)
+    consecutive = quarters[n - 1 :] - quarters[: len(quarters) - n + 1] == n - 1
+    out[:, n - 1 :] = np.where((gaps == 0) & consecutive, sums, np.nan)
+    return out
+
+
+def _divide(
+    numerator: npt.NDArray[np.float64], denominator: npt.NDArray[np.float64]
+) -> npt.NDArray[np.float64]:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator != 0, numerator / denominator, np.nan)
+
+
+def _line(
+    matrix: FundamentalsMatrix | None,
+    names: Sequence[str],
+    companies: npt.NDArray[np.int64],
+    periods: npt.NDArray[np.int64],
+) -> npt.NDArray[np.float64]:
+    out = np.full((len(companies), len(periods)), np.nan)
+    if matrix is None or not len(matrix.periods):
+        return out
+    columns = np.searchsorted(matrix.periods, periods).clip(max=len(matrix.periods) - 1)
+    has_column = matrix.periods[columns] == periods
+    for name in names:
+        _, _, values = matrix.series(name, company_ids=companies)
+        out = np.where(np.isnan(out) & has_column, values[:, columns], out)
+    return out
+
+
+def compute_ratios(
+    income: FundamentalsMatrix | None,
+    balance: FundamentalsMatrix | None,
+    market_caps: dict[int, float],
+) -> RatioSeries:
+    matrices = {FSType.INCOME: income, FSType.BALANCE_SHEET: balance}
+    present = [m for m in matrices.values() if m is not None]
+    companies = (
+        np.unique(np.concatenate([m.companies for m in present]))
+        if present
+        else np.empty(0, np.int64)
+    )
+    periods = (
+        np.unique(np.concatenate([m.periods for m in present]))
+        if present
+        else np.empty(0, np.int64)
+    )
+    periods = periods[(periods % 10 >= 1) & (periods % 10 <= 4)]
+
+    lines = {
+        figure: _line(matrices[st_type], names, companies, periods)
+        for figure, (st_type, names) in RATIO_LINES.items()
+    }
+    values = {
+        f"{figure}_ttm": trailing_sum(lines[figure], periods)
+        for figure in ("revenue", "gross_profit", "operating_income", "net_income")
+    }
+    values["total_equity"] = lines["total_equity"]
+    values["total_debt"] = lines["total_debt"]
+    values["gross_margin"] = _divide(values["gross_profit_ttm"], values["revenue_ttm"])
+    values["operating_margin"] = _divide(
+        values["operating_income_ttm"], values["revenue_ttm"]
+    )
+    values["net_margin"] = _divide(values["net_income_ttm"], values["revenue_ttm"])
+    values["roe"] = _divide(values["net_income_ttm"], values["total_equity"])
+    values["debt_to_equity"] = _divide(values["total_debt"], values["total_equity"])
+
+    # P/E only on the latest quarter with a TTM net income, market cap is today's
+    pe = np.full((len(companies), len(periods)), np.nan)
+    earnings = ~np.isnan(values["net_income_ttm"])
+    if len(periods):
+        latest = len(periods) - 1 - np.argmax(earnings[:, ::-1], axis=1)
+        caps = np.array(
+            [market_caps.get(int(c), np.nan) for c in companies], dtype=float
+        )
+        rows = np.flatnonzero(earnings.any(axis=1) & (caps > 0))
+        pe[rows, latest[rows]] = _divide(
+            caps[rows], values["net_income_ttm"][rows, latest[rows]]
+        )
+    values["pe"] = pe
+    return RatioSeries(companies=companies, periods=periods, values=values)
+
+
+def _rows(series: RatioSeries) -> list[dict[str, object]]:
+    names = list(series.values)
+    stacked = np.stack([series.values[name] for name in names])
+    company_index, period_index = np.nonzero(~np.isnan(stacked).all(axis=0))
+    cells = stacked[:, company_index, period_index].T
+    rows = []
+    for c, p, cell in zip(company_index, period_index, cells, strict=True):
+        period = int(series.periods[p])
+        row: dict[str, object] = {
+            name: None if np.isnan(v) else float(v)
+            for name, v in zip(names, cell, strict=True)
+        }
+        row.update(
+            company_id=int(series.companies[c]), year=period // 10, qtr=period % 10
+        )
+        rows.append(row)
+    return rows
+
+
+def _lines(st_type: FSType) -> list[str]:
+    return [
+        name
+        for line_type, names in RATIO_LINES.values()
+        if line_type == st_type
+        for name in names
+    ]
+
+
+def _recompute(session: Session, company_ids: Sequence[int] | None) -> int:
+    caps = select(col(Company.id), col(Company.market_cap))
+    if company_ids is not None:
+        caps = caps.where(col(Company.id).in_(company_ids))
+    backfill_line_name_ids(session, company_ids)
+    series = compute_ratios(
+        materialize(session, FSType.INCOME, company_ids, _lines(FSType.INCOME)),
+        materialize(
+            session, FSType.BALANCE_SHEET, company_ids, _lines(FSType.BALANCE_SHEET)
+        ),
+        dict(session.execute(caps).tuples().all()),
+    )
+    statement = delete(FinRatio)
+    if company_ids is not None:
+        statement = statement.where(col(FinRatio.company_id).in_(company_ids))
+    session.execute(statement)
+    rows = _rows(series)
+    if rows:
+        session.execute(insert(FinRatio), rows)
+    return len(rows)
+
+
+def recompute_ratios(
+    session: Session, company_ids: Sequence[int] | set[int] | None = None
+) -> int:
+    """
+    Replace the stored ratios of the given companies, or of every company,
+    and return the number of rows written. Commits once per chunk of
+    companies.
+    """
+    if company_ids is None:
+        written = _recompute(session, None)
+        session.commit()
+        return written
+    ids = sorted(company_ids)
+    written = 0
+    for start in range(0, len(ids), _COMPANY_BATCH):
+        written += _recompute(session, ids[start : start + _COMPANY_BATCH])
+        session.commit()
+    return written
@@ -0,0 +1,453 @@
+"""
+Pre-trade risk checks. Limits, account balances and positions are kept in
+memory, loaded once and then updated from ledger fills and account sync
+events, so checking an order is a handful of dict lookups and never reads
+the database.
+
+Accepted orders hold the buying power they use until they fill, are
+cancelled, rejected, replaced or deleted, or until the broker reports a new
+buying power for the account, which already accounts for its working orders.
+Reservations are kept by the worker that checked the order, so each worker
+only counts its own; the order events that release them come over the bus.
+"""
+import itertools
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from datetime import date
+
+from sqlalchemy import select
+from sqlmodel import Session, col
+
+from app.core.account_sync import AccountDelta
+from app.core.config import settings
+from app.core.event_bus import (
+    ACCOUNT,
+    FILL,
+    ORDER,
+    ORDER_DELETED,
+    POSITION,
+    BusEvent,
+    OverflowPolicy,
+    Topic,
+    event_bus,
+)
+from app.core.ledger import LedgerDelta
+from app.models import (
+    Account,
+    Instrument,
+    OrderGroupCreate,
+    OrderGroupType,
+    OrderSide,
+    OrderStatus,
+    Portfolio,
+    Position,
+    PositionDirection,
+    QtyUnits,
+    RiskStats,
+)
+
+# statuses of orders that no longer need their buying power
+_DONE = {
+    OrderStatus.FILLED.value,
+    OrderStatus.CANCELLED.value,
+    OrderStatus.REJECTED.value,
+}
+
+
+class RiskRejected(ValueError):
+    def __init__(self, reasons: list[str]):
+        super().__init__("; ".join(reasons))
+        self.reasons = reasons
+
+
+@dataclass(frozen=True, slots=True)
+class RiskLimits:
+    max_order_notional: float
+    max_position_value: float
+    max_daytrades: int
+    # the day trade limit only applies to accounts below this equity
+    pdt_min_equity: float
+
+
+@dataclass(slots=True)
+class AccountExposure:
+    account_id: int
+    buying_power: float = 0.0
+    equity: float = 0.0
+    daytrade_count: int = 0
+    # buying power held per ticket
+    reserved: dict[int, float] = field(default_factory=dict)
+
+
+@dataclass(slots=True)
+class PositionExposure:
+    # signed, negative for shorts
+    qty: float = 0.0
+    # day a fill opened the position from flat, None for loaded positions
+    opened_on: date | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class RiskTicket:
+    id: int
+    account_id: int
+    buying_power: float
+
+
+class LatencyHistogram:
+    """
+    Counts of durations per bucket, bounds are the buckets' upper ends in
+    microseconds with an open-ended bucket after the last.
+    """
+
+    BOUNDS_US = (
+        1.0,
+        2.0,
+        5.0,
+        10.0,
+        20.0,
+        50.0,
+        100.0,
+        200.0,
+        500.0,
+        1_000.0,
+        2_000.0,
+        5_000.0,
+        10_000.0,
+    )
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(self.BOUNDS_US) + 1)
+
+    def record(self, nanoseconds: int) -> None:
+        self.counts[bisect_left(self.BOUNDS_US, nanoseconds / 1_000)] += 1
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Upper bound of the bucket holding the q quantile, the last bound for
+        the open-ended bucket; None before anything was recorded.
+        """
+        total = sum(self.counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.BOUNDS_US[min(i, len(self.BOUNDS_US) - 1)]
+        return self.BOUNDS_US[-1]
+
+
+def _exposure(order_in: OrderGroupCreate) -> tuple[float, float]:
+    """
+    Qty and price of the order that opens exposure: the entry of a bracket,
+    the largest leg of an OCO group as only one of them fills.
+    """
+    if order_in.group_type == OrderGroupType.OCO and order_in.legs:
+        leg = max(order_in.legs, key=lambda leg: leg.qty * leg.price)
+        return leg.qty, leg.price
+    return order_in.qty, order_in.price
+
+
+class RiskEngine:
+    """
+    Checks orders against the notional, position value, buying power and
+    day trade limits. Every check is timed into a latency histogram.
+    """
+
+    def __init__(self, limits: RiskLimits):
+        self.limits = limits
+        self.latency = LatencyHistogram()
+        self.checks = 0
+        self.rejections = 0
+        self.__account_limits: dict[int, RiskLimits] = {}
+        self.__accounts: dict[int, AccountExposure] = {}
+        self.__portfolio_accounts: dict[int, int] = {}
+        self.__symbols: dict[int, str] = {}
+        self.__positions: dict[tuple[int, str], PositionExposure] = {}
+        self.__prices: dict[str, float] = {}
+        self.__tickets: dict[int, RiskTicket] = {}
+        self.__ticket_ids = itertools.count(1)
+        self.__lock = threading.Lock()
+
+    def set_limits(self, account_id: int, limits: RiskLimits) -> None:
+        """
+        Limits of one account in place of the defaults.
+        """
+        with self.__lock:
+            self.__account_limits[account_id] = limits
+
+    def add_instruments(self, symbols: Mapping[int, str]) -> None:
+        """
+        Symbols of instrument ids, fills in other instruments are ignored.
+        """
+        with self.__lock:
+            self.__symbols.update(symbols)
+
+    def account(self, account_id: int) -> AccountExposure | None:
+        return self.__accounts.get(account_id)
+
+    def position(self, portfolio_id: int, symbol: str) -> PositionExposure | None:
+        return self.__positions.get((portfolio_id, symbol))
+
+    def load(self, session: Session) -> None:
+        """
+        Replace the in-memory exposures with the rows currently in the
+        database, dropping every reservation.
+        """
+        accounts = (
+            session.execute(
+                select(
+                    col(Account.id),
+                    col(Account.buying_power),
+                    col(Account.equity),
+                    col(Account.daytrade_count),
+                )
+            )
+            .tuples()
+            .all()
+        )
+        portfolios = (
+            session.execute(
+                select(col(Portfolio.id), col(Portfolio.account_id)).where(
+                    col(Portfolio.account_id).is_not(None)
+                )
+            )
+            .tuples()
+            .all()
+        )
+        symbols = (
+            session.execute(select(col(Instrument.id), col(Instrument.symbol)))
+            .tuples()
+            .all()
+        )
+        positions = (
+            session.execute(
+                select(
+                    col(Position.portfolio_id),
+                    col(Instrument.symbol),
+                    col(Position.qty),
+                    col(Position.long_short),
+                    col(Position.market_value),
+                )
+                .join(Instrument, col(Instrument.id) == Position.instrument_id)
+                .where(col(Position.portfolio_id).is_not(None), col(Position.qty) != 0)
+            )
+            .tuples()
+            .all()
+        )
+        with self.__lock:
+            self.__accounts = {
+                id: AccountExposure(id, buying_power, equity, daytrade_count)
+                for id, buying_power, equity, daytrade_count in accounts
+            }
+            self.__portfolio_accounts = dict(portfolios)
+            self.__symbols = dict(symbols)
+            self.__positions = {}
+            for portfolio_id, symbol, qty, long_short, market_value in positions:
+                sign = -1.0 if long_short == PositionDirection.SHORT else 1.0
+                self.__positions[(portfolio_id, symbol)] = PositionExposure(sign * qty)
+                if market_value:
+                    self.__prices.setdefault(symbol, abs(market_value / qty))
+            self.__tickets = {}
+
+    def on_ledger_delta(self, delta: LedgerDelta) -> None:
+        with self.__lock:
+            symbol = self.__symbols.get(delta.instrument_id)
+            if symbol is None:
+                return
+            if delta.qty:
+                self.__prices[symbol] = delta.market_value / delta.qty
+            position = self.__positions.setdefault(
+                (delta.portfolio_id, symbol), PositionExposure()
+            )
+            if delta.is_fill and not position.qty and delta.qty:
+                position.opened_on = date.today()
+            position.qty = delta.qty
+
+    def on_account_delta(self, delta: AccountDelta) -> None:
+        with self.__lock:
+            account = self.__accounts.setdefault(
+                delta.account_id, AccountExposure(delta.account_id)
+            )
+            changes = delta.changes
+            if "buying_power" in changes:
+                account.buying_power = changes["buying_power"]
+                account.reserved.clear()
+            if "equity" in changes:
+                account.equity = changes["equity"]
+            if "daytrade_count" in changes:
+                account.daytrade_count = int(changes["daytrade_count"])
+
+    def check(
+        self,
+        order_in: OrderGroupCreate,
+        replaces: int | None = None,
+        today: date | None = None,
+    ) -> RiskTicket:
+        """
+        Reserve the buying power of an order group or raise RiskRejected with
+        every limit it breaks. replaces is the id of the order the group
+        replaces, its reservation doesn't count against the new one.
+        """
+        started = time.perf_counter_ns()
+        try:
+            with self.__lock:
+                self.checks += 1
+                try:
+                    return self.__check(order_in, replaces, today or date.today())
+                except RiskRejected:
+                    self.rejections += 1
+                    raise
+        finally:
+            self.latency.record(time.perf_counter_ns() - started)
+
+    def __check(
+        self, order_in: OrderGroupCreate, replaces: int | None, today: date
+    ) -> RiskTicket:
+        account_id = order_in.account_id
+        if account_id is None and order_in.portfolio_id is not None:
+            account_id = self.__portfolio_accounts.get(order_in.portfolio_id)
+        if account_id is None:
+            raise RiskRejected(["Order has no account"])
+        account = self.__accounts.get(account_id)
+        if account is None:
+            raise RiskRejected([f"Unknown account {account_id}"])
+        limits = self.__account_limits.get(account_id, self.limits)
+
+        qty, price = _exposure(order_in)
+        if price <= 0:
+            price = self.__prices.get(order_in.symbol, 0.0)
+        if price <= 0:
+            raise RiskRejected([f"No price for {order_in.symbol}"])
+        shares = qty / price if order_in.unit == QtyUnits.USD else qty
+        signed = shares if order_in.side == OrderSide.BUY else -shares
+
+        position = None
+        if order_in.portfolio_id is not None:
+            position = self.__positions.get((order_in.portfolio_id, order_in.symbol))
+        current = position.qty if position else 0.0
+        reducing = (
+            min(abs(signed), abs(current))
+            if current and (current > 0) != (signed > 0)
+            else 0.0
+        )
+        opening = abs(signed) - reducing
+
+        reasons = []
+        notional = abs(shares) * price
+        if notional > limits.max_order_notional:
+            reasons.append(
+                f"Notional {notional:.2f} is over the limit of {limits.max_order_notional:.2f}"
+            )
+        position_value = abs(current + signed) * price
+        if opening and position_value > limits.max_position_value:
+            reasons.append(
+                f"Position value {position_value:.2f} would be over the limit of {limits.max_position_value:.2f}"
+            )
+        held = sum(account.reserved.values())
+        previous = self.__tickets.get(replaces) if replaces is not None else None
+        if previous is not None:
+            held -= account.reserved.get(previous.id, 0.0)
+        if opening * price > account.buying_power - held:
+            reasons.append(
+                f"Needs {opening * price:.2f} of buying power, {account.buying_power - held:.2f} available"
+            )
+        if (
+            reducing
+            and position is not None
+            and position.opened_on == today
+            and account.equity < limits.pdt_min_equity
+            and account.daytrade_count >= limits.max_daytrades
+        ):
+            reasons.append(f"Day trade limit of {limits.max_daytrades} reached")
+        if reasons:
+            raise RiskRejected(reasons)
+
+        ticket = RiskTicket(next(self.__ticket_ids), account_id, opening * price)
+        account.reserved[ticket.id] = ticket.buying_power
+        return ticket
+
+    def attach(self, order_id: int, ticket: RiskTicket) -> None:
+        """
+        Keep the ticket's reservation until the order is released, replacing
+        the one of a previous group under the same id.
+        """
+        with self.__lock:
+            previous = self.__tickets.get(order_id)
+            if previous is not None and previous.id != ticket.id:
+                self.__release(previous)
+            self.__tickets[order_id] = ticket
+
+    def release(self, ticket: RiskTicket) -> None:
+        with self.__lock:
+            self.__release(ticket)
+
+    def __release(self, ticket: RiskTicket) -> None:
+        account = self.__accounts.get(ticket.account_id)
+        if account is not None:
+            account.reserved.pop(ticket.id, None)
+
+    def release_order(self, order_id: int) -> None:
+        with self.__lock:
+            ticket = self.__tickets.pop(order_id, None)
+            if ticket is not None:
+                self.__release(ticket)
+
+    def on_order(self, order_id: int, status: str | None) -> None:
+        """
+        Release the reservation of an order that filled or never will.
+        """
+        if status in _DONE:
+            self.release_order(order_id)
+
+    def stats(self) -> RiskStats:
+        return RiskStats(
+            checks=self.checks,
+            rejections=self.rejections,
+            latency_bounds_us=list(LatencyHistogram.BOUNDS_US),
+            latency_counts=list(self.latency.counts),
+            p50_us=self.latency.quantile(0.5),
+            p99_us=self.latency.quantile(0.99),
+        )
+
+
+risk_engine = RiskEngine(
+    RiskLimits(
+        max_order_notional=settings.RISK_MAX_ORDER_NOTIONAL,
+        max_position_value=settings.RISK_MAX_POSITION_VALUE,
+        max_daytrades=settings.RISK_MAX_DAYTRADES,
+        pdt_min_equity=settings.RISK_PDT_MIN_EQUITY,
+    )
+)
+
+
+def apply_ledger_event(event: BusEvent) -> None:
+    risk_engine.on_ledger_delta(LedgerDelta(**event.payload))
+
+
+def apply_order_event(event: BusEvent) -> None:
+    if event.topic.kind == ORDER_DELETED:
+        risk_engine.release_order(event.payload["id"])
+    else:
+        risk_engine.on_order(event.payload["id"], event.payload["status"])
+
+
+def apply_account_event(event: BusEvent) -> None:
+    risk_engine.on_account_delta(AccountDelta(**event.payload))
+
+
+# fills and balances come over the bus, so every worker sees those of the
+# leader, which runs the ledger and the account sync
+event_bus.add_consumer(
+    [Topic(FILL), Topic(POSITION)], apply_ledger_event, OverflowPolicy.BLOCK
+)
+event_bus.add_consumer(Topic(ACCOUNT), apply_account_event, OverflowPolicy.BLOCK)
+# the leader marks orders filled, any worker may cancel or delete them
+event_bus.add_consumer(
+    [Topic(ORDER), Topic(ORDER_DELETED)], apply_order_event, OverflowPolicy.BLOCK
+)
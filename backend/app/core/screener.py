@@ -0,0 +1,212 @@
+"""
+Instrument screens, either compiled into one SQL statement or evaluated on an
+in-memory columnar snapshot of the instruments. Both return the same
+instruments in the same order: range criteria never match a missing value,
+missing values sort last and ties are broken by instrument id.
+"""
+import threading
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import Select, func, select
+from sqlmodel import Session, col
+
+from app.core.config import settings
+from app.models import (
+    Company,
+    Instrument,
+    InstrumentPublic,
+    InstrumentScreen,
+    InstrumentsPublic,
+    ScreenField,
+)
+
+_COLUMNS: dict[ScreenField, Any] = {
+    field: getattr(
+        Company if field == ScreenField.MARKET_CAP else Instrument, field.value
+    )
+    for field in ScreenField
+}
+
+
+def _needs_company(screen: InstrumentScreen) -> bool:
+    return bool(
+        screen.sectors
+        or screen.subsectors
+        or screen.sort_by == ScreenField.MARKET_CAP
+        or any(r.field == ScreenField.MARKET_CAP for r in screen.ranges)
+    )
+
+
+def compile_screen(screen: InstrumentScreen) -> Select[Any]:
+    """
+    Select of the matching instruments, limited to screen.limit, with the
+    total number of matches as a window count in the "total" column.
+    """
+    statement = select(Instrument, func.count().over().label("total"))
+    if _needs_company(screen):
+        statement = statement.join(Company, col(Company.id) == Instrument.company_id)
+    if screen.asset_types:
+        statement = statement.where(col(Instrument.asset_type).in_(screen.asset_types))
+    if screen.exchanges:
+        statement = statement.where(col(Instrument.exchange).in_(screen.exchanges))
+    if screen.currencies:
+        statement = statement.where(col(Instrument.currency).in_(screen.currencies))
+    if screen.sectors:
+        statement = statement.where(col(Company.sector).in_(screen.sectors))
+    if screen.subsectors:
+        statement = statement.where(col(Company.subsector).in_(screen.subsectors))
+    for r in screen.ranges:
+        if r.min is not None:
+            statement = statement.where(_COLUMNS[r.field] >= r.min)
+        if r.max is not None:
+            statement = statement.where(_COLUMNS[r.field] <= r.max)
+    if screen.sort_by is not None:
+        column = _COLUMNS[screen.sort_by]
+        statement = statement.order_by(
+            (column.desc() if screen.descending else column.asc()).nulls_last()
+        )
+    return statement.order_by(col(Instrument.id)).limit(screen.limit)
+
+
+def _factorize(
+    values: Sequence[str | None],
+) -> tuple[dict[str, int], npt.NDArray[np.int32]]:
+    codes: dict[str, int] = {}
+    array = np.array(
+        [-1 if v is None else codes.setdefault(v, len(codes)) for v in values],
+        dtype=np.int32,
+    )
+    return codes, array
+
+
+@dataclass
+class InstrumentSnapshot:
+    """
+    The screenable columns of every instrument, one array per column in
+    instrument id order, string columns dictionary encoded.
+    """
+
+    rows: list[dict[str, Any]]
+    categories: dict[str, tuple[dict[str, int], npt.NDArray[np.int32]]]
+    numbers: dict[ScreenField, npt.NDArray[np.float64]]
+    loaded_at: float
+
+    @classmethod
+    def from_rows(cls, rows: list[dict[str, Any]]) -> "InstrumentSnapshot":
+        """
+        rows are InstrumentPublic fields plus sector, subsector and
+        market_cap, sorted by id.
+        """
+        categories = {
+            name: _factorize(
+                [row[name].value if name == "asset_type" else row[name] for row in rows]
+            )
+            for name in ("asset_type", "exchange", "currency", "sector", "subsector")
+        }
+        numbers = {
+            field: np.array([row[field.value] for row in rows], dtype=np.float64)
+            for field in ScreenField
+        }
+        return cls(
+            rows=rows,
+            categories=categories,
+            numbers=numbers,
+            loaded_at=time.monotonic(),
+        )
+
+    @classmethod
+    def load(cls, session: Session) -> "InstrumentSnapshot":
+        columns = [getattr(Instrument, name) for name in InstrumentPublic.model_fields]
+        statement = (
+            select(
+                *columns,
+                col(Company.sector),
+                col(Company.subsector),
+                col(Company.market_cap),
+            )
+            .outerjoin(Company, col(Company.id) == Instrument.company_id)
+            .order_by(col(Instrument.id))
+        )
+        return cls.from_rows(
+            [dict(row) for row in session.execute(statement).mappings()]
+        )
+
+    def _matches(
+        self, name: str, values: Sequence[str] | None, mask: npt.NDArray[np.bool_]
+    ) -> npt.NDArray[np.bool_]:
+        if not values:
+            return mask
+        codes, array = self.categories[name]
+        return mask & np.isin(array, [codes[v] for v in values if v in codes])
+
+    def screen(self, screen: InstrumentScreen) -> InstrumentsPublic:
+        mask = np.ones(len(self.rows), dtype=bool)
+        mask = self._matches(
+            "asset_type", [a.value for a in screen.asset_types or []], mask
+        )
+        mask = self._matches("exchange", screen.exchanges, mask)
+        mask = self._matches("currency", screen.currencies, mask)
+        mask = self._matches("sector", screen.sectors, mask)
+        mask = self._matches("subsector", screen.subsectors, mask)
+        for r in screen.ranges:
+            column = self.numbers[r.field]
+            if r.min is not None:
+                mask &= column >= r.min
+            if r.max is not None:
+                mask &= column <= r.max
+        # comparisons with NaN are false, missing values never match a range
+        matched = np.flatnonzero(mask)
+        if screen.sort_by is not None:
+            keys = self.numbers[screen.sort_by][matched]
+            # NaN sorts last either way, the stable sort keeps ties in id order
+            order = np.argsort(-keys if screen.descending else keys, kind="stable")
+            matched = matched[order]
+        return InstrumentsPublic(
+            data=[
+                InstrumentPublic.model_validate(self.rows[i])
+                for i in matched[: screen.limit]
+            ],
+            count=len(matched),
+        )
+
+
+class SnapshotStore:
+    """
+    Holds the current InstrumentSnapshot, loading it on first use and again
+    once it is older than max_age seconds.
+    """
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self.__snapshot: InstrumentSnapshot | None = None
+        self.__lock = threading.Lock()
+
+    def get(self, session: Session) -> InstrumentSnapshot:
+        with self.__lock:
+            snapshot = self.__snapshot
+            if snapshot is None or time.monotonic() - snapshot.loaded_at > self.max_age:
+                snapshot = self.__snapshot = InstrumentSnapshot.load(session)
+            return snapshot
+
+    def refresh(self, session: Session) -> InstrumentSnapshot:
+        snapshot = InstrumentSnapshot.load(session)
+        with self.__lock:
+            self.__snapshot = snapshot
+        return snapshot
+
+
+instrument_snapshot = SnapshotStore(settings.SCREENER_SNAPSHOT_MAX_AGE_SECONDS)
+
+
+def screen_instruments(session: Session, screen: InstrumentScreen) -> InstrumentsPublic:
+    if settings.SCREENER_SNAPSHOT:
+        return instrument_snapshot.get(session).screen(screen)
+    rows = session.execute(compile_screen(screen)).all()
+    return InstrumentsPublic(
+        data=[row[0] for row in rows], count=rows[0][1] if rows else 0
+    )
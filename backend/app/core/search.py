@@ -0,0 +1,245 @@
+"""
+Typeahead search over instrument symbols and company names. A query matches
+an instrument when it is a prefix of the symbol, of the company name or of
+a later word of the company name, case insensitive. Matches on the symbol
+rank first, then by average daily volume.
+"""
+import heapq
+import logging
+import threading
+from collections.abc import Iterable
+from typing import Any
+
+from sqlalchemy import Engine, Select, case, or_, select
+from sqlmodel import Session, col
+
+from app.core.config import settings
+from app.models import Company, Instrument, InstrumentSearchHit
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.upper().split())
+
+
+def search_keys(symbol: str, company_name: str | None) -> list[str]:
+    """
+    Keys an instrument is found under: its symbol, its company name and every
+    suffix of the company name starting at a word.
+    """
+    keys = [normalize(symbol)]
+    words = normalize(company_name or "").split(" ")
+    keys.extend(" ".join(words[i:]) for i in range(len(words)) if words[i])
+    return keys
+
+
+def _hits() -> Select[Any]:
+    return select(
+        col(Instrument.id),
+        col(Instrument.symbol),
+        col(Instrument.asset_type),
+        col(Instrument.currency),
+        col(Instrument.exchange),
+        col(Company.name).label("company_name"),
+        col(Instrument.avg_daily_volume),
+    ).outerjoin(Company, col(Company.id) == Instrument.company_id)
+
+
+def search_statement(query: str, limit: int) -> Select[Any]:
+    """
+    The same search in SQL, the LIKE patterns are served by the trigram
+    indexes on instrument.symbol and company.name.
+    """
+    query = normalize(query)
+    on_symbol = col(Instrument.symbol).istartswith(query, autoescape=True)
+    return (
+        _hits()
+        .where(
+            or_(
+                on_symbol,
+                col(Company.name).istartswith(query, autoescape=True),
+                col(Company.name).icontains(f" {query}", autoescape=True),
+            )
+        )
+        .order_by(
+            case((on_symbol, 0), else_=1),
+            col(Instrument.avg_daily_volume).desc().nulls_last(),
+            col(Instrument.symbol),
+            col(Instrument.id),
+        )
+        .limit(limit)
+    )
+
+
+class PrefixIndex:
+    """
+    Prefix trie over string keys of ranked ids, flattened into a dict from
+    prefix to the best k ids below it. A prefix with k or fewer ids below it
+    ends its branch and keeps all of its (key, id) pairs instead, longer
+    queries are answered by filtering those. A lookup is one dict access per
+    query character at most.
+    """
+
+    def __init__(
+        self, entries: Iterable[tuple[str, int]], rank: dict[int, Any], k: int = 20
+    ):
+        self.k = k
+        self.__top: dict[str, list[int]] = {}
+        self.__leaves: dict[str, list[tuple[str, int]]] = {}
+        pairs = sorted(set(entries))
+        self.__rank = rank
+        if pairs:
+            self.__build(pairs)
+
+    def __len__(self) -> int:
+        return len(self.__top) + len(self.__leaves)
+
+    def __ranked(self, ids: Iterable[int], n: int | None = None) -> list[int]:
+        unique = set(ids)
+        if n is None:
+            return sorted(unique, key=self.__rank.__getitem__)
+        return heapq.nsmallest(n, unique, key=self.__rank.__getitem__)
+
+    def __build(self, pairs: list[tuple[str, int]]) -> None:
+        # depth first over the prefixes, the pairs below a prefix are a slice
+        # of the sorted pairs
+        stack = [("", pairs, 0)]
+        while stack:
+            prefix, pairs, depth = stack.pop()
+            ids = {i for _, i in pairs}
+            if len(ids) <= self.k:
+                order = {i: n for n, i in enumerate(self.__ranked(ids))}
+                self.__leaves[prefix] = sorted(pairs, key=lambda pair: order[pair[1]])
+                continue
+            self.__top[prefix] = self.__ranked(ids, self.k)
+            start = 0
+            while start < len(pairs):
+                if len(pairs[start][0]) <= depth:
+                    start += 1
+                    continue
+                char = pairs[start][0][depth]
+                end = start
+                while (
+                    end < len(pairs)
+                    and len(pairs[end][0]) > depth
+                    and pairs[end][0][depth] == char
+                ):
+                    end += 1
+                stack.append((prefix + char, pairs[start:end], depth + 1))
+                start = end
+
+    def search(self, query: str, limit: int | None = None) -> list[int]:
+        """
+        Best ids with a key starting with query, query has to be normalized.
+        """
+        limit = self.k if limit is None else min(limit, self.k)
+        top = self.__top.get(query)
+        if top is not None:
+            return top[:limit]
+        for end in range(len(query), -1, -1):
+            leaf = self.__leaves.get(query[:end])
+            if leaf is not None:
+                found: list[int] = []
+                for key, i in leaf:
+                    if key.startswith(query) and i not in found:
+                        found.append(i)
+                        if len(found) == limit:
+                            break
+                return found
+            if query[:end] in self.__top:
+                break
+        return []
+
+
+class InstrumentSearchIndex:
+    """
+    In-memory PrefixIndex of all instruments, rebuilt as a whole by load().
+    Until the first load, search() returns None and callers fall back to SQL.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self.__index: PrefixIndex | None = None
+        self.__symbols: PrefixIndex | None = None
+        self.__hits: dict[int, InstrumentSearchHit] = {}
+        self.__lock = threading.Lock()
+
+    def build(self, hits: Iterable[InstrumentSearchHit]) -> None:
+        by_id = {hit.id: hit for hit in hits}
+        rank: dict[int, Any] = {
+            i: (
+                hit.avg_daily_volume is None,
+                -(hit.avg_daily_volume or 0.0),
+                hit.symbol,
+                i,
+            )
+            for i, hit in by_id.items()
+        }
+        symbols = PrefixIndex(
+            ((normalize(hit.symbol), i) for i, hit in by_id.items()), rank, self.k
+        )
+        everything = PrefixIndex(
+            (
+                (key, i)
+                for i, hit in by_id.items()
+                for key in search_keys(hit.symbol, hit.company_name)
+            ),
+            rank,
+            self.k,
+        )
+        with self.__lock:
+            self.__index = everything
+            self.__symbols = symbols
+            self.__hits = by_id
+
+    def load(self, session: Session) -> int:
+        hits = [
+            InstrumentSearchHit.model_validate(row)
+            for row in session.execute(_hits()).mappings()
+        ]
+        self.build(hits)
+        return len(hits)
+
+    def run_refresh(
+        self, engine: Engine, stop: threading.Event, refresh_seconds: float
+    ) -> None:
+        """
+        Reload loop for a background thread, returns once stop is set.
+        """
+        while not stop.wait(refresh_seconds):
+            try:
+                with Session(engine) as session:
+                    self.load(session)
+            except Exception:
+                logger.exception("Instrument search index refresh failed")
+
+    def search(self, query: str, limit: int) -> list[InstrumentSearchHit] | None:
+        with self.__lock:
+            index, symbols, hits = self.__index, self.__symbols, self.__hits
+        if index is None or symbols is None:
+            return None
+        # symbol matches first, then the best of all matches; at most k
+        # results, the k best matches always hold enough non-symbol ones
+        query = normalize(query)
+        limit = min(limit, self.k)
+        ids = symbols.search(query, limit)
+        for i in index.search(query):
+            if len(ids) == limit:
+                break
+            if i not in ids:
+                ids.append(i)
+        return [hits[i] for i in ids]
+
+
+instrument_search = InstrumentSearchIndex(settings.SEARCH_INDEX_TOP_K)
+
+
+def search_instruments(
+    session: Session, query: str, limit: int
+) -> list[InstrumentSearchHit]:
+    hits = instrument_search.search(query, limit)
+    if hits is None:
+        rows = session.execute(search_statement(query, limit)).mappings()
+        hits = [InstrumentSearchHit.model_validate(row) for row in rows]
+    return hits
@@ -0,0 +1,215 @@
+"""
+Trade aggregates computed in SQL. Trades are dated by their exit bar; the
+part of a request before the start of the current period is closed and its
+result cached, only the open period is aggregated on every request.
+"""
+import json
+import threading
+from collections.abc import Sequence
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, col, select
+
+from app.core.cache import TieredCache
+from app.core.event_bus import OverflowPolicy, cache_topic, event_bus
+from app.models import Bar, Trade, TradeAggregate, TradeAggregates, TradeGroup
+
+_BUCKETS = (TradeGroup.DAY, TradeGroup.WEEK, TradeGroup.MONTH)
+_KEYS = {
+    TradeGroup.INSTRUMENT: ("instrument_id", col(Trade.instrument_id)),
+    TradeGroup.DIRECTION: ("direction", col(Trade.direction)),
+    TradeGroup.PORTFOLIO: ("portfolio_id", col(Trade.portfolio_id)),
+}
+
+# bumped by writes to trades, older cache entries are no longer looked up
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def invalidate_trade_aggregates() -> None:
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+# trades written by any worker; bumping once covers any number of writes waiting
+event_bus.add_consumer(
+    cache_topic(Trade.__tablename__),  # type: ignore[arg-type]
+    lambda _event: invalidate_trade_aggregates(),
+    OverflowPolicy.CONFLATE,
+)
+
+
+def period_start(now: datetime, bucket: TradeGroup | None) -> datetime:
+    """
+    Start of the period now is in, the same as date_trunc in SQL; a day
+    without a time bucket.
+    """
+    day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == TradeGroup.WEEK:
+        return day - timedelta(days=day.weekday())
+    if bucket == TradeGroup.MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def _bucket(group_by: Sequence[TradeGroup]) -> TradeGroup | None:
+    buckets = [g for g in group_by if g in _BUCKETS]
+    if len(buckets) > 1:
+        raise ValueError("Group by at most one of day, week and month")
+    return buckets[0] if buckets else None
+
+
+def _query(
+    session: Session,
+    group_by: Sequence[TradeGroup],
+    portfolio_id: int | None,
+    instrument_id: int | None,
+    start: datetime | None,
+    end: datetime | None,
+) -> list[dict[str, Any]]:
+    exit_ = aliased(Bar)
+    bucket = _bucket(group_by)
+    keys: list[Any] = []
+    if bucket is not None:
+        keys.append(func.date_trunc(bucket.value, exit_.timestamp).label("bucket"))
+    keys.extend(
+        column.label(name)
+        for group, (name, column) in _KEYS.items()
+        if group in group_by
+    )
+    profit_loss = func.coalesce(func.sum(Trade.profit_loss), 0.0)
+    columns = [
+        *keys,
+        func.count(col(Trade.id)).label("trades"),
+        func.coalesce(
+            func.sum(case((col(Trade.is_win).is_(True), 1), else_=0)), 0
+        ).label("wins"),
+        profit_loss.label("profit_loss"),
+        func.coalesce(func.sum(Trade.total_fees), 0.0).label("total_fees"),
+    ]
+    if bucket is not None:
+        columns.append(
+            func.sum(profit_loss)
+            .over(partition_by=keys[1:] or None, order_by=keys[0])
+            .label("cumulative_profit_loss")
+        )
+    statement = select(*columns).join(exit_, col(exit_.id) == Trade.exit_action_bar_id)
+    if portfolio_id is not None:
+        statement = statement.where(Trade.portfolio_id == portfolio_id)
+    if instrument_id is not None:
+        statement = statement.where(Trade.instrument_id == instrument_id)
+    if start is not None:
+        statement = statement.where(exit_.timestamp >= start)
+    if end is not None:
+        statement = statement.where(exit_.timestamp < end)
+    if keys:
+        statement = statement.group_by(*keys).order_by(*keys)
+    rows = session.execute(statement).mappings().all()
+    return [
+        TradeAggregate.model_validate(row).model_dump(mode="json")
+        for row in rows
+        if row["trades"]
+    ]
+
+
+def _group_key(row: dict[str, Any]) -> tuple[Any, ...]:
+    return tuple(row[name] for name, _ in _KEYS.values())
+
+
+def _merge(
+    closed: list[dict[str, Any]], current: list[dict[str, Any]], bucketed: bool
+) -> list[dict[str, Any]]:
+    if bucketed:
+        # buckets never straddle the period start, only the running totals
+        # of the open buckets continue from the closed ones
+        totals: dict[tuple[Any, ...], float] = {}
+        for row in closed:
+            totals[_group_key(row)] = row["cumulative_profit_loss"]
+        for row in current:
+            row["cumulative_profit_loss"] += totals.get(_group_key(row), 0.0)
+        return closed + current
+    merged = {_group_key(row): dict(row) for row in closed}
+    for row in current:
+        into = merged.setdefault(
+            _group_key(row),
+            {**row, "trades": 0, "wins": 0, "profit_loss": 0.0, "total_fees": 0.0},
+        )
+        for name in ("trades", "wins", "profit_loss", "total_fees"):
+            into[name] += row[name]
+    return [
+        merged[key]
+        for key in sorted(merged, key=lambda key: tuple((k is None, k) for k in key))
+    ]
+
+
+def _naive_utc(value: datetime | None) -> datetime | None:
+    """
+    Bar timestamps are naive UTC, aware bounds are converted to match.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def aggregate_trades(
+    session: Session,
+    group_by: Sequence[TradeGroup],
+    *,
+    portfolio_id: int | None = None,
+    instrument_id: int | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    cache: TieredCache | None = None,
+    now: datetime | None = None,
+) -> TradeAggregates:
+    """
+    Trades with an exit bar in [start, end) summed per combination of the
+    group_by keys, ordered by them. The closed part, before the start of the
+    current period, is served from cache when one is given.
+    """
+    start, end = _naive_utc(start), _naive_utc(end)
+    bucket = _bucket(group_by)
+    closed_until = period_start(now or datetime.utcnow(), bucket)
+    closed_end = closed_until if end is None else min(end, closed_until)
+    closed: list[dict[str, Any]] = []
+    if start is None or start < closed_end:
+        key = json.dumps(
+            [
+                "trade_aggregates",
+                _generation,
+                sorted(g.value for g in group_by),
+                portfolio_id,
+                instrument_id,
+                start and start.isoformat(),
+                closed_end.isoformat(),
+            ]
+        )
+        cached = cache.get(key) if cache is not None else None
+        if cached is None:
+            cached = _query(
+                session, group_by, portfolio_id, instrument_id, start, closed_end
+            )
+            if cache is not None:
+                cache.set(key, cached)
+        closed = cached
+    current: list[dict[str, Any]] = []
+    if end is None or end > closed_until:
+        current = _query(
+            session,
+            group_by,
+            portfolio_id,
+            instrument_id,
+            closed_until if start is None else max(start, closed_until),
+            end,
+        )
+    return TradeAggregates(
+        data=[
+            TradeAggregate.model_validate(row)
+            for row in _merge(closed, current, bucket is not None)
+        ],
+        closed_until=closed_until,
+    )
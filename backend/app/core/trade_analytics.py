@@ -0,0 +1,291 @@
+"""
+Per trade excursions and profit, and per portfolio statistics over the
+closed trades. Excursions are computed chart by chart: the bars covering all
+trades of a chart are read once and every trade's high / low is a range
+reduction over them.
+"""
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import select, update
+from sqlalchemy.orm import aliased
+from sqlmodel import Session, col
+
+from app.core.equity import append_trades, rebuild_equity
+from app.core.pnl_rollups import refresh_daily_pnl, trade_days
+from app.core.trade_aggregates import invalidate_trade_aggregates
+from app.models import Bar, PositionDirection, Trade, TradeStats
+
+_SECONDS_PER_YEAR = 365.25 * 24 * 3600
+
+
+def range_extremes(
+    highs: npt.NDArray[np.float64],
+    lows: npt.NDArray[np.float64],
+    starts: npt.NDArray[np.intp],
+    ends: npt.NDArray[np.intp],
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Highest high and lowest low of the bars [start, end) of each range, NaN
+    for empty ranges.
+    """
+    empty = ends <= starts
+    if not len(highs) or empty.all():
+        return np.full(len(starts), np.nan), np.full(len(starts), np.nan)
+    # reduceat folds [i, next index), a trailing sentinel lets ranges end at
+    # the last bar; empty ranges are masked afterwards
+    indices = np.ravel(np.column_stack([starts, np.maximum(ends, starts + 1)]))
+    indices = np.minimum(indices, len(highs))
+    highest = np.maximum.reduceat(np.append(highs, -np.inf), indices)[::2]
+    lowest = np.minimum.reduceat(np.append(lows, np.inf), indices)[::2]
+    return np.where(empty, np.nan, highest), np.where(empty, np.nan, lowest)
+
+
+def excursions(
+    entry_prices: npt.NDArray[np.float64],
+    qtys: npt.NDArray[np.float64],
+    is_long: npt.NDArray[np.bool_],
+    highest: npt.NDArray[np.float64],
+    lowest: npt.NDArray[np.float64],
+) -> tuple[npt.NDArray[np.float64], npt.NDArray[np.float64]]:
+    """
+    Maximum favorable and maximum adverse excursion of each trade, both as
+    non negative amounts.
+    """
+    up = (highest - entry_prices) * qtys
+    down = (entry_prices - lowest) * qtys
+    mfe = np.where(is_long, up, down)
+    mae = np.where(is_long, down, up)
+    return np.maximum(mfe, 0.0), np.maximum(mae, 0.0)
+
+
+def _bars(
+    session: Session, chart_id: int, start: datetime, end: datetime
+) -> tuple[
+    npt.NDArray[np.datetime64], npt.NDArray[np.float64], npt.NDArray[np.float64]
+]:
+    statement = (
+        select(col(Bar.timestamp), col(Bar.high), col(Bar.low))
+        .where(
+            col(Bar.chart_id) == chart_id,
+            col(Bar.timestamp) >= start,
+            col(Bar.timestamp) <= end,
+        )
+        .order_by(col(Bar.timestamp))
+    )
+    rows = session.execute(statement).all()
+    if not rows:
+        return np.empty(0, "datetime64[us]"), np.empty(0), np.empty(0)
+    timestamps, highs, lows = zip(*rows, strict=True)
+    return (
+        np.array(timestamps, dtype="datetime64[us]"),
+        np.array(highs, float),
+        np.array(lows, float),
+    )
+
+
+def analyze_trades(
+    session: Session,
+    portfolio_ids: Sequence[int] | None = None,
+    recompute: bool = False,
+) -> int:
+    """
+    Compute profit_loss, is_win, mfe and mea of the trades, by default only
+    of those not analyzed yet, and return the number of trades updated. A
+    trade without entry and exit bars only gets its profit. The equity
+    curves of the portfolios are extended, or rebuilt on a recompute, and
+    the daily P&L rollups of the trades' days refreshed.
+    """
+    entry = aliased(Bar)
+    exit_ = aliased(Bar)
+    statement = (
+        select(
+            col(Trade.id),
+            col(Trade.direction),
+            col(Trade.qty),
+            col(Trade.entry_price),
+            col(Trade.exit_price),
+            col(Trade.total_fees),
+            col(entry.chart_id),
+            col(entry.timestamp),
+            col(exit_.timestamp),
+            col(Trade.portfolio_id),
+        )
+        .outerjoin(entry, col(entry.id) == Trade.entry_action_bar_id)
+        .outerjoin(exit_, col(exit_.id) == Trade.exit_action_bar_id)
+    )
+    if portfolio_ids is not None:
+        statement = statement.where(col(Trade.portfolio_id).in_(portfolio_ids))
+    if not recompute:
+        statement = statement.where(col(Trade.profit_loss).is_(None))
+    rows = session.execute(statement).all()
+    if not rows:
+        return 0
+
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    is_long = np.array([r[1] == PositionDirection.LONG for r in rows])
+    qtys, entry_prices, exit_prices, fees = (
+        np.array([r[i] if r[i] is not None else 0.0 for r in rows], dtype=float)
+        for i in (2, 3, 4, 5)
+    )
+    profit = (
+        np.where(is_long, exit_prices - entry_prices, entry_prices - exit_prices) * qtys
+        - fees
+    )
+
+    mfe = np.full(len(rows), np.nan)
+    mae = np.full(len(rows), np.nan)
+    charts = np.array(
+        [r[6] if r[6] is not None and r[8] is not None else -1 for r in rows],
+        dtype=np.int64,
+    )
+    for chart_id in np.unique(charts[charts >= 0]):
+        trades = np.flatnonzero(charts == chart_id)
+        starts_at = np.array([rows[i][7] for i in trades], dtype="datetime64[us]")
+        ends_at = np.array([rows[i][8] for i in trades], dtype="datetime64[us]")
+        timestamps, highs, lows = _bars(
+            session, int(chart_id), starts_at.min().item(), ends_at.max().item()
+        )
+        starts = np.searchsorted(timestamps, starts_at, side="left")
+        ends = np.searchsorted(timestamps, ends_at, side="right")
+        highest, lowest = range_extremes(highs, lows, starts, ends)
+        mfe[trades], mae[trades] = excursions(
+            entry_prices[trades], qtys[trades], is_long[trades], highest, lowest
+        )
+
+    values: list[dict[str, Any]] = [
+        {
+            "id": int(i),
+            "profit_loss": float(p),
+            "is_win": bool(p > 0),
+            "mfe": None if np.isnan(f) else float(f),
+            "mea": None if np.isnan(a) else float(a),
+        }
+        for i, p, f, a in zip(ids, profit, mfe, mae, strict=True)
+    ]
+    # ORM bulk UPDATE by primary key, a single executemany
+    session.execute(update(Trade), values)
+    refresh_daily_pnl(session, trade_days(session, [v["id"] for v in values]))
+
+    by_portfolio: dict[int, list[int]] = {}
+    for r in rows:
+        if r[9] is not None:
+            by_portfolio.setdefault(r[9], []).append(r[0])
+    for portfolio_id, trade_ids in by_portfolio.items():
+        if recompute:
+            rebuild_equity(session, portfolio_id)
+        else:
+            append_trades(session, portfolio_id, trade_ids)
+    session.commit()
+    invalidate_trade_aggregates()
+    return len(values)
+
+
+def max_drawdown(pnl: npt.NDArray[np.float64]) -> float:
+    """
+    Largest fall of the cumulative P&L from a previous high, starting at 0.
+    """
+    equity = np.concatenate([[0.0], np.cumsum(pnl)])
+    return float(np.max(np.maximum.accumulate(equity) - equity))
+
+
+def _mean(values: npt.NDArray[np.float64]) -> float | None:
+    return float(values.mean()) if len(values) else None
+
+
+def trade_stats(
+    portfolio_id: int,
+    pnl: npt.NDArray[np.float64],
+    returns: npt.NDArray[np.float64],
+    exits: npt.NDArray[np.datetime64],
+    mfe: npt.NDArray[np.float64],
+    mae: npt.NDArray[np.float64],
+) -> TradeStats:
+    """
+    Statistics over one portfolio's closed trades in exit order. returns are
+    the profits relative to the entry value, exits the exit times as
+    datetime64.
+    """
+    wins, losses = pnl[pnl > 0], pnl[pnl < 0]
+    gross_profit, gross_loss = float(wins.sum()), float(np.abs(losses).sum())
+    sharpe = None
+    if len(returns) > 1 and returns.std(ddof=1) > 0:
+        years = (exits.max() - exits.min()) / np.timedelta64(1, "s") / _SECONDS_PER_YEAR
+        if years > 0:
+            sharpe = float(
+                returns.mean() / returns.std(ddof=1) * np.sqrt(len(returns) / years)
+            )
+    return TradeStats(
+        portfolio_id=portfolio_id,
+        trades=len(pnl),
+        wins=len(wins),
+        losses=len(losses),
+        win_rate=len(wins) / len(pnl) if len(pnl) else None,
+        gross_profit=gross_profit,
+        gross_loss=gross_loss,
+        profit_factor=gross_profit / gross_loss if gross_loss else None,
+        expectancy=_mean(pnl),
+        avg_win=_mean(wins),
+        avg_loss=_mean(losses),
+        avg_mfe=_mean(mfe[~np.isnan(mfe)]),
+        avg_mae=_mean(mae[~np.isnan(mae)]),
+        max_drawdown=max_drawdown(pnl),
+        sharpe=sharpe,
+    )
+
+
+def portfolio_trade_stats(
+    session: Session, portfolio_ids: Sequence[int]
+) -> list[TradeStats]:
+    """
+    TradeStats of the analyzed trades of each portfolio, ordered by exit bar
+    time (trade id for trades without one).
+    """
+    exit_ = aliased(Bar)
+    statement = (
+        select(
+            col(Trade.portfolio_id),
+            col(Trade.profit_loss),
+            col(Trade.qty),
+            col(Trade.entry_price),
+            col(Trade.mfe),
+            col(Trade.mea),
+            col(exit_.timestamp),
+        )
+        .outerjoin(exit_, col(exit_.id) == Trade.exit_action_bar_id)
+        .where(
+            col(Trade.portfolio_id).in_(portfolio_ids),
+            col(Trade.profit_loss).is_not(None),
+        )
+        .order_by(
+            col(Trade.portfolio_id),
+            col(exit_.timestamp).asc().nulls_last(),
+            col(Trade.id),
+        )
+    )
+    rows = session.execute(statement).all()
+    portfolios = np.array([r[0] for r in rows], dtype=np.int64)
+    pnl, qtys, entry_prices, mfe, mae = (
+        np.array([r[i] for r in rows], dtype=float) for i in (1, 2, 3, 4, 5)
+    )
+    exits = np.array([r[6] for r in rows], dtype="datetime64[us]")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = pnl / np.abs(entry_prices * qtys)
+    stats = []
+    for portfolio_id in portfolio_ids:
+        rows_of = portfolios == portfolio_id
+        timed = rows_of & np.isfinite(returns) & ~np.isnat(exits)
+        stats.append(
+            trade_stats(
+                portfolio_id,
+                pnl[rows_of],
+                returns[timed],
+                exits[timed],
+                mfe[rows_of],
+                mae[rows_of],
+            )
+        )
+    return stats
@@ -0,0 +1,221 @@
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from statistics import NormalDist
+
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy import ScalarSelect, select
+from sqlmodel import Session, col
+
+from app.core.config import settings
+from app.core.event_bus import (
+    FILL,
+    POSITION,
+    BusEvent,
+    OverflowPolicy,
+    Topic,
+    event_bus,
+)
+from app.core.ledger import Ledger, LedgerDelta
+from app.models import (
+    Bar,
+    Chart,
+    ChartInterval,
+    Company,
+    Instrument,
+    PortfolioValuation,
+    Position,
+    PositionDirection,
+)
+
+
+def _latest_close() -> ScalarSelect[float]:
+    return (
+        select(col(Bar.close))
+        .join(Chart, col(Bar.chart_id) == Chart.id)
+        .where(col(Chart.instrument_id) == Position.instrument_id)
+        .order_by(col(Bar.timestamp).desc())
+        .limit(1)
+        .correlate(Position)
+        .scalar_subquery()
+    )
+
+
+def _group_sum(labels: list[str], values: npt.NDArray[np.float64]) -> dict[str, float]:
+    if not labels:
+        return {}
+    keys, inverse = np.unique(np.asarray(labels), return_inverse=True)
+    sums = np.bincount(inverse, weights=values, minlength=len(keys))
+    return {str(k): float(v) for k, v in zip(keys, sums, strict=True)}
+
+
+def _daily_returns(
+    session: Session, instrument_ids: npt.NDArray[np.int64], lookback_days: int
+) -> npt.NDArray[np.float64]:
+    """
+    Daily log returns as a (days, instruments) matrix, only days on which
+    every instrument has a close are kept.
+    """
+    since = datetime.utcnow() - timedelta(days=lookback_days)
+    statement = (
+        select(col(Chart.instrument_id), col(Bar.timestamp), col(Bar.close))
+        .join(Chart, col(Bar.chart_id) == Chart.id)
+        .where(
+            col(Chart.interval) == ChartInterval.Daily,
+            col(Chart.instrument_id).in_(instrument_ids.tolist()),
+            col(Bar.timestamp) >= since,
+        )
+    )
+    rows = session.execute(statement).all()
+    if not rows:
+        return np.empty((0, len(instrument_ids)))
+    ids, stamps, closes = (np.asarray(c) for c in zip(*rows, strict=True))
+    days, day_index = np.unique(stamps.astype("datetime64[D]"), return_inverse=True)
+    column = np.searchsorted(instrument_ids, ids)
+    prices = np.full((len(days), len(instrument_ids)), np.nan)
+    prices[day_index, column] = closes.astype(float)
+    prices = prices[~np.isnan(prices).any(axis=1)]
+    if len(prices) < 2:
+        return np.empty((0, len(instrument_ids)))
+    return np.diff(np.log(prices), axis=0)
+
+
+def parametric_var(
+    exposures: npt.NDArray[np.float64],
+    returns: npt.NDArray[np.float64],
+    confidence: float,
+    horizon_days: int,
+) -> float:
+    """
+    Variance-covariance VaR of a vector of signed exposures.
+    """
+    if len(returns) < 2 or not exposures.any():
+        return 0.0
+    covariance = np.atleast_2d(np.cov(returns, rowvar=False))
+    variance = float(exposures @ covariance @ exposures)
+    z = NormalDist().inv_cdf(confidence)
+    return z * math.sqrt(max(variance, 0.0) * horizon_days)
+
+
+def value_portfolio(
+    session: Session,
+    portfolio_id: int,
+    confidence: float = 0.99,
+    horizon_days: int = 1,
+    live: Ledger | None = None,
+) -> PortfolioValuation:
+    """
+    Load every position with its instrument, company and latest close in one
+    query and value the portfolio with array math. Prices marked by a live
+    ledger take precedence over the last stored close.
+    """
+    statement = (
+        select(
+            col(Position.instrument_id),
+            col(Position.long_short),
+            col(Position.qty),
+            col(Position.cost),
+            col(Position.market_value),
+            col(Instrument.asset_type),
+            col(Company.sector),
+            _latest_close(),
+        )
+        .join(Instrument, col(Position.instrument_id) == Instrument.id)
+        .outerjoin(Company, col(Instrument.company_id) == Company.id)
+        .where(col(Position.portfolio_id) == portfolio_id, col(Position.qty) != 0)
+    )
+    rows = session.execute(statement).all()
+    n = len(rows)
+    instrument_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=n)
+    sign = np.fromiter(
+        (-1.0 if r[1] == PositionDirection.SHORT else 1.0 for r in rows),
+        dtype=float,
+        count=n,
+    )
+    qty = sign * np.fromiter((r[2] for r in rows), dtype=float, count=n)
+    cost = sign * np.fromiter((r[3] or 0.0 for r in rows), dtype=float, count=n)
+    stored_value = sign * np.fromiter((r[4] or 0.0 for r in rows), dtype=float, count=n)
+    price = np.fromiter(
+        (np.nan if r[7] is None else r[7] for r in rows), dtype=float, count=n
+    )
+    if live is not None:
+        for i, instrument_id in enumerate(instrument_ids):
+            position = live.position(portfolio_id, int(instrument_id))
+            if position is not None and position.price:
+                price[i] = position.price
+    market_value = np.where(np.isnan(price), stored_value, qty * price)
+
+    held, column = np.unique(instrument_ids, return_inverse=True)
+    exposures = np.bincount(column, weights=market_value, minlength=len(held)).astype(
+        np.float64
+    )
+    returns = (
+        _daily_returns(session, held, settings.VALUATION_LOOKBACK_DAYS)
+        if n
+        else np.empty((0, 0))
+    )
+
+    return PortfolioValuation(
+        portfolio_id=portfolio_id,
+        market_value=float(market_value.sum()),
+        cost=float(cost.sum()),
+        unrealized_pnl=float((market_value - cost).sum()),
+        exposure_by_asset_type=_group_sum([r[5].value for r in rows], market_value),
+        exposure_by_sector=_group_sum([r[6] or "unknown" for r in rows], market_value),
+        var=parametric_var(exposures, returns, confidence, horizon_days),
+        var_confidence=confidence,
+        var_horizon_days=horizon_days,
+    )
+
+
+class ValuationCache:
+    """
+    Valuations per portfolio, dropped on the next price or fill event for the
+    portfolio or once max_age has passed.
+    """
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self.__entries: dict[
+            int, dict[tuple[float, int], tuple[float, PortfolioValuation]]
+        ] = {}
+        self.__lock = threading.Lock()
+
+    def get(
+        self, portfolio_id: int, confidence: float, horizon_days: int
+    ) -> PortfolioValuation | None:
+        with self.__lock:
+            entry = self.__entries.get(portfolio_id, {}).get((confidence, horizon_days))
+        if entry is None or time.monotonic() - entry[0] > self.max_age:
+            return None
+        return entry[1]
+
+    def put(self, valuation: PortfolioValuation) -> None:
+        key = (valuation.var_confidence, valuation.var_horizon_days)
+        with self.__lock:
+            self.__entries.setdefault(valuation.portfolio_id, {})[key] = (
+                time.monotonic(),
+                valuation,
+            )
+
+    def invalidate(self, portfolio_id: int) -> None:
+        with self.__lock:
+            self.__entries.pop(portfolio_id, None)
+
+    def on_ledger_delta(self, delta: LedgerDelta) -> None:
+        self.invalidate(delta.portfolio_id)
+
+
+valuation_cache = ValuationCache(settings.VALUATION_CACHE_SECONDS)
+
+
+def drop_valuation(event: BusEvent) -> None:
+    valuation_cache.invalidate(event.payload["portfolio_id"])
+
+
+# the ledger runs in the leader, its fills and marks come over the bus
+event_bus.add_consumer(
+    [Topic(FILL), Topic(POSITION)], drop_valuation, OverflowPolicy.BLOCK
+)
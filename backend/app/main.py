@@ -1,10 +1,27 @@
+import threading
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
 import sentry_sdk
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.routing import APIRoute
+from sqlmodel import Session
+from starlette.middleware.base import RequestResponseEndpoint
 from starlette.middleware.cors import CORSMiddleware
 
+from app.adopters.broker import IBAccountFeed, IBExecutionFeed, IBMarketDataFeed
 from app.api.main import api_router
+from app.core.account_sync import account_sync
 from app.core.config import settings
+from app.core.db import engine
+from app.core.event_bus import PgEventBridge, event_bus
+from app.core.fills import FillHandler
+from app.core.journal import event_journal, open_order_journal, order_journal, recover
+from app.core.leader import leader_election
+from app.core.ledger import ledger
+from app.core.loaders import detect_n_plus_one
+from app.core.risk import risk_engine
+from app.core.search import instrument_search
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -14,10 +31,179 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+def run_leader_jobs(stop: threading.Event) -> None:
+    """
+    Jobs only the elected worker runs, returns once stop is set.
+    """
+    threads = []
+    try:
+        if settings.LEDGER_ENABLED and settings.JOURNAL_ENABLED:
+            # replays the fills on disk, the ledger then loads what they restored
+            with Session(engine) as session:
+                recover(session)
+            threads.append(
+                threading.Thread(
+                    target=event_journal.run_commits, args=(stop,), daemon=True
+                )
+            )
+            threads.append(
+                threading.Thread(
+                    target=event_journal.run_drains,
+                    args=(
+                        engine,
+                        stop,
+                        settings.JOURNAL_DRAIN_SECONDS,
+                        settings.JOURNAL_DRAIN_BATCH,
+                        True,
+                    ),
+                    daemon=True,
+                )
+            )
+        if settings.LEDGER_ENABLED:
+            with Session(engine) as session:
+                ledger.load(session)
+            threads.append(
+                threading.Thread(
+                    target=ledger.run_checkpoints, args=(engine, stop), daemon=True
+                )
+            )
+            if settings.IB_FILLS_ENABLED:
+                fills = FillHandler(engine, ledger, settings.IB_CLIENT_ID)
+                execution_feed = IBExecutionFeed(
+                    settings.IB_HOST,
+                    settings.IB_PORT,
+                    settings.IB_FILLS_CLIENT_ID,
+                    fills,
+                )
+                threads.append(
+                    threading.Thread(
+                        target=execution_feed.run, args=(stop,), daemon=True
+                    )
+                )
+            if settings.MARKET_DATA_ENABLED:
+                market_data_feed = IBMarketDataFeed(
+                    settings.IB_HOST,
+                    settings.IB_PORT,
+                    settings.MARKET_DATA_CLIENT_ID,
+                    engine,
+                    ledger,
+                )
+                threads.append(
+                    threading.Thread(
+                        target=market_data_feed.run, args=(stop,), daemon=True
+                    )
+                )
+        if settings.ACCOUNT_SYNC_ENABLED:
+            with Session(engine) as session:
+                account_sync.load(session)
+            account_feed = IBAccountFeed(
+                settings.IB_HOST,
+                settings.IB_PORT,
+                settings.ACCOUNT_SYNC_CLIENT_ID,
+                account_sync,
+            )
+            threads.append(
+                threading.Thread(target=account_feed.run, args=(stop,), daemon=True)
+            )
+            threads.append(
+                threading.Thread(
+                    target=account_sync.run_flushes, args=(engine, stop), daemon=True
+                )
+            )
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if event_journal.is_open:
+            # after the ledger's last checkpoint and the last drain
+            event_journal.truncate(ledger.checkpointed_at)
+    finally:
+        if event_journal.is_open:
+            event_journal.close()
+        # the next leader loads it from the last checkpoint
+        ledger.unload()
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI) -> AsyncIterator[None]:
+    stop = threading.Event()
+    threads = []
+    # before anything that publishes on it
+    event_bus.start()
+    if settings.EVENT_BUS_BRIDGE_ENABLED:
+        bridge = PgEventBridge(
+            event_bus,
+            engine.url.set(drivername="postgresql").render_as_string(
+                hide_password=False
+            ),
+            settings.EVENT_BUS_CHANNEL,
+            settings.EVENT_BUS_SHARED_KINDS,
+        )
+        bridge.attach()
+        threads.append(
+            threading.Thread(target=bridge.run_sender, args=(stop,), daemon=True)
+        )
+        threads.append(
+            threading.Thread(target=bridge.run_listener, args=(stop,), daemon=True)
+        )
+    if settings.JOURNAL_ENABLED:
+        # replays the orders on disk before any request can change them
+        with Session(engine) as session:
+            open_order_journal(session)
+        threads.append(
+            threading.Thread(
+                target=order_journal.run_commits, args=(stop,), daemon=True
+            )
+        )
+        threads.append(
+            threading.Thread(
+                target=order_journal.run_drains,
+                args=(
+                    engine,
+                    stop,
+                    settings.JOURNAL_DRAIN_SECONDS,
+                    settings.JOURNAL_DRAIN_BATCH,
+                ),
+                daemon=True,
+            )
+        )
+    if settings.SEARCH_INDEX_ENABLED:
+        with Session(engine) as session:
+            instrument_search.load(session)
+        threads.append(
+            threading.Thread(
+                target=instrument_search.run_refresh,
+                args=(engine, stop, settings.SEARCH_INDEX_REFRESH_SECONDS),
+                daemon=True,
+            )
+        )
+    if settings.LEDGER_ENABLED or settings.ACCOUNT_SYNC_ENABLED:
+        threads.append(
+            threading.Thread(
+                target=leader_election.run, args=(stop, run_leader_jobs), daemon=True
+            )
+        )
+    if settings.RISK_CHECKS_ENABLED:
+        with Session(engine) as session:
+            risk_engine.load(session)
+    for thread in threads:
+        thread.start()
+    yield
+    stop.set()
+    # lets producers waiting on a full queue through before joining them
+    await event_bus.stop()
+    for thread in threads:
+        thread.join()
+    if order_journal.is_open:
+        order_journal.close()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
@@ -32,4 +218,17 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_headers=["*"],
     )
 
+if settings.ENVIRONMENT == "local" and settings.N_PLUS_ONE_DETECTION != "off":
+
+    @app.middleware("http")
+    async def n_plus_one_detection(
+        request: Request, call_next: RequestResponseEndpoint
+    ) -> Response:
+        label = f"{request.method} {request.url.path}"
+        with detect_n_plus_one(
+            settings.N_PLUS_ONE_THRESHOLD, settings.N_PLUS_ONE_DETECTION, label
+        ):
+            return await call_next(request)
+
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
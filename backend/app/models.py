@@ -1,6 +1,8 @@
 import enum
-from datetime import datetime
+from datetime import date, datetime
+from typing import Any
 
+from sqlalchemy import JSON, BigInteger, Index
 from sqlmodel import Field, Relationship, SQLModel
 
 
@@ -80,7 +82,7 @@ class ItemUpdate(ItemBase):
 class Item(ItemBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
     title: str
-    owner_id: int | None = Field(default=None, foreign_key="user.id", nullable=False)
+    owner_id: int | None = Field(default=None, foreign_key="user.id", nullable=False, index=True)
     owner: User | None = Relationship(back_populates="items")
 
 
@@ -122,6 +124,8 @@ class NewPassword(SQLModel):
 
 class AccountBase(SQLModel):
     broker: str
+    # account id at the broker, linked accounts are kept in sync with it
+    broker_account: str | None = Field(default=None, unique=True, index=True)
     buying_power: float = 0
     cash: float = 0
     currency: str = "USD"
@@ -167,6 +171,12 @@ class CompanyBase(SQLModel):
 
 
 class Company(CompanyBase, table=True):
+    __table_args__ = (
+        Index("ix_company_sector_subsector", "sector", "subsector"),
+        Index("ix_company_market_cap", "market_cap"),
+        Index("ix_company_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     instruments: list["Instrument"] = Relationship(back_populates="company")
     statements:list["FinStatement"] = Relationship(back_populates="company")
@@ -205,6 +215,10 @@ class FinStatementBase(SQLModel):
 
 
 class FinStatement(FinStatementBase, table=True):
+    __table_args__ = (
+        Index("ix_finstatement_company_id_st_type_year_qtr", "company_id", "st_type", "year", "qtr", unique=True),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
 
     company_id: int | None = Field(default=None, foreign_key="company.id", nullable=False)
@@ -235,10 +249,23 @@ class FinStatementLineItemBase(SQLModel):
     amount: float
 
 
+# dictionary of line names, line items and the fundamentals matrices refer to
+# a line by its integer id instead of matching on the name
+class FinLineName(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    name: str = Field(unique=True)
+
+
 class FinStatementLineItem(FinStatementLineItemBase, table=True):
+    __table_args__ = (
+        # one line item per name and statement, the importer merges on it
+        Index("ix_finstatementlineitem_parent_id_name_id", "parent_id", "name_id", unique=True),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
+    name_id: int | None = Field(default=None, foreign_key="finlinename.id", index=True)
 
-    parent_id: int | None = Field(default=None, foreign_key="finstatement.id", nullable=False)
+    parent_id: int | None = Field(default=None, foreign_key="finstatement.id", nullable=False, index=True)
     parent: FinStatement | None = Relationship(back_populates="lines")
 
 
@@ -246,6 +273,43 @@ class FinStatementLineItemCreate(FinStatementBase):
     pass
 
 
+##########################################################################
+## FinancialRatio
+##########################################################################
+
+# trailing twelve month sums and ratios per company and quarter, derived from
+# the statement line items by app.core.ratios
+class FinRatioBase(SQLModel):
+    year: int
+    qtr: int
+    revenue_ttm: float | None = None
+    gross_profit_ttm: float | None = None
+    operating_income_ttm: float | None = None
+    net_income_ttm: float | None = None
+    total_equity: float | None = None
+    total_debt: float | None = None
+    gross_margin: float | None = None
+    operating_margin: float | None = None
+    net_margin: float | None = None
+    roe: float | None = None
+    debt_to_equity: float | None = None
+    # only set on a company's latest quarter, from the current market cap
+    pe: float | None = None
+
+
+class FinRatio(FinRatioBase, table=True):
+    __table_args__ = (
+        Index("ix_finratio_company_id_year_qtr", "company_id", "year", "qtr", unique=True),
+    )
+
+    id: int | None = Field(default=None, primary_key=True)
+    company_id: int = Field(foreign_key="company.id")
+
+
+class FinRatioPublic(FinRatioBase):
+    company_id: int
+
+
 ##########################################################################
 ## Instrument
 ##########################################################################
@@ -266,7 +330,7 @@ class AssetType(enum.Enum):
 
 
 class InstrumentBase(SQLModel):
-    symbol: str
+    symbol: str = Field(index=True)
     asset_type: AssetType
     currency: str = "USD"
     exchange: str | None
@@ -282,9 +346,19 @@ class InstrumentBase(SQLModel):
 
 
 class Instrument(InstrumentBase, table=True):
+    __table_args__ = (
+        # screener filters, the other metric columns are only read for the
+        # instruments these narrow down to
+        Index("ix_instrument_asset_type_exchange", "asset_type", "exchange"),
+        Index("ix_instrument_avg_daily_volume", "avg_daily_volume"),
+        # prefix search on symbols, needs the pg_trgm extension
+        Index("ix_instrument_symbol_trgm", "symbol", postgresql_using="gin",
+              postgresql_ops={"symbol": "gin_trgm_ops"}),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
 
-    company_id: int | None = Field(default=None, foreign_key="company.id", nullable=False)
+    company_id: int | None = Field(default=None, foreign_key="company.id", nullable=False, index=True)
     company: Company | None = Relationship(back_populates="instruments")
 
     charts: list["Chart"] = Relationship(back_populates="instrument")
@@ -307,6 +381,46 @@ class InstrumentsPublic(SQLModel):
     count: int
 
 
+class InstrumentSearchHit(SQLModel):
+    id: int
+    symbol: str
+    asset_type: AssetType
+    currency: str
+    exchange: str | None
+    company_name: str | None
+    avg_daily_volume: float | None
+
+
+class ScreenField(enum.Enum):
+    AVG_DAILY_VOLUME = "avg_daily_volume"
+    ONE_YEAR_RETURN = "one_year_return"
+    ONE_MONTH_RETURN = "one_month_return"
+    ONE_WEEK_RETURN = "one_week_return"
+    ONE_DAY_RETURN = "one_day_return"
+    METRIC_52_HIGH = "metric_52_high"
+    METRIC_52_LOW = "metric_52_low"
+    MARKET_CAP = "market_cap"
+
+
+class ScreenRange(SQLModel):
+    field: ScreenField
+    min: float | None = None
+    max: float | None = None
+
+
+# every given criterion has to match, list criteria match any of their values
+class InstrumentScreen(SQLModel):
+    asset_types: list[AssetType] | None = None
+    exchanges: list[str] | None = None
+    currencies: list[str] | None = None
+    sectors: list[str] | None = None
+    subsectors: list[str] | None = None
+    ranges: list[ScreenRange] = []
+    sort_by: ScreenField | None = None
+    descending: bool = True
+    limit: int = Field(default=100, ge=1, le=1000)
+
+
 ##########################################################################
 ## Chart
 ##########################################################################
@@ -325,6 +439,10 @@ class ChartBase(SQLModel):
 
 
 class Chart(ChartBase, table=True):
+    __table_args__ = (
+        Index("ix_chart_instrument_id_interval", "instrument_id", "interval"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
     instrument_id: int | None = Field(default=None, foreign_key="instrument.id", nullable=False)
     instrument: Instrument | None = Relationship(back_populates="charts")
@@ -370,6 +488,13 @@ class BarBase(SQLModel):
 
 
 class Bar(BarBase, table=True):
+    __table_args__ = (
+        # covers chart_id lookups as well as bar range reads
+        Index("ix_bar_chart_id_timestamp", "chart_id", "timestamp"),
+        # bars are appended in time order, a BRIN index stays tiny
+        Index("ix_bar_timestamp", "timestamp", postgresql_using="brin"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
 
     chart_id: int | None = Field(default=None, foreign_key="chart.id", nullable=False)
@@ -413,6 +538,45 @@ class PortfoliosPublic(SQLModel):
     data: list[PortfolioPublic]
     count: int
 
+
+class PortfolioValuation(SQLModel):
+    portfolio_id: int
+    market_value: float
+    cost: float
+    unrealized_pnl: float
+    exposure_by_asset_type: dict[str, float]
+    exposure_by_sector: dict[str, float]
+    var: float
+    var_confidence: float
+    var_horizon_days: int
+
+
+# cumulative realized P&L of a portfolio after each closed trade and its
+# distance to the running peak, numbered per portfolio in time order so a
+# downsampled read fetches the points it returns by primary key
+class EquityPointBase(SQLModel):
+    timestamp: datetime
+    equity: float
+    drawdown: float
+
+
+class EquityPoint(EquityPointBase, table=True):
+    __table_args__ = (
+        Index("ix_equitypoint_portfolio_id_timestamp", "portfolio_id", "timestamp"),
+    )
+
+    portfolio_id: int = Field(foreign_key="portfolio.id", primary_key=True)
+    seq: int = Field(primary_key=True)
+
+
+# columnar for charting, total is the number of stored points in the range
+class EquityCurve(SQLModel):
+    portfolio_id: int
+    total: int
+    timestamps: list[datetime]
+    equity: list[float]
+    drawdown: list[float]
+
 ##########################################################################
 ## Position
 ##########################################################################
@@ -432,9 +596,12 @@ class PositionBase(SQLModel):
 class Position(PositionBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
 
-    portfolio_id: int | None = Field(default=None, foreign_key="portfolio.id")
+    portfolio_id: int | None = Field(default=None, foreign_key="portfolio.id", index=True)
     portfolio: Portfolio | None = Relationship(back_populates="positions")
 
+    instrument_id: int | None = Field(default=None, foreign_key="instrument.id", index=True)
+    instrument: Instrument | None = Relationship()
+
     orders: list["Order"] = Relationship(back_populates="position")
 
 
@@ -455,6 +622,11 @@ class PositionsPublic(SQLModel):
     count: int
 
 
+class PositionDetailPublic(PositionPublic):
+    instrument_id: int | None
+    instrument: InstrumentPublic | None
+
+
 ##########################################################################
 ## Order
 ##########################################################################
@@ -475,6 +647,27 @@ class QtyUnits(enum.Enum):
     USD = "usd"
 
 
+class OrderSide(enum.Enum):
+    BUY = "buy"
+    SELL = "sell"
+
+
+class OrderStatus(enum.Enum):
+    PENDING = "pending"
+    SUBMITTED = "submitted"
+    FILLED = "filled"
+    CANCELLED = "cancelled"
+    REJECTED = "rejected"
+
+
+# How the legs of a composite order are linked at the broker
+class OrderGroupType(enum.Enum):
+    # the parent is the entry, legs are exits that activate once it fills
+    BRACKET = "bracket"
+    # the parent is only a header, the first leg to fill cancels the others
+    OCO = "oco"
+
+
 class OrderBase(SQLModel):
     currency: str
     symbol: str
@@ -485,18 +678,29 @@ class OrderBase(SQLModel):
     unit: QtyUnits
     time_in_force: TimeInForce
     status: str | None
+    side: OrderSide = OrderSide.BUY
 
 
 class Order(OrderBase, table=True):
+    __table_args__ = (
+        # covers portfolio_id lookups as well as orders by status
+        Index("ix_order_portfolio_id_status", "portfolio_id", "status"),
+        Index("ix_order_status", "status"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
+    group_type: OrderGroupType | None = None
+    broker_order_id: int | None = None
+    # bumped by every journaled change, replaying the journal keeps the newer state
+    version: int = 0
 
     portfolio_id: int | None = Field(default=None, foreign_key="portfolio.id")
     portfolio: Portfolio | None = Relationship(back_populates="orders")
 
-    account_id: int | None = Field(default=None, foreign_key="account.id")
+    account_id: int | None = Field(default=None, foreign_key="account.id", index=True)
     account: Account | None = Relationship(back_populates="orders")
 
-    position_id: int | None = Field(default=None, foreign_key="position.id")
+    position_id: int | None = Field(default=None, foreign_key="position.id", index=True)
     position: Position | None = Relationship(back_populates="orders")
 
     legs: list["OrderLeg"] = Relationship(back_populates="parent")
@@ -533,18 +737,75 @@ class OrderLegBase(SQLModel):
 
 class OrderLeg(OrderLegBase, table=True):
     id: int | None = Field(default=None, primary_key=True)
-    parent_id: int | None = Field(default=None, foreign_key="order.id")
+    broker_order_id: int | None = None
+    parent_id: int | None = Field(default=None, foreign_key="order.id", index=True)
     parent: Order | None = Relationship(back_populates="legs")
 
 
-class OrderLegCreate(OrderLegBase):
-    pass
+class OrderLegCreate(SQLModel):
+    order_type: OrderType
+    qty: float
+    price: float
 
 
 class OrderLegUpdate(OrderLegBase):
     pass
 
 
+class OrderLegPublic(OrderLegBase):
+    id: int
+
+
+# Parent order plus all of its legs, submitted in a single request; the
+# account, or the portfolio's, is what the risk checks run against
+class OrderGroupCreate(OrderCreate):
+    group_type: OrderGroupType
+    legs: list[OrderLegCreate]
+    portfolio_id: int | None = None
+    account_id: int | None = None
+
+
+class OrderGroupPublic(OrderPublic):
+    group_type: OrderGroupType | None
+    legs: list[OrderLegPublic]
+
+
+# Portfolio with its positions and orders, load it with the "portfolio.detail" profile
+class PortfolioDetailPublic(PortfolioPublic):
+    positions: list[PositionDetailPublic]
+    orders: list[OrderGroupPublic]
+
+
+##########################################################################
+## Execution
+##########################################################################
+
+
+# broker executions the ledger has applied, written in the same checkpoint
+# as the positions they changed, so one the broker reports again after a
+# reconnect or a restart is applied once
+class Execution(SQLModel, table=True):
+    exec_id: str = Field(primary_key=True)
+    portfolio_id: int = Field(foreign_key="portfolio.id")
+    instrument_id: int = Field(foreign_key="instrument.id")
+    applied_at: datetime = Field(index=True)
+
+
+##########################################################################
+## Journal
+##########################################################################
+
+
+# events drained from the local event journals, numbered in the order each
+# journal wrote them; data is the position and portfolio after a fill or the
+# order with its legs after a change
+class JournalEvent(SQLModel, table=True):
+    journal: str = Field(primary_key=True)
+    seq: int = Field(primary_key=True, sa_type=BigInteger, sa_column_kwargs={"autoincrement": False})
+    kind: str
+    data: dict[str, Any] = Field(sa_type=JSON)
+    recorded_at: datetime
+
 
 ##########################################################################
 ## Trade
@@ -564,15 +825,19 @@ class TradeBase(SQLModel):
 
 
 class Trade(TradeBase, table=True):
+    __table_args__ = (
+        Index("ix_trade_portfolio_id_instrument_id", "portfolio_id", "instrument_id"),
+    )
+
     id: int | None = Field(default=None, primary_key=True)
 
     portfolio_id: int | None = Field(default=None, foreign_key="portfolio.id")
-    instrument_id: int | None = Field(default=None, foreign_key="instrument.id")
-    entry_signal_bar_id: int | None = Field(default=None, foreign_key="bar.id")
-    entry_action_bar_id: int | None = Field(default=None, foreign_key="bar.id")
-    exit_action_bar_id: int | None = Field(default=None, foreign_key="bar.id")
-    exit_order_id: int | None = Field(default=None, foreign_key="order.id")
-    position_id: int | None = Field(default=None, foreign_key="position.id")
+    instrument_id: int | None = Field(default=None, foreign_key="instrument.id", index=True)
+    entry_signal_bar_id: int | None = Field(default=None, foreign_key="bar.id", index=True)
+    entry_action_bar_id: int | None = Field(default=None, foreign_key="bar.id", index=True)
+    exit_action_bar_id: int | None = Field(default=None, foreign_key="bar.id", index=True)
+    exit_order_id: int | None = Field(default=None, foreign_key="order.id", index=True)
+    position_id: int | None = Field(default=None, foreign_key="position.id", index=True)
 
 
 
@@ -593,6 +858,85 @@ class TradesPublic(SQLModel):
     count: int
 
 
+# closed trade statistics of a portfolio, amounts are in the trade currency;
+# ratios are None where they are undefined (no trades, no losses)
+class TradeStats(SQLModel):
+    portfolio_id: int
+    trades: int
+    wins: int
+    losses: int
+    win_rate: float | None
+    gross_profit: float
+    gross_loss: float
+    profit_factor: float | None
+    expectancy: float | None
+    avg_win: float | None
+    avg_loss: float | None
+    avg_mfe: float | None
+    avg_mae: float | None
+    max_drawdown: float
+    # mean over the standard deviation of the trade returns, annualized by the
+    # number of trades per year
+    sharpe: float | None
+
+
+class TradeGroup(enum.Enum):
+    DAY = "day"
+    WEEK = "week"
+    MONTH = "month"
+    INSTRUMENT = "instrument"
+    DIRECTION = "direction"
+    PORTFOLIO = "portfolio"
+
+
+# sums over the trades with an exit bar, only the grouped by keys are set
+class TradeAggregate(SQLModel):
+    bucket: datetime | None = None
+    instrument_id: int | None = None
+    direction: PositionDirection | None = None
+    portfolio_id: int | None = None
+    trades: int
+    wins: int
+    profit_loss: float
+    total_fees: float
+    # running profit_loss over the buckets of each combination of the other keys
+    cumulative_profit_loss: float | None = None
+
+
+# buckets before closed_until come from the cache of closed periods
+class TradeAggregates(SQLModel):
+    data: list[TradeAggregate]
+    closed_until: datetime
+
+
+# realized P&L of the trades exiting on a day, per portfolio and per account
+# over the account's portfolios; maintained by app.core.pnl_rollups
+class DailyPnlBase(SQLModel):
+    trades: int
+    wins: int
+    profit_loss: float
+    total_fees: float
+
+
+class PortfolioDailyPnl(DailyPnlBase, table=True):
+    portfolio_id: int = Field(foreign_key="portfolio.id", primary_key=True)
+    day: date = Field(primary_key=True, index=True)
+
+
+class AccountDailyPnl(DailyPnlBase, table=True):
+    account_id: int = Field(foreign_key="account.id", primary_key=True)
+    day: date = Field(primary_key=True, index=True)
+
+
+# P&L of the day, week or month starting on day
+class PnlPeriod(DailyPnlBase):
+    day: date
+
+
+class PnlPeriods(SQLModel):
+    data: list[PnlPeriod]
+
+
 ##########################################################################
 ## Exchange
 ##########################################################################
@@ -604,4 +948,57 @@ class ExchangeBase(SQLModel):
     market :str
 
 class Exchange(ExchangeBase, table=True):
-    id: int | None = Field(default=None, primary_key=True)
\ No newline at end of file
+    id: int | None = Field(default=None, primary_key=True)
+
+##########################################################################
+## Cache
+##########################################################################
+
+class CacheStats(SQLModel):
+    name: str
+    size: int
+    hits: int
+    shared_hits: int
+    misses: int
+    hit_ratio: float
+    evictions: int
+    expirations: int
+    invalidations: int
+
+
+# pre-trade risk check counters, latency bucket bounds are the upper ends in
+# microseconds and the last count is of the checks slower than every bound
+class RiskStats(SQLModel):
+    checks: int
+    rejections: int
+    latency_bounds_us: list[float]
+    latency_counts: list[int]
+    p50_us: float | None
+    p99_us: float | None
+
+
+# event bus counters of a topic kind, lags are from publishing to a consumer
+# getting the event and None before any was delivered
+class TopicStats(SQLModel):
+    kind: str
+    subscribers: int
+    published: int
+    # published on the bus of another worker
+    received: int
+    published_per_second: int
+    delivered: int
+    dropped: int
+    conflated: int
+    blocked: int
+    lag_avg_ms: float | None
+    lag_max_ms: float | None
+
+
+class QueryStats(SQLModel):
+    name: str
+    calls: int
+    compiled_cache_hits: int
+    # averages per call
+    compile_ms: float
+    execute_ms: float
+    load_ms: float
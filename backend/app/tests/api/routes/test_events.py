@@ -0,0 +1,24 @@
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_stream_needs_superuser(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/events/stream", headers=normal_user_token_headers
+    )
+    assert response.status_code == 403
+
+
+def test_stream_of_unknown_portfolio(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.get(
+        f"{settings.API_V1_STR}/events/stream",
+        headers=superuser_token_headers,
+        params={"portfolio_id": [2_000_000_000]},
+    )
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Portfolios not found: [2000000000]"
@@ -0,0 +1,174 @@
+from typing import Any
+
+from fastapi.testclient import TestClient
+
+from app.api.deps import get_risk_engine
+from app.core.config import settings
+from app.core.risk import RiskEngine, RiskLimits
+from app.main import app
+
+
+def bracket_order_data() -> dict[str, Any]:
+    return {
+        "currency": "USD",
+        "symbol": "AAPL",
+        "open_date_time": "2024-05-01T14:30:00",
+        "order_type": "limit",
+        "qty": 10,
+        "price": 100,
+        "unit": "shares",
+        "time_in_force": "day",
+        "status": None,
+        "group_type": "bracket",
+        "legs": [
+            {"order_type": "limit", "qty": 10, "price": 110},
+            {"order_type": "stop", "qty": 10, "price": 95},
+        ],
+    }
+
+
+def test_create_order_group(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/orders/group",
+        headers=superuser_token_headers,
+        json=bracket_order_data(),
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["group_type"] == "bracket"
+    assert content["status"] == "submitted"
+    assert len(content["legs"]) == 2
+    assert all(leg["status"] == "submitted" for leg in content["legs"])
+
+
+def test_create_order_group_oco_needs_two_legs(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    data = bracket_order_data()
+    data["group_type"] = "oco"
+    data["legs"] = data["legs"][:1]
+    response = client.post(
+        f"{settings.API_V1_STR}/orders/group",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "An OCO order needs at least two legs"
+
+
+def test_replace_and_cancel_order_group(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/orders/group",
+        headers=superuser_token_headers,
+        json=bracket_order_data(),
+    )
+    order_id = response.json()["id"]
+
+    data = bracket_order_data()
+    data["legs"] = data["legs"][:1]
+    response = client.put(
+        f"{settings.API_V1_STR}/orders/{order_id}/group",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["id"] == order_id
+    assert len(content["legs"]) == 1
+
+    response = client.post(
+        f"{settings.API_V1_STR}/orders/{order_id}/group/cancel",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 200
+    content = response.json()
+    assert content["status"] == "cancelled"
+    assert all(leg["status"] == "cancelled" for leg in content["legs"])
+
+    response = client.post(
+        f"{settings.API_V1_STR}/orders/{order_id}/group/cancel",
+        headers=superuser_token_headers,
+    )
+    assert response.status_code == 400
+    response = client.put(
+        f"{settings.API_V1_STR}/orders/{order_id}/group",
+        headers=superuser_token_headers,
+        json=data,
+    )
+    assert response.status_code == 400
+
+
+def test_single_orders_refused_with_risk_checks(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    data = bracket_order_data()
+    del data["group_type"], data["legs"]
+    response = client.post(
+        f"{settings.API_V1_STR}/orders/", headers=superuser_token_headers, json=data
+    )
+    assert response.status_code == 200
+    order_id = response.json()["id"]
+
+    limits = RiskLimits(
+        max_order_notional=1e6,
+        max_position_value=1e6,
+        max_daytrades=3,
+        pdt_min_equity=0,
+    )
+    app.dependency_overrides[get_risk_engine] = lambda: RiskEngine(limits)
+    try:
+        response = client.post(
+            f"{settings.API_V1_STR}/orders/", headers=superuser_token_headers, json=data
+        )
+        assert response.status_code == 400
+        data["qty"] = 1000
+        response = client.put(
+            f"{settings.API_V1_STR}/orders/{order_id}",
+            headers=superuser_token_headers,
+            json=data,
+        )
+        assert response.status_code == 400
+    finally:
+        app.dependency_overrides.pop(get_risk_engine)
+
+    response = client.get(
+        f"{settings.API_V1_STR}/orders/{order_id}", headers=superuser_token_headers
+    )
+    assert response.json()["qty"] == 10
+    client.delete(
+        f"{settings.API_V1_STR}/orders/{order_id}", headers=superuser_token_headers
+    )
+
+
+def test_orders_need_superuser(
+    client: TestClient, normal_user_token_headers: dict[str, str]
+) -> None:
+    response = client.post(
+        f"{settings.API_V1_STR}/orders/group",
+        headers=normal_user_token_headers,
+        json=bracket_order_data(),
+    )
+    assert response.status_code == 403
+    response = client.get(
+        f"{settings.API_V1_STR}/orders/", headers=normal_user_token_headers
+    )
+    assert response.status_code == 403
+
+
+def test_read_orders(
+    client: TestClient, superuser_token_headers: dict[str, str]
+) -> None:
+    client.post(
+        f"{settings.API_V1_STR}/orders/group",
+        headers=superuser_token_headers,
+        json=bracket_order_data(),
+    )
+    response = client.get(
+        f"{settings.API_V1_STR}/orders/", headers=superuser_token_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["count"] >= 1
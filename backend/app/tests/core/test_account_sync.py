@@ -0,0 +1,70 @@
+from sqlmodel import Session
+
+from app.core.account_sync import AccountDelta, AccountSync, parse_account_value
+from app.models import Account, Portfolio
+
+
+def test_parse_account_value() -> None:
+    assert parse_account_value("cash", "1500.25") == 1500.25
+    assert parse_account_value("cash", "") is None
+    assert parse_account_value("daytrade_count", "1") == 2
+    assert parse_account_value("daytrade_count", "-1") == 0
+
+
+def test_apply_coalesces_and_filters() -> None:
+    sync = AccountSync()
+    sync.track(
+        Account(id=1, broker="ib", broker_account="U1", portfolio_id=1, cash=100.0)
+    )
+    assert not sync.apply("U2", "TotalCashValue", "5", "USD")
+    assert not sync.apply("U1", "Leverage-S", "5", "USD")
+    assert not sync.apply("U1", "TotalCashValue", "5", "EUR")
+    assert sync.apply("U1", "TotalCashValue", "150", "USD")
+    assert sync.apply("U1", "TotalCashValue", "175", "USD")
+    state = sync.account("U1")
+    assert state and state.pending == {"cash": 175.0}
+
+    # back to the stored value, nothing left to write
+    assert not sync.apply("U1", "TotalCashValue", "100", "USD")
+    assert not sync.dirty()
+
+    # once a tag comes in the base currency its per currency values are ignored
+    assert sync.apply("U1", "NetLiquidation", "900", "BASE")
+    assert not sync.apply("U1", "NetLiquidation", "800", "USD")
+    assert state.pending == {"equity": 900.0}
+
+
+def test_flush_writes_changed_fields(db: Session) -> None:
+    portfolio = Portfolio(cash=0, equity=0, profit=0)
+    db.add(portfolio)
+    db.flush()
+    account = Account(
+        broker="ib",
+        broker_account="U-SYNC-1",
+        portfolio_id=portfolio.id,
+        cash=100.0,
+        equity=100.0,
+    )
+    db.add(account)
+    db.commit()
+    assert account.id is not None
+    sync = AccountSync()
+    deltas: list[AccountDelta] = []
+    sync.subscribe(deltas.append)
+    sync.load(db)
+
+    for value in ("110", "120", "130"):
+        sync.apply("U-SYNC-1", "TotalCashValue", value, "USD")
+    sync.apply("U-SYNC-1", "NetLiquidation", "100", "USD")
+    sync.apply("U-SYNC-1", "DayTradesRemaining", "2", "")
+    assert sync.flush(db) == 1
+    assert sync.flush(db) == 0
+    assert deltas == [
+        AccountDelta(account.id, "U-SYNC-1", {"cash": 130.0, "daytrade_count": 1})
+    ]
+
+    db.refresh(account)
+    assert (account.cash, account.equity, account.daytrade_count) == (130.0, 100.0, 1)
+    db.delete(account)
+    db.delete(portfolio)
+    db.commit()
@@ -0,0 +1,63 @@
+import time
+
+from app.adopters.cache import LocalCacheBackend
+from app.core.cache import TieredCache, TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used() -> None:
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_ttl_cache_expires_entries() -> None:
+    cache = TTLCache(maxsize=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+    assert len(cache) == 0
+
+
+def test_tiered_cache_counts_hits_and_misses() -> None:
+    cache = TieredCache("test", TTLCache(maxsize=10, ttl=60))
+    assert cache.get("company:1") is None
+    cache.set("company:1", {"id": 1, "name": "Acme"})
+    assert cache.get("company:1") == {"id": 1, "name": "Acme"}
+    cache.invalidate("company:1")
+    assert cache.get("company:1") is None
+    stats = cache.stats()
+    assert (stats.hits, stats.misses, stats.invalidations) == (1, 2, 1)
+    assert stats.hit_ratio == 1 / 3
+
+
+def test_tiered_cache_fills_local_tier_from_shared() -> None:
+    shared = LocalCacheBackend()
+    writer = TieredCache("writer", TTLCache(maxsize=10, ttl=60), shared)
+    reader = TieredCache("reader", TTLCache(maxsize=10, ttl=60), shared)
+    writer.set("company:1", {"id": 1})
+    assert reader.get("company:1") == {"id": 1}
+    assert reader.get("company:1") == {"id": 1}
+    assert (reader.stats().shared_hits, reader.stats().hits) == (1, 1)
+
+    writer.invalidate("company:1")
+    assert shared.get("company:1") is None
+
+
+def test_tiered_cache_evicts_local_tier_only() -> None:
+    shared = LocalCacheBackend()
+    cache = TieredCache("test", TTLCache(maxsize=10, ttl=60), shared)
+    for key in ("company:1", "company:2", "instrument:1"):
+        cache.set(key, {"key": key})
+    cache.evict("company:1")
+    assert cache.local.get("company:1") is None
+    assert shared.get("company:1") is not None
+    cache.evict(prefix="company:")
+    assert len(cache.local) == 1
+    assert cache.stats().invalidations == 2
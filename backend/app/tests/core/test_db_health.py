@@ -0,0 +1,16 @@
+from sqlmodel import Session, SQLModel
+
+from app.core.db_health import sequential_scans, unindexed_foreign_keys
+
+
+def test_model_foreign_keys_are_indexed(db: Session) -> None:
+    unindexed = [
+        f"{fk.table}.{fk.column}"
+        for fk in unindexed_foreign_keys(db)
+        if fk.table in SQLModel.metadata.tables
+    ]
+    assert unindexed == []
+
+
+def test_sequential_scans_respects_min_rows(db: Session) -> None:
+    assert sequential_scans(db, min_rows=10**12) == []
@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlmodel import Session, select
+
+from app.core.equity import (
+    append_trades,
+    equity_curve,
+    rebuild_equity,
+    running_drawdown,
+    sample_seqs,
+)
+from app.models import (
+    AssetType,
+    Bar,
+    Chart,
+    ChartInterval,
+    Company,
+    EquityPoint,
+    Instrument,
+    Portfolio,
+    PositionDirection,
+    Trade,
+)
+
+
+def test_running_drawdown() -> None:
+    equity = np.array([-1.0, 2.0, 1.0, 3.0, 0.0])
+    assert running_drawdown(equity).tolist() == [1.0, 0.0, 1.0, 0.0, 3.0]
+    assert running_drawdown(equity, peak=5.0).tolist() == [6.0, 3.0, 4.0, 2.0, 5.0]
+
+
+def test_sample_seqs() -> None:
+    assert sample_seqs(3, 6, 10).tolist() == [3, 4, 5, 6]
+    seqs = sample_seqs(1, 1_000_000, 500)
+    assert len(seqs) == 500
+    assert (seqs[0], seqs[-1]) == (1, 1_000_000)
+    assert (np.diff(seqs) > 0).all()
+
+
+def test_append_and_downsample(db: Session) -> None:
+    company = Company(name="Equity Inc")
+    portfolio = Portfolio(cash=0, equity=0, profit=0)
+    db.add_all([company, portfolio])
+    db.flush()
+    instrument = Instrument(
+        symbol="EQTY",
+        asset_type=AssetType.EQUITY,
+        exchange=None,
+        root=None,
+        underlying=None,
+        company_id=company.id,
+    )
+    db.add(instrument)
+    db.flush()
+    chart = Chart(
+        instrument_id=instrument.id,
+        interval=ChartInterval.Daily,
+        timestamp=datetime(2024, 1, 1),
+    )
+    db.add(chart)
+    db.flush()
+    bars = [
+        Bar(
+            chart_id=chart.id,
+            timestamp=datetime(2024, 1, 1) + timedelta(days=i),
+            loc=i,
+            open=1,
+            close=1,
+            high=1,
+            low=1,
+            volume=0,
+            downTicks=None,
+            downVolume=None,
+            totalTicks=None,
+            upTicks=None,
+            upVolume=None,
+            symbol="EQTY",
+        )
+        for i in range(10)
+    ]
+    db.add_all(bars)
+    db.flush()
+    trades = [
+        Trade(
+            portfolio_id=portfolio.id,
+            qty=1,
+            entry_price=0,
+            exit_price=0,
+            direction=PositionDirection.LONG,
+            profit_loss=pnl,
+            exit_action_bar_id=bars[i].id,
+        )
+        for i, pnl in enumerate([5.0, -2.0, 4.0, -10.0, 1.0, 3.0, 2.0, -1.0, 6.0, 1.0])
+    ]
+    db.add_all(trades)
+    db.flush()
+    assert portfolio.id is not None
+    ids = [t.id for t in trades if t.id is not None]
+
+    assert append_trades(db, portfolio.id, ids[:4]) == 4
+    assert append_trades(db, portfolio.id, ids[4:]) == 6
+    # a trade closing before the last point rebuilds the curve
+    assert append_trades(db, portfolio.id, [ids[2]]) == 10
+
+    curve = equity_curve(db, portfolio.id)
+    assert curve.total == 10
+    assert curve.equity == [5.0, 3.0, 7.0, -3.0, -2.0, 1.0, 3.0, 2.0, 8.0, 9.0]
+    assert curve.drawdown == [0.0, 2.0, 0.0, 10.0, 9.0, 6.0, 4.0, 5.0, 0.0, 0.0]
+
+    curve = equity_curve(
+        db, portfolio.id, start=datetime(2024, 1, 3), end=datetime(2024, 1, 8), points=3
+    )
+    assert curve.total == 6
+    assert curve.timestamps == [
+        datetime(2024, 1, 3),
+        datetime(2024, 1, 6),
+        datetime(2024, 1, 8),
+    ]
+    assert curve.equity == [7.0, 1.0, 2.0]
+
+    assert rebuild_equity(db, portfolio.id) == 10
+    assert equity_curve(db, portfolio.id, start=datetime(2025, 1, 1)).total == 0
+    assert (
+        len(
+            db.exec(
+                select(EquityPoint).where(EquityPoint.portfolio_id == portfolio.id)
+            ).all()
+        )
+        == 10
+    )
+    db.rollback()
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+from typing import Any
+
+from app.core.event_bus import (
+    FILL,
+    PRICE,
+    BusEvent,
+    BusSubscription,
+    EventBus,
+    OverflowPolicy,
+    PgEventBridge,
+    Topic,
+    decode_event,
+    encode_event,
+    portfolio_topic,
+    price_topic,
+)
+
+
+async def _get_all(subscription: BusSubscription) -> list[dict[str, Any]]:
+    payloads = []
+    while len(subscription):
+        payloads.append((await subscription.get()).payload)
+    return payloads
+
+
+def test_topics() -> None:
+    assert str(price_topic(7)) == "price:7"
+    assert Topic.parse("fill:3") == portfolio_topic(FILL, 3)
+    assert Topic.parse("fill") == Topic(FILL)
+    assert Topic(FILL).matches(portfolio_topic(FILL, 3))
+    assert Topic(FILL, "3").matches(portfolio_topic(FILL, 3))
+    assert not Topic(FILL, "4").matches(portfolio_topic(FILL, 3))
+    assert not Topic(PRICE).matches(portfolio_topic(FILL, 3))
+
+
+def test_overflow_policies() -> None:
+    async def run() -> None:
+        bus = EventBus(queue_size=2)
+        bus.start()
+        dropping = bus.subscribe(Topic(PRICE))
+        conflating = bus.subscribe(Topic(PRICE), OverflowPolicy.CONFLATE)
+        blocking = bus.subscribe(Topic(PRICE), OverflowPolicy.BLOCK)
+        one = bus.subscribe(price_topic(2))
+        for instrument_id, price in [(1, 10.0), (2, 20.0), (1, 11.0), (2, 21.0)]:
+            bus.publish(
+                price_topic(instrument_id), {"id": instrument_id, "price": price}
+            )
+
+        assert await _get_all(dropping) == [
+            {"id": 1, "price": 11.0},
+            {"id": 2, "price": 21.0},
+        ]
+        assert await _get_all(conflating) == [
+            {"id": 1, "price": 11.0},
+            {"id": 2, "price": 21.0},
+        ]
+        # on the loop nothing can wait, the bound is exceeded instead
+        assert len(await _get_all(blocking)) == 4
+        assert await _get_all(one) == [
+            {"id": 2, "price": 20.0},
+            {"id": 2, "price": 21.0},
+        ]
+
+        # a new topic in a full conflating queue drops the oldest one
+        for instrument_id in (1, 2, 3):
+            bus.publish(price_topic(instrument_id), {"id": instrument_id})
+        assert await _get_all(conflating) == [{"id": 2}, {"id": 3}]
+
+        (stats,) = bus.stats()
+        assert (stats.kind, stats.subscribers, stats.published) == (PRICE, 4, 7)
+        assert stats.conflated == 2
+        assert stats.dropped == 2 + 1 + 1
+        assert stats.delivered == 2 + 2 + 4 + 2 + 2
+        assert stats.lag_max_ms is not None and stats.lag_avg_ms is not None
+        assert stats.lag_max_ms >= stats.lag_avg_ms
+        await bus.stop()
+
+    asyncio.run(run())
+
+
+def test_blocking_publisher_waits_for_room() -> None:
+    async def run() -> None:
+        bus = EventBus(queue_size=1)
+        bus.start()
+        subscription = bus.subscribe(Topic(FILL), OverflowPolicy.BLOCK)
+        published = []
+
+        def publish() -> None:
+            for i in range(3):
+                bus.publish(portfolio_topic(FILL, 1), {"i": i})
+                published.append(i)
+
+        thread = threading.Thread(target=publish)
+        thread.start()
+        received = []
+        for _ in range(3):
+            event = await asyncio.wait_for(subscription.get(), 5)
+            received.append(event.payload["i"])
+            await asyncio.sleep(0.05)
+            # the publisher never gets more than one event ahead
+            assert len(published) <= len(received) + 1
+        await asyncio.to_thread(thread.join)
+        assert received == [0, 1, 2]
+        assert bus.stats()[0].blocked >= 1
+        await bus.stop()
+
+    asyncio.run(run())
+
+
+def test_consumers() -> None:
+    async def run() -> None:
+        bus = EventBus()
+        seen: list[BusEvent] = []
+
+        def fail(event: BusEvent) -> None:
+            raise RuntimeError(f"consumer bug on {event.topic}")
+
+        async def consume(event: BusEvent) -> None:
+            seen.append(event)
+
+        bus.add_consumer(Topic(FILL), fail)
+        bus.add_consumer([Topic(FILL), Topic(PRICE)], consume)
+        # dropped, nothing delivers before the bus is started
+        bus.publish(portfolio_topic(FILL, 1), {"i": 0})
+        bus.start()
+        bus.publish(portfolio_topic(FILL, 1), {"i": 1})
+        await asyncio.to_thread(bus.publish, price_topic(1), {"i": 2})
+        await bus.publish_async(portfolio_topic(FILL, 2), {"i": 3})
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert [event.payload["i"] for event in seen] == [1, 2, 3]
+        await bus.stop()
+
+    asyncio.run(run())
+
+
+def test_bridge() -> None:
+    async def run() -> None:
+        sender, receiver = EventBus(), EventBus()
+        sender.start()
+        receiver.start()
+        outbox: list[BusEvent] = []
+        sender.bridge(outbox.append, [FILL])
+        local = sender.subscribe(Topic(FILL))
+        remote = receiver.subscribe(Topic(FILL))
+
+        event = sender.publish(portfolio_topic(FILL, 1), {"qty": 1.0})
+        sender.publish(price_topic(1), {"price": 1.0})
+        assert outbox == [event]
+        bridge = PgEventBridge(receiver, "", "event_bus", [FILL])
+        bridge.receive(encode_event(event))
+        # its own events come back over the channel too
+        PgEventBridge(sender, "", "event_bus", [FILL]).receive(encode_event(event))
+        bridge.receive("not json")
+
+        assert len(local) == 1
+        assert await remote.get() == event
+        assert len(remote) == 0
+        assert receiver.stats()[0].received == 1
+        assert decode_event(encode_event(event)) == event
+        await sender.stop()
+        await receiver.stop()
+
+    asyncio.run(run())
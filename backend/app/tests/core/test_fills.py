@@ -0,0 +1,126 @@
+from sqlmodel import Session, col, delete
+
+from app.core.db import engine
+from app.core.fills import BrokerFill, FillHandler
+from app.core.ledger import Ledger
+from app.models import (
+    AssetType,
+    Company,
+    Execution,
+    Instrument,
+    Order,
+    OrderGroupType,
+    OrderLeg,
+    OrderStatus,
+    OrderType,
+    Portfolio,
+    Position,
+    QtyUnits,
+    TimeInForce,
+)
+
+
+def _fill(
+    exec_id: str, broker_order_id: int, qty: float, filled: float, client_id: int = 1
+) -> BrokerFill:
+    return BrokerFill(
+        exec_id=exec_id,
+        client_id=client_id,
+        broker_order_id=broker_order_id,
+        symbol="FILLX",
+        qty=qty,
+        price=50.0,
+        fees=1.0,
+        filled=filled,
+    )
+
+
+def test_executions_fill_the_order_once(db: Session) -> None:
+    company = Company(name="Fills Inc")
+    db.add(company)
+    db.flush()
+    portfolio = Portfolio(cash=0, equity=0, profit=0)
+    instrument = Instrument(
+        symbol="FILLX",
+        asset_type=AssetType.EQUITY,
+        exchange=None,
+        root=None,
+        underlying=None,
+        company_id=company.id,
+    )
+    db.add_all([portfolio, instrument])
+    db.flush()
+    order = Order(
+        portfolio_id=portfolio.id,
+        currency="USD",
+        symbol="FILLX",
+        open_date_time="2024-01-02T09:30:00",
+        order_type=OrderType.LIMIT,
+        qty=10,
+        price=50,
+        unit=QtyUnits.SHARES,
+        time_in_force=TimeInForce.DAY,
+        status=OrderStatus.SUBMITTED.value,
+        group_type=OrderGroupType.BRACKET,
+        broker_order_id=9001,
+    )
+    order.legs = [
+        OrderLeg(
+            order_type=OrderType.LIMIT,
+            qty=10,
+            price=60,
+            status=OrderStatus.SUBMITTED.value,
+            broker_order_id=9002,
+        ),
+        OrderLeg(
+            order_type=OrderType.STOP,
+            qty=10,
+            price=45,
+            status=OrderStatus.SUBMITTED.value,
+            broker_order_id=9003,
+        ),
+    ]
+    db.add(order)
+    db.commit()
+    assert portfolio.id is not None and instrument.id is not None
+    ledger = Ledger()
+    fills = FillHandler(engine, ledger, client_id=1)
+
+    assert fills.apply(_fill("e1", 9001, 4, filled=4)) is not None
+    db.refresh(order)
+    assert order.status == OrderStatus.SUBMITTED.value
+    delta = fills.apply(_fill("e2", 9001, 6, filled=10))
+    assert delta is not None and delta.qty == 10
+    db.refresh(order)
+    assert order.status == OrderStatus.FILLED.value
+
+    # reported again after a reconnect, or placed by another client
+    assert fills.apply(_fill("e2", 9001, 6, filled=10)) is None
+    assert fills.apply(_fill("e3", 9001, 6, filled=10, client_id=7)) is None
+    position = ledger.position(portfolio.id, instrument.id)
+    assert position and position.qty == 10
+
+    # the checkpoint writes the executions with the position they opened
+    ledger.checkpoint(db)
+    reloaded = Ledger()
+    reloaded.load(db)
+    assert reloaded.apply_execution("e2", portfolio.id, instrument.id, 6, 50.0) is None
+
+    # the take profit filling cancels the stop
+    assert fills.apply(_fill("e4", 9002, -10, filled=10)) is not None
+    db.refresh(order)
+    assert {leg.broker_order_id: leg.status for leg in order.legs} == {
+        9002: OrderStatus.FILLED.value,
+        9003: OrderStatus.CANCELLED.value,
+    }
+    assert order.status == OrderStatus.FILLED.value
+
+    db.execute(delete(Execution).where(col(Execution.portfolio_id) == portfolio.id))
+    db.execute(delete(Position).where(col(Position.portfolio_id) == portfolio.id))
+    for leg in order.legs:
+        db.delete(leg)
+    db.delete(order)
+    db.delete(instrument)
+    db.delete(portfolio)
+    db.delete(company)
+    db.commit()
@@ -0,0 +1,152 @@
+from pathlib import Path
+
+import numpy as np
+from sqlmodel import Session
+
+from app.core.fundamentals import (
+    FundamentalsMatrix,
+    backfill_line_name_ids,
+    line_name_ids,
+    materialize,
+    period_key,
+)
+from app.models import Company, FinLineName, FinStatement, FinStatementLineItem, FSType
+
+
+def _matrix() -> FundamentalsMatrix:
+    nan = np.nan
+    return FundamentalsMatrix(
+        st_type=FSType.INCOME,
+        companies=np.array([10, 20, 30]),
+        periods=np.array(
+            [period_key(2023, 3), period_key(2023, 4), period_key(2024, 1)]
+        ),
+        line_ids=np.array([1, 2]),
+        line_names=np.array(["revenue", "net_income"]),
+        values=np.array(
+            [
+                [[100.0, 110.0, 120.0], [50.0, nan, 55.0], [nan, 7.0, nan]],
+                [[10.0, 11.0, 12.0], [5.0, 6.0, nan], [nan, nan, nan]],
+            ]
+        ),
+    )
+
+
+def test_cross_section() -> None:
+    companies, values = _matrix().cross_section("revenue", 2023, 4)
+    assert companies.tolist() == [10, 20, 30]
+    np.testing.assert_array_equal(values, [110.0, np.nan, 7.0])
+
+    companies, values = _matrix().cross_section(2, 2024, 1, company_ids=[30, 99, 10])
+    assert companies.tolist() == [30, 99, 10]
+    np.testing.assert_array_equal(values, [np.nan, np.nan, 12.0])
+
+    _, values = _matrix().cross_section("revenue", 2019, 1)
+    assert np.isnan(values).all()
+
+
+def test_series_and_latest() -> None:
+    companies, periods, values = _matrix().series(
+        "revenue", company_ids=[20], start=(2023, 4)
+    )
+    assert periods.tolist() == [period_key(2023, 4), period_key(2024, 1)]
+    np.testing.assert_array_equal(values, [[np.nan, 55.0]])
+
+    companies, values = _matrix().latest("net_income")
+    np.testing.assert_array_equal(values, [12.0, 6.0, np.nan])
+
+    assert np.isnan(_matrix().line("unknown")).all()
+
+
+def test_save_and_load(tmp_path: Path) -> None:
+    path = tmp_path / "income.npz"
+    _matrix().save(path)
+    loaded = FundamentalsMatrix.load(path)
+    assert loaded.st_type == FSType.INCOME
+    assert loaded.line_names.tolist() == ["revenue", "net_income"]
+    np.testing.assert_array_equal(loaded.values, _matrix().values)
+
+
+def test_materialize(db: Session) -> None:
+    company = Company(name="Fundamentals Inc")
+    db.add(company)
+    db.flush()
+    ids = line_name_ids(db, ["test_revenue", "test_net_income"])
+    for qtr, revenue in [(1, 100.0), (2, 120.0)]:
+        statement = FinStatement(
+            company_id=company.id, st_type=FSType.INCOME, year=2030, qtr=qtr
+        )
+        statement.lines = [
+            FinStatementLineItem(
+                name="test_revenue", name_id=ids["test_revenue"], amount=revenue
+            ),
+            FinStatementLineItem(
+                name="test_net_income",
+                name_id=ids["test_net_income"],
+                amount=revenue / 10,
+            ),
+        ]
+        db.add(statement)
+    db.flush()
+    assert company.id is not None
+
+    matrix = materialize(db, FSType.INCOME)
+    _, values = matrix.cross_section("test_revenue", 2030, 2, company_ids=[company.id])
+    assert values.tolist() == [120.0]
+    _, _, series = matrix.series(
+        ids["test_net_income"], company_ids=[company.id], start=(2030, 1), end=(2030, 2)
+    )
+    assert series.tolist() == [[10.0, 12.0]]
+    assert line_name_ids(db, ["test_revenue"]) == {"test_revenue": ids["test_revenue"]}
+    db.rollback()
+
+
+def test_materialize_lines_matched_by_name(db: Session) -> None:
+    company = Company(name="Unnamed Lines Inc")
+    revenue, cash = (
+        FinLineName(name="test_named_revenue"),
+        FinLineName(name="test_named_cash"),
+    )
+    db.add_all([company, revenue, cash])
+    db.flush()
+    statement = FinStatement(
+        company_id=company.id, st_type=FSType.INCOME, year=2031, qtr=1
+    )
+    # written without name_id, as anything but the importer does
+    statement.lines = [
+        FinStatementLineItem(name="test_named_revenue", amount=100.0),
+        FinStatementLineItem(name="test_named_cash", amount=7.0),
+    ]
+    db.add(statement)
+    db.flush()
+    assert company.id is not None
+
+    matrix = materialize(db, FSType.INCOME, [company.id], lines=["test_named_revenue"])
+    assert matrix.shape == (1, 1, 1)
+    assert matrix.line_ids.tolist() == [revenue.id]
+    _, values = matrix.latest("test_named_revenue")
+    assert values.tolist() == [100.0]
+    db.rollback()
+
+
+def test_backfill_line_name_ids(db: Session) -> None:
+    company = Company(name="Backfill Inc")
+    db.add(company)
+    db.flush()
+    statement = FinStatement(
+        company_id=company.id, st_type=FSType.INCOME, year=2031, qtr=2
+    )
+    statement.lines = [FinStatementLineItem(name="test_backfilled_line", amount=1.0)]
+    db.add(statement)
+    db.flush()
+    assert company.id is not None
+
+    assert backfill_line_name_ids(db, [company.id]) == 1
+    db.expire_all()
+    (line,) = db.get_one(FinStatement, statement.id).lines
+    assert (
+        line.name_id
+        == line_name_ids(db, ["test_backfilled_line"])["test_backfilled_line"]
+    )
+    assert backfill_line_name_ids(db, [company.id]) == 0
+    db.rollback()
@@ -0,0 +1,98 @@
+import io
+
+from sqlmodel import Session, select
+
+from app.core.fundamentals_import import import_line_items, read_csv, read_json
+from app.models import Company, FinStatement, FinStatementLineItem, FSType
+
+
+def test_read_csv() -> None:
+    f = io.StringIO(
+        "company_id,st_type,year,qtr,name,amount\n1,income,2024,1,revenue,100.5\n1,INCOME,2024,1,cogs,40\n"
+    )
+    assert list(read_csv(f)) == [
+        (1, FSType.INCOME, 2024, 1, "revenue", 100.5),
+        (1, FSType.INCOME, 2024, 1, "cogs", 40.0),
+    ]
+
+
+def test_read_json() -> None:
+    f = io.StringIO(
+        '{"company_id": 1, "st_type": "balancesheet", "year": 2024, "qtr": 2, "lines": {"cash": 5, "debt": 7}}\n'
+        "\n"
+        '{"company_id": 2, "st_type": "cashflow", "year": 2024, "qtr": 2, "name": "capex", "amount": -3}\n'
+    )
+    assert list(read_json(f)) == [
+        (1, FSType.BALANCE_SHEET, 2024, 2, "cash", 5.0),
+        (1, FSType.BALANCE_SHEET, 2024, 2, "debt", 7.0),
+        (2, FSType.CASHFLOW, 2024, 2, "capex", -3.0),
+    ]
+
+
+def test_import_line_items_upserts_changed_amounts(db: Session) -> None:
+    company = Company(name="Import Inc")
+    db.add(company)
+    db.commit()
+    assert company.id is not None
+    rows = [
+        (company.id, FSType.INCOME, 2031, 1, "import_revenue", 100.0),
+        (company.id, FSType.INCOME, 2031, 1, "import_cogs", 60.0),
+        (company.id, FSType.INCOME, 2031, 2, "import_revenue", 110.0),
+        (company.id, FSType.INCOME, 2031, 2, "import_revenue", 115.0),
+    ]
+    report = import_line_items(db, rows, batch_size=3)
+    assert (
+        report.rows,
+        report.duplicates,
+        report.statements_created,
+        report.inserted,
+    ) == (4, 0, 2, 3)
+    assert report.updated == 1
+
+    # written without the importer, it has no name_id yet
+    first = db.exec(
+        select(FinStatement).where(
+            FinStatement.company_id == company.id, FinStatement.qtr == 1
+        )
+    ).one()
+    db.add(FinStatementLineItem(parent_id=first.id, name="import_ebit", amount=1.0))
+    db.commit()
+
+    report = import_line_items(
+        db,
+        [
+            rows[0],
+            (company.id, FSType.INCOME, 2031, 1, "import_cogs", 65.0),
+            (company.id, FSType.INCOME, 2031, 1, "import_ebit", 5.0),
+        ],
+    )
+    assert (
+        report.statements_created,
+        report.inserted,
+        report.updated,
+        report.unchanged,
+    ) == (0, 0, 2, 1)
+
+    statements = db.exec(
+        select(FinStatement).where(FinStatement.company_id == company.id)
+    ).all()
+    amounts = {
+        (s.qtr, line.name): line.amount
+        for s in statements
+        for line in db.exec(
+            select(FinStatementLineItem).where(FinStatementLineItem.parent_id == s.id)
+        )
+    }
+    assert amounts == {
+        (1, "import_revenue"): 100.0,
+        (1, "import_cogs"): 65.0,
+        (1, "import_ebit"): 5.0,
+        (2, "import_revenue"): 115.0,
+    }
+
+    for s in statements:
+        for line in s.lines:
+            db.delete(line)
+        db.delete(s)
+    db.delete(company)
+    db.commit()
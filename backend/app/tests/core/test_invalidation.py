@@ -0,0 +1,67 @@
+import asyncio
+import time
+
+from sqlalchemy import delete, insert, update
+from sqlmodel import Session, col
+
+from app.adopters.cache import evict_written_rows, reference_cache
+from app.core.event_bus import CACHE, BusEvent, Topic, cache_topic, event_bus
+from app.models import Company
+from app.tests.utils.utils import random_lower_string
+
+
+def test_commit_announces_written_rows(db: Session) -> None:
+    async def run() -> list[tuple[str | None, list[int] | None]]:
+        event_bus.start()
+        subscription = event_bus.subscribe(Topic(CACHE))
+        company = Company(name=random_lower_string())
+        db.add(company)
+        db.commit()
+        company_id = company.id
+
+        company.market_cap = 5.0
+        db.commit()
+        db.execute(update(Company), [{"id": company_id, "market_cap": 6.0}])
+        db.commit()
+        db.execute(
+            update(Company)
+            .where(col(Company.id) == company_id)
+            .values(sector="rolled back")
+        )
+        db.rollback()
+        db.execute(delete(Company).where(col(Company.id) == company_id))
+        db.commit()
+        db.execute(insert(Company), [{"name": random_lower_string()}])
+        db.commit()
+
+        events = []
+        while len(subscription):
+            event = await subscription.get()
+            events.append((event.topic.key, event.payload["ids"]))
+        await event_bus.stop()
+        return [(key, ids and [i - company_id for i in ids]) for key, ids in events]
+
+    # ids relative to the company's, None for every row of the table
+    assert asyncio.run(run()) == [
+        ("company", [0]),
+        ("company", [0]),
+        ("company", [0]),
+        ("company", None),
+        ("company", None),
+    ]
+
+
+def test_evict_written_rows() -> None:
+    def written(ids: list[int] | None, origin: str) -> BusEvent:
+        return BusEvent(cache_topic("company"), {"ids": ids}, time.time(), origin)
+
+    for key in ("company:-1", "company:-2", "instrument:-1"):
+        reference_cache.set(key, {"key": key})
+    evict_written_rows(written([-1], "another-worker"))
+    assert reference_cache.get("company:-1") is None
+    assert reference_cache.get("company:-2") is not None
+
+    evict_written_rows(written(None, event_bus.origin))
+    assert reference_cache.get("company:-2") is None
+    assert reference_cache.get("instrument:-1") is not None
+    reference_cache.invalidate("instrument:-1")
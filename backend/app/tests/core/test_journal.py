@@ -0,0 +1,304 @@
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from sqlmodel import Session, col, delete, select
+
+from app.core.journal import (
+    FILL,
+    ORDER,
+    ORDER_DELETED,
+    ORDER_FAILED,
+    EventJournal,
+    JournalLocked,
+    JournalRecord,
+    commit_order,
+    drained_records,
+    last_drained_seq,
+    order_event,
+    order_journal,
+    replay,
+)
+from app.models import (
+    AssetType,
+    Company,
+    Execution,
+    Instrument,
+    JournalEvent,
+    Order,
+    OrderLeg,
+    OrderStatus,
+    OrderType,
+    Portfolio,
+    Position,
+    PositionDirection,
+    QtyUnits,
+    TimeInForce,
+)
+
+
+def _order() -> Order:
+    order = Order(
+        currency="USD",
+        symbol="JRNL",
+        open_date_time="2024-03-04T09:30:00",
+        order_type=OrderType.LIMIT,
+        qty=10,
+        price=100,
+        unit=QtyUnits.SHARES,
+        time_in_force=TimeInForce.DAY,
+        status=OrderStatus.SUBMITTED.value,
+    )
+    order.legs = [
+        OrderLeg(
+            order_type=OrderType.STOP,
+            qty=10,
+            price=90,
+            status=OrderStatus.SUBMITTED.value,
+        )
+    ]
+    return order
+
+
+def _journal(path: Path, segment_bytes: int = 4096) -> EventJournal:
+    journal = EventJournal(path, segment_bytes)
+    journal.open()
+    return journal
+
+
+def test_append_commit_and_reopen(tmp_path: Path) -> None:
+    journal = _journal(tmp_path)
+    assert journal.append(FILL, {"id": 1}) == 1
+    assert journal.append(FILL, {"id": 2}) == 2
+    assert journal.synced_seq == 0
+    assert journal.commit() == 2
+    assert journal.wait(2, timeout=0)
+    journal.close()
+
+    journal = _journal(tmp_path)
+    assert journal.last_seq == 2
+    assert journal.append(FILL, {"id": 3}) == 3
+    assert [(r.seq, r.kind, r.data) for r in journal.records(after_seq=1)] == [
+        (2, FILL, {"id": 2}),
+        (3, FILL, {"id": 3}),
+    ]
+    journal.close()
+
+
+def test_torn_record_ends_the_segment(tmp_path: Path) -> None:
+    journal = _journal(tmp_path)
+    journal.append(FILL, {"id": 1})
+    journal.append(FILL, {"id": 2})
+    journal.close()
+    segment = next(tmp_path.glob("*.journal"))
+    data = bytearray(segment.read_bytes())
+    # flip a payload byte of the second record
+    second = data.index(b'{"kind"', data.index(b'{"kind"') + 1)
+    data[second + 2] ^= 0xFF
+    segment.write_bytes(bytes(data))
+
+    journal = _journal(tmp_path)
+    assert journal.last_seq == 1
+    # appends overwrite the torn record
+    assert journal.append(FILL, {"id": 3}) == 2
+    assert [r.data["id"] for r in journal.records()] == [1, 3]
+    journal.close()
+
+
+def test_segments_roll_over_and_truncate(tmp_path: Path) -> None:
+    journal = _journal(tmp_path, segment_bytes=256)
+    for i in range(20):
+        journal.append(FILL, {"portfolio_id": 1, "instrument_id": i})
+    assert len(list(tmp_path.glob("*.journal"))) > 2
+    # rolling over syncs the full segments
+    assert journal.synced_seq > 0
+    assert [r.seq for r in journal.records()] == list(range(1, 21))
+    # nothing drained yet
+    assert journal.truncate() == 0
+    journal.close()
+
+    journal = EventJournal(tmp_path, 256)
+    journal.open(drained_seq=20)
+    segments = len(list(tmp_path.glob("*.journal")))
+    assert journal.truncate() == segments - 1
+    # the segment appended to is kept
+    assert [r.seq for r in journal.records()][-1] == 20
+    assert journal.append(FILL, {}) == 21
+    journal.close()
+
+
+def test_one_process_opens_a_directory(tmp_path: Path) -> None:
+    journal = _journal(tmp_path)
+    with pytest.raises(JournalLocked):
+        _journal(tmp_path)
+    journal.close()
+    # closing lets go of the directory
+    _journal(tmp_path).close()
+
+
+def test_group_commit(tmp_path: Path) -> None:
+    journal = EventJournal(tmp_path, 4096, commit_ms=1.0)
+    journal.open()
+    stop = threading.Event()
+    committer = threading.Thread(target=journal.run_commits, args=(stop,))
+    committer.start()
+    seqs = [journal.append(FILL, {"id": i}) for i in range(10)]
+    assert journal.wait(seqs[-1], timeout=5)
+    stop.set()
+    committer.join()
+    journal.close()
+
+
+def test_replay_restores_fills_not_checkpointed(db: Session) -> None:
+    company = Company(name="Journal Inc")
+    portfolio = Portfolio(cash=0, equity=0, profit=0)
+    db.add_all([company, portfolio])
+    db.flush()
+    instrument = Instrument(
+        symbol="JRNL",
+        asset_type=AssetType.EQUITY,
+        exchange=None,
+        root=None,
+        underlying=None,
+        company_id=company.id,
+    )
+    db.add(instrument)
+    db.flush()
+    assert portfolio.id is not None and instrument.id is not None
+    # the ledger checkpointed the first fill
+    db.add(
+        Execution(
+            exec_id="j1",
+            portfolio_id=portfolio.id,
+            instrument_id=instrument.id,
+            applied_at=datetime(2024, 3, 4),
+        )
+    )
+    db.flush()
+    fill = {
+        "portfolio_id": portfolio.id,
+        "instrument_id": instrument.id,
+        "qty": -5.0,
+        "market_value": -500.0,
+        "cost": -450.0,
+        "cash": 450.0,
+        "equity": -50.0,
+        "profit": -50.0,
+    }
+    records = [
+        JournalRecord(1, FILL, dict(fill, exec_id="j1", qty=-2.0, cash=180.0), 0.0),
+        JournalRecord(2, FILL, dict(fill, exec_id="j2", qty=-4.0), 0.0),
+        JournalRecord(3, FILL, dict(fill, exec_id="j3"), 0.0),
+    ]
+    assert replay(db, records[:1]) == 0
+    replay(db, records)
+    db.expire_all()
+
+    position = db.exec(
+        select(Position).where(Position.portfolio_id == portfolio.id)
+    ).one()
+    assert (position.long_short, position.qty, position.cost) == (
+        PositionDirection.SHORT,
+        5.0,
+        450.0,
+    )
+    assert db.get(Portfolio, portfolio.id).cash == 450.0  # type: ignore[union-attr]
+    executions = db.exec(
+        select(Execution.exec_id).where(Execution.portfolio_id == portfolio.id)
+    ).all()
+    assert sorted(executions) == ["j1", "j2", "j3"]
+    db.rollback()
+
+
+def test_commit_order_journals_before_the_commit(db: Session, tmp_path: Path) -> None:
+    order_journal.directory = tmp_path
+    order_journal.open()
+    stop = threading.Event()
+    committer = threading.Thread(target=order_journal.run_commits, args=(stop,))
+    committer.start()
+    try:
+        order = _order()
+        db.add(order)
+        commit_order(db, order)
+    finally:
+        stop.set()
+        committer.join()
+        order_journal.close()
+    journal = _journal(tmp_path)
+    [record] = journal.records()
+    journal.close()
+    assert record.kind == ORDER
+    assert (record.data["id"], record.data["version"]) == (order.id, 1)
+    assert [leg["id"] for leg in record.data["legs"]] == [order.legs[0].id]
+    db.delete(order.legs[0])
+    db.delete(order)
+    db.commit()
+
+
+def test_replay_keeps_the_newest_order_version(db: Session) -> None:
+    order = _order()
+    order.version = 1
+    db.add(order)
+    db.commit()
+    db.refresh(order)
+    event = order_event(order)
+    cancelled = dict(
+        event,
+        version=2,
+        status=OrderStatus.CANCELLED.value,
+        legs=[dict(event["legs"][0], status=OrderStatus.CANCELLED.value)],
+    )
+    records = [
+        JournalRecord(1, ORDER, cancelled, 0.0),
+        JournalRecord(2, ORDER, dict(event, version=3, qty=99), 0.0),
+        # the commit of the third version failed
+        JournalRecord(3, ORDER_FAILED, {"seq": 2}, 0.0),
+    ]
+    assert replay(db, records + [JournalRecord(4, ORDER, event, 0.0)]) == 2
+    db.commit()
+    db.expire_all()
+    order = db.get(Order, order.id)  # type: ignore[assignment]
+    assert (order.version, order.status, order.qty) == (
+        2,
+        OrderStatus.CANCELLED.value,
+        10,
+    )
+    assert [leg.status for leg in order.legs] == [OrderStatus.CANCELLED.value]
+    # replaying again changes nothing
+    assert replay(db, records) == 0
+
+    # an order whose commit was lost is written again
+    db.delete(order.legs[0])
+    db.delete(order)
+    db.commit()
+    assert replay(db, records) == 2
+    db.commit()
+    assert db.get(Order, event["id"]) is not None
+
+    deleted = {"id": event["id"], "version": 3}
+    assert replay(db, [JournalRecord(5, ORDER_DELETED, deleted, 0.0)]) == 1
+    db.commit()
+    assert db.get(Order, event["id"]) is None
+    assert db.get(OrderLeg, event["legs"][0]["id"]) is None
+
+
+def test_drain_copies_synced_events(db: Session, tmp_path: Path) -> None:
+    start = last_drained_seq(db, "test")
+    journal = EventJournal(tmp_path, 4096, name="test")
+    journal.open(drained_seq=start)
+    journal.append(FILL, {"id": 1})
+    journal.append(FILL, {"id": 2})
+    # only synced events are drained
+    assert journal.drain(db) == 0
+    journal.commit()
+    assert journal.drain(db, limit=1) == 1
+    assert journal.drain(db) == 1
+    assert journal.drained_seq == start + 2
+    assert [r.data for r in drained_records(db, start, "test")] == [
+        {"id": 1},
+        {"id": 2},
+    ]
+    journal.close()
+    db.execute(delete(JournalEvent).where(col(JournalEvent.journal) == "test"))
+    db.commit()
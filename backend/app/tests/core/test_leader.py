@@ -0,0 +1,42 @@
+import threading
+
+from app.core.db import engine
+from app.core.leader import LeaderElection
+
+
+def test_only_one_worker_holds_the_lock() -> None:
+    first = LeaderElection(engine, 42_001)
+    second = LeaderElection(engine, 42_001)
+    held = first.try_acquire()
+    assert held is not None
+    assert second.try_acquire() is None
+
+    # closing the connection lets go of the lock
+    held.close()
+    taken = second.try_acquire()
+    assert taken is not None
+    taken.close()
+
+
+def test_leader_runs_the_jobs_until_stopped() -> None:
+    election = LeaderElection(engine, 42_002, poll_seconds=0.05)
+    started, resigned = threading.Event(), threading.Event()
+
+    def jobs(stop: threading.Event) -> None:
+        started.set()
+        stop.wait()
+        resigned.set()
+
+    stop = threading.Event()
+    thread = threading.Thread(target=election.run, args=(stop, jobs), daemon=True)
+    thread.start()
+    try:
+        assert started.wait(5)
+        assert election.is_leader
+        # no one else gets the lock meanwhile
+        assert LeaderElection(engine, 42_002).try_acquire() is None
+    finally:
+        stop.set()
+    thread.join(5)
+    assert resigned.is_set()
+    assert not election.is_leader
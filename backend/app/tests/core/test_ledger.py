@@ -0,0 +1,115 @@
+import pytest
+
+from app.core.ledger import Ledger, LedgerDelta
+
+
+def test_apply_fill_opens_position() -> None:
+    ledger = Ledger()
+    delta = ledger.apply_fill(1, 10, qty=100, price=50.0, fees=1.0)
+    portfolio = ledger.portfolio(1)
+    assert portfolio
+    assert portfolio.cash == -5001.0
+    assert delta.qty == 100
+    assert delta.market_value == 5000.0
+    assert delta.profit == -1.0
+    assert delta.equity_change == -1.0
+
+
+def test_apply_fill_realizes_profit_on_reduce() -> None:
+    ledger = Ledger()
+    ledger.apply_fill(1, 10, qty=100, price=50.0)
+    ledger.apply_fill(1, 10, qty=-40, price=60.0)
+    position = ledger.position(1, 10)
+    portfolio = ledger.portfolio(1)
+    assert position and portfolio
+    assert position.qty == 60
+    assert position.cost == 3000.0
+    assert portfolio.realized == 400.0
+    assert portfolio.profit == 400.0 + 600.0
+
+
+def test_apply_fill_flips_position() -> None:
+    ledger = Ledger()
+    ledger.apply_fill(1, 10, qty=10, price=100.0)
+    ledger.apply_fill(1, 10, qty=-30, price=90.0)
+    position = ledger.position(1, 10)
+    portfolio = ledger.portfolio(1)
+    assert position and portfolio
+    assert position.qty == -20
+    assert position.cost == -1800.0
+    assert portfolio.realized == -100.0
+
+
+def test_apply_price_marks_all_holders() -> None:
+    ledger = Ledger()
+    deltas: list[LedgerDelta] = []
+    ledger.subscribe(deltas.append)
+    ledger.apply_fill(1, 10, qty=10, price=100.0)
+    ledger.apply_fill(2, 10, qty=-5, price=100.0)
+    ledger.apply_fill(2, 11, qty=1, price=20.0)
+    deltas.clear()
+
+    ledger.apply_price(10, 110.0)
+
+    assert [(d.portfolio_id, d.equity_change) for d in deltas] == [
+        (1, 100.0),
+        (2, -50.0),
+    ]
+    portfolio = ledger.portfolio(2)
+    assert portfolio
+    assert portfolio.equity == 500.0 - 20.0 - 550.0 + 20.0
+    assert portfolio.profit == -50.0
+
+
+def test_held_instruments_skip_closed_positions() -> None:
+    ledger = Ledger()
+    ledger.apply_fill(1, 10, qty=10, price=100.0)
+    ledger.apply_fill(2, 11, qty=5, price=20.0)
+    ledger.apply_fill(2, 11, qty=-5, price=21.0)
+    assert ledger.held_instruments() == {10}
+
+
+def test_should_checkpoint_on_dirty_threshold() -> None:
+    ledger = Ledger(checkpoint_seconds=3600, checkpoint_max_dirty=2)
+    assert not ledger.should_checkpoint()
+    ledger.apply_fill(1, 10, qty=1, price=1.0)
+    assert not ledger.should_checkpoint()
+    ledger.apply_fill(1, 11, qty=1, price=1.0)
+    assert ledger.should_checkpoint()
+
+
+class _FailingCommit:
+    def execute(self, *_args: object) -> None:
+        pass
+
+    def scalars(self, *_args: object) -> "_FailingCommit":
+        return self
+
+    def all(self) -> list[int]:
+        return [42]
+
+    def commit(self) -> None:
+        raise ConnectionError("connection lost")
+
+    def rollback(self) -> None:
+        pass
+
+
+def test_failed_checkpoint_forgets_inserted_ids() -> None:
+    ledger = Ledger(checkpoint_seconds=0)
+    ledger.apply_fill(1, 10, qty=1, price=1.0)
+    with pytest.raises(ConnectionError):
+        ledger.checkpoint(_FailingCommit())  # type: ignore[arg-type]
+    position = ledger.position(1, 10)
+    assert position and position.position_id is None
+    assert ledger.should_checkpoint()
+
+
+def test_apply_execution_once() -> None:
+    ledger = Ledger()
+    delta = ledger.apply_execution("0001.01", 1, 10, qty=100, price=50.0)
+    assert delta is not None and delta.exec_id == "0001.01"
+    # reported again after a reconnect
+    assert ledger.apply_execution("0001.01", 1, 10, qty=100, price=50.0) is None
+    position = ledger.position(1, 10)
+    assert position and position.qty == 100
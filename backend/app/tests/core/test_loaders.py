@@ -0,0 +1,47 @@
+import pytest
+from sqlmodel import Session, select
+
+from app.core.loaders import NPlusOneError, detect_n_plus_one, loader_options
+from app.models import Portfolio, Position, PositionDirection
+
+
+def create_portfolios(db: Session, count: int) -> list[int]:
+    ids = []
+    for _ in range(count):
+        portfolio = Portfolio(cash=0, equity=0, profit=0)
+        portfolio.positions = [
+            Position(long_short=PositionDirection.LONG, qty=1, cost=1, market_value=1)
+        ]
+        db.add(portfolio)
+        db.commit()
+        assert portfolio.id is not None
+        ids.append(portfolio.id)
+    db.expunge_all()
+    return ids
+
+
+def test_loader_options_unknown_profile() -> None:
+    with pytest.raises(ValueError):
+        loader_options("portfolio.everything")
+
+
+def test_detect_n_plus_one_raises_on_lazy_loads(db: Session) -> None:
+    ids = create_portfolios(db, 3)
+    statement = select(Portfolio).where(Portfolio.id.in_(ids))  # type: ignore[union-attr]
+    with pytest.raises(NPlusOneError):
+        with detect_n_plus_one(3, "raise"):
+            for portfolio in db.exec(statement).all():
+                assert portfolio.positions
+
+
+def test_detect_n_plus_one_quiet_with_profile(db: Session) -> None:
+    ids = create_portfolios(db, 3)
+    statement = (
+        select(Portfolio)
+        .where(Portfolio.id.in_(ids))  # type: ignore[union-attr]
+        .options(*loader_options("portfolio.detail"))
+    )
+    with detect_n_plus_one(3, "raise"):
+        for portfolio in db.exec(statement).all():
+            assert portfolio.positions
+            assert portfolio.orders == []
@@ -0,0 +1,77 @@
+import pytest
+from sqlmodel import Session
+
+from app.adopters.broker import PaperBroker
+from app.core.oms import OrderManager
+from app.models import (
+    Order,
+    OrderGroupCreate,
+    OrderGroupType,
+    OrderLeg,
+    OrderStatus,
+    OrderType,
+    Portfolio,
+    QtyUnits,
+    TimeInForce,
+)
+
+
+def test_cancel_group_leaves_filled_orders(db: Session) -> None:
+    portfolio = Portfolio(cash=0, equity=0, profit=0)
+    db.add(portfolio)
+    db.flush()
+    order = Order(
+        portfolio_id=portfolio.id,
+        currency="USD",
+        symbol="OMSX",
+        open_date_time="2024-01-02T09:30:00",
+        order_type=OrderType.LIMIT,
+        qty=10,
+        price=50,
+        unit=QtyUnits.SHARES,
+        time_in_force=TimeInForce.DAY,
+        status=OrderStatus.FILLED.value,
+        group_type=OrderGroupType.BRACKET,
+        broker_order_id=9101,
+    )
+    order.legs = [
+        OrderLeg(
+            order_type=OrderType.LIMIT,
+            qty=10,
+            price=60,
+            status=OrderStatus.SUBMITTED.value,
+            broker_order_id=9102,
+        ),
+        OrderLeg(
+            order_type=OrderType.STOP,
+            qty=10,
+            price=45,
+            status=OrderStatus.SUBMITTED.value,
+            broker_order_id=9103,
+        ),
+    ]
+    db.add(order)
+    db.commit()
+    db.refresh(order)
+    broker = PaperBroker()
+    broker.working.update({9102, 9103})
+    oms = OrderManager(db, broker)
+
+    # the entry filled, replacing it would open the position twice
+    order_in = OrderGroupCreate.model_validate(order.model_dump() | {"legs": []})
+    with pytest.raises(ValueError):
+        oms.replace_group(order, order_in)
+
+    order = oms.cancel_group(order)
+    assert order.status == OrderStatus.FILLED.value
+    assert all(leg.status == OrderStatus.CANCELLED.value for leg in order.legs)
+    assert not broker.working
+
+    with pytest.raises(ValueError):
+        oms.cancel_group(order)
+
+    for leg in order.legs:
+        db.delete(leg)
+    db.delete(order)
+    db.delete(portfolio)
+    db.commit()
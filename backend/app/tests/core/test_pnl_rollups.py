@@ -0,0 +1,154 @@
+from datetime import date, datetime
+
+import pytest
+from sqlalchemy import select
+from sqlmodel import Session, col
+
+from app.adopters.database import DefaultUnitOfWork
+from app.core.pnl_rollups import account_pnl, portfolio_pnl, rebuild_daily_pnl
+from app.models import (
+    Account,
+    AccountDailyPnl,
+    AssetType,
+    Bar,
+    Chart,
+    ChartInterval,
+    Company,
+    Instrument,
+    Portfolio,
+    PortfolioDailyPnl,
+    PositionDirection,
+    Trade,
+    TradeGroup,
+)
+
+
+def _rows(
+    db: Session, table: type[PortfolioDailyPnl] | type[AccountDailyPnl], id: int
+) -> list[tuple[date, int, int, float, float]]:
+    owner = (
+        col(table.portfolio_id) if table is PortfolioDailyPnl else col(table.account_id)  # type: ignore[union-attr]
+    )
+    statement = (
+        select(
+            col(table.day),
+            col(table.trades),
+            col(table.wins),
+            col(table.profit_loss),
+            col(table.total_fees),
+        )
+        .where(owner == id)
+        .order_by(col(table.day))
+    )
+    return list(db.execute(statement).tuples())
+
+
+def test_rollups_follow_trade_writes(db: Session) -> None:
+    company = Company(name="Rollups Inc")
+    first, second = (
+        Portfolio(cash=0, equity=0, profit=0),
+        Portfolio(cash=0, equity=0, profit=0),
+    )
+    db.add_all([company, first, second])
+    db.flush()
+    account = Account(broker="test", portfolio_id=first.id)
+    db.add(account)
+    db.flush()
+    first.account_id = second.account_id = account.id
+    instrument = Instrument(
+        symbol="ROLL",
+        asset_type=AssetType.EQUITY,
+        exchange=None,
+        root=None,
+        underlying=None,
+        company_id=company.id,
+    )
+    db.add_all([first, second, instrument])
+    db.flush()
+    chart = Chart(
+        instrument_id=instrument.id,
+        interval=ChartInterval.Daily,
+        timestamp=datetime(2024, 3, 1),
+    )
+    db.add(chart)
+    db.flush()
+    days = [
+        datetime(2024, 3, 1, 15),
+        datetime(2024, 3, 1, 16),
+        datetime(2024, 3, 4, 15),
+    ]
+    bars = [
+        Bar(
+            chart_id=chart.id,
+            timestamp=day,
+            loc=i,
+            open=1,
+            close=1,
+            high=1,
+            low=1,
+            volume=0,
+            downTicks=None,
+            downVolume=None,
+            totalTicks=None,
+            upTicks=None,
+            upVolume=None,
+            symbol="ROLL",
+        )
+        for i, day in enumerate(days)
+    ]
+    db.add_all(bars)
+    db.flush()
+    assert first.id is not None and account.id is not None
+    march_1, march_4 = date(2024, 3, 1), date(2024, 3, 4)
+
+    with DefaultUnitOfWork(db) as uow:
+        trades = uow.trades.bulk_create(
+            [
+                Trade(
+                    qty=1,
+                    entry_price=0,
+                    exit_price=0,
+                    direction=PositionDirection.LONG,
+                    profit_loss=pnl,
+                    is_win=pnl > 0,
+                    total_fees=1.0,
+                    portfolio_id=portfolio.id,
+                    instrument_id=instrument.id,
+                    exit_action_bar_id=bar.id,
+                )
+                for portfolio, bar, pnl in [
+                    (first, bars[0], 10.0),
+                    (first, bars[1], -4.0),
+                    (first, bars[2], 6.0),
+                    (second, bars[0], 2.0),
+                ]
+            ]
+        )
+        assert _rows(db, PortfolioDailyPnl, first.id) == [
+            (march_1, 2, 1, 6.0, 2.0),
+            (march_4, 1, 1, 6.0, 1.0),
+        ]
+        assert _rows(db, AccountDailyPnl, account.id) == [
+            (march_1, 3, 2, 8.0, 3.0),
+            (march_4, 1, 1, 6.0, 1.0),
+        ]
+
+        # moving the only trade of a day away leaves no row for it
+        uow.trades.bulk_update([{"id": trades[2].id, "exit_action_bar_id": bars[1].id}])
+        assert _rows(db, PortfolioDailyPnl, first.id) == [(march_1, 3, 2, 12.0, 3.0)]
+        assert trades[3].id is not None
+        uow.trades.delete(trades[3].id)
+        assert _rows(db, AccountDailyPnl, account.id) == [(march_1, 3, 2, 12.0, 3.0)]
+
+        rebuilt = _rows(db, PortfolioDailyPnl, first.id)
+        assert rebuild_daily_pnl(db, march_1, date(2024, 4, 1)) == 1
+        assert _rows(db, PortfolioDailyPnl, first.id) == rebuilt
+        assert _rows(db, AccountDailyPnl, account.id) == [(march_1, 3, 2, 12.0, 3.0)]
+
+        monthly = portfolio_pnl(db, first.id, period=TradeGroup.MONTH)
+        assert [(p.day, p.trades, p.profit_loss) for p in monthly.data] == [
+            (march_1, 3, 12.0)
+        ]
+        assert account_pnl(db, account.id, start=march_4).data == []
+        with pytest.raises(ValueError):
+            account_pnl(db, account.id, period=TradeGroup.INSTRUMENT)
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+
+from app.core.event_bus import FILL, ORDER
+from app.core.push import RESET, PushHub, PushSubscription
+
+
+def _drain(subscription: PushSubscription) -> list[tuple[str, int]]:
+    events = []
+    while not subscription.queue.empty():
+        event = subscription.queue.get_nowait()
+        events.append((event.type, event.seq))
+    return events
+
+
+def test_filters_by_portfolio_and_account() -> None:
+    async def run() -> None:
+        hub = PushHub()
+        everything = hub.subscribe()
+        portfolio = hub.subscribe(portfolio_ids=[1])
+        account = hub.subscribe(account_ids=[7])
+        hub.publish(ORDER, {"id": 1}, portfolio_id=1, account_id=7)
+        hub.publish(FILL, {}, portfolio_id=2)
+        hub.publish(ORDER, {"id": 2}, account_id=7)
+        # published from another thread, handed over on the loop
+        thread = threading.Thread(
+            target=hub.publish, args=(FILL, {}), kwargs={"portfolio_id": 1}
+        )
+        thread.start()
+        thread.join()
+        await asyncio.sleep(0)
+        assert [seq for _, seq in _drain(everything)] == [1, 2, 3, 4]
+        assert [seq for _, seq in _drain(portfolio)] == [1, 4]
+        assert [seq for _, seq in _drain(account)] == [1, 3]
+
+    asyncio.run(run())
+
+
+def test_resume_from_last_event_id() -> None:
+    async def run() -> None:
+        hub = PushHub(buffer_size=3)
+        events = [hub.publish(ORDER, {"id": i}, portfolio_id=1) for i in range(5)]
+
+        resumed = hub.subscribe(last_event_id=hub.event_id(events[2]))
+        assert _drain(resumed) == [(ORDER, 4), (ORDER, 5)]
+        # right after the oldest buffered event's predecessor still resumes
+        assert len(_drain(hub.subscribe(last_event_id=hub.event_id(events[1])))) == 3
+        # gone from the buffer, from another process or malformed
+        assert _drain(hub.subscribe(last_event_id=hub.event_id(events[0]))) == [
+            (RESET, 5)
+        ]
+        assert _drain(hub.subscribe(last_event_id="other-3")) == [(RESET, 5)]
+        assert _drain(hub.subscribe(last_event_id="garbage")) == [(RESET, 5)]
+
+    asyncio.run(run())
+
+
+def test_slow_subscriber_gets_a_reset() -> None:
+    async def run() -> None:
+        hub = PushHub(queue_size=2)
+        subscription = hub.subscribe()
+        for i in range(4):
+            hub.publish(ORDER, {"id": i})
+        await asyncio.sleep(0)
+        assert subscription.lagging
+        assert (await subscription.get()).type == RESET
+        assert not subscription.lagging
+        hub.publish(ORDER, {"id": 5})
+        await asyncio.sleep(0)
+        assert (await subscription.get()).seq == 5
+
+        hub.unsubscribe(subscription)
+        hub.publish(ORDER, {"id": 6})
+        await asyncio.sleep(0)
+        assert subscription.queue.empty()
+
+    asyncio.run(run())
+
+
+def test_encode() -> None:
+    hub = PushHub()
+    event = hub.publish(FILL, {"qty": 1.0})
+    assert (
+        hub.encode(event) == f'id: {hub.epoch}-1\nevent: fill\ndata: {{"qty":1.0}}\n\n'
+    )
@@ -0,0 +1,99 @@
+import time
+
+from sqlalchemy import create_engine, event
+from sqlmodel import Session, SQLModel
+
+from app.core.queries import (
+    orders_by_status,
+    positions_by_portfolio,
+    query_stats,
+    reset_query_stats,
+)
+from app.models import (
+    Order,
+    OrderStatus,
+    OrderType,
+    Portfolio,
+    Position,
+    PositionDirection,
+    QtyUnits,
+    TimeInForce,
+)
+
+
+def _order(portfolio_id: int, status: OrderStatus) -> Order:
+    return Order(
+        portfolio_id=portfolio_id,
+        currency="USD",
+        symbol="AAPL",
+        open_date_time="2024-01-02T09:30:00",
+        order_type=OrderType.LIMIT,
+        qty=10,
+        price=100,
+        unit=QtyUnits.SHARES,
+        time_in_force=TimeInForce.DAY,
+        status=status.value,
+    )
+
+
+def test_hot_queries_filter_and_record_timings(db: Session) -> None:
+    portfolio = Portfolio(cash=0, equity=0, profit=0)
+    db.add(portfolio)
+    db.flush()
+    assert portfolio.id is not None
+    db.add_all(
+        [
+            _order(portfolio.id, OrderStatus.PENDING),
+            _order(portfolio.id, OrderStatus.SUBMITTED),
+            _order(portfolio.id, OrderStatus.FILLED),
+            Position(
+                portfolio_id=portfolio.id,
+                long_short=PositionDirection.LONG,
+                qty=1,
+                cost=1,
+                market_value=1,
+            ),
+        ]
+    )
+    db.commit()
+    reset_query_stats()
+
+    working = orders_by_status(
+        db, portfolio.id, [OrderStatus.PENDING, OrderStatus.SUBMITTED]
+    )
+    assert {o.status for o in working} == {
+        OrderStatus.PENDING.value,
+        OrderStatus.SUBMITTED.value,
+    }
+    assert len(orders_by_status(db, portfolio.id, [OrderStatus.FILLED])) == 1
+    assert len(positions_by_portfolio(db, portfolio.id)) == 1
+
+    stats = {s.name: s for s in query_stats()}
+    assert stats["orders_by_status"].calls == 2
+    # a different number of statuses reuses the compiled statement
+    assert stats["orders_by_status"].compiled_cache_hits >= 1
+    assert stats["positions_by_portfolio"].calls == 1
+    assert all(s.compile_ms >= 0 and s.execute_ms >= 0 for s in stats.values())
+
+    for row in [
+        *working,
+        *orders_by_status(db, portfolio.id, [OrderStatus.FILLED]),
+        *positions_by_portfolio(db, portfolio.id),
+        portfolio,
+    ]:
+        db.delete(row)
+    db.commit()
+
+
+def test_compile_time_leaves_out_the_checkout() -> None:
+    engine = create_engine("sqlite://")
+    SQLModel.metadata.create_all(
+        engine,
+        tables=[Portfolio.__table__, Position.__table__],  # type: ignore[attr-defined]
+    )
+    event.listen(engine, "checkout", lambda *_args: time.sleep(0.2))
+    reset_query_stats()
+    with Session(engine) as session:
+        positions_by_portfolio(session, 1)
+    (stats,) = query_stats()
+    assert stats.compile_ms < 200
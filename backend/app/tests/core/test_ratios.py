@@ -0,0 +1,104 @@
+import numpy as np
+from sqlmodel import Session, select
+
+from app.core.fundamentals import FundamentalsMatrix, line_name_ids, period_key
+from app.core.ratios import compute_ratios, recompute_ratios, trailing_sum
+from app.models import Company, FinRatio, FinStatement, FinStatementLineItem, FSType
+
+
+def test_trailing_sum() -> None:
+    periods = np.array(
+        [period_key(2023, q) for q in (1, 2, 3, 4)]
+        + [period_key(2024, 1), period_key(2024, 3)]
+    )
+    values = np.array(
+        [
+            [1.0, 2.0, 3.0, 4.0, 5.0, 6.0],
+            [1.0, np.nan, 3.0, 4.0, 5.0, 6.0],
+        ]
+    )
+    np.testing.assert_array_equal(
+        trailing_sum(values, periods),
+        [
+            [np.nan, np.nan, np.nan, 10.0, 14.0, np.nan],
+            [np.nan, np.nan, np.nan, np.nan, np.nan, np.nan],
+        ],
+    )
+    assert np.isnan(trailing_sum(values[:, :3], periods[:3])).all()
+
+
+def test_compute_ratios() -> None:
+    periods = np.array([period_key(2023, q) for q in (1, 2, 3, 4)])
+    income = FundamentalsMatrix(
+        st_type=FSType.INCOME,
+        companies=np.array([1, 2]),
+        periods=periods,
+        line_ids=np.array([1, 2, 3]),
+        line_names=np.array(["RTLR", "NetIncome", "NINC"]),
+        values=np.array(
+            [
+                [[100.0, 100.0, 100.0, 100.0], [50.0, 50.0, 50.0, np.nan]],
+                [[10.0, 10.0, 10.0, 10.0], [5.0, 5.0, 5.0, 5.0]],
+                [[20.0, 20.0, 20.0, 20.0], [np.nan, np.nan, np.nan, np.nan]],
+            ]
+        ),
+    )
+    balance = FundamentalsMatrix(
+        st_type=FSType.BALANCE_SHEET,
+        companies=np.array([1]),
+        periods=np.array([period_key(2023, 0), period_key(2023, 4)]),
+        line_ids=np.array([4]),
+        line_names=np.array(["QTLE"]),
+        values=np.array([[[1.0, 400.0]]]),
+    )
+    series = compute_ratios(income, balance, {1: 1600.0, 2: 100.0})
+    assert series.companies.tolist() == [1, 2]
+    assert series.periods.tolist() == periods.tolist()
+    # the COA code comes first, plain names fill in for companies without it
+    np.testing.assert_array_equal(series.values["net_income_ttm"][:, 3], [80.0, 20.0])
+    np.testing.assert_array_equal(series.values["net_margin"][:, 3], [0.2, np.nan])
+    np.testing.assert_array_equal(series.values["roe"][:, 3], [0.2, np.nan])
+    np.testing.assert_array_equal(
+        series.values["pe"],
+        [
+            [np.nan, np.nan, np.nan, 20.0],
+            [np.nan, np.nan, np.nan, 5.0],
+        ],
+    )
+
+
+def test_recompute_ratios(db: Session) -> None:
+    company = Company(name="Ratios Inc", market_cap=1000.0)
+    db.add(company)
+    db.flush()
+    ids = line_name_ids(db, ["RTLR", "NINC"])
+    for qtr in (1, 2, 3, 4):
+        statement = FinStatement(
+            company_id=company.id, st_type=FSType.INCOME, year=2032, qtr=qtr
+        )
+        statement.lines = [
+            FinStatementLineItem(name="RTLR", name_id=ids["RTLR"], amount=50.0),
+            FinStatementLineItem(name="NINC", name_id=ids["NINC"], amount=5.0),
+        ]
+        db.add(statement)
+    db.commit()
+    assert company.id is not None
+
+    # quarters without a full trailing year have nothing to store
+    assert recompute_ratios(db, [company.id]) == 1
+    assert recompute_ratios(db, [company.id]) == 1
+    ratios = db.exec(select(FinRatio).where(FinRatio.company_id == company.id)).all()
+    assert [(r.qtr, r.revenue_ttm, r.net_margin, r.pe) for r in ratios] == [
+        (4, 200.0, 0.1, 50.0)
+    ]
+
+    for r in ratios:
+        db.delete(r)
+    for s in db.exec(
+        select(FinStatement).where(FinStatement.company_id == company.id)
+    ).all():
+        for line in s.lines:
+            db.delete(line)
+        db.delete(s)
+    db.delete(company)
+    db.commit()
@@ -0,0 +1,69 @@
+import threading
+
+from sqlalchemy import Engine, create_engine
+
+from app.core.db import ReplicaRouter
+
+
+class FakeLagRouter(ReplicaRouter):
+    def __init__(
+        self,
+        replica: Engine | None,
+        lags: list[float | None],
+        check_seconds: float = 0.0,
+    ):
+        super().__init__(
+            create_engine("sqlite://"),
+            replica,
+            max_lag=5.0,
+            check_seconds=check_seconds,
+        )
+        self.lags = lags
+        self.checks = 0
+
+    def lag(self) -> float | None:
+        self.checks += 1
+        return self.lags.pop(0)
+
+
+def test_reads_use_primary_without_replica() -> None:
+    router = FakeLagRouter(None, [])
+    assert router.engine() is router.primary
+    assert router.checks == 0
+
+
+def test_reads_fall_back_to_primary_while_replica_lags() -> None:
+    router = FakeLagRouter(create_engine("sqlite://"), [0.5, 30.0, None, 1.0])
+    assert router.engine() is router.replica
+    assert router.engine() is router.primary
+    # unreachable replica
+    assert router.engine() is router.primary
+    assert router.engine() is router.replica
+
+
+def test_lag_is_checked_once_per_interval() -> None:
+    router = FakeLagRouter(create_engine("sqlite://"), [0.0], check_seconds=60.0)
+    for _ in range(10):
+        assert router.engine() is router.replica
+    assert router.checks == 1
+
+
+def test_other_readers_do_not_wait_for_the_lag_check() -> None:
+    probing, release = threading.Event(), threading.Event()
+
+    class SlowLagRouter(FakeLagRouter):
+        def lag(self) -> float | None:
+            probing.set()
+            release.wait(5)
+            return super().lag()
+
+    router = SlowLagRouter(create_engine("sqlite://"), [0.0], check_seconds=60.0)
+    thread = threading.Thread(target=router.engine)
+    thread.start()
+    assert probing.wait(5)
+    # the replica isn't known to be caught up yet
+    assert router.engine() is router.primary
+    release.set()
+    thread.join()
+    assert router.engine() is router.replica
+    assert router.checks == 1
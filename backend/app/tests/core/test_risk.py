@@ -0,0 +1,167 @@
+from datetime import date
+from typing import Any
+
+import pytest
+
+from app.core.account_sync import AccountDelta
+from app.core.ledger import LedgerDelta
+from app.core.risk import LatencyHistogram, RiskEngine, RiskLimits, RiskRejected
+from app.models import (
+    OrderGroupCreate,
+    OrderGroupType,
+    OrderLegCreate,
+    OrderSide,
+    OrderStatus,
+    OrderType,
+    QtyUnits,
+    TimeInForce,
+)
+
+TODAY = date(2024, 3, 4)
+
+
+def _engine(max_daytrades: int = 3) -> RiskEngine:
+    engine = RiskEngine(
+        RiskLimits(
+            max_order_notional=10_000.0,
+            max_position_value=20_000.0,
+            max_daytrades=max_daytrades,
+            pdt_min_equity=25_000.0,
+        )
+    )
+    engine.add_instruments({7: "AAPL"})
+    engine.on_account_delta(
+        AccountDelta(1, "U1", {"buying_power": 15_000.0, "equity": 15_000.0})
+    )
+    return engine
+
+
+def _order(
+    qty: float, price: float = 100.0, side: OrderSide = OrderSide.BUY, **fields: Any
+) -> OrderGroupCreate:
+    return OrderGroupCreate(
+        currency="USD",
+        symbol="AAPL",
+        open_date_time="2024-03-04T10:00:00",
+        order_type=OrderType.LIMIT,
+        qty=qty,
+        price=price,
+        unit=fields.pop("unit", QtyUnits.SHARES),
+        time_in_force=TimeInForce.DAY,
+        status=None,
+        side=side,
+        group_type=fields.pop("group_type", OrderGroupType.BRACKET),
+        legs=fields.pop(
+            "legs",
+            [OrderLegCreate(order_type=OrderType.STOP, qty=qty, price=price * 0.9)],
+        ),
+        portfolio_id=1,
+        account_id=fields.pop("account_id", 1),
+    )
+
+
+def _fill(engine: RiskEngine, qty: float, price: float = 100.0) -> None:
+    engine.on_ledger_delta(
+        LedgerDelta(
+            portfolio_id=1,
+            instrument_id=7,
+            qty=qty,
+            market_value=qty * price,
+            cost=qty * price,
+            cash=0.0,
+            equity=0.0,
+            profit=0.0,
+            equity_change=0.0,
+            is_fill=True,
+        )
+    )
+
+
+def test_rejects_with_every_reason() -> None:
+    engine = _engine()
+    with pytest.raises(RiskRejected) as e:
+        engine.check(_order(300), today=TODAY)
+    assert len(e.value.reasons) == 3
+    assert engine.checks == 1 and engine.rejections == 1
+
+    with pytest.raises(RiskRejected, match="Unknown account 2"):
+        engine.check(_order(1, account_id=2), today=TODAY)
+    with pytest.raises(RiskRejected, match="No price"):
+        engine.check(_order(1, price=0.0), today=TODAY)
+
+
+def test_usd_units_and_oco_largest_leg() -> None:
+    engine = _engine()
+    ticket = engine.check(_order(5_000, unit=QtyUnits.USD), today=TODAY)
+    assert ticket.buying_power == pytest.approx(5_000.0)
+
+    legs = [
+        OrderLegCreate(order_type=OrderType.LIMIT, qty=10, price=100.0),
+        OrderLegCreate(order_type=OrderType.STOP, qty=90, price=120.0),
+    ]
+    with pytest.raises(RiskRejected, match="Notional"):
+        engine.check(_order(0, group_type=OrderGroupType.OCO, legs=legs), today=TODAY)
+
+
+def test_reservations_until_released_or_broker_update() -> None:
+    engine = _engine()
+    first = engine.check(_order(80), today=TODAY)
+    engine.attach(10, first)
+    with pytest.raises(RiskRejected, match="buying power"):
+        engine.check(_order(80), today=TODAY)
+
+    # a replacement doesn't compete with the group it replaces
+    replacement = engine.check(_order(90), replaces=10, today=TODAY)
+    engine.attach(10, replacement)
+    account = engine.account(1)
+    assert account and list(account.reserved.values()) == [9_000.0]
+
+    engine.release_order(10)
+    assert not account.reserved
+    engine.attach(11, engine.check(_order(80), today=TODAY))
+    engine.on_account_delta(AccountDelta(1, "U1", {"buying_power": 7_000.0}))
+    assert not account.reserved
+
+
+def test_done_orders_release_their_reservation() -> None:
+    engine = _engine()
+    engine.attach(10, engine.check(_order(80), today=TODAY))
+    engine.on_order(10, OrderStatus.SUBMITTED.value)
+    with pytest.raises(RiskRejected, match="buying power"):
+        engine.check(_order(80), today=TODAY)
+
+    engine.on_order(10, OrderStatus.FILLED.value)
+    account = engine.account(1)
+    assert account and not account.reserved
+    engine.check(_order(80), today=TODAY)
+
+
+def test_closing_orders_skip_buying_power_and_day_trades() -> None:
+    engine = _engine(max_daytrades=1)
+    _fill(engine, 100)
+    position = engine.position(1, "AAPL")
+    assert position and position.qty == 100 and position.opened_on == date.today()
+
+    engine.on_account_delta(AccountDelta(1, "U1", {"buying_power": 0.0}))
+    ticket = engine.check(_order(100, side=OrderSide.SELL), today=TODAY)
+    assert ticket.buying_power == 0.0
+
+    engine.on_account_delta(AccountDelta(1, "U1", {"daytrade_count": 1}))
+    with pytest.raises(RiskRejected, match="Day trade limit"):
+        engine.check(_order(100, side=OrderSide.SELL), today=date.today())
+    engine.on_account_delta(AccountDelta(1, "U1", {"equity": 30_000.0}))
+    engine.check(_order(100, side=OrderSide.SELL), today=date.today())
+
+
+def test_latency_histogram() -> None:
+    histogram = LatencyHistogram()
+    assert histogram.quantile(0.5) is None
+    for nanoseconds in (500, 1_500, 1_800, 40_000, 50_000_000):
+        histogram.record(nanoseconds)
+    assert (
+        histogram.counts[0] == 1
+        and histogram.counts[1] == 2
+        and histogram.counts[-1] == 1
+    )
+    assert histogram.quantile(0.5) == 2.0
+    assert histogram.quantile(0.99) == LatencyHistogram.BOUNDS_US[-1]
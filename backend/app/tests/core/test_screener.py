@@ -0,0 +1,130 @@
+from typing import Any
+
+from sqlmodel import Session
+
+from app.core.screener import InstrumentSnapshot, compile_screen
+from app.models import (
+    AssetType,
+    Company,
+    Instrument,
+    InstrumentScreen,
+    ScreenField,
+    ScreenRange,
+)
+
+SCREENS = [
+    InstrumentScreen(),
+    InstrumentScreen(
+        asset_types=[AssetType.EQUITY], sort_by=ScreenField.ONE_YEAR_RETURN, limit=2
+    ),
+    InstrumentScreen(
+        exchanges=["NYSE", "LSE"],
+        currencies=["USD"],
+        descending=False,
+        sort_by=ScreenField.AVG_DAILY_VOLUME,
+    ),
+    InstrumentScreen(
+        sectors=["Tech"], ranges=[ScreenRange(field=ScreenField.MARKET_CAP, min=500)]
+    ),
+    InstrumentScreen(
+        ranges=[ScreenRange(field=ScreenField.ONE_YEAR_RETURN, min=-0.1, max=0.2)],
+        sort_by=ScreenField.MARKET_CAP,
+    ),
+]
+
+
+def _rows() -> list[dict[str, Any]]:
+    def row(
+        id: int,
+        asset_type: AssetType,
+        exchange: str | None,
+        currency: str,
+        volume: float | None,
+        one_year: float | None,
+        sector: str | None,
+        market_cap: float | None,
+    ) -> dict[str, Any]:
+        fields = dict.fromkeys(
+            [
+                "root",
+                "underlying",
+                "one_month_return",
+                "one_week_return",
+                "one_day_return",
+                "metric_52_high",
+                "metric_52_low",
+                "subsector",
+            ]
+        )
+        return fields | {
+            "id": id,
+            "symbol": f"S{id}",
+            "asset_type": asset_type,
+            "exchange": exchange,
+            "currency": currency,
+            "avg_daily_volume": volume,
+            "one_year_return": one_year,
+            "sector": sector,
+            "market_cap": market_cap,
+        }
+
+    return [
+        row(1, AssetType.EQUITY, "NYSE", "USD", 1000.0, 0.1, "Tech", 1000.0),
+        row(2, AssetType.EQUITY, "LSE", "GBP", 500.0, 0.3, "Tech", 200.0),
+        row(3, AssetType.ETF, "NYSE", "USD", None, None, "Funds", 0.0),
+        row(4, AssetType.EQUITY, None, "USD", 2000.0, 0.3, None, 0.0),
+        row(5, AssetType.FUTURE, "LSE", "USD", 300.0, -0.05, "Tech", 800.0),
+    ]
+
+
+def test_snapshot_screen() -> None:
+    snapshot = InstrumentSnapshot.from_rows(_rows())
+    results = [snapshot.screen(screen) for screen in SCREENS]
+    assert [([i.id for i in r.data], r.count) for r in results] == [
+        ([1, 2, 3, 4, 5], 5),
+        ([2, 4], 3),
+        ([5, 1, 3], 3),
+        ([1, 5], 2),
+        ([1, 5], 2),
+    ]
+    assert results[1].data[0].symbol == "S2"
+    assert snapshot.screen(InstrumentScreen(exchanges=["XETRA"])).count == 0
+
+
+def test_compiled_screen_matches_snapshot(db: Session) -> None:
+    companies = {
+        row["id"]: Company(
+            name=f"Screen {row['id']}",
+            sector=row["sector"],
+            market_cap=row["market_cap"],
+        )
+        for row in _rows()
+    }
+    db.add_all(companies.values())
+    db.flush()
+    instruments = {
+        row["id"]: Instrument(
+            symbol=row["symbol"],
+            asset_type=row["asset_type"],
+            exchange=row["exchange"],
+            currency=row["currency"],
+            root=None,
+            underlying=None,
+            avg_daily_volume=row["avg_daily_volume"],
+            one_year_return=row["one_year_return"],
+            company_id=companies[row["id"]].id,
+        )
+        for row in _rows()
+    }
+    db.add_all(instruments.values())
+    db.flush()
+
+    by_id = {instruments[key].id: key for key in instruments}
+    snapshot = InstrumentSnapshot.from_rows(_rows())
+    for screen in SCREENS:
+        # restrict to the rows of this test, the database may hold others
+        screen = screen.model_copy(update={"limit": 1000})
+        rows = db.execute(compile_screen(screen)).all()
+        found = [by_id[r[0].id] for r in rows if r[0].id in by_id]
+        assert found == [i.id for i in snapshot.screen(screen).data]
+    db.rollback()
@@ -0,0 +1,118 @@
+import random
+import string
+
+from sqlmodel import Session
+
+from app.core.search import (
+    InstrumentSearchIndex,
+    PrefixIndex,
+    search_keys,
+    search_statement,
+)
+from app.models import AssetType, Company, Instrument, InstrumentSearchHit
+
+
+def _hit(
+    id: int, symbol: str, company_name: str | None, volume: float | None
+) -> InstrumentSearchHit:
+    return InstrumentSearchHit(
+        id=id,
+        symbol=symbol,
+        asset_type=AssetType.EQUITY,
+        currency="USD",
+        exchange=None,
+        company_name=company_name,
+        avg_daily_volume=volume,
+    )
+
+
+HITS = [
+    _hit(1, "AAPL", "Apple Inc", 900.0),
+    _hit(2, "AMZN", "Amazon.com Inc", 800.0),
+    _hit(3, "APP", "Applovin Corp", 50.0),
+    _hit(4, "MAPL", "Maple Leaf Foods", None),
+    _hit(5, "INCY", "Incyte Corp", 20.0),
+]
+
+
+def _ids(index: InstrumentSearchIndex, query: str, limit: int) -> list[int]:
+    hits = index.search(query, limit)
+    assert hits is not None
+    return [h.id for h in hits]
+
+
+def test_search_keys() -> None:
+    assert search_keys("brk.b", "Berkshire  hathaway inc") == [
+        "BRK.B",
+        "BERKSHIRE HATHAWAY INC",
+        "HATHAWAY INC",
+        "INC",
+    ]
+
+
+def test_prefix_index_matches_brute_force() -> None:
+    rng = random.Random(7)
+    keys = {
+        i: ["".join(rng.choices("ABC", k=rng.randint(1, 6))) for _ in range(2)]
+        for i in range(300)
+    }
+    rank = {i: rng.random() for i in keys}
+    index = PrefixIndex(((key, i) for i, ks in keys.items() for key in ks), rank, k=5)
+    for query in ["", "A", "AB", "ABC", "CCCA", "ABCABC", "ABCABCA", "D"] + [
+        "".join(rng.choices("ABC", k=rng.randint(1, 5))) for _ in range(50)
+    ]:
+        expected = sorted(
+            (i for i, ks in keys.items() if any(k.startswith(query) for k in ks)),
+            key=rank.__getitem__,
+        )
+        assert index.search(query) == expected[:5], query
+        assert index.search(query, 2) == expected[:2], query
+
+
+def test_instrument_search_index() -> None:
+    index = InstrumentSearchIndex(k=3)
+    assert index.search("a", 3) is None
+    index.build(HITS)
+    # symbol matches rank before name matches with more volume
+    assert _ids(index, "ap", 3) == [3, 1]
+    assert _ids(index, "a", 3) == [1, 2, 3]
+    assert _ids(index, "map", 3) == [4]
+    assert _ids(index, "inc", 10) == [5, 1, 2]
+    assert _ids(index, "  maple   leaf", 3) == [4]
+    assert index.search(string.punctuation, 3) == []
+
+
+def test_search_statement_matches_index(db: Session) -> None:
+    tag = "".join(random.choices(string.ascii_uppercase, k=6))
+    ids = {}
+    for hit in HITS:
+        company = Company(name=f"{hit.company_name} {tag}")
+        db.add(company)
+        db.flush()
+        instrument = Instrument(
+            symbol=f"{tag}{hit.symbol}",
+            asset_type=AssetType.EQUITY,
+            exchange=None,
+            root=None,
+            underlying=None,
+            avg_daily_volume=hit.avg_daily_volume,
+            company_id=company.id,
+        )
+        db.add(instrument)
+        db.flush()
+        ids[instrument.id] = hit.id
+
+    index = InstrumentSearchIndex(k=10)
+    index.build(
+        _hit(
+            hit.id,
+            f"{tag}{hit.symbol}",
+            f"{hit.company_name} {tag}",
+            hit.avg_daily_volume,
+        )
+        for hit in HITS
+    )
+    for query in [tag, f"{tag}A", f"{tag}AP", f"inc {tag}", f"{tag.lower()}m"]:
+        rows = db.execute(search_statement(query, 10)).mappings().all()
+        assert [ids[row["id"]] for row in rows] == _ids(index, query, 10), query
+    db.rollback()
@@ -0,0 +1,188 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlmodel import Session
+
+from app.core.cache import TieredCache, TTLCache
+from app.core.trade_aggregates import (
+    aggregate_trades,
+    invalidate_trade_aggregates,
+    period_start,
+)
+from app.models import (
+    AssetType,
+    Bar,
+    Chart,
+    ChartInterval,
+    Company,
+    Instrument,
+    Portfolio,
+    PositionDirection,
+    Trade,
+    TradeGroup,
+)
+
+
+def test_period_start() -> None:
+    now = datetime(2024, 5, 16, 13, 45)
+    assert period_start(now, None) == datetime(2024, 5, 16)
+    assert period_start(now, TradeGroup.DAY) == datetime(2024, 5, 16)
+    assert period_start(now, TradeGroup.WEEK) == datetime(2024, 5, 13)
+    assert period_start(now, TradeGroup.MONTH) == datetime(2024, 5, 1)
+
+
+def test_aggregate_trades_needs_one_bucket(db: Session) -> None:
+    with pytest.raises(ValueError):
+        aggregate_trades(db, [TradeGroup.DAY, TradeGroup.MONTH])
+
+
+def test_aggregate_trades(db: Session) -> None:
+    company = Company(name="Aggregates Inc")
+    portfolio = Portfolio(cash=0, equity=0, profit=0)
+    db.add_all([company, portfolio])
+    db.flush()
+    instrument = Instrument(
+        symbol="AGGR",
+        asset_type=AssetType.EQUITY,
+        exchange=None,
+        root=None,
+        underlying=None,
+        company_id=company.id,
+    )
+    db.add(instrument)
+    db.flush()
+    chart = Chart(
+        instrument_id=instrument.id,
+        interval=ChartInterval.Daily,
+        timestamp=datetime(2024, 5, 1),
+    )
+    db.add(chart)
+    db.flush()
+    days = [
+        datetime(2024, 5, 1, 16),
+        datetime(2024, 5, 1, 17),
+        datetime(2024, 5, 2, 16),
+        datetime(2024, 5, 3, 16),
+    ]
+    bars = [
+        Bar(
+            chart_id=chart.id,
+            timestamp=day,
+            loc=i,
+            open=1,
+            close=1,
+            high=1,
+            low=1,
+            volume=0,
+            downTicks=None,
+            downVolume=None,
+            totalTicks=None,
+            upTicks=None,
+            upVolume=None,
+            symbol="AGGR",
+        )
+        for i, day in enumerate(days)
+    ]
+    db.add_all(bars)
+    db.flush()
+    db.add_all(
+        [
+            Trade(
+                portfolio_id=portfolio.id,
+                instrument_id=instrument.id,
+                qty=1,
+                entry_price=0,
+                exit_price=0,
+                direction=direction,
+                profit_loss=pnl,
+                is_win=pnl > 0,
+                total_fees=1,
+                exit_action_bar_id=bar.id,
+            )
+            for bar, direction, pnl in [
+                (bars[0], PositionDirection.LONG, 10.0),
+                (bars[1], PositionDirection.SHORT, -4.0),
+                (bars[2], PositionDirection.LONG, 6.0),
+                (bars[3], PositionDirection.SHORT, 3.0),
+            ]
+        ]
+    )
+    db.flush()
+    cache = TieredCache("test", TTLCache(10, 60))
+    now = datetime(2024, 5, 3, 18)
+
+    daily = aggregate_trades(
+        db, [TradeGroup.DAY], portfolio_id=portfolio.id, cache=cache, now=now
+    )
+    assert daily.closed_until == datetime(2024, 5, 3)
+    assert [
+        (a.bucket, a.trades, a.wins, a.profit_loss, a.cumulative_profit_loss)
+        for a in daily.data
+    ] == [
+        (datetime(2024, 5, 1), 2, 1, 6.0, 6.0),
+        (datetime(2024, 5, 2), 1, 1, 6.0, 12.0),
+        (datetime(2024, 5, 3), 1, 1, 3.0, 15.0),
+    ]
+    assert cache.misses == 1
+
+    by_direction = aggregate_trades(
+        db,
+        [TradeGroup.DIRECTION, TradeGroup.DAY],
+        portfolio_id=portfolio.id,
+        cache=cache,
+        now=now,
+    )
+    assert [
+        (a.bucket, a.direction, a.cumulative_profit_loss) for a in by_direction.data
+    ] == [
+        (datetime(2024, 5, 1), PositionDirection.LONG, 10.0),
+        (datetime(2024, 5, 1), PositionDirection.SHORT, -4.0),
+        (datetime(2024, 5, 2), PositionDirection.LONG, 16.0),
+        (datetime(2024, 5, 3), PositionDirection.SHORT, -1.0),
+    ]
+
+    totals = aggregate_trades(
+        db, [TradeGroup.DIRECTION], portfolio_id=portfolio.id, cache=cache, now=now
+    )
+    assert [
+        (a.direction, a.trades, a.profit_loss, a.total_fees, a.bucket)
+        for a in totals.data
+    ] == [
+        (PositionDirection.LONG, 2, 16.0, 2.0, None),
+        (PositionDirection.SHORT, 2, -1.0, 2.0, None),
+    ]
+
+    # the closed days come from the cache until trades change
+    aggregate_trades(
+        db, [TradeGroup.DAY], portfolio_id=portfolio.id, cache=cache, now=now
+    )
+    assert cache.hits == 1
+    invalidate_trade_aggregates()
+    aggregate_trades(
+        db, [TradeGroup.DAY], portfolio_id=portfolio.id, cache=cache, now=now
+    )
+    assert cache.hits == 1
+
+    later = aggregate_trades(
+        db,
+        [],
+        portfolio_id=portfolio.id,
+        start=days[2],
+        end=now + timedelta(days=1),
+        now=now,
+    )
+    assert [(a.trades, a.profit_loss) for a in later.data] == [(2, 9.0)]
+
+    # aware bounds, as parsed from an ISO string with an offset, are UTC
+    aware = aggregate_trades(
+        db,
+        [],
+        portfolio_id=portfolio.id,
+        start=(days[2] + timedelta(hours=2)).replace(
+            tzinfo=timezone(timedelta(hours=2))
+        ),
+        end=(now + timedelta(days=1)).replace(tzinfo=timezone.utc),
+        now=now,
+    )
+    assert aware.data == later.data
+    db.rollback()
@@ -0,0 +1,211 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlmodel import Session, col, select
+
+from app.core.trade_analytics import (
+    analyze_trades,
+    excursions,
+    max_drawdown,
+    portfolio_trade_stats,
+    range_extremes,
+    trade_stats,
+)
+from app.models import (
+    AssetType,
+    Bar,
+    Chart,
+    ChartInterval,
+    Company,
+    EquityPoint,
+    Instrument,
+    Portfolio,
+    PositionDirection,
+    Trade,
+)
+
+
+def test_range_extremes_matches_slices() -> None:
+    rng = np.random.default_rng(3)
+    highs = rng.random(50) + 1
+    lows = highs - 1
+    starts = rng.integers(0, 51, 200)
+    ends = rng.integers(0, 51, 200)
+    highest, lowest = range_extremes(highs, lows, starts, ends)
+    for s, e, h, lo in zip(starts, ends, highest, lowest, strict=True):
+        if e <= s:
+            assert np.isnan(h) and np.isnan(lo)
+        else:
+            assert (h, lo) == (highs[s:e].max(), lows[s:e].min())
+    assert np.isnan(
+        range_extremes(np.empty(0), np.empty(0), np.array([0]), np.array([0]))[0]
+    ).all()
+
+
+def test_excursions() -> None:
+    mfe, mae = excursions(
+        np.array([100.0, 100.0, 100.0]),
+        np.array([2.0, 2.0, 1.0]),
+        np.array([True, False, True]),
+        np.array([110.0, 110.0, 99.0]),
+        np.array([95.0, 95.0, 90.0]),
+    )
+    assert mfe.tolist() == [20.0, 10.0, 0.0]
+    assert mae.tolist() == [10.0, 20.0, 10.0]
+
+
+def test_trade_stats() -> None:
+    assert max_drawdown(np.array([5.0, -3.0, 2.0, -6.0, 1.0])) == 7.0
+    assert max_drawdown(np.array([-2.0, 1.0])) == 2.0
+
+    pnl = np.array([10.0, -5.0, 20.0, -5.0])
+    exits = np.array(
+        ["2024-01-01", "2024-04-01", "2024-07-01", "2024-12-31"], dtype="datetime64[us]"
+    )
+    stats = trade_stats(
+        1,
+        pnl,
+        pnl / 100,
+        exits,
+        np.array([12.0, np.nan, 25.0, 1.0]),
+        np.full(4, np.nan),
+    )
+    assert (stats.trades, stats.wins, stats.losses, stats.win_rate) == (4, 2, 2, 0.5)
+    assert (stats.gross_profit, stats.gross_loss, stats.profit_factor) == (
+        30.0,
+        10.0,
+        3.0,
+    )
+    assert (stats.expectancy, stats.avg_win, stats.avg_loss) == (5.0, 15.0, -5.0)
+    assert (stats.avg_mfe, stats.avg_mae, stats.max_drawdown) == (38.0 / 3, None, 5.0)
+    assert stats.sharpe is not None and stats.sharpe > 0
+
+    empty = trade_stats(
+        2,
+        np.empty(0),
+        np.empty(0),
+        np.empty(0, "datetime64[us]"),
+        np.empty(0),
+        np.empty(0),
+    )
+    assert (empty.trades, empty.win_rate, empty.profit_factor, empty.sharpe) == (
+        0,
+        None,
+        None,
+        None,
+    )
+
+
+def test_analyze_trades(db: Session) -> None:
+    company = Company(name="Analytics Inc")
+    db.add(company)
+    db.flush()
+    instrument = Instrument(
+        symbol="ANLT",
+        asset_type=AssetType.EQUITY,
+        exchange=None,
+        root=None,
+        underlying=None,
+        company_id=company.id,
+    )
+    portfolio = Portfolio(cash=0, equity=0, profit=0)
+    db.add_all([instrument, portfolio])
+    db.flush()
+    chart = Chart(
+        instrument_id=instrument.id,
+        interval=ChartInterval.Daily,
+        timestamp=datetime(2024, 1, 1),
+    )
+    db.add(chart)
+    db.flush()
+    bars = [
+        Bar(
+            chart_id=chart.id,
+            timestamp=datetime(2024, 1, 1) + timedelta(days=i),
+            loc=i,
+            open=100,
+            close=100,
+            high=high,
+            low=low,
+            volume=0,
+            downTicks=None,
+            downVolume=None,
+            totalTicks=None,
+            upTicks=None,
+            upVolume=None,
+            symbol="ANLT",
+        )
+        for i, (high, low) in enumerate(
+            [(101, 99), (105, 98), (103, 90), (108, 97), (102, 100)]
+        )
+    ]
+    db.add_all(bars)
+    db.flush()
+    trades = [
+        Trade(
+            portfolio_id=portfolio.id,
+            instrument_id=instrument.id,
+            qty=2,
+            entry_price=100,
+            exit_price=104,
+            direction=PositionDirection.LONG,
+            total_fees=1,
+            entry_action_bar_id=bars[0].id,
+            exit_action_bar_id=bars[1].id,
+        ),
+        Trade(
+            portfolio_id=portfolio.id,
+            instrument_id=instrument.id,
+            qty=1,
+            entry_price=100,
+            exit_price=106,
+            direction=PositionDirection.SHORT,
+            entry_action_bar_id=bars[2].id,
+            exit_action_bar_id=bars[3].id,
+        ),
+        Trade(
+            portfolio_id=portfolio.id,
+            instrument_id=instrument.id,
+            qty=1,
+            entry_price=100,
+            exit_price=101,
+            direction=PositionDirection.LONG,
+        ),
+    ]
+    db.add_all(trades)
+    db.commit()
+    assert portfolio.id is not None
+
+    assert analyze_trades(db, [portfolio.id]) == 3
+    assert analyze_trades(db, [portfolio.id]) == 0
+    rows = db.exec(
+        select(Trade).where(Trade.portfolio_id == portfolio.id).order_by(col(Trade.id))
+    ).all()
+    assert [(t.profit_loss, t.is_win, t.mfe, t.mea) for t in rows] == [
+        (7.0, True, 10.0, 4.0),
+        (-6.0, False, 10.0, 8.0),
+        (1.0, True, None, None),
+    ]
+
+    (stats,) = portfolio_trade_stats(db, [portfolio.id])
+    assert (stats.trades, stats.wins, stats.profit_factor, stats.max_drawdown) == (
+        3,
+        2,
+        8.0 / 6.0,
+        6.0,
+    )
+    assert stats.avg_mfe == 10.0
+
+    # trades with an exit bar extend the equity curve
+    points = db.exec(
+        select(EquityPoint).where(EquityPoint.portfolio_id == portfolio.id)
+    ).all()
+    assert [(p.seq, p.equity, p.drawdown) for p in points] == [
+        (1, 7.0, 0.0),
+        (2, 1.0, 6.0),
+    ]
+
+    for row in [*points, *rows, *bars, chart, instrument, portfolio, company]:
+        db.delete(row)
+        db.flush()
+    db.commit()
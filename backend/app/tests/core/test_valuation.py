@@ -0,0 +1,54 @@
+import numpy as np
+
+from app.core.ledger import Ledger
+from app.core.valuation import ValuationCache, parametric_var
+from app.models import PortfolioValuation
+
+
+def make_valuation(portfolio_id: int) -> PortfolioValuation:
+    return PortfolioValuation(
+        portfolio_id=portfolio_id,
+        market_value=100.0,
+        cost=90.0,
+        unrealized_pnl=10.0,
+        exposure_by_asset_type={"equity": 100.0},
+        exposure_by_sector={"Tech": 100.0},
+        var=5.0,
+        var_confidence=0.99,
+        var_horizon_days=1,
+    )
+
+
+def test_parametric_var_single_instrument() -> None:
+    returns = np.array([[0.01], [-0.01], [0.01], [-0.01]])
+    var = parametric_var(np.array([1000.0]), returns, 0.99, 4)
+    expected = 2.3263478740408408 * 1000.0 * np.std(returns, ddof=1) * 2
+    assert np.isclose(var, expected)
+
+
+def test_parametric_var_hedged_exposures() -> None:
+    returns = np.array([[0.01, 0.01], [-0.02, -0.02], [0.03, 0.03]])
+    assert np.isclose(parametric_var(np.array([500.0, -500.0]), returns, 0.95, 1), 0.0)
+
+
+def test_parametric_var_without_history() -> None:
+    assert parametric_var(np.array([500.0]), np.empty((0, 1)), 0.95, 1) == 0.0
+
+
+def test_valuation_cache_dropped_on_ledger_event() -> None:
+    cache = ValuationCache(max_age=60)
+    ledger = Ledger()
+    ledger.subscribe(cache.on_ledger_delta)
+    cache.put(make_valuation(1))
+    cache.put(make_valuation(2))
+
+    ledger.apply_fill(1, 10, qty=1, price=1.0)
+
+    assert cache.get(1, 0.99, 1) is None
+    assert cache.get(2, 0.99, 1) is not None
+
+
+def test_valuation_cache_max_age() -> None:
+    cache = ValuationCache(max_age=0)
+    cache.put(make_valuation(1))
+    assert cache.get(1, 0.99, 1) is None
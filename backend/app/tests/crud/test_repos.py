@@ -0,0 +1,98 @@
+import pytest
+from sqlmodel import Session
+
+from app.adopters.cache import CachedCompaniesRepo
+from app.adopters.database import DefaultCompaniesRepo, DefaultUnitOfWork
+from app.core.cache import TieredCache, TTLCache
+from app.models import Company, CompanyCreate, CompanyUpdate
+from app.tests.utils.utils import random_lower_string
+
+
+def test_bulk_create_update_delete(db: Session) -> None:
+    repo = DefaultCompaniesRepo(db)
+    names = [random_lower_string() for _ in range(3)]
+    companies = repo.bulk_create([CompanyCreate(name=name) for name in names])
+    assert [c.name for c in companies] == names
+    ids = [c.id for c in companies if c.id]
+    assert len(ids) == len(companies)
+
+    assert (
+        repo.bulk_update(
+            [{"id": ids[0], "sector": "Energy"}, {"id": ids[1], "sector": "Utilities"}]
+        )
+        == 2
+    )
+    energy, utilities = repo.get_company(ids[0]), repo.get_company(ids[1])
+    assert energy and energy.sector == "Energy"
+    assert utilities and utilities.sector == "Utilities"
+
+    assert repo.bulk_delete(ids) == 3
+    assert all(db.get(Company, id) is None for id in ids)
+
+
+def test_bulk_update_needs_ids(db: Session) -> None:
+    with pytest.raises(ValueError):
+        DefaultCompaniesRepo(db).bulk_update([{"sector": "Energy"}])
+
+
+def test_update(db: Session) -> None:
+    repo = DefaultCompaniesRepo(db)
+    company = repo.create(CompanyCreate(name=random_lower_string()))
+    assert company.id is not None
+    updated = repo.update(company.id, CompanyUpdate(name="renamed", market_cap=10))
+    assert updated.id == company.id
+    assert updated.name == "renamed"
+    repo.delete(company.id)
+    with pytest.raises(ValueError):
+        repo.update(company.id, CompanyUpdate(name="renamed"))
+
+
+def test_search_company(db: Session) -> None:
+    repo = DefaultCompaniesRepo(db)
+    word = random_lower_string()[:12]
+    small, large = repo.bulk_create(
+        [
+            CompanyCreate(name=f"{word} Holdings", market_cap=1),
+            CompanyCreate(name=f"First {word}_% Bank", market_cap=2),
+        ]
+    )
+    assert [c.id for c in repo.search_company(word.upper())] == [large.id, small.id]
+    assert [c.id for c in repo.search_company(f"first  {word}_%")] == [large.id]
+    assert repo.search_company(f"{word}_%") == [large]
+    assert small.id is not None and large.id is not None
+    repo.bulk_delete([small.id, large.id])
+
+
+def test_unit_of_work_commits_once(db: Session) -> None:
+    with DefaultUnitOfWork(db) as uow:
+        company = uow.companies.create(CompanyCreate(name=random_lower_string()))
+        uow.flush()
+        company_id = company.id
+        uow.commit()
+    assert company_id is not None and db.get(Company, company_id) is not None
+    DefaultCompaniesRepo(db).delete(company_id)
+
+
+def test_unit_of_work_rolls_back_without_commit(db: Session) -> None:
+    with DefaultUnitOfWork(db) as uow:
+        company = uow.companies.create(CompanyCreate(name=random_lower_string()))
+        uow.flush()
+        company_id = company.id
+    assert db.get(Company, company_id) is None
+
+
+def test_cached_repo_invalidates_on_update(db: Session) -> None:
+    cache = TieredCache("test", TTLCache(maxsize=10, ttl=60))
+    repo = CachedCompaniesRepo(DefaultCompaniesRepo(db), cache)
+    company = repo.create(CompanyCreate(name=random_lower_string()))
+    assert company.id is not None
+    for _ in range(2):
+        cached = repo.get_company(company.id)
+        assert cached and cached.name == company.name
+    assert cache.stats().hits == 1
+
+    repo.update(company.id, CompanyUpdate(name="renamed"))
+    renamed = repo.get_company(company.id)
+    assert renamed and renamed.name == "renamed"
+    repo.delete(company.id)
+    assert repo.get_company(company.id) is None
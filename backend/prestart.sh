@@ -8,3 +8,6 @@ alembic upgrade head
 
 # Create initial data in DB
 python app/initial_data.py
+
+# Report unindexed foreign keys and sequential scan hot spots, never blocks startup
+python -m app.cli db check-indexes || true